@@ -0,0 +1,217 @@
+# plant_dashboard/adapter_health.py
+"""
+Bluetoothアダプタの健全性モデル
+
+デバイス単位の失敗（電池切れ・通信圏外・接続拒否）とアダプタ単位の異常を区別し、
+Bluetoothサービスの再起動はアダプタ全体の症状が出ているときだけ行う。
+
+アダプタ全体の症状とみなすもの:
+- スキャンで周囲のアドバタイズが1件も受信できない、またはD-Bus/アダプタのエラーが連続する
+- 複数の異なるデバイスへの接続が、間に成功を挟まずに失敗し続ける
+
+スキャン時間・接続時間は直近のサンプルからパーセンタイル (p50/p90/p99) を計算し、
+定期的に adapter_health_metrics テーブルへ保存してグラフ表示に使う。
+"""
+
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+import config
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+UNHEALTHY = 'unhealthy'
+
+# アダプタ（bluetoothd / D-Bus / HCI）側の問題を示すエラーメッセージ
+ADAPTER_ERROR_MARKERS = (
+    'org.freedesktop.dbus.error',
+    'org.bluez.error.notready',
+    'org.bluez.error.inprogress',
+    'no bluetooth adapters found',
+    'bluetooth adapter',
+    'adapter not found',
+    'not powered',
+    'dbus',
+)
+
+
+def classify_ble_error(error):
+    """BLEのエラーが 'adapter'（アダプタ側）か 'device'（デバイス側）かを判定する"""
+    message = str(error).lower()
+    if any(marker in message for marker in ADAPTER_ERROR_MARKERS):
+        return 'adapter'
+    return 'device'
+
+
+def percentile(sorted_values, p):
+    """ソート済みの値から最近傍順位法でパーセンタイルを求める"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class LatencyWindow:
+    """直近N件の所要時間(秒)を保持してパーセンタイルを返す"""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentiles(self):
+        values = sorted(self.samples)
+        return {f'p{p}': percentile(values, p) for p in (50, 90, 99)}
+
+
+class AdapterHealthMonitor:
+    """
+    アダプタごとのスキャン・接続の結果を記録し、再起動が必要かを判定する。
+    PlantDeviceBLE と bluetooth_daemon のスキャン処理から記録される。
+    """
+
+    def __init__(self, adapter='hci0', window_size=None, adapter_failure_threshold=None, connect_failure_devices=None):
+        self.adapter = adapter
+        self.scan_latency = LatencyWindow(window_size or config.ADAPTER_LATENCY_WINDOW)
+        self.connect_latency = LatencyWindow(window_size or config.ADAPTER_LATENCY_WINDOW)
+        self.adapter_failure_threshold = adapter_failure_threshold or config.ADAPTER_FAILURE_THRESHOLD
+        self.connect_failure_devices = connect_failure_devices or config.ADAPTER_CONNECT_FAILURE_DEVICES
+        # アダプタ全体の症状
+        self.adapter_failure_streak = 0
+        self.failed_connect_devices = set()
+        self.last_adapter_error = None
+        self.last_healthy_at = time.monotonic()
+        self.restart_count = 0
+        self._reset_counters()
+
+    def _reset_counters(self):
+        """スナップショット間の件数"""
+        self.counters = {
+            'scan_count': 0, 'empty_scan_count': 0, 'adapter_error_count': 0,
+            'connect_count': 0, 'connect_failure_count': 0,
+            'device_success_count': 0, 'device_failure_count': 0,
+        }
+
+    def record_scan(self, duration, seen_count, error=None):
+        """
+        スキャン1回の結果を記録する。対象デバイスが見つからなかったこと自体はデバイス単位の失敗として扱う。
+
+        Args:
+            duration: スキャンの所要時間(秒)
+            seen_count: スキャン中に受信したアドバタイズの件数（対象以外も含む）
+            error: スキャンで発生した例外
+        """
+        self.counters['scan_count'] += 1
+        self.scan_latency.add(duration)
+        if error is not None and classify_ble_error(error) == 'adapter':
+            self._adapter_symptom(f"スキャンエラー: {error}")
+        elif error is None and seen_count == 0:
+            self.counters['empty_scan_count'] += 1
+            self._adapter_symptom(f"スキャン({duration:.1f}秒)でアドバタイズを1件も受信できませんでした")
+        elif error is None:
+            # 周囲のアドバタイズを受信できていれば、アダプタ自体は動いている
+            self.adapter_failure_streak = 0
+            self.last_healthy_at = time.monotonic()
+
+    def record_connect(self, device_id, duration, success, error=None):
+        """デバイスへの接続1回の結果を記録する"""
+        self.counters['connect_count'] += 1
+        if success:
+            self.connect_latency.add(duration)
+            self.failed_connect_devices.clear()
+            self.last_healthy_at = time.monotonic()
+            return
+        self.counters['connect_failure_count'] += 1
+        if error is not None and classify_ble_error(error) == 'adapter':
+            self._adapter_symptom(f"接続エラー: {error}")
+        else:
+            self.failed_connect_devices.add(device_id)
+
+    def record_error(self, error):
+        """スキャン・接続以外のBLE操作で発生したエラーを記録する（アダプタ側のエラーのみ症状として数える）"""
+        if classify_ble_error(error) == 'adapter':
+            self._adapter_symptom(f"BLE操作エラー: {error}")
+
+    def record_device_result(self, device_id, success):
+        """ポーリング1回の最終結果を記録する（指標のみ。再起動の判定には使わない）"""
+        self.counters['device_success_count' if success else 'device_failure_count'] += 1
+
+    def _adapter_symptom(self, reason):
+        self.counters['adapter_error_count'] += 1
+        self.adapter_failure_streak += 1
+        self.last_adapter_error = reason
+        logger.warning(f"[{self.adapter}] アダプタの異常を検出しました ({self.adapter_failure_streak}回連続): {reason}")
+
+    def status(self, active_devices=None):
+        """
+        アダプタの状態と理由を返す。
+
+        Args:
+            active_devices: ポーリング対象の（ブレーカーが閉じている）デバイス数。
+                接続失敗の広がりを判定する閾値の上限に使う（1台だけなら接続失敗ではアダプタの異常とみなさない）
+        """
+        if self.adapter_failure_streak >= self.adapter_failure_threshold:
+            return UNHEALTHY, self.last_adapter_error
+        threshold = self.connect_failure_devices
+        if active_devices is not None:
+            threshold = max(2, min(threshold, active_devices))
+        if len(self.failed_connect_devices) >= threshold:
+            return UNHEALTHY, f"{len(self.failed_connect_devices)}台のデバイスへの接続が続けて失敗しました"
+        if self.adapter_failure_streak > 0 or self.failed_connect_devices:
+            return DEGRADED, self.last_adapter_error
+        return HEALTHY, None
+
+    def should_restart(self, active_devices=None):
+        return self.status(active_devices)[0] == UNHEALTHY
+
+    def mark_restarted(self):
+        """Bluetoothサービスを再起動した後に、症状の記録をリセットする"""
+        self.restart_count += 1
+        self.reset()
+
+    def reset(self):
+        """症状の記録をリセットする"""
+        self.adapter_failure_streak = 0
+        self.failed_connect_devices.clear()
+        self.last_adapter_error = None
+
+    def metrics(self, active_devices=None):
+        """現在の指標（グラフ・ログ用）"""
+        status, reason = self.status(active_devices)
+        return {
+            'adapter': self.adapter,
+            'status': status,
+            'reason': reason,
+            'scan_latency': self.scan_latency.percentiles(),
+            'connect_latency': self.connect_latency.percentiles(),
+            'adapter_failure_streak': self.adapter_failure_streak,
+            'failed_connect_devices': sorted(self.failed_connect_devices),
+            'restart_count': self.restart_count,
+            'seconds_since_healthy': round(time.monotonic() - self.last_healthy_at, 1),
+            **self.counters,
+        }
+
+    def save_snapshot(self, conn, active_devices=None):
+        """現在の指標を adapter_health_metrics に保存し、件数をリセットする（コミットは呼び出し側で行う）"""
+        m = self.metrics(active_devices)
+        conn.execute("""
+            INSERT INTO adapter_health_metrics (
+                recorded_at, adapter, status,
+                scan_count, empty_scan_count, adapter_error_count, scan_p50, scan_p90, scan_p99,
+                connect_count, connect_failure_count, connect_p50, connect_p90, connect_p99,
+                device_success_count, device_failure_count, restart_count
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.adapter, m['status'],
+            m['scan_count'], m['empty_scan_count'], m['adapter_error_count'],
+            m['scan_latency']['p50'], m['scan_latency']['p90'], m['scan_latency']['p99'],
+            m['connect_count'], m['connect_failure_count'],
+            m['connect_latency']['p50'], m['connect_latency']['p90'], m['connect_latency']['p99'],
+            m['device_success_count'], m['device_failure_count'], self.restart_count
+        ))
+        self._reset_counters()
@@ -7,7 +7,7 @@ from flask import Flask, current_app
 # configモジュールをインポート
 import config
 
-from database import init_db
+from database import init_db, init_app as init_db_pool
 # device_managerはブループリントから利用されるためimportを維持
 import device_manager as dm
 
@@ -39,6 +39,9 @@ def create_app():
         else:
             logger.error("UPLOAD_FOLDER is not configured in config.py")
 
+    # リクエストスコープのDB接続をteardownでプールへ返却する
+    init_db_pool(app)
+
     # Blueprintを登録
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(devices_bp)
@@ -54,6 +57,7 @@ def create_app():
             {'url': 'management.management', 'icon': 'bi-sliders', 'text': 'Management'},
             {'url': 'management.watering_profiles', 'icon': 'bi-droplet-half', 'text': 'Watering Profiles'},
             {'url': 'devices.devices', 'icon': 'bi-hdd-stack-fill', 'text': 'Devices'},
+            {'url': 'devices.device_completeness', 'icon': 'bi-grid-3x3', 'text': 'Data Coverage'},
             {'url': 'plants.plants', 'icon': 'bi-book-half', 'text': 'Plant Library'}
         ])
 
@@ -0,0 +1,166 @@
+# plant_dashboard/backfill.py
+"""
+センサーデータの欠損検出とバックフィル計画
+
+BLEの通信圏外などで受信できなかった期間を sensor_data から検出し、
+デバイス内に記録されているデータ (CMD_GET_TIME_DATA) を取得する時刻を決める。
+取得したデータは bluetooth_daemon がパイプに書き出し、分析デーモンが
+device_manager.save_sensor_data_batch で重複なく保存する。
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+
+import config
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def find_sensor_gaps(conn, device_id, since, until, threshold_seconds):
+    """
+    デバイスの読み取り間隔が threshold_seconds を超えている区間を返す。
+
+    since より前の最後の読み取りを起点に含めるため、期間の先頭にまたがる欠損も検出する。
+    最後の読み取りから until までの区間（現在も続いている欠損）も含める。
+    デバイスに読み取りが1件もない場合は欠損なしとする。
+
+    Returns:
+        list: (gap_start, gap_end) のdatetimeタプルのリスト（古い順）
+    """
+    since_str = since.strftime(TIMESTAMP_FORMAT)
+    until_str = until.strftime(TIMESTAMP_FORMAT)
+    rows = conn.execute(
+        """
+        WITH readings AS (
+            SELECT timestamp FROM sensor_data
+            WHERE device_id = ?
+              AND timestamp >= COALESCE(
+                  (SELECT MAX(timestamp) FROM sensor_data WHERE device_id = ? AND timestamp < ?), ?)
+              AND timestamp <= ?
+        )
+        SELECT gap_start, gap_end FROM (
+            SELECT LAG(timestamp) OVER (ORDER BY timestamp) AS gap_start, timestamp AS gap_end
+            FROM readings
+        )
+        WHERE gap_start IS NOT NULL
+          AND (julianday(gap_end) - julianday(gap_start)) * 86400 > ?
+        ORDER BY gap_start
+        """,
+        (device_id, device_id, since_str, since_str, until_str, threshold_seconds)
+    ).fetchall()
+    gaps = [(_parse(row['gap_start']), _parse(row['gap_end'])) for row in rows]
+
+    last = conn.execute(
+        "SELECT MAX(timestamp) AS ts FROM sensor_data WHERE device_id = ? AND timestamp <= ?",
+        (device_id, until_str)
+    ).fetchone()['ts']
+    if last is not None:
+        last_dt = _parse(last)
+        if (until - last_dt).total_seconds() > threshold_seconds:
+            gaps.append((last_dt, until))
+
+    return [(start, end) for start, end in gaps if start is not None and end is not None]
+
+
+def plan_backfill_targets(gaps, step_seconds, max_targets, skip=None):
+    """
+    欠損区間の中で取得する時刻を step_seconds 間隔で決める。
+    新しい欠損を優先し、skip（取得済み・取得できなかった時刻の集合）に含まれる時刻は除く。
+
+    Returns:
+        list: (target_time, gap_start, gap_end) のタプルのリスト
+    """
+    step = timedelta(seconds=step_seconds)
+    targets = []
+    for gap_start, gap_end in sorted(gaps, reverse=True):
+        target = gap_start + step
+        # 区間の両端の読み取りと近すぎる時刻は要求しない
+        while target <= gap_end - step / 2:
+            if skip is None or target.strftime(TIMESTAMP_FORMAT) not in skip:
+                targets.append((target, gap_start, gap_end))
+                if len(targets) >= max_targets:
+                    return targets
+            target += step
+    return targets
+
+
+def collect_backfill_records(targets, results):
+    """
+    get_time_data_batch の結果から保存するレコードを作る。
+    デバイスは要求時刻に最も近い記録を返すため、欠損区間の外の記録（既に保存済みの時刻）と
+    同じ記録への重複した応答は除く。
+
+    Args:
+        targets: plan_backfill_targets の戻り値
+        results: [(target_time, reading or None), ...]（targetsと同じ順）
+
+    Returns:
+        list: パイプに書き出す {"timestamp": ..., "data": {...}} のリスト（古い順）
+    """
+    records = {}
+    for (target, gap_start, gap_end), (_, reading) in zip(targets, results):
+        if not reading:
+            continue
+        actual = _parse(reading.get('datetime'))
+        if actual is None or not (gap_start < actual < gap_end):
+            continue
+        timestamp = actual.strftime(TIMESTAMP_FORMAT)
+        records[timestamp] = {"timestamp": timestamp, "data": reading}
+    return [records[timestamp] for timestamp in sorted(records)]
+
+
+class BackfillPlanner:
+    """
+    デバイスごとのバックフィル対象時刻を決める。
+    デバイスに記録がなかった時刻を毎回要求し続けないよう、要求した時刻を retry_seconds の間は除外する。
+    """
+
+    def __init__(self, lookback_hours=None, threshold_seconds=None, step_seconds=None,
+                 max_targets=None, retry_seconds=None):
+        self.lookback = timedelta(hours=lookback_hours or config.BACKFILL_LOOKBACK_HOURS)
+        self.threshold_seconds = threshold_seconds or config.BACKFILL_GAP_THRESHOLD_SECONDS
+        self.step_seconds = step_seconds or config.BACKFILL_STEP_SECONDS
+        self.max_targets = max_targets or config.BACKFILL_MAX_TARGETS_PER_POLL
+        self.retry_seconds = retry_seconds or config.BACKFILL_RETRY_SECONDS
+        # device_id -> {target_time文字列: 要求した時刻(monotonic)}
+        self.attempted = {}
+
+    def plan(self, device_id, now=None):
+        """欠損を検出して取得する時刻を返す"""
+        now = now or datetime.now()
+        attempted = self._prune(device_id)
+        conn = get_db_connection(readonly=True)
+        try:
+            gaps = find_sensor_gaps(conn, device_id, now - self.lookback, now, self.threshold_seconds)
+        finally:
+            conn.close()
+        targets = plan_backfill_targets(gaps, self.step_seconds, self.max_targets, skip=attempted)
+        if targets:
+            logger.info(f"[{device_id}] 欠損 {len(gaps)} 区間からバックフィル対象 {len(targets)} 件を計画しました")
+        return targets
+
+    def mark_attempted(self, device_id, targets):
+        attempted = self.attempted.setdefault(device_id, {})
+        now = time.monotonic()
+        for target, _, _ in targets:
+            attempted[target.strftime(TIMESTAMP_FORMAT)] = now
+
+    def _prune(self, device_id):
+        attempted = self.attempted.get(device_id, {})
+        now = time.monotonic()
+        for key in [key for key, at in attempted.items() if now - at >= self.retry_seconds]:
+            del attempted[key]
+        return attempted
+
+
+def _parse(timestamp):
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
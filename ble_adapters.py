@@ -0,0 +1,176 @@
+# plant_dashboard/ble_adapters.py
+"""
+複数のBluetoothアダプタ (hci0, hci1, ...) へのデバイスの割り当て
+
+bluetooth_daemon はアダプタごとに独立したポーリングパイプラインを動かし、
+各デバイスをどのアダプタで扱うかをここで決める。
+
+割り当ての優先順位:
+1. config.BLE_DEVICE_ADAPTER_MAP による固定の割り当て（device_id または MACアドレス）
+2. スキャンで観測したRSSIが最も強いアダプタ（現在の割り当てより BLE_ADAPTER_RSSI_MARGIN dB 以上強い場合のみ移す）
+3. 割り当て済みのデバイス数が最も少ないアダプタ
+
+アダプタ全体の異常（adapter_health）が出たアダプタは一定時間外し、そのデバイスは他のアダプタに移す。
+"""
+
+import logging
+import os
+import re
+import time
+
+import config
+from adapter_health import AdapterHealthMonitor, UNHEALTHY
+
+logger = logging.getLogger(__name__)
+
+SYSFS_BLUETOOTH_PATH = "/sys/class/bluetooth"
+# hci0:64 のような接続ごとのエントリは除く
+ADAPTER_NAME_PATTERN = re.compile(r'^hci(\d+)$')
+
+
+def discover_adapters(sysfs_path=SYSFS_BLUETOOTH_PATH):
+    """
+    ローカルのHCIアダプタ名を番号順に返す。
+    config.BLE_ADAPTERS が設定されていればそれを使う。検出できなければ空のリスト。
+    """
+    if config.BLE_ADAPTERS:
+        return list(config.BLE_ADAPTERS)
+    try:
+        names = os.listdir(sysfs_path)
+    except OSError:
+        return []
+    adapters = [name for name in names if ADAPTER_NAME_PATTERN.match(name)]
+    return sorted(adapters, key=lambda name: int(ADAPTER_NAME_PATTERN.match(name).group(1)))
+
+
+class AdapterPool:
+    """アダプタごとの健全性と、デバイスの割り当てを管理する"""
+
+    def __init__(self, adapters, mapping=None, rssi_margin=None, rssi_ttl_seconds=None, failover_retry_seconds=None):
+        self.mapping = {str(key).upper(): value for key, value in (mapping if mapping is not None else config.BLE_DEVICE_ADAPTER_MAP).items()}
+        self.rssi_margin = rssi_margin if rssi_margin is not None else config.BLE_ADAPTER_RSSI_MARGIN
+        self.rssi_ttl_seconds = rssi_ttl_seconds or config.BLE_ADAPTER_RSSI_TTL_SECONDS
+        self.failover_retry_seconds = failover_retry_seconds or config.BLE_ADAPTER_FAILOVER_RETRY_SECONDS
+        self.adapters = []
+        self.health = {}
+        # adapter -> 外した時刻(monotonic)
+        self.failed = {}
+        # MACアドレス -> {adapter: (rssi, 観測時刻)}
+        self.rssi = {}
+        # device_id -> adapter
+        self.assignment = {}
+        self.update_adapters(adapters or [config.BLE_DEFAULT_ADAPTER])
+
+    def update_adapters(self, adapters):
+        """アダプタの増減（USBドングルの抜き差し）を反映する"""
+        if not adapters:
+            return
+        for adapter in adapters:
+            if adapter not in self.health:
+                self.health[adapter] = AdapterHealthMonitor(adapter=adapter)
+                logger.info(f"Bluetoothアダプタ {adapter} を使用します")
+        for adapter in set(self.adapters) - set(adapters):
+            logger.warning(f"Bluetoothアダプタ {adapter} が見つからなくなりました。割り当てられたデバイスを移します")
+            self.failed.pop(adapter, None)
+            del self.health[adapter]
+            self.assignment = {device_id: assigned for device_id, assigned in self.assignment.items() if assigned != adapter}
+        self.adapters = list(adapters)
+
+    def bleak_kwargs(self, adapter):
+        """BleakScanner / BleakClient に渡す引数。アダプタが1つだけならシステムの既定のアダプタを使う"""
+        if adapter is None or len(self.adapters) <= 1:
+            return {}
+        return {'adapter': adapter}
+
+    def available(self, now=None):
+        """使用可能なアダプタ。外してから failover_retry_seconds が経ったアダプタは戻す"""
+        now = time.monotonic() if now is None else now
+        for adapter, failed_at in list(self.failed.items()):
+            if now - failed_at >= self.failover_retry_seconds:
+                del self.failed[adapter]
+                self.health[adapter].reset()
+                logger.info(f"Bluetoothアダプタ {adapter} をポーリングに戻します")
+        return [adapter for adapter in self.adapters if adapter not in self.failed]
+
+    def mark_failed(self, adapter, reason=None, now=None):
+        """アダプタを外し、そのデバイスを他のアダプタに移す"""
+        if adapter in self.failed:
+            return
+        self.failed[adapter] = time.monotonic() if now is None else now
+        moved = [device_id for device_id, assigned in self.assignment.items() if assigned == adapter]
+        for device_id in moved:
+            del self.assignment[device_id]
+        logger.warning(
+            f"Bluetoothアダプタ {adapter} に異常があるため {self.failover_retry_seconds}秒間外し、"
+            f"{len(moved)}台のデバイスを他のアダプタに移します: {reason}"
+        )
+
+    def unhealthy_adapters(self, active_by_adapter=None, now=None):
+        """使用中のアダプタのうち、アダプタ全体の異常と判定されたもの (adapter, 理由) のリスト"""
+        active_by_adapter = active_by_adapter or {}
+        unhealthy = []
+        for adapter in self.available(now):
+            status, reason = self.health[adapter].status(active_by_adapter.get(adapter))
+            if status == UNHEALTHY:
+                unhealthy.append((adapter, reason))
+        return unhealthy
+
+    def mark_restarted(self):
+        """Bluetoothサービスを再起動した後に、すべてのアダプタを使用可能に戻す"""
+        self.failed.clear()
+        for health in self.health.values():
+            health.mark_restarted()
+
+    def record_rssi(self, address, adapter, rssi, now=None):
+        if address is None or rssi is None or adapter is None:
+            return
+        now = time.monotonic() if now is None else now
+        self.rssi.setdefault(address.upper(), {})[adapter] = (rssi, now)
+
+    def adapter_for(self, device, now=None):
+        """デバイスをポーリングするアダプタを決める。使えるアダプタがなければNone"""
+        now = time.monotonic() if now is None else now
+        available = self.available(now)
+        if not available:
+            return None
+        device_id = device['device_id']
+        mac_address = (device.get('mac_address') or '').upper()
+
+        mapped = self.mapping.get(str(device_id).upper()) or self.mapping.get(mac_address)
+        if mapped in available:
+            return self._assign(device_id, mapped)
+
+        current = self.assignment.get(device_id)
+        if current not in available:
+            current = None
+
+        best = None
+        for adapter, (rssi, seen_at) in self.rssi.get(mac_address, {}).items():
+            if adapter in available and now - seen_at <= self.rssi_ttl_seconds:
+                if best is None or rssi > best[1]:
+                    best = (adapter, rssi)
+        if best is not None:
+            if current is None:
+                return self._assign(device_id, best[0])
+            current_rssi = self.rssi.get(mac_address, {}).get(current)
+            # 現在のアダプタで受信できていない、または十分に強いアダプタがあれば移す
+            if current_rssi is None or now - current_rssi[1] > self.rssi_ttl_seconds \
+                    or best[1] >= current_rssi[0] + self.rssi_margin:
+                return self._assign(device_id, best[0])
+            return current
+
+        if current is not None:
+            return current
+        load = {adapter: 0 for adapter in available}
+        for assigned in self.assignment.values():
+            if assigned in load:
+                load[assigned] += 1
+        return self._assign(device_id, min(available, key=lambda adapter: (load[adapter], available.index(adapter))))
+
+    def _assign(self, device_id, adapter):
+        previous = self.assignment.get(device_id)
+        if previous != adapter:
+            self.assignment[device_id] = adapter
+            if previous is not None:
+                logger.info(f"[{device_id}] アダプタを {previous} から {adapter} に切り替えます")
+        return adapter
@@ -3,13 +3,14 @@
 import asyncio
 import logging
 import struct
+import time
 from pathlib import Path
-from datetime import datetime
 from functools import wraps
 from bleak import BleakClient, BleakScanner
 from bleak.exc import BleakError
 
 import config
+from sensor_payloads import detect_sensor_layout, format_reading, TIME_DATA_LAYOUTS
 
 # --- UUID定義 ---
 PLANT_SERVICE_UUID = config.TARGET_SERVICE_UUID
@@ -22,27 +23,34 @@ SWITCHBOT_COMMON_SERVICE_UUID = "0000fd3d-0000-1000-8000-00805f9b34fb"
 CMD_GET_SENSOR_DATA = 0x01
 CMD_GET_SYSTEM_STATUS = 0x02
 CMD_SET_PLANT_PROFILE = 0x03
+CMD_GET_TIME_DATA = 0x0A
 CMD_GET_PLANT_PROFILE = 0x0C
 CMD_CONTROL_LED = 0x18
 
-# Ensure log directory exists
-config.LOG_FILE_PATH = "/var/log/plant_dashboard/bluetooth_manager.log"
+# Bluetoothデーモンのログ出力先
+BLE_MANAGER_LOG_PATH = "/var/log/plant_dashboard/bluetooth_manager.log"
 #config.DEBUG = True
 
-log_dir = Path(config.LOG_FILE_PATH).parent
-log_dir.mkdir(parents=True, exist_ok=True)
-
-logging.basicConfig(
-    level=config.LOG_LEVEL,
-    format='%(asctime)s - [Ble_Manager] - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(config.LOG_FILE_PATH),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
+def configure_logging(log_path=BLE_MANAGER_LOG_PATH):
+    """
+    Bluetoothマネージャーのログを log_path にも出力する。
+    以前はimport時にlogging.basicConfigを実行していたが、Webアプリなど他のプロセスのログ設定を
+    上書きしてしまうため、このモジュールのロガーにだけハンドラーを追加する。
+    ルートロガーへの出力（デーモン自身のログ設定）はそのまま残る。
+    """
+    Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+    log_path = str(Path(log_path).resolve())
+    logger.setLevel(config.LOG_LEVEL)
+    if any(isinstance(h, logging.FileHandler) and h.baseFilename == log_path for h in logger.handlers):
+        return
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - [Ble_Manager] - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+
+
 def retry_on_failure(max_attempts=None, delay=None, exceptions=(BleakError, asyncio.TimeoutError)):
     """
     BLE操作の失敗時に自動リトライを行うデコレーター
@@ -84,267 +92,85 @@ def retry_on_failure(max_attempts=None, delay=None, exceptions=(BleakError, asyn
         return wrapper
     return decorator
 
-def _parse_tm_data_t(data, offset):
-    """tm_data_t構造体をパース (36バイト)"""
-    tm_format = "<9i"  # 9個のint (tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year, tm_wday, tm_yday, tm_isdst)
-    tm_size = struct.calcsize(tm_format)
-    tm_values = struct.unpack_from(tm_format, data, offset)
-
-    tm_dict = {
-        'tm_sec': tm_values[0],
-        'tm_min': tm_values[1],
-        'tm_hour': tm_values[2],
-        'tm_mday': tm_values[3],
-        'tm_mon': tm_values[4],
-        'tm_year': tm_values[5],
-        'tm_wday': tm_values[6],
-        'tm_yday': tm_values[7],
-        'tm_isdst': tm_values[8],
-    }
-
-    return tm_dict, offset + tm_size
-
-
-def _parse_sensor_common(payload, device_id):
-    """
-    data_version 2/3 共通のセンサーデータをパースする (非packed、コンパイラパディングあり)。
-    soil_temperature[4] + soil_temperature_count + soil_moisture_capacitance[4] まで読み取る。
-    soil_temperature_count に基づき、存在しないセンサーの値は None にする。
-
-    メモリレイアウト (soil_data_t, 非packed):
-      offset  0: uint8_t  data_version         (1B + 3B padding)
-      offset  4: struct tm datetime             (36B)
-      offset 40: float    lux, temperature, humidity, soil_moisture (16B)
-      offset 56: bool     sensor_error          (1B + 3B padding)
-      offset 60: float    soil_temperature[4]   (16B)
-      offset 76: uint8_t  soil_temperature_count(1B + 3B padding)
-      offset 80: float    soil_moisture_cap[4]  (16B)
-      offset 96: (v3のみ: ext_temperature, ext_temperature_valid)
-    共通部分合計: 96バイト
-
-    Args:
-        payload: ペイロードデータ
-        device_id: ログ出力用のデバイスID
-
-    Returns:
-        tuple: (sensor_data_dict, offset) - 共通部分のデータと次のオフセット
-
-    Raises:
-        struct.error: データ解析エラー
-    """
-    # 共通部分の最小サイズ: 96バイト
-    if len(payload) < 96:
-        raise struct.error(f"ペイロードが短すぎます: {len(payload)} バイト (期待: 96以上)")
-
-    logger.debug(f"[{device_id}] ペイロード長: {len(payload)} バイト")
-    logger.debug(f"[{device_id}] ペイロード(hex): {payload[:104].hex() if len(payload) >= 104 else payload.hex()}")
-
-    offset = 0
-    # offset 0: data_version (uint8_t) + 3バイトパディング
-    data_version = struct.unpack_from("<B", payload, offset)[0]
-    logger.debug(f"   offset {offset} (0x{offset:02x}): data_version = {data_version}")
-    offset += 4  # 1B + 3B padding
-
-    # offset 4: datetime (struct tm = 9 x int32 = 36バイト)
-    datetime_dict, offset = _parse_tm_data_t(payload, offset)
-    logger.debug(f"   offset after tm_data_t: {offset} (0x{offset:02x})")
-
-    # offset 40: lux, temperature, humidity, soil_moisture (4 floats = 16バイト)
-    lux, temperature, humidity, soil_moisture = struct.unpack_from("<4f", payload, offset)
-    logger.debug(f"   offset {offset} (0x{offset:02x}): lux={lux}, temp={temperature}, hum={humidity}, soil_moist={soil_moisture}")
-    offset += 16
-
-    # offset 56: sensor_error (bool 1B) + 3バイトパディング
-    sensor_error = struct.unpack_from("<B", payload, offset)[0]
-    logger.debug(f"   offset {offset} (0x{offset:02x}): sensor_error = {sensor_error}")
-    offset += 4  # 1B + 3B padding
-
-    # offset 60: soil_temperature[4] (4 floats = 16バイト)
-    soil_temps_raw = struct.unpack_from("<4f", payload, offset)
-    logger.debug(f"   offset {offset} (0x{offset:02x}): soil_temps_raw={soil_temps_raw}")
-    offset += 16
-
-    # offset 76: soil_temperature_count (uint8_t) + 3バイトパディング
-    soil_temperature_count = struct.unpack_from("<B", payload, offset)[0]
-    logger.debug(f"   offset {offset} (0x{offset:02x}): soil_temperature_count = {soil_temperature_count}")
-    offset += 4  # 1B + 3B padding
-
-    # offset 80: soil_moisture_capacitance[4] (4 floats = 16バイト)
-    soil_moisture_capacitance = struct.unpack_from("<4f", payload, offset)
-    logger.debug(f"   offset {offset} (0x{offset:02x}): capacitance={soil_moisture_capacitance}")
-    offset += 16
-    # offset 96: 共通部分終了
-
-    # soil_temperature_count に基づき、存在しないセンサーの値を None にする
-    soil_temps = [
-        soil_temps_raw[i] if i < soil_temperature_count else None
-        for i in range(4)
-    ]
-
-    # datetimeオブジェクト作成
-    try:
-        dt = datetime(datetime_dict['tm_year'] + 1900, datetime_dict['tm_mon'] + 1, datetime_dict['tm_mday'], datetime_dict['tm_hour'], datetime_dict['tm_min'], datetime_dict['tm_sec'])
-        dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-    except (ValueError, OverflowError) as e:
-        logger.warning(f"[{device_id}] 無効な日時データ: {e}. デフォルト値を使用します")
-        dt_str = "1970-01-01 00:00:00"
-
-    logger.info(f"[{device_id}] Parsed datetime: {dt_str}")
-
-    sensor_data = {
-        'data_version': data_version,
-        'datetime': dt_str,
-        'light_lux': lux,
-        'temperature': temperature,
-        'humidity': humidity,
-        'soil_moisture': soil_moisture,
-        'sensor_error': bool(sensor_error),
-        'soil_temperature1': soil_temps[0],
-        'soil_temperature2': soil_temps[1],
-        'soil_temperature3': soil_temps[2],
-        'soil_temperature4': soil_temps[3],
-        'soil_temperature_count': soil_temperature_count,
-        'capacitance_ch1': soil_moisture_capacitance[0],
-        'capacitance_ch2': soil_moisture_capacitance[1],
-        'capacitance_ch3': soil_moisture_capacitance[2],
-        'capacitance_ch4': soil_moisture_capacitance[3],
-        'battery_level': None
-    }
-
-    return sensor_data, offset
-
-
-def _format_soil_temps_log(sensor_data):
-    """soil_temperature_countに基づいて土壌温度のログ文字列を生成"""
-    count = sensor_data['soil_temperature_count']
-    temps = [sensor_data[f'soil_temperature{i+1}'] for i in range(4)]
-    return ', '.join(
-        f'{temps[i]:.1f}' if i < count else 'N/A'
-        for i in range(4)
-    )
-
-
-def _parse_sensor_data_v2(payload, device_id):
-    """
-    data_version 2 のセンサーデータをパースする (Rev3用, 非packed)
-    共通部分96バイト: soil_temperature[4] + soil_temperature_count + soil_moisture_capacitance[4]
-
-    Args:
-        payload: ペイロードデータ
-        device_id: ログ出力用のデバイスID
-
-    Returns:
-        dict: センサーデータ辞書
-    """
-    sensor_data, offset = _parse_sensor_common(payload, device_id)
-    sensor_data['data_version'] = 2
-
-    caps = [sensor_data['capacitance_ch1'], sensor_data['capacitance_ch2'],
-            sensor_data['capacitance_ch3'], sensor_data['capacitance_ch4']]
-
-    logger.info(
-        f"[{device_id}] v2データ解析完了: "
-        f"temp={sensor_data['temperature']:.1f}°C, humidity={sensor_data['humidity']:.1f}%, "
-        f"soil_temps=[{_format_soil_temps_log(sensor_data)}]°C "
-        f"(count={sensor_data['soil_temperature_count']}), "
-        f"cap=[{', '.join(f'{c:.1f}' for c in caps)}]pF"
-    )
-
-    logger.debug(f"   final offset: {offset} (0x{offset:02x}) / {len(payload)}")
-    return sensor_data
-
-
-# soil_data_v3 合計サイズ: 104バイト (共通96B + ext_temperature 4B + ext_temperature_valid 1B + 3B padding)
-SOIL_DATA_V3_SIZE = 104
-
-
-def _parse_sensor_data_v3(payload, device_id):
-    """
-    data_version 3 のセンサーデータをパースする (Rev4用, 非packed)
-    共通部分96バイト + ext_temperature (DS18B20) + ext_temperature_valid + padding = 104バイト
-
-    メモリレイアウト (v3追加分):
-      offset 96: float    ext_temperature       (4B)
-      offset100: bool     ext_temperature_valid  (1B + 3B padding)
-      合計: 104バイト
-
-    Args:
-        payload: ペイロードデータ
-        device_id: ログ出力用のデバイスID
-
-    Returns:
-        dict: センサーデータ辞書
-    """
-    if len(payload) < SOIL_DATA_V3_SIZE:
-        raise struct.error(f"v3ペイロードが短すぎます: {len(payload)} バイト (期待: {SOIL_DATA_V3_SIZE})")
-
-    sensor_data, offset = _parse_sensor_common(payload, device_id)
-    sensor_data['data_version'] = 3
-
-    # offset 96: 拡張温度 (DS18B20) - float (4バイト)
-    ext_temperature = struct.unpack_from("<f", payload, offset)[0]
-    logger.debug(f"   offset {offset} (0x{offset:02x}): ext_temperature = {ext_temperature}")
-    offset += 4
+# --- コマンド/レスポンスヘッダー ---
+# センサーデータのペイロードレイアウトは sensor_payloads のレジストリで data_version ごとに定義している。
+COMMAND_HEADER = struct.Struct('<BBH')    # command_id, sequence_num, data_length
+RESPONSE_HEADER = struct.Struct('<BBBH')  # response_id, status_code, sequence_num, data_length
+TIME_DATA_REQUEST = struct.Struct('<9i')  # time_data_request_t (struct tm)
 
-    # offset 100: 拡張温度有効性フラグ - bool (1バイト) + 3バイトパディング
-    ext_temperature_valid = struct.unpack_from("<B", payload, offset)[0]
-    logger.debug(f"   offset {offset} (0x{offset:02x}): ext_temperature_valid = {ext_temperature_valid}")
-    offset += 4  # 1B + 3B padding → 合計104バイト
 
-    sensor_data['ex_temperature'] = ext_temperature if ext_temperature_valid else None
-    sensor_data['ext_temperature_valid'] = bool(ext_temperature_valid)
+def _log_payload_debug(device_id, payload):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"[{device_id}] ペイロード長: {len(payload)} バイト")
+        logger.debug(f"[{device_id}] ペイロード(hex): {bytes(payload).hex()}")
 
-    caps = [sensor_data['capacitance_ch1'], sensor_data['capacitance_ch2'],
-            sensor_data['capacitance_ch3'], sensor_data['capacitance_ch4']]
-
-    logger.info(
-        f"[{device_id}] v3データ解析完了: "
-        f"temp={sensor_data['temperature']:.1f}°C, humidity={sensor_data['humidity']:.1f}%, "
-        f"soil_temps=[{_format_soil_temps_log(sensor_data)}]°C "
-        f"(count={sensor_data['soil_temperature_count']}), "
-        f"cap=[{', '.join(f'{c:.1f}' for c in caps)}]pF, "
-        f"ext_temp={'%.1f' % ext_temperature if ext_temperature_valid else 'N/A'}°C"
-    )
-
-    logger.debug(f"   final offset: {offset} (0x{offset:02x}) / {len(payload)}")
-    return sensor_data
 
 class PlantDeviceBLE:
     """
     プラントモニターデバイスとのBLE通信を管理するクラス。
     """
-    def __init__(self, mac_address, device_id):
+    def __init__(self, mac_address, device_id, health=None, adapter=None):
         self.mac_address = mac_address
         self.device_id = device_id
-        self.client = BleakClient(mac_address)
+        # 使用するBluetoothアダプタ (hci0, hci1, ...)。Noneならシステムの既定のアダプタ
+        self.adapter = adapter
+        self.adapter_kwargs = {'adapter': adapter} if adapter else {}
+        self.client = BleakClient(mac_address, **self.adapter_kwargs)
         self.is_connected = False
         self.sequence_num = 0
+        # スキャン・接続の結果を記録する adapter_health.AdapterHealthMonitor（任意）
+        self.health = health
+        # 直近のスキャンで受信したRSSI（アダプタの割り当てに使う）
+        self.last_rssi = None
 
     async def connect(self):
         """デバイスへの接続を試みる"""
         logger.info(f"[{self.device_id}] {self.mac_address} への接続を試みています...")
+        target = self.mac_address.upper()
+        seen_count = 0
+
+        def match(device, advertisement_data):
+            # 対象以外も含めて受信したアドバタイズを数える（0件ならアダプタの異常を疑う）
+            nonlocal seen_count
+            seen_count += 1
+            if device.address.upper() != target:
+                return False
+            if advertisement_data is not None:
+                self.last_rssi = advertisement_data.rssi
+            return True
+
+        stage = 'scan'
+        started = time.monotonic()
         try:
-            device = await BleakScanner.find_device_by_address(
-                self.mac_address,
-                timeout=config.BLE_SCAN_TIMEOUT
-            )
+            device = await BleakScanner.find_device_by_filter(match, timeout=config.BLE_SCAN_TIMEOUT, **self.adapter_kwargs)
+            if self.health:
+                self.health.record_scan(time.monotonic() - started, seen_count)
             if device is None:
                 logger.error(
                     f"[{self.device_id}] スキャン中にアドレス {self.mac_address} のデバイスが見つかりませんでした "
-                    f"(タイムアウト: {config.BLE_SCAN_TIMEOUT}秒)"
+                    f"(タイムアウト: {config.BLE_SCAN_TIMEOUT}秒, 受信したアドバタイズ: {seen_count}件)"
                 )
                 self.is_connected = False
                 return False
 
             logger.info(f"[{self.device_id}] デバイスが見つかりました。接続を開始します。")
+            stage = 'connect'
+            started = time.monotonic()
             await self.client.connect(timeout=config.BLE_CONNECT_TIMEOUT)
             self.is_connected = self.client.is_connected
+            if self.health:
+                self.health.record_connect(self.device_id, time.monotonic() - started, self.is_connected)
             if self.is_connected:
                 logger.info(f"[{self.device_id}] 接続に成功しました。")
             else:
                 logger.warning(f"[{self.device_id}] 接続の試行に失敗しました。")
             return self.is_connected
         except (BleakError, asyncio.TimeoutError) as e:
+            if self.health:
+                if stage == 'scan':
+                    self.health.record_scan(time.monotonic() - started, seen_count, error=e)
+                else:
+                    self.health.record_connect(self.device_id, time.monotonic() - started, False, error=e)
             logger.error(
                 f"[{self.device_id}] 接続に失敗しました "
                 f"(タイムアウト: {config.BLE_CONNECT_TIMEOUT}秒): {e}"
@@ -398,7 +224,7 @@ class PlantDeviceBLE:
             await self.client.start_notify(RESPONSE_CHAR_UUID, notification_handler)
 
             self.sequence_num = (self.sequence_num + 1) % 256
-            command_packet = struct.pack('<BBH', CMD_GET_SYSTEM_STATUS, self.sequence_num, 0)
+            command_packet = COMMAND_HEADER.pack(CMD_GET_SYSTEM_STATUS, self.sequence_num, 0)
 
             logger.debug(f"[{self.device_id}] Sending CMD_GET_SYSTEM_STATUS")
             await self.client.write_gatt_char(COMMAND_CHAR_UUID, command_packet)
@@ -409,7 +235,7 @@ class PlantDeviceBLE:
                  logger.warning(f"[{self.device_id}] Invalid system status response")
                  return None
             
-            resp_id, status_code, resp_seq, data_len = struct.unpack('<BBBH', received_data[:5])
+            resp_id, status_code, resp_seq, data_len = RESPONSE_HEADER.unpack_from(received_data)
             if status_code != 0:
                 logger.error(f"[{self.device_id}] CMD_GET_SYSTEM_STATUS error: {status_code}")
                 return None
@@ -463,7 +289,7 @@ class PlantDeviceBLE:
             await self.client.start_notify(RESPONSE_CHAR_UUID, notification_handler)
 
             self.sequence_num = (self.sequence_num + 1) % 256
-            command_packet = struct.pack('<BBH', CMD_GET_PLANT_PROFILE, self.sequence_num, 0)
+            command_packet = COMMAND_HEADER.pack(CMD_GET_PLANT_PROFILE, self.sequence_num, 0)
 
             logger.debug(f"[{self.device_id}] Sending CMD_GET_PLANT_PROFILE")
             await self.client.write_gatt_char(COMMAND_CHAR_UUID, command_packet)
@@ -473,7 +299,7 @@ class PlantDeviceBLE:
             if received_data is None or len(received_data) < 5:
                  return None
             
-            resp_id, status_code, resp_seq, data_len = struct.unpack('<BBBH', received_data[:5])
+            resp_id, status_code, resp_seq, data_len = RESPONSE_HEADER.unpack_from(received_data)
             if status_code != 0:
                 logger.error(f"[{self.device_id}] CMD_GET_PLANT_PROFILE error: {status_code}")
                 return None
@@ -542,7 +368,7 @@ class PlantDeviceBLE:
             )
 
             self.sequence_num = (self.sequence_num + 1) % 256
-            command_packet = struct.pack('<BBH', CMD_SET_PLANT_PROFILE, self.sequence_num, len(payload)) + payload
+            command_packet = COMMAND_HEADER.pack(CMD_SET_PLANT_PROFILE, self.sequence_num, len(payload)) + payload
 
             logger.info(f"[{self.device_id}] Sending CMD_SET_PLANT_PROFILE")
             await self.client.write_gatt_char(COMMAND_CHAR_UUID, command_packet)
@@ -619,7 +445,7 @@ class PlantDeviceBLE:
             self.sequence_num = (self.sequence_num + 1) % 256
             # ws2812_led_control_t構造体: red, green, blue (uint8_t), brightness (uint8_t), duration_ms (uint16_t)
             payload = struct.pack('<BBBHH', red, green, blue, brightness, duration_ms)
-            command_packet = struct.pack('<BBH', CMD_CONTROL_LED, self.sequence_num, len(payload)) + payload
+            command_packet = COMMAND_HEADER.pack(CMD_CONTROL_LED, self.sequence_num, len(payload)) + payload
 
             logger.info(
                 f"[{self.device_id}] LED制御コマンドを {COMMAND_CHAR_UUID} へ書き込み中: "
@@ -667,7 +493,8 @@ class PlantDeviceBLE:
 
         def notification_handler(sender: int, data: bytearray):
             nonlocal received_data
-            logger.debug(f"[{self.device_id}] Notification received from handle {sender}: {data.hex()}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[{self.device_id}] Notification received from handle {sender}: {data.hex()}")
             received_data = data
             notification_received.set()
 
@@ -676,9 +503,10 @@ class PlantDeviceBLE:
             await self.client.start_notify(RESPONSE_CHAR_UUID, notification_handler)
 
             self.sequence_num = (self.sequence_num + 1) % 256
-            command_packet = struct.pack('<BBH', CMD_GET_SENSOR_DATA, self.sequence_num, 0)
+            command_packet = COMMAND_HEADER.pack(CMD_GET_SENSOR_DATA, self.sequence_num, 0)
 
-            logger.debug(f"[{self.device_id}] {COMMAND_CHAR_UUID} へコマンドを送信: {command_packet.hex()}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[{self.device_id}] {COMMAND_CHAR_UUID} へコマンドを送信: {command_packet.hex()}")
             await self.client.write_gatt_char(COMMAND_CHAR_UUID, command_packet)
 
             logger.debug(
@@ -695,64 +523,37 @@ class PlantDeviceBLE:
                 logger.warning(f"[{self.device_id}] レスポンスヘッダーが短すぎます: {len(received_data)} バイト")
                 raise BleakError(f"レスポンスヘッダーが短すぎます: {len(received_data)} バイト")
 
-            resp_id, status_code, resp_seq, data_len = struct.unpack('<BBBH', received_data[:5])
+            resp_id, status_code, resp_seq, data_len = RESPONSE_HEADER.unpack_from(received_data)
 
-            logger.debug(f"[{self.device_id}] 解析されたヘッダー: ID={resp_id}, Status={status_code}, Seq={resp_seq}, Len={data_len}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"[{self.device_id}] 解析されたヘッダー: ID={resp_id}, Status={status_code}, Seq={resp_seq}, Len={data_len}")
 
             if resp_seq != self.sequence_num:
                 logger.warning(f"[{self.device_id}] シーケンス番号の不一致。期待値: {self.sequence_num}, 受信: {resp_seq}")
 
-            payload = received_data[5:]
+            # ヘッダー以降をコピーせずに参照する
+            payload = memoryview(received_data)[RESPONSE_HEADER.size:]
             if len(payload) != data_len:
                 logger.error(f"[{self.device_id}] ペイロード長の不一致。ヘッダー: {data_len}, 実際: {len(payload)}")
                 raise BleakError(f"ペイロード長の不一致: 期待 {data_len}, 実際 {len(payload)}")
 
-            # v1デバイス処理 (data_versionフィールドなし、固定56バイト)
-            if data_len == 56:
-                unpacked_data = struct.unpack('<9i4f?3x', payload)
-
-                tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year, tm_wday, tm_yday, tm_isdst, \
-                lux, temp, humidity, soil, error = unpacked_data
-
-                dt = datetime(tm_year + 1900, tm_mon + 1, tm_mday, tm_hour, tm_min, tm_sec)
-                dt_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-
-                sensor_data = {
-                    'data_version': 1,
-                    'datetime': dt_str,
-                    'light_lux': lux,
-                    'temperature': temp,
-                    'humidity': humidity,
-                    'soil_moisture': soil,
-                    'sensor_error': error,
-                    'battery_level': None
-                }
-
-                logger.info(f"[{self.device_id}] v1センサーデータの解析に成功: {sensor_data}")
-                return sensor_data
-
-            # v2/v3デバイス処理 (data_versionバイトで判別)
-            elif data_len > 70:
-                # 先頭バイトからdata_versionを読み取り
-                payload_data_version = struct.unpack_from("<B", payload, 0)[0]
-                logger.info(f"[{self.device_id}] data_version={payload_data_version} のデータを検出しました ({data_len}バイト)")
-
-                try:
-                    if payload_data_version == 3:
-                        sensor_data = _parse_sensor_data_v3(payload, self.device_id)
-                        logger.info(f"[{self.device_id}] v3センサーデータの解析に成功")
-                    else:
-                        sensor_data = _parse_sensor_data_v2(payload, self.device_id)
-                        logger.info(f"[{self.device_id}] v2センサーデータの解析に成功")
-                    return sensor_data
-                except struct.error as e:
-                    logger.error(f"[{self.device_id}] v{payload_data_version}データの解析に失敗: {e}")
-                    raise BleakError(f"v{payload_data_version}データ解析エラー: {e}")
-
-            else:
+            # v1は固定56バイト、v2以降は先頭のdata_versionバイトでレイアウトを判別する
+            layout = detect_sensor_layout(payload)
+            if layout is None:
                 logger.error(f"[{self.device_id}] サポートされていないペイロード長: {data_len}")
                 raise BleakError(f"サポートされていないペイロード長: {data_len}")
 
+            _log_payload_debug(self.device_id, payload)
+            try:
+                reading = layout.decode(payload, self.device_id)
+            except struct.error as e:
+                logger.error(f"[{self.device_id}] v{layout.data_version}データの解析に失敗: {e}")
+                raise BleakError(f"v{layout.data_version}データ解析エラー: {e}")
+
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"[{self.device_id}] v{layout.data_version}データ解析完了: {format_reading(reading)}")
+            return reading._asdict()
+
         except asyncio.TimeoutError as e:
             logger.error(
                 f"[{self.device_id}] 通知の待機中にタイムアウトしました "
@@ -765,7 +566,7 @@ class PlantDeviceBLE:
             self.is_connected = False
             raise
         except struct.error as e:
-            logger.error(f"[{self.device_id}] レスポンスデータの解析に失敗: {e}. ペイロード: {payload.hex() if 'payload' in locals() else 'N/A'}")
+            logger.error(f"[{self.device_id}] レスポンスデータの解析に失敗: {e}. ペイロード: {bytes(payload).hex() if 'payload' in locals() else 'N/A'}")
             raise BleakError(f"データ解析エラー: {e}")
         except Exception as e:
             logger.error(f"[{self.device_id}] get_sensor_data で予期しないエラーが発生: {e}", exc_info=True)
@@ -779,6 +580,93 @@ class PlantDeviceBLE:
             except Exception as e:
                 logger.warning(f"[{self.device_id}] 通知の停止に失敗しました: {e}")
 
+    async def get_time_data_batch(self, target_times, pipeline_depth=None):
+        """
+        指定時刻のデータをデバイス内の記録からまとめて取得する (CMD_GET_TIME_DATA = 0x0A)
+
+        1回の接続・通知購読のまま、最大 pipeline_depth 件のリクエストを応答を待たずに送信し、
+        応答はシーケンス番号で対応付ける。応答が BLE_OPERATION_TIMEOUT 秒途切れた場合は
+        残りを取得せずに終了する。
+
+        Args:
+            target_times: 取得する時刻 (datetime) のリスト
+            pipeline_depth: 同時に応答待ちにするリクエスト数 (既定: config.BACKFILL_PIPELINE_DEPTH)
+
+        Returns:
+            list: (target_time, データ辞書 or None) のリスト (target_timesと同じ順)。
+                  データ辞書の 'datetime' はデバイスが返した記録の実際の時刻
+        """
+        if not await self.ensure_connection():
+            raise BleakError(f"デバイス {self.device_id} への接続を確立できませんでした")
+
+        depth = max(1, pipeline_depth or config.BACKFILL_PIPELINE_DEPTH)
+        results = [None] * len(target_times)
+        responses = asyncio.Queue()
+
+        def notification_handler(sender: int, data: bytearray):
+            responses.put_nowait(bytes(data))
+
+        await self.client.start_notify(RESPONSE_CHAR_UUID, notification_handler)
+        try:
+            in_flight = {}  # sequence_num -> target_timesの添字
+            next_index = 0
+            while next_index < len(target_times) or in_flight:
+                # 応答待ちが depth 件になるまでリクエストを送信する
+                while next_index < len(target_times) and len(in_flight) < depth:
+                    # Pythonのtimetupleをstruct tmの表現 (月・曜日・年内日数は0始まり、曜日は日曜=0) に変換
+                    tm = target_times[next_index].timetuple()
+                    body = TIME_DATA_REQUEST.pack(
+                        tm.tm_sec, tm.tm_min, tm.tm_hour, tm.tm_mday, tm.tm_mon - 1, tm.tm_year - 1900,
+                        (tm.tm_wday + 1) % 7, tm.tm_yday - 1, tm.tm_isdst
+                    )
+                    self.sequence_num = (self.sequence_num + 1) % 256
+                    await self.client.write_gatt_char(
+                        COMMAND_CHAR_UUID,
+                        COMMAND_HEADER.pack(CMD_GET_TIME_DATA, self.sequence_num, len(body)) + body
+                    )
+                    in_flight[self.sequence_num] = next_index
+                    next_index += 1
+
+                try:
+                    data = await asyncio.wait_for(responses.get(), timeout=config.BLE_OPERATION_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"[{self.device_id}] CMD_GET_TIME_DATAの応答がありません。"
+                        f"{len(in_flight) + len(target_times) - next_index} 件を未取得のまま終了します"
+                    )
+                    break
+
+                if len(data) < RESPONSE_HEADER.size:
+                    continue
+                resp_id, status_code, resp_seq, data_len = RESPONSE_HEADER.unpack_from(data)
+                if resp_id != CMD_GET_TIME_DATA or resp_seq not in in_flight:
+                    logger.debug(f"[{self.device_id}] 対応するリクエストのない応答を無視します: ID={resp_id}, Seq={resp_seq}")
+                    continue
+                index = in_flight.pop(resp_seq)
+                if status_code != 0:
+                    # 指定時刻の記録がデバイスにない
+                    continue
+
+                payload = memoryview(data)[RESPONSE_HEADER.size:]
+                layout = TIME_DATA_LAYOUTS.get(payload[0]) if len(payload) else None
+                if layout is None:
+                    logger.warning(f"[{self.device_id}] 未対応の時間指定データです: {len(payload)} バイト")
+                    continue
+                try:
+                    results[index] = layout.decode(payload, self.device_id)._asdict()
+                except struct.error as e:
+                    logger.warning(f"[{self.device_id}] 時間指定データの解析に失敗: {e}")
+        finally:
+            try:
+                if self.client.is_connected:
+                    await self.client.stop_notify(RESPONSE_CHAR_UUID)
+            except Exception as e:
+                logger.warning(f"[{self.device_id}] 通知の停止に失敗しました: {e}")
+
+        received = sum(1 for reading in results if reading is not None)
+        logger.info(f"[{self.device_id}] 時間指定データを {received}/{len(target_times)} 件取得しました")
+        return list(zip(target_times, results))
+
 
 def _parse_switchbot_adv_data(address, adv_data):
     """SwitchBotのAdvertisingデータを解析する内部ヘルパー関数"""
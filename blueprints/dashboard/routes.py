@@ -1,12 +1,19 @@
-from flask import Blueprint, render_template, request, jsonify, Response, abort, current_app, url_for
-from datetime import date, timedelta
+from flask import Blueprint, render_template, request, jsonify, Response, abort, current_app, url_for, stream_with_context
+from werkzeug.http import is_resource_modified
+from datetime import date, datetime, timedelta, timezone
+import hashlib
+from itertools import chain, groupby
 import json
 import os
 import time
 import uuid
-import httpx
 import logging
+import config
 import device_manager as dm
+from database import get_request_db
+from history_cache import get_history_cache
+from lib.downsample import downsample_rows
+from lib.history_format import HISTORY_FORMATS, compress, gzip_stream, json_dumps, to_columnar
 from functools import wraps
 
 logger = logging.getLogger(__name__)
@@ -33,6 +40,36 @@ def requires_auth(f):
     return decorated
 
 # --- データ取得関数 ---
+def apply_live_alert_status(conn, managed_plant_id, analysis):
+    """
+    当日表示の場合、分析デーモンがストリーミング判定した最新のアラート状態で
+    survival_limit_statusを上書きする（日次分析の実行を待たずに反映するため）。
+    """
+    alert_state = conn.execute(
+        "SELECT alert_status FROM plant_alert_state WHERE managed_plant_id = ?",
+        (managed_plant_id,)
+    ).fetchone()
+    if alert_state:
+        analysis['survival_limit_status'] = alert_state['alert_status']
+    return analysis
+
+SOIL_SENSOR_FIELDS = (
+    'temperature', 'humidity', 'light_lux', 'soil_moisture',
+    'soil_temperature1', 'soil_temperature2', 'soil_temperature3', 'soil_temperature4',
+    'capacitance_ch1', 'capacitance_ch2', 'capacitance_ch3', 'capacitance_ch4',
+    'timestamp'
+)
+ENVIRONMENT_SENSOR_FIELDS = ('temperature', 'humidity', 'timestamp')
+
+def _latest_sensor_values(conn, device_id, until, battery_levels, fields):
+    """sensor_latest経由で指定日時点の最新値を取得し、表示に必要な項目とバッテリー残量を返す"""
+    row = dm.get_latest_sensor_row(conn, device_id, until)
+    if row is None:
+        return None
+    values = {field: row[field] for field in fields}
+    values['battery_level'] = battery_levels.get(device_id)
+    return values
+
 def get_plant_centric_data(selected_date_str):
     """
     管理されている植物を中心としたダッシュボード用のデータを集約して取得する。
@@ -50,6 +87,8 @@ def get_plant_centric_data(selected_date_str):
         ORDER BY mp.plant_name
     """).fetchall()
 
+    battery_levels = {r['device_id']: r['battery_level'] for r in conn.execute("SELECT device_id, battery_level FROM devices")}
+
     dashboard_data = []
     for row in managed_plants_rows:
         plant_data = dict(row)
@@ -63,6 +102,8 @@ def get_plant_centric_data(selected_date_str):
             ORDER BY analysis_date DESC LIMIT 1
         """, (plant_data['managed_plant_id'], selected_date_str)).fetchone()
         plant_data['analysis'] = dict(analysis) if analysis else {}
+        if selected_date_str == date.today().isoformat():
+            apply_live_alert_status(conn, plant_data['managed_plant_id'], plant_data['analysis'])
 
         # センサーデータを取得
         plant_data['sensors'] = {}
@@ -70,30 +111,19 @@ def get_plant_centric_data(selected_date_str):
 
         # 土壌センサーが割り当てられている場合、それを最優先
         if plant_data['assigned_plant_sensor_id']:
-            sensor_data = conn.execute("""
-                SELECT s.temperature, s.humidity, s.light_lux, s.soil_moisture,
-                       s.soil_temperature1, s.soil_temperature2,
-                       s.soil_temperature3, s.soil_temperature4,
-                       s.capacitance_ch1, s.capacitance_ch2,
-                       s.capacitance_ch3, s.capacitance_ch4,
-                       d.battery_level, s.timestamp
-                FROM sensor_data s JOIN devices d ON s.device_id = d.device_id
-                WHERE s.device_id = ? AND s.timestamp <= ?
-                ORDER BY s.timestamp DESC LIMIT 1
-            """, (plant_data['assigned_plant_sensor_id'], end_of_day_str)).fetchone()
+            sensor_data = _latest_sensor_values(
+                conn, plant_data['assigned_plant_sensor_id'], end_of_day_str, battery_levels, SOIL_SENSOR_FIELDS
+            )
             plant_data['sensors']['source'] = 'soil_sensor'
 
         # 土壌センサーのデータがない、または割り当てられていない場合、環境センサーをフォールバックとして使用
         if not sensor_data and plant_data['assigned_switchbot_id']:
-            sensor_data = conn.execute("""
-                SELECT s.temperature, s.humidity, d.battery_level, s.timestamp
-                FROM sensor_data s JOIN devices d ON s.device_id = d.device_id
-                WHERE s.device_id = ? AND s.timestamp <= ?
-                ORDER BY s.timestamp DESC LIMIT 1
-            """, (plant_data['assigned_switchbot_id'], end_of_day_str)).fetchone()
+            sensor_data = _latest_sensor_values(
+                conn, plant_data['assigned_switchbot_id'], end_of_day_str, battery_levels, ENVIRONMENT_SENSOR_FIELDS
+            )
             plant_data['sensors']['source'] = 'environment_sensor'
         
-        plant_data['sensors']['primary'] = dict(sensor_data) if sensor_data else {}
+        plant_data['sensors']['primary'] = sensor_data or {}
         
         dashboard_data.append(plant_data)
         
@@ -114,7 +144,7 @@ def dashboard():
 
     is_today = (selected_date == date.today())
     
-    conn = dm.get_db_connection()
+    conn = get_request_db(readonly=True)
 
     # SQLクエリを修正し、COALESCEを使用して表示用URLを決定する
     plant_list_query = """
@@ -142,30 +172,28 @@ def dashboard():
         # 最新のセンサーデータを取得
         sensor_data = conn.execute("""
             SELECT temperature, humidity, light_lux, soil_moisture, soil_temperature1, soil_temperature2
-            FROM sensor_data
+            FROM sensor_latest
             WHERE device_id = (SELECT assigned_plant_sensor_id FROM managed_plants WHERE managed_plant_id = ?)
-            ORDER BY timestamp DESC
-            LIMIT 1
         """, (plant_dict['managed_plant_id'],)).fetchone()
         plant_dict['sensors'] = {'primary': dict(sensor_data) if sensor_data else {}}
 
         # 最新の分析データを取得
         analysis = conn.execute("""
-            SELECT growth_period, watering_advice, watering_status
+            SELECT growth_period, watering_advice, watering_status, survival_limit_status
             FROM daily_plant_analysis
             WHERE managed_plant_id = ? AND analysis_date <= ?
             ORDER BY analysis_date DESC
             LIMIT 1
         """, (plant_dict['managed_plant_id'], selected_date)).fetchone()
         plant_dict['analysis'] = dict(analysis) if analysis else {}
+        if is_today:
+            apply_live_alert_status(conn, plant_dict['managed_plant_id'], plant_dict['analysis'])
         
         plants_data.append(plant_dict)
 
     # グラフ表示用のSwitchBotデバイスを取得
     switchbots_for_chart = conn.execute("SELECT device_id, device_name FROM devices WHERE device_type LIKE 'switchbot_%'").fetchall()
 
-    conn.close()
-
     return render_template('dashboard.html',
                            plants_data=plants_data,
                            switchbots_for_chart=switchbots_for_chart,
@@ -176,7 +204,7 @@ def dashboard():
 @requires_auth
 def plant_detail(managed_plant_id):
     """個別の植物詳細ページを表示する"""
-    conn = dm.get_db_connection()
+    conn = get_request_db(readonly=True)
 
     # プラントの基本情報を取得 (managed_plants.image_urlを優先)
     plant_info_query = """
@@ -192,7 +220,6 @@ def plant_detail(managed_plant_id):
     plant_row = conn.execute(plant_info_query, (managed_plant_id,)).fetchone()
 
     if plant_row is None:
-        conn.close()
         abort(404, description="Plant not found")
         
     today_str = date.today().isoformat()
@@ -211,8 +238,6 @@ def plant_detail(managed_plant_id):
         ORDER BY analysis_date DESC
     """, (managed_plant_id,)).fetchall()
 
-    conn.close()
-
     if plant is None:
         abort(404, description="Plant data could not be loaded")
 
@@ -223,71 +248,154 @@ def plant_detail(managed_plant_id):
                            today_date=today_str)
 
 
-@dashboard_bp.route('/api/history/<device_id>')
-@requires_auth
-def api_history(device_id):
-    """デバイスの履歴データと、関連する植物の閾値を返すAPI"""
-    period = request.args.get('period', '24h')
+# --- 履歴APIの条件付きレスポンス ---
+# 期間ごとの開始日（終了日から遡る日数）。SQLの集計期間を含むように余裕を持たせる
+HISTORY_PERIOD_DAYS = {'24h': 0, '7d': 7, '30d': 31, '1y': 366}
+# max_points 指定時に形を保つ対象の列
+HISTORY_DOWNSAMPLE_KEYS = [
+    'temperature', 'humidity', 'light_lux', 'soil_moisture', 'soil_temperature1', 'soil_temperature2',
+    'capacitance_ch1', 'capacitance_ch2', 'capacitance_ch3', 'capacitance_ch4',
+]
+
+# 閾値の編集・一括取り込み・再分析・デバイス削除で過去の期間も変わるため、期間によらず
+# 毎回ETagで再検証させる（sensor_completeness により版の確認は軽い）
+HISTORY_CACHE_CONTROL = "private, no-cache"
+
+def history_validators(version, *parts):
+    """
+    データの版 (件数, 最終更新日時) とレスポンスに影響するその他の値から
+    (ETag, Last-Modified, Cache-Control) を作る。
+    """
+    count, updated_at = version
+    etag = hashlib.sha1(json.dumps([count, updated_at, *parts], sort_keys=True, default=str).encode()).hexdigest()
+    last_modified = None
+    if updated_at:
+        # DBの日時はサーバーのローカル時刻
+        last_modified = datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S").astimezone(timezone.utc)
+    return etag, last_modified, HISTORY_CACHE_CONTROL
+
+def is_not_modified(validators):
+    """リクエストの If-None-Match / If-Modified-Since が現在の版と一致するか"""
+    etag, last_modified, _ = validators
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+def with_validators(response, validators):
+    etag, last_modified, cache_control = validators
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def not_modified_response(validators):
+    return with_validators(Response(status=304), validators)
+
+def history_response(body, validators):
+    """履歴APIのJSON本文をレスポンスにする（gzipに対応していれば圧縮する）"""
+    response = Response(body, mimetype='application/json')
+    if request.accept_encodings['gzip']:
+        compressed = compress(body)
+        if compressed is not None:
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return with_validators(response, validators)
+
+
+def parse_history_options():
+    """履歴APIの共通パラメータ (date, max_points, format) を読む"""
     end_date_str = request.args.get('date', date.today().isoformat())
-    
-    conn = dm.get_db_connection()
+    try:
+        end_date = date.fromisoformat(end_date_str)
+    except ValueError:
+        abort(400, description="Invalid date")
+    max_points = request.args.get('max_points', type=int)
+    if 'max_points' in request.args and (max_points is None or max_points < 3):
+        abort(400, description="max_points must be an integer of 3 or more")
+    history_format = request.args.get('format', 'rows')
+    if history_format not in HISTORY_FORMATS:
+        abort(400, description="Invalid format")
+    return end_date_str, end_date, max_points, history_format
+
+def get_history_thresholds(conn, device_ids):
+    """
+    デバイスに関連する植物の閾値を1回のクエリで取得する。
+    デバイスが複数の植物に割り当てられている場合は最初の植物を使う。
 
-    # Find the managed plant associated with this device to get thresholds
-    managed_plant = conn.execute("""
-        SELECT mp.managed_plant_id
+    Returns:
+        dict: device_id -> 閾値の辞書（植物がなければ空の辞書）
+    """
+    placeholders = ','.join('?' * len(device_ids))
+    rows = conn.execute(f"""
+        SELECT
+            mp.assigned_plant_sensor_id, mp.assigned_switchbot_id, p.plant_id,
+            p.lethal_temp_high, p.lethal_temp_low,
+            p.growing_fast_temp_high, p.growing_fast_temp_low,
+            p.growing_slow_temp_high, p.growing_slow_temp_low,
+            p.hot_dormancy_temp_high, p.hot_dormancy_temp_low,
+            p.cold_dormancy_temp_high, p.cold_dormancy_temp_low
         FROM managed_plants mp
-        WHERE mp.assigned_plant_sensor_id = ? OR mp.assigned_switchbot_id = ?
-        LIMIT 1
-    """, (device_id, device_id)).fetchone()
+        LEFT JOIN plants p ON p.plant_id = mp.library_plant_id
+        WHERE mp.assigned_plant_sensor_id IN ({placeholders}) OR mp.assigned_switchbot_id IN ({placeholders})
+        ORDER BY mp.rowid
+    """, (*device_ids, *device_ids)).fetchall()
 
     thresholds = {}
-    if managed_plant:
-        thresholds_row = conn.execute("""
-            SELECT
-                p.lethal_temp_high, p.lethal_temp_low,
-                p.growing_fast_temp_high, p.growing_fast_temp_low,
-                p.growing_slow_temp_high, p.growing_slow_temp_low,
-                p.hot_dormancy_temp_high, p.hot_dormancy_temp_low,
-                p.cold_dormancy_temp_high, p.cold_dormancy_temp_low
-            FROM plants p
-            JOIN managed_plants mp ON p.plant_id = mp.library_plant_id
-            WHERE mp.managed_plant_id = ?
-        """, (managed_plant['managed_plant_id'],)).fetchone()
-        if thresholds_row:
-            thresholds = dict(thresholds_row)
-    
+    for row in rows:
+        values = dict(row)
+        sensor_ids = (values.pop('assigned_plant_sensor_id'), values.pop('assigned_switchbot_id'))
+        plant_id = values.pop('plant_id')
+        for device_id in sensor_ids:
+            if device_id in device_ids and device_id not in thresholds:
+                thresholds[device_id] = values if plant_id is not None else {}
+    return {device_id: thresholds.get(device_id, {}) for device_id in device_ids}
+
+def history_range(period, end_date):
+    """ETag用のデータの版を求める期間 (since, until)"""
+    since = datetime.combine(end_date - timedelta(days=HISTORY_PERIOD_DAYS.get(period, 7)), datetime.min.time())
+    return since, datetime.combine(end_date, datetime.max.time())
+
+def query_history(conn, period, device_ids, end_date_str):
+    """
+    期間の履歴をデバイスごとに返す（複数デバイスを1回のクエリで集計する）。
+
+    Yields:
+        (device_id, 行の辞書のリスト)。デバイスID順で、データのないデバイスは含まない
+    """
+    placeholders = ','.join('?' * len(device_ids))
     end_datetime = f"{end_date_str} 23:59:59"
 
     if period == '24h':
-        query = """
-            SELECT timestamp, temperature, humidity, light_lux, soil_moisture,
+        query = f"""
+            SELECT device_id, timestamp, temperature, humidity, light_lux, soil_moisture,
                    soil_temperature1, soil_temperature2,
                    capacitance_ch1, capacitance_ch2, capacitance_ch3, capacitance_ch4
             FROM sensor_data
-            WHERE device_id = ? AND date(timestamp) = ?
-            ORDER BY timestamp ASC
+            WHERE device_id IN ({placeholders}) AND date(timestamp) = ?
+            ORDER BY device_id, timestamp ASC
         """
-        history = conn.execute(query, (device_id, end_date_str)).fetchall()
+        cursor = conn.execute(query, (*device_ids, end_date_str))
     else:
         if period == '7d':
             time_modifier = "'-7 days'"
-            group_by_clause = "GROUP BY strftime('%Y-%m-%d %H', timestamp)"
+            group_by_clause = "GROUP BY device_id, strftime('%Y-%m-%d %H', timestamp)"
             select_timestamp = "strftime('%Y-%m-%d %H:00:00', timestamp) as timestamp"
         elif period == '30d':
             time_modifier = "'-1 month'"
-            group_by_clause = "GROUP BY strftime('%Y-%m-%d', timestamp), CAST(strftime('%H', timestamp) / 6 AS INTEGER)"
+            group_by_clause = "GROUP BY device_id, strftime('%Y-%m-%d', timestamp), CAST(strftime('%H', timestamp) / 6 AS INTEGER)"
             select_timestamp = "strftime('%Y-%m-%d', timestamp) || ' ' || printf('%02d:00:00', (CAST(strftime('%H', timestamp) AS INTEGER) / 6) * 6) as timestamp"
         elif period == '1y':
             time_modifier = "'-1 year'"
-            group_by_clause = "GROUP BY date(timestamp)"
+            group_by_clause = "GROUP BY device_id, date(timestamp)"
             select_timestamp = "strftime('%Y-%m-%d 00:00:00', timestamp) as timestamp"
         else: # Default to 7d
             time_modifier = "'-7 days'"
-            group_by_clause = "GROUP BY strftime('%Y-%m-%d %H', timestamp)"
+            group_by_clause = "GROUP BY device_id, strftime('%Y-%m-%d %H', timestamp)"
             select_timestamp = "strftime('%Y-%m-%d %H:00:00', timestamp) as timestamp"
 
         query = f"""
             SELECT
+                device_id,
                 {select_timestamp},
                 AVG(temperature) as temperature,
                 MAX(temperature) as temperature_max,
@@ -312,20 +420,174 @@ def api_history(device_id):
                 AVG(capacitance_ch3) as capacitance_ch3,
                 AVG(capacitance_ch4) as capacitance_ch4
             FROM sensor_data
-            WHERE device_id = ? AND timestamp BETWEEN datetime(?, {time_modifier}) AND ?
+            WHERE device_id IN ({placeholders}) AND timestamp BETWEEN datetime(?, {time_modifier}) AND ?
             {group_by_clause}
-            ORDER BY timestamp ASC
+            ORDER BY device_id, timestamp ASC
         """
-        history = conn.execute(query, (device_id, end_datetime, end_datetime)).fetchall()
-        
-    conn.close()
+        cursor = conn.execute(query, (*device_ids, end_datetime, end_datetime))
+
+    # 行はデバイスID順に並んでいるので、デバイスが切り替わるたびに返す（全件をメモリに載せない）
+    for device_id, rows in groupby(cursor, key=lambda row: row['device_id']):
+        history = []
+        for row in rows:
+            values = dict(row)
+            del values['device_id']
+            history.append(values)
+        yield device_id, history
+
+def history_body(history, thresholds, max_points, history_format):
+    """履歴の行と閾値から履歴APIのJSON本文を作る"""
+    history_rows = downsample_rows(history, max_points, HISTORY_DOWNSAMPLE_KEYS)
+    if history_format == 'columnar':
+        response_data = {"format": "columnar", **to_columnar(history_rows), "thresholds": thresholds}
+    else:
+        response_data = {"history": history_rows, "thresholds": thresholds}
+    return json_dumps(response_data)
+
+def history_cache_period(period, max_points, history_format):
+    """履歴キャッシュのキーに使う期間（同じ期間でも間引き・形式が違えば別のエントリにする）"""
+    return f"{period}:{history_format}" + ("" if max_points is None else f"@{max_points}")
+
+
+@dashboard_bp.route('/api/history/<device_id>')
+@requires_auth
+def api_history(device_id):
+    """
+    デバイスの履歴データと、関連する植物の閾値を返すAPI。
+    期間内のデータの版からETag/Last-Modifiedを作り、変わっていなければ集計せずに304を返す。
+    max_points を指定するとLTTBでその点数以下に間引く（グラフの幅に合わせる）。
+    format=columnar を指定すると列指向（時刻は差分エンコード）で返す (lib/history_format.py)。
+    """
+    period = request.args.get('period', '24h')
+    end_date_str, end_date, max_points, history_format = parse_history_options()
     
-    response_data = {
-        "history": [dict(row) for row in history],
-        "thresholds": thresholds
+    conn = get_request_db(readonly=True)
+    thresholds = get_history_thresholds(conn, [device_id])[device_id]
+
+    since, until = history_range(period, end_date)
+    validators = history_validators(
+        dm.get_history_version(conn, device_id, since, until), device_id, period, end_date_str, thresholds,
+        max_points, history_format
+    )
+    if is_not_modified(validators):
+        return not_modified_response(validators)
+
+    # 他のタブ・ワーカーが同じ期間を集計済みならその結果を返す
+    history_cache = get_history_cache()
+    live = end_date >= date.today()
+    cache_period = history_cache_period(period, max_points, history_format)
+    cached_body = history_cache.get(device_id, cache_period, end_date_str, validators[0], live)
+    if cached_body is not None:
+        return history_response(cached_body, validators)
+
+    history = next((rows for _, rows in query_history(conn, period, [device_id], end_date_str)), [])
+    body = history_body(history, thresholds, max_points, history_format)
+    history_cache.put(device_id, cache_period, end_date_str, validators[0], live, body)
+    return history_response(body, validators)
+
+
+@dashboard_bp.route('/api/history/batch')
+@requires_auth
+def api_history_batch():
+    """
+    複数デバイスの履歴をまとめて返すAPI（グラフが多いページを1往復で描画する）。
+
+    Query:
+        devices: "device_id" または "device_id:period" のカンマ区切り。periodを省略した項目は period パラメータを使う
+        date, max_points, format: /api/history と同じ
+
+    Response:
+        {"results": {"device_id:period": /api/history と同じ本文, ...}} をデバイスごとに逐次送る。
+        閾値の取得は1回、集計は期間ごとに1回のクエリで行い、項目ごとの結果は /api/history と同じキャッシュを使う。
+    """
+    default_period = request.args.get('period', '24h')
+    end_date_str, end_date, max_points, history_format = parse_history_options()
+    items = []
+    for token in request.args.get('devices', '').split(','):
+        device_id, _, period = token.strip().partition(':')
+        if device_id and (device_id, period or default_period) not in items:
+            items.append((device_id, period or default_period))
+    if not items:
+        abort(400, description="devices is required")
+    if len(items) > config.HISTORY_BATCH_MAX_ITEMS:
+        abort(400, description=f"Too many devices (max {config.HISTORY_BATCH_MAX_ITEMS})")
+
+    conn = get_request_db(readonly=True)
+    device_ids = list(dict.fromkeys(device_id for device_id, _ in items))
+    thresholds = get_history_thresholds(conn, device_ids)
+    versions = {}
+    for period in dict.fromkeys(period for _, period in items):
+        since, until = history_range(period, end_date)
+        for device_id, version in dm.get_history_versions(conn, device_ids, since, until).items():
+            versions[(device_id, period)] = version
+
+    # 項目ごとのETagは /api/history と同じ値になり、キャッシュのエントリを共有できる
+    item_validators = {
+        (device_id, period): history_validators(
+            versions[(device_id, period)], device_id, period, end_date_str, thresholds[device_id],
+            max_points, history_format
+        )
+        for device_id, period in items
     }
-    
-    return jsonify(response_data)
+    updated = [v[1] for v in item_validators.values() if v[1]]
+    validators = (
+        hashlib.sha1(json.dumps([v[0] for v in item_validators.values()]).encode()).hexdigest(),
+        max(updated) if updated else None,
+        HISTORY_CACHE_CONTROL,
+    )
+    if is_not_modified(validators):
+        return not_modified_response(validators)
+
+    history_cache = get_history_cache()
+    live = end_date >= date.today()
+
+    def generate():
+        first = True
+
+        def entry(device_id, period, body):
+            nonlocal first
+            separator = b'' if first else b','
+            first = False
+            return separator + json_dumps(f"{device_id}:{period}") + b':' + body
+
+        yield b'{"results":{'
+        # キャッシュにある項目を先に送り、残りを期間ごとにまとめて集計する
+        missing = {}
+        for device_id, period in items:
+            cache_period = history_cache_period(period, max_points, history_format)
+            body = history_cache.get(device_id, cache_period, end_date_str, item_validators[(device_id, period)][0], live)
+            if body is not None:
+                yield entry(device_id, period, body)
+            else:
+                missing.setdefault(period, []).append(device_id)
+
+        for period, period_device_ids in missing.items():
+            cache_period = history_cache_period(period, max_points, history_format)
+            pending = set(period_device_ids)
+            found = query_history(conn, period, period_device_ids, end_date_str)
+            # データのないデバイスも空の履歴として返す
+            for device_id, history in chain(found, ((device_id, []) for device_id in period_device_ids)):
+                if device_id not in pending:
+                    continue
+                pending.discard(device_id)
+                body = history_body(history, thresholds[device_id], max_points, history_format)
+                history_cache.put(device_id, cache_period, end_date_str, item_validators[(device_id, period)][0], live, body)
+                yield entry(device_id, period, body)
+        yield b'}}'
+
+    chunks = stream_with_context(generate())
+    response = Response(gzip_stream(chunks) if request.accept_encodings['gzip'] else chunks, mimetype='application/json')
+    if request.accept_encodings['gzip']:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return with_validators(response, validators)
+
+
+@dashboard_bp.route('/api/cache/history')
+@requires_auth
+def api_history_cache_metrics():
+    """このワーカーの履歴キャッシュのヒット率などを返す"""
+    return jsonify(get_history_cache().metrics())
 
 
 @dashboard_bp.route('/api/plant-analysis-history/<managed_plant_id>')
@@ -333,10 +595,15 @@ def api_history(device_id):
 def api_plant_analysis_history(managed_plant_id):
     """
     指定された管理植物の日別集計データと、関連する閾値を返すAPI。
+    期間内の分析結果の版からETag/Last-Modifiedを作り、変わっていなければ304を返す。
     """
     period = request.args.get('period', '7d')
     end_date_str = request.args.get('date', date.today().isoformat())
-    conn = dm.get_db_connection()
+    try:
+        end_date = date.fromisoformat(end_date_str)
+    except ValueError:
+        abort(400, description="Invalid date")
+    conn = get_request_db(readonly=True)
 
     # Get plant library thresholds
     thresholds_row = conn.execute("""
@@ -354,7 +621,6 @@ def api_plant_analysis_history(managed_plant_id):
     thresholds = dict(thresholds_row) if thresholds_row else {}
 
     # 期間に応じて開始日を計算
-    end_date = date.fromisoformat(end_date_str)
     if period == '7d':
         start_date = end_date - timedelta(days=6)
     elif period == '30d':
@@ -366,6 +632,13 @@ def api_plant_analysis_history(managed_plant_id):
     
     start_date_str = start_date.strftime('%Y-%m-%d')
 
+    validators = history_validators(
+        dm.get_analysis_version(conn, managed_plant_id, start_date_str, end_date_str),
+        managed_plant_id, period, end_date_str, thresholds
+    )
+    if is_not_modified(validators):
+        return not_modified_response(validators)
+
     # daily_plant_analysisから集計済みデータを取得
     query = """
         SELECT
@@ -382,20 +655,20 @@ def api_plant_analysis_history(managed_plant_id):
     """
     
     history = conn.execute(query, (managed_plant_id, start_date_str, end_date_str)).fetchall()
-    conn.close()
     
     response_data = {
         "history": [dict(row) for row in history],
         "thresholds": thresholds
     }
     
-    return jsonify(response_data)
+    return with_validators(jsonify(response_data), validators)
 
 
 @dashboard_bp.route('/api/plants/<managed_plant_id>/observation/parse', methods=['POST'])
 @requires_auth
 def api_observation_parse(managed_plant_id):
     """自由テキストをClaude APIで解析して観察フィールドに変換する"""
+    import httpx
     data = request.json
     text = (data.get('text') or '').strip()
     if not text:
@@ -536,7 +809,7 @@ def api_observations_list(managed_plant_id):
         today = date.today()
         month_prefix = f"{today.year:04d}-{today.month:02d}"
 
-    conn = dm.get_db_connection()
+    conn = get_request_db(readonly=True)
     rows = conn.execute("""
         SELECT id, observed_at,
                event_new_bud, event_leaves_dropped, event_flower_stem,
@@ -547,7 +820,6 @@ def api_observations_list(managed_plant_id):
         WHERE managed_plant_id = ? AND observed_at LIKE ?
         ORDER BY observed_at DESC, created_at DESC
     """, (managed_plant_id, f"{month_prefix}%")).fetchall()
-    conn.close()
     result = []
     for r in rows:
         obs = dict(r)
@@ -560,14 +832,13 @@ def api_observations_list(managed_plant_id):
 @requires_auth
 def api_observation_months(managed_plant_id):
     """観察記録のある年月一覧を返す（ナビゲーション用）"""
-    conn = dm.get_db_connection()
+    conn = get_request_db(readonly=True)
     rows = conn.execute("""
         SELECT DISTINCT substr(observed_at, 1, 7) as ym
         FROM plant_observations
         WHERE managed_plant_id = ?
         ORDER BY ym DESC
     """, (managed_plant_id,)).fetchall()
-    conn.close()
     return jsonify({'success': True, 'months': [r['ym'] for r in rows]})
 
 
@@ -575,11 +846,10 @@ def api_observation_months(managed_plant_id):
 @requires_auth
 def observations_page():
     """全植物の観察記録一覧ページ"""
-    conn = dm.get_db_connection()
+    conn = get_request_db(readonly=True)
     plants = conn.execute(
         "SELECT managed_plant_id, plant_name FROM managed_plants ORDER BY plant_name"
     ).fetchall()
-    conn.close()
     return render_template('observations.html', plants=plants, active_page='observations')
 
 
@@ -590,7 +860,7 @@ def api_all_observations():
     limit = request.args.get('limit', 50, type=int)
     plant_id = request.args.get('managed_plant_id', '')
 
-    conn = dm.get_db_connection()
+    conn = get_request_db(readonly=True)
     if plant_id:
         rows = conn.execute("""
             SELECT po.*,
@@ -614,7 +884,6 @@ def api_all_observations():
             ORDER BY po.observed_at DESC, po.created_at DESC
             LIMIT ?
         """, (limit,)).fetchall()
-    conn.close()
 
     result = []
     for r in rows:
@@ -3,12 +3,12 @@ from flask import Blueprint, render_template, jsonify, request, Response
 import asyncio
 import json
 import logging
-import random
+from datetime import datetime, timedelta
 import device_manager as dm
-from ble_manager import scan_devices as ble_scan
+from database import get_request_db, expected_readings_per_hour
 from blueprints.dashboard.routes import requires_auth
+from history_cache import get_history_cache
 import config  # configをインポート
-from bleak import BleakClient
 
 devices_bp = Blueprint('devices', __name__, template_folder='../../templates')
 logger = logging.getLogger(__name__)
@@ -52,11 +52,127 @@ def determine_data_version(device_name):
 def devices():
     """デバイス管理ページを表示します。"""
     conn = dm.get_db_connection()
-    registered_devices = conn.execute('SELECT * FROM devices ORDER BY device_name').fetchall()
+    registered_devices = conn.execute("""
+        SELECT d.*, ps.breaker_state, ps.consecutive_failures, ps.retry_at, ps.last_error
+        FROM devices d
+        LEFT JOIN device_poll_state ps ON ps.device_id = d.device_id
+        ORDER BY d.device_name
+    """).fetchall()
     conn.close()
     return render_template('devices.html', registered_devices=registered_devices)
 
 
+@devices_bp.route('/api/devices')
+@requires_auth
+def api_devices():
+    """登録済みデバイスの一覧と、ポーリング状態（サーキットブレーカー）を返します。"""
+    conn = get_request_db(readonly=True)
+    rows = conn.execute("""
+        SELECT d.device_id, d.device_name, d.mac_address, d.device_type, d.data_version, d.battery_level,
+               ps.breaker_state, ps.consecutive_failures, ps.opened_at, ps.retry_at,
+               ps.last_success_at, ps.last_failure_at, ps.last_error
+        FROM devices d
+        LEFT JOIN device_poll_state ps ON ps.device_id = d.device_id
+        ORDER BY d.device_type, d.device_name
+    """).fetchall()
+
+    devices = []
+    for row in rows:
+        device = {key: row[key] for key in ('device_id', 'device_name', 'mac_address', 'device_type', 'data_version', 'battery_level')}
+        device['circuit_breaker'] = {
+            'state': row['breaker_state'] or 'closed',
+            'consecutive_failures': row['consecutive_failures'] or 0,
+            'opened_at': row['opened_at'],
+            'retry_at': row['retry_at'],
+            'last_success_at': row['last_success_at'],
+            'last_failure_at': row['last_failure_at'],
+            'last_error': row['last_error'],
+        }
+        devices.append(device)
+    return jsonify(devices)
+
+
+@devices_bp.route('/api/bluetooth/health')
+@requires_auth
+def api_bluetooth_health():
+    """
+    Bluetoothアダプタの健全性指標の時系列を返します（bluetooth_daemonが定期的に保存）。
+    スキャン・接続時間のパーセンタイルは秒単位です。
+    """
+    hours = request.args.get('hours', default=24, type=int)
+    hours = max(1, min(hours, 24 * 31))
+    since = (datetime.now() - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = get_request_db(readonly=True)
+    rows = conn.execute("""
+        SELECT * FROM adapter_health_metrics
+        WHERE recorded_at >= ?
+        ORDER BY adapter, recorded_at
+    """, (since,)).fetchall()
+
+    adapters = {}
+    for row in rows:
+        series = adapters.setdefault(row['adapter'], [])
+        series.append({key: row[key] for key in row.keys() if key not in ('id', 'adapter')})
+    return jsonify({
+        'adapters': [
+            {'adapter': adapter, 'latest': series[-1], 'series': series}
+            for adapter, series in adapters.items()
+        ]
+    })
+
+
+@devices_bp.route('/devices/completeness')
+@requires_auth
+def device_completeness():
+    """デバイスごとのデータ完全性（時間帯別の受信率）ページを表示します。"""
+    return render_template('device_completeness.html')
+
+
+@devices_bp.route('/api/devices/completeness')
+@requires_auth
+def api_devices_completeness():
+    """
+    直近 hours 時間のデバイス別・時間帯別の読み取り数を返します。
+    counts は hours 配列と同じ順の実読み取り数で、カバレッジの低いデバイスから並べます。
+    """
+    hours = request.args.get('hours', default=168, type=int)
+    hours = max(1, min(hours, 24 * 31))
+    now = datetime.now()
+    until = now.replace(minute=0, second=0, microsecond=0)
+    since = until - timedelta(hours=hours - 1)
+    hour_keys = [(since + timedelta(hours=i)).strftime("%Y-%m-%d %H") for i in range(hours)]
+    index = {hour: i for i, hour in enumerate(hour_keys)}
+
+    conn = get_request_db(readonly=True)
+    devices = conn.execute(
+        "SELECT device_id, device_name FROM devices WHERE device_type = 'plant_sensor' ORDER BY device_name"
+    ).fetchall()
+    counts = {device['device_id']: [0] * hours for device in devices}
+    for row in dm.get_sensor_completeness(conn, since, until):
+        if row['device_id'] in counts:
+            counts[row['device_id']][index[row['hour']]] = row['actual_count']
+    coverage = dm.get_device_coverage(conn, hours, now=now)
+
+    result = []
+    for device in devices:
+        device_coverage = coverage.get(device['device_id'], {'coverage': 1.0, 'missing_hours': 0})
+        result.append({
+            'device_id': device['device_id'],
+            'device_name': device['device_name'],
+            'coverage': round(device_coverage['coverage'], 4),
+            'missing_hours': device_coverage['missing_hours'],
+            'counts': counts[device['device_id']],
+        })
+    result.sort(key=lambda d: d['coverage'])
+
+    return jsonify({
+        'hours': hour_keys,
+        'expected_per_hour': expected_readings_per_hour(),
+        'devices': result,
+    })
+
+
 @devices_bp.route('/devices/profiles')
 @requires_auth
 def devices_profiles():
@@ -70,13 +186,7 @@ def devices_profiles():
         device_dict = dict(device)
 
         # 最新のセンサーデータを取得
-        sensor_data = conn.execute("""
-            SELECT *
-            FROM sensor_data
-            WHERE device_id = ?
-            ORDER BY timestamp DESC
-            LIMIT 1
-        """, (device['device_id'],)).fetchone()
+        sensor_data = conn.execute("SELECT * FROM sensor_latest WHERE device_id = ?", (device['device_id'],)).fetchone()
 
         device_dict['sensor_data'] = dict(sensor_data) if sensor_data else {}
 
@@ -120,13 +230,7 @@ def device_profile_detail(device_id):
     device_dict = dict(device)
 
     # 最新のセンサーデータを取得
-    sensor_data = conn.execute("""
-        SELECT *
-        FROM sensor_data
-        WHERE device_id = ?
-        ORDER BY timestamp DESC
-        LIMIT 1
-    """, (device_id,)).fetchone()
+    sensor_data = conn.execute("SELECT * FROM sensor_latest WHERE device_id = ?", (device_id,)).fetchone()
 
     device_dict['sensor_data'] = dict(sensor_data) if sensor_data else {}
 
@@ -282,6 +386,7 @@ async def read_device_settings_from_ble(mac_address):
     - CMD_GET_TIMEZONE (0x10)
     - CMD_GET_SENSOR_CONFIG (0x1A)
     """
+    from bleak import BleakClient
     import struct
     from datetime import datetime
 
@@ -477,6 +582,7 @@ async def write_device_settings_to_ble(mac_address, settings):
     - CMD_SET_WIFI_CONFIG (0x0D) + CMD_SAVE_WIFI_CONFIG (0x13)
     - CMD_SET_TIMEZONE (0x15) + CMD_SAVE_TIMEZONE (0x16)
     """
+    from bleak import BleakClient
     import struct
 
     COMMAND_UUID = "6A3B2C1D-4E5F-6A7B-8C9D-E0F123456791"
@@ -596,21 +702,25 @@ async def write_device_settings_to_ble(mac_address, settings):
 
 async def read_device_data_at_time_from_ble(mac_address, target_time):
     """
-    BLE経由で指定時刻のデータを取得する非同期関数 (Mock)
+    BLE経由でデバイス内に記録されている指定時刻のデータを取得する非同期関数
+    CMD_GET_TIME_DATA (0x0A) を使用。デバイスは指定時刻に最も近い記録を返す
     """
+    from ble_manager import PlantDeviceBLE
+
     logger.info(f"Fetching data from {mac_address} at {target_time}...")
-    
-    # 通信遅延のシミュレーション
-    await asyncio.sleep(1.5)
-    
-    return {
-        "timestamp": target_time,
-        "temperature": round(random.uniform(20.0, 30.0), 1),
-        "humidity": round(random.uniform(40.0, 70.0), 1),
-        "light_lux": int(random.uniform(100, 1000)),
-        "soil_moisture": int(random.uniform(1500, 3000)),
-        "soil_temperature1": round(random.uniform(18.0, 25.0), 1)
-    }
+    target = datetime.fromisoformat(target_time)
+
+    ble_device = PlantDeviceBLE(mac_address, mac_address)
+    try:
+        if not await ble_device.connect():
+            raise ConnectionError(f"Could not connect to {mac_address}")
+        [(_, reading)] = await ble_device.get_time_data_batch([target], pipeline_depth=1)
+    finally:
+        await ble_device.disconnect()
+
+    if reading is None:
+        raise LookupError(f"No data stored on the device near {target_time}")
+    return {"timestamp": reading['datetime'], **reading}
 
 
 async def update_device_firmware_ble(mac_address, firmware_file):
@@ -632,6 +742,7 @@ async def read_last_log_from_ble(mac_address):
     BLE経由でデバイスから直前の計測テキストログを取得する非同期関数
     CMD_GET_LAST_LOG (0x1B) を使用
     """
+    from bleak import BleakClient
     import struct
 
     COMMAND_UUID = "6A3B2C1D-4E5F-6A7B-8C9D-E0F123456791"
@@ -832,6 +943,10 @@ def api_fetch_device_data_at_time(device_id):
     """指定された日時のデータをデバイスから取得するAPI"""
     data = request.json
     target_time = data.get('target_time')
+    try:
+        datetime.fromisoformat(target_time)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid target_time'}), 400
     
     conn = dm.get_db_connection()
     device = conn.execute('SELECT * FROM devices WHERE device_id = ?', (device_id,)).fetchone()
@@ -843,6 +958,8 @@ def api_fetch_device_data_at_time(device_id):
     try:
         result = asyncio.run(read_device_data_at_time_from_ble(device['mac_address'], target_time))
         return jsonify({'success': True, 'data': result})
+    except LookupError as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
     except Exception as e:
         logger.error(f"Failed to fetch data from device: {e}", exc_info=True)
         return jsonify({'success': False, 'message': f"Communication error: {str(e)}"}), 500
@@ -852,6 +969,7 @@ def api_fetch_device_data_at_time(device_id):
 @requires_auth
 def api_ble_scan():
     """周辺のBLEデバイスをスキャンして結果を返します。"""
+    from ble_manager import scan_devices as ble_scan
     try:
         # 非同期関数であるble_scanを実行し、結果を待つ
         devices = asyncio.run(ble_scan())
@@ -965,6 +1083,7 @@ async def control_led_ble(mac_address, red, green, blue, brightness, duration_ms
     BLE経由でWS2812 LEDを制御する非同期関数
     CMD_CONTROL_LED (0x18) - 6バイト: R, G, B, brightness(0-100), duration_ms(uint16)
     """
+    from bleak import BleakClient
     import struct
 
     COMMAND_UUID = "6A3B2C1D-4E5F-6A7B-8C9D-E0F123456791"
@@ -1067,6 +1186,10 @@ def api_delete_device(device_id):
 
         # センサーデータを削除
         conn.execute('DELETE FROM sensor_data WHERE device_id = ?', (device_id,))
+        conn.execute('DELETE FROM sensor_latest WHERE device_id = ?', (device_id,))
+        conn.execute('DELETE FROM sensor_daily_last WHERE device_id = ?', (device_id,))
+        conn.execute('DELETE FROM sensor_completeness WHERE device_id = ?', (device_id,))
+        conn.execute('DELETE FROM device_poll_state WHERE device_id = ?', (device_id,))
 
         # デバイスを削除
         conn.execute('DELETE FROM devices WHERE device_id = ?', (device_id,))
@@ -1076,6 +1199,8 @@ def api_delete_device(device_id):
 
         # メモリ上のデバイスリストを再読み込み
         dm.load_devices_from_db()
+        # 削除したデバイスの履歴キャッシュを全ワーカーで無効にする
+        get_history_cache().invalidate_devices([device_id], include_past=True)
 
         logger.info(f"デバイス {device_id} を削除しました。")
         return jsonify({'success': True, 'message': 'デバイスを削除しました。'})
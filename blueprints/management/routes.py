@@ -1,10 +1,12 @@
 # blueprints/management/routes.py
 from flask import Blueprint, render_template, jsonify, request, Response
 import device_manager as dm
+import data_export
+from database import get_pool_metrics
+from datetime import date
 import uuid
 import json
 from blueprints.dashboard.routes import requires_auth
-from ble_manager import PlantDeviceBLE
 import asyncio
 
 management_bp = Blueprint('management', __name__, template_folder='../../templates')
@@ -213,4 +215,38 @@ def api_delete_managed_plant(managed_plant_id):
         conn.close()
         return jsonify({'success': True, 'message': 'Plant deleted successfully.'})
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@management_bp.route('/api/system/db-pool', methods=['GET'])
+@requires_auth
+def api_db_pool_metrics():
+    """Webプロセスのデータベース接続プールの利用状況を返します。"""
+    return jsonify({'success': True, 'pool': get_pool_metrics()})
+
+
+@management_bp.route('/api/export/<dataset>', methods=['GET'])
+@requires_auth
+def api_export(dataset):
+    """
+    sensor_data / daily_plant_analysis をCSVまたはParquetでダウンロードします (data_export.py)。
+    DBからチャンクごとに読みながら送信するため、長い期間でもメモリに全件を載せません。
+
+    Query:
+        device_id または plant_id, start, end (YYYY-MM-DD、省略可), format (csv / parquet)
+    """
+    export_format = request.args.get('format', 'csv')
+    device_id = request.args.get('device_id')
+    plant_id = request.args.get('plant_id')
+    try:
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else None
+        chunks = data_export.export(dataset, export_format, device_id, plant_id, start, end)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    filename = data_export.export_filename(dataset, export_format, device_id, plant_id, start, end)
+    return Response(
+        chunks,
+        mimetype=data_export.MIMETYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
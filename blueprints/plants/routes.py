@@ -4,7 +4,6 @@ import device_manager as dm
 import json
 import uuid
 import os
-import httpx
 import logging
 from werkzeug.utils import secure_filename
 from blueprints.dashboard.routes import requires_auth
@@ -133,6 +132,7 @@ def api_upload_image():
 @requires_auth
 def api_search_variety():
     """品種名からAIを使用して候補リストを検索します。"""
+    import httpx
     data = request.json
     variety_name = data.get('variety_name', '').strip()
 
@@ -246,6 +246,7 @@ JSON形式で回答してください：
 @requires_auth
 def api_translate():
     """AIモデルを使用してテキストを翻訳します。"""
+    import httpx
     data = request.json
     text_to_translate = data.get('text', '').strip()
     target_lang = data.get('target_lang', 'English').strip()
@@ -311,6 +312,7 @@ Text to translate: "{text_to_translate}"
 @requires_auth
 def api_plant_lookup():
     """AIを使用して植物情報を検索します。(Claude API使用)"""
+    import httpx
     data = request.json
     plant_name = f"{data.get('genus', '')} {data.get('species', '')} {data.get('variety', '')}".strip()
     
@@ -623,6 +625,7 @@ def contains_japanese(text):
 
 def translate_to_english(text, api_key):
     """日本語テキストを英語に翻訳（植物名用）"""
+    import httpx
     try:
         translate_prompt = f"Translate this plant name to English (botanical/scientific terms preferred). Return only the translated text, no explanation: {text}"
         translate_url = "https://api.anthropic.com/v1/messages"
@@ -652,6 +655,7 @@ def translate_to_english(text, api_key):
 @requires_auth
 def api_search_image():
     """Wikimedia Commons APIを使用して植物画像を検索します。"""
+    import httpx
     data = request.json
     genus = data.get('genus', '').strip()
     species = data.get('species', '').strip()
@@ -3,18 +3,24 @@ import asyncio
 import logging
 import json
 from datetime import datetime
-from collections import deque
 import os
 import subprocess
 import signal
+import math
 import threading
+import time
 
 import config
 import device_manager as dm
-from ble_manager import PlantDeviceBLE
+from ble_manager import PlantDeviceBLE, configure_logging as configure_ble_logging
 from bleak import BleakScanner
 from bleak.exc import BleakError
 from database import get_db_connection
+from backfill import BackfillPlanner, collect_backfill_records
+from sensor_payloads import TIME_DATA_LAYOUTS
+from poll_scheduler import PollScheduler, load_poll_thresholds
+from circuit_breaker import DeviceCircuitBreaker, CLOSED, OPEN
+from ble_adapters import AdapterPool, discover_adapters
 
 # データ連携用の一時ファイルパス
 DATA_PIPE_PATH = "/tmp/plant_dashboard_pipe.jsonl"
@@ -42,39 +48,32 @@ console_handler.setFormatter(formatter)
 # ルートロガー設定
 logging.basicConfig(level=logging.INFO, handlers=[file_handler, error_file_handler, console_handler])
 
+# Bluetoothマネージャーのログ設定（ble_managerのimport時には設定されない）
+configure_ble_logging()
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-class BluetoothConnectionTracker:
-    """Bluetooth接続成功率を追跡し、必要に応じてBluetoothサービスを再起動する"""
+class BluetoothRestartManager:
+    """
+    使用中のすべてのアダプタで、アダプタの健全性モデル (adapter_health.AdapterHealthMonitor) が
+    アダプタ全体の異常と判定したときにBluetoothサービスを再起動する。
+    一部のアダプタだけの異常は、そのアダプタのデバイスを他のアダプタに移して対処する (ble_adapters.AdapterPool)。
+    再起動を繰り返しても改善しない場合はシステムを再起動する。
+    """
 
-    def __init__(self, history_size=10, success_rate_threshold=0.5, restart_cooldown_seconds=600, max_restarts_before_reboot=3):
-        self.history = deque(maxlen=history_size)
-        self.success_rate_threshold = success_rate_threshold
-        self.restart_cooldown_seconds = restart_cooldown_seconds
+    def __init__(self, pool, restart_cooldown_seconds=None, max_restarts_before_reboot=None):
+        self.pool = pool
+        self.restart_cooldown_seconds = restart_cooldown_seconds or config.BLUETOOTH_RESTART_COOLDOWN_SECONDS
         self.last_restart_time = None
         self.consecutive_restarts = 0
-        self.max_restarts_before_reboot = max_restarts_before_reboot
-
-    def record_result(self, success: bool):
-        """接続結果を記録する"""
-        self.history.append(success)
-
-    def get_success_rate(self) -> float:
-        """現在の成功率を取得する（0.0 ~ 1.0）"""
-        if len(self.history) == 0:
-            return 1.0
-        return sum(self.history) / len(self.history)
+        self.max_restarts_before_reboot = max_restarts_before_reboot or config.BLUETOOTH_MAX_RESTARTS_BEFORE_REBOOT
 
-    def should_restart_bluetooth(self) -> bool:
+    def should_restart_bluetooth(self, active_by_adapter=None) -> bool:
         """Bluetoothサービスを再起動すべきかどうかを判定する"""
-        # 履歴が十分にない場合は再起動しない
-        if len(self.history) < self.history.maxlen:
-            return False
-
-        # 成功率が閾値以上なら再起動不要
-        if self.get_success_rate() >= self.success_rate_threshold:
+        available = self.pool.available()
+        if not available or len(self.pool.unhealthy_adapters(active_by_adapter)) < len(available):
             return False
 
         # クールダウン期間中は再起動しない
@@ -111,10 +110,9 @@ class BluetoothConnectionTracker:
             self.reboot_system()
             return False
 
-        success_rate = self.get_success_rate()
+        reasons = ", ".join(f"{adapter}: {reason}" for adapter, reason in self.pool.unhealthy_adapters())
         logger.warning(
-            f"Bluetooth接続成功率が低下しています: {success_rate*100:.0f}% "
-            f"(直近{len(self.history)}回中{sum(self.history)}回成功). "
+            f"Bluetoothアダプタの異常を検出しました ({reasons}). "
             f"Bluetoothサービスを再起動します... (試行 {self.consecutive_restarts + 1}/{self.max_restarts_before_reboot})"
         )
 
@@ -130,8 +128,8 @@ class BluetoothConnectionTracker:
             self.last_restart_time = datetime.now()
 
             if result.returncode == 0:
-                logger.info("Bluetoothサービスを正常に再起動しました。接続履歴をリセットします。")
-                self.history.clear()
+                logger.info("Bluetoothサービスを正常に再起動しました。アダプタの異常の記録をリセットします。")
+                self.pool.mark_restarted()
                 return True
 
             # Step 2: 失敗した場合 → bluetoothd が D-Bus でデッドロックしている可能性
@@ -156,8 +154,8 @@ class BluetoothConnectionTracker:
                 capture_output=True, text=True, timeout=30
             )
             if retry.returncode == 0:
-                logger.info("dbus reload 後に Bluetooth サービスを起動しました。接続履歴をリセットします。")
-                self.history.clear()
+                logger.info("dbus reload 後に Bluetooth サービスを起動しました。アダプタの異常の記録をリセットします。")
+                self.pool.mark_restarted()
                 return True
             else:
                 logger.error(f"dbus reload 後の bluetooth 起動も失敗しました: {retry.stderr.strip()}")
@@ -175,8 +173,9 @@ class BluetoothConnectionTracker:
             return False
 
 
-# グローバルなトラッカーインスタンス
-bt_connection_tracker = BluetoothConnectionTracker()
+# アダプタごとの健全性モデルとデバイスの割り当て、それに基づいてBluetoothサービスを再起動するマネージャー
+adapter_pool = AdapterPool(discover_adapters())
+bt_restart_manager = BluetoothRestartManager(adapter_pool)
 
 
 # --- ble_manager.pyから移動した関数群 ---
@@ -237,11 +236,18 @@ def _parse_switchbot_adv_data(address, adv_data):
         return {'type': 'switchbot_meter', 'data': {'temperature': temperature, 'humidity': humidity, 'battery_level': battery}}
     return None
 
-async def get_switchbot_adv_data(mac_address: str):
-    """指定されたMACアドレスのSwitchBotデバイスのアドバタイズデータをスキャンして取得する"""
+async def get_switchbot_adv_data(mac_address: str, adapter=None):
+    """指定されたMACアドレスのSwitchBotデバイスのアドバタイズデータをアダプタ adapter でスキャンして取得する"""
     logger.debug(f"{mac_address} を見つけるために5秒間スキャンします...")
+    health = adapter_pool.health.get(adapter)
+    started = time.monotonic()
     try:
-        devices = await BleakScanner.discover(timeout=5.0, return_adv=True)
+        devices = await BleakScanner.discover(timeout=5.0, return_adv=True, **adapter_pool.bleak_kwargs(adapter))
+        if health:
+            health.record_scan(time.monotonic() - started, len(devices))
+        # 受信したすべてのデバイスのRSSIをアダプタの割り当てに使う
+        for address, (_device, adv_data) in devices.items():
+            adapter_pool.record_rssi(address, adapter, adv_data.rssi if adv_data else None)
         target_device_info = devices.get(mac_address.upper())
         if target_device_info:
             _device, adv_data = target_device_info
@@ -258,6 +264,8 @@ async def get_switchbot_adv_data(mac_address: str):
             logger.warning(f"5秒間のスキャンでデバイス {mac_address} が見つかりませんでした。")
         return None
     except BleakError as e:
+        if health:
+            health.record_scan(time.monotonic() - started, 0, error=e)
         logger.error(f"{mac_address} のスキャン中にBleakErrorが発生しました: {e}")
         return None
     except Exception as e:
@@ -268,12 +276,18 @@ async def get_switchbot_adv_data(mac_address: str):
 
 
 def get_devices_from_db():
-    """DBからポーリング対象のデバイス情報を取得する"""
+    """
+    DBからポーリング対象のデバイス情報を取得する。
+    直近のカバレッジが低い（欠損の多い）デバイスから順に返す。
+    """
     conn = None
     try:
         conn = get_db_connection()
         devices = conn.execute('SELECT device_id, device_name, mac_address, device_type, data_version FROM devices').fetchall()
-        return [dict(row) for row in devices]
+        coverage = dm.get_device_coverage(conn, config.COMPLETENESS_PRIORITY_HOURS)
+        devices = [dict(row) for row in devices]
+        devices.sort(key=lambda d: coverage.get(d['device_id'], {}).get('coverage', 1.0))
+        return devices
     except Exception as e:
         logger.error(f"データベースからデバイス情報の取得に失敗しました: {e}", exc_info=True)
         return []
@@ -281,6 +295,14 @@ def get_devices_from_db():
         if conn:
             conn.close()
 
+def get_poll_thresholds_from_db():
+    """ポーリング間隔の調整に使う植物の閾値をDBから取得する"""
+    conn = get_db_connection(readonly=True)
+    try:
+        return load_poll_thresholds(conn)
+    finally:
+        conn.close()
+
 def write_to_pipe(data):
     """取得したデータを一時ファイルにJSON Lines形式で追記する"""
     try:
@@ -289,6 +311,48 @@ def write_to_pipe(data):
     except Exception as e:
         logger.error(f"データパイプへの書き込みに失敗しました: {e}")
 
+
+# デバイスごとのロック（アダプタごとのポーリングとコマンド処理が同じデバイスに同時に接続しないようにする）
+device_locks = {}
+
+
+def get_device_lock(device_id):
+    if device_id not in device_locks:
+        device_locks[device_id] = asyncio.Lock()
+    return device_locks[device_id]
+
+
+def get_plant_device(plant_connections, device_id, mac_address, adapter):
+    """プラントセンサーの接続を返す。割り当てられたアダプタが変わっていれば作り直す"""
+    health = adapter_pool.health.get(adapter)
+    adapter_name = adapter_pool.bleak_kwargs(adapter).get('adapter')
+    ble_device = plant_connections.get(device_id)
+    if ble_device is None or ble_device.mac_address != mac_address \
+            or ble_device.adapter != adapter_name or ble_device.health is not health:
+        ble_device = PlantDeviceBLE(mac_address, device_id, health=health, adapter=adapter_name)
+        plant_connections[device_id] = ble_device
+    return ble_device
+
+
+def get_command_device(plant_connections, device_id):
+    """コマンドの送信先デバイスの接続を、デバイスに割り当てられたアダプタで用意する"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        dev_info = conn.execute("SELECT device_id, mac_address FROM devices WHERE device_id = ?", (device_id,)).fetchone()
+    except Exception as e:
+        logger.error(f"デバイス情報の取得中にエラーが発生しました: {e}", exc_info=True)
+        return None
+    finally:
+        if conn:
+            conn.close()
+    if not dev_info:
+        logger.error(f"コマンド実行のためにデバイス {device_id} がデータベースに見つかりません。")
+        return None
+    adapter = adapter_pool.adapter_for(dict(dev_info))
+    return get_plant_device(plant_connections, device_id, dev_info['mac_address'], adapter)
+
+
 async def process_commands(plant_connections):
     """コマンドパイプを処理してBLE操作を実行する"""
     logger.info("コマンドパイプ内のコマンドを確認しています...")
@@ -314,62 +378,27 @@ async def process_commands(plant_connections):
                 logger.info(f"コマンド '{command}' をデバイス {device_id} のために受信しました")
 
                 if command == "set_watering_thresholds":
-                    if device_id not in plant_connections:
-                        logger.warning(f"{device_id} の有効な接続がないため、閾値を設定できません。接続を試みます。")
-                        # データベースからこのデバイスのMACアドレスを再取得
-                        conn = None
-                        try:
-                            conn = get_db_connection()
-                            dev_info = conn.execute("SELECT mac_address FROM devices WHERE device_id = ?", (device_id,)).fetchone()
-                            if dev_info:
-                                plant_connections[device_id] = PlantDeviceBLE(dev_info['mac_address'], device_id)
-                            else:
-                                logger.error(f"コマンド実行のためにデバイス {device_id} がデータベースに見つかりません。")
-                                continue
-                        except Exception as e:
-                            logger.error(f"デバイス情報の取得中にエラーが発生しました: {e}", exc_info=True)
-                            continue
-                        finally:
-                            if conn:
-                                conn.close()
-                    
-                    ble_device = plant_connections[device_id]
                     dry_mv = payload.get('dry_threshold')
                     wet_mv = payload.get('wet_threshold')
 
                     if dry_mv is not None and wet_mv is not None:
-                        try:
-                            success = await ble_device.set_watering_thresholds(dry_mv, wet_mv)
-                            if success:
-                                logger.info(f"{device_id} に閾値を正常に送信しました。")
-                        except Exception as e:
-                            logger.error(f"{device_id} への閾値の送信に失敗しました: {e}")
-                        finally:
-                            await ble_device.disconnect()
+                        # ポーリング中のデバイスは、ポーリングが終わるまで待つ
+                        async with get_device_lock(device_id):
+                            ble_device = get_command_device(plant_connections, device_id)
+                            if ble_device is None:
+                                continue
+                            try:
+                                success = await ble_device.set_watering_thresholds(dry_mv, wet_mv)
+                                if success:
+                                    logger.info(f"{device_id} に閾値を正常に送信しました。")
+                            except Exception as e:
+                                logger.error(f"{device_id} への閾値の送信に失敗しました: {e}")
+                            finally:
+                                await ble_device.disconnect()
                     else:
                         logger.error(f"set_watering_thresholds のペイロードが無効です: {payload}")
                 
                 elif command == "control_led":
-                    if device_id not in plant_connections:
-                        logger.warning(f"No active connection for {device_id} to control LED. Attempting to connect.")
-                        # Re-fetch MAC address for this device from the DB
-                        conn = None
-                        try:
-                            conn = get_db_connection()
-                            dev_info = conn.execute("SELECT mac_address FROM devices WHERE device_id = ?", (device_id,)).fetchone()
-                            if dev_info:
-                                plant_connections[device_id] = PlantDeviceBLE(dev_info['mac_address'], device_id)
-                            else:
-                                logger.error(f"Device {device_id} not found in database for command execution.")
-                                continue
-                        except Exception as e:
-                            logger.error(f"Error fetching device info: {e}", exc_info=True)
-                            continue
-                        finally:
-                            if conn:
-                                conn.close()
-                    
-                    ble_device = plant_connections[device_id]
                     red = payload.get('red')
                     green = payload.get('green')
                     blue = payload.get('blue')
@@ -377,15 +406,19 @@ async def process_commands(plant_connections):
                     duration_ms = payload.get('duration_ms', 0)
 
                     if all(v is not None for v in [red, green, blue, brightness]):
-                        try:
-                            logger.info(f"Sending LED control command to {device_id}: R={red}, G={green}, B={blue}, Brightness={brightness}, Duration={duration_ms}ms")
-                            success = await ble_device.control_led(red, green, blue, brightness, duration_ms)
-                            if success:
-                                logger.info(f"Successfully sent LED control command to {device_id}.")
-                        except Exception as e:
-                            logger.error(f"Failed to send LED control command to {device_id}: {e}")
-                        finally:
-                            await ble_device.disconnect()
+                        async with get_device_lock(device_id):
+                            ble_device = get_command_device(plant_connections, device_id)
+                            if ble_device is None:
+                                continue
+                            try:
+                                logger.info(f"Sending LED control command to {device_id}: R={red}, G={green}, B={blue}, Brightness={brightness}, Duration={duration_ms}ms")
+                                success = await ble_device.control_led(red, green, blue, brightness, duration_ms)
+                                if success:
+                                    logger.info(f"Successfully sent LED control command to {device_id}.")
+                            except Exception as e:
+                                logger.error(f"Failed to send LED control command to {device_id}: {e}")
+                            finally:
+                                await ble_device.disconnect()
                     else:
                         logger.error(f"Invalid payload for control_led: {payload}")
 
@@ -400,6 +433,57 @@ SWITCHBOT_POLL_TIMEOUT = 30   # SwitchBotアドバタイズスキャンのタイ
 HARD_KILL_EXTRA = 30          # SIGALRM発動までの追加バッファ（秒）
 
 
+class HardDeadlineRegistry:
+    """
+    run_with_ble_timeout のハードタイムアウトの期限を管理する。
+    アダプタごとのポーリングが並行して動くため、プロセスに1つしかないSIGALRMを
+    実行中のBLE操作のうち最も早い期限に合わせて設定し直す。
+    """
+
+    def __init__(self):
+        # token -> (期限(monotonic), device_id, 秒数)
+        self.deadlines = {}
+        self._tokens = 0
+        self._installed = False
+
+    def add(self, device_id, seconds):
+        if not self._installed:
+            signal.signal(signal.SIGALRM, self._handler)
+            self._installed = True
+        self._tokens += 1
+        self.deadlines[self._tokens] = (time.monotonic() + seconds, device_id, seconds)
+        self._arm()
+        return self._tokens
+
+    def remove(self, token):
+        self.deadlines.pop(token, None)
+        self._arm()
+
+    def _arm(self):
+        if not self.deadlines:
+            signal.alarm(0)
+            return
+        earliest = min(deadline for deadline, _, _ in self.deadlines.values())
+        signal.alarm(max(1, math.ceil(earliest - time.monotonic())))
+
+    def _handler(self, signum, frame):
+        now = time.monotonic()
+        expired = [(device_id, seconds) for deadline, device_id, seconds in self.deadlines.values() if deadline <= now]
+        if not expired:
+            # 期限が延びた（先に終わった操作の期限で発動した）場合は設定し直す
+            self._arm()
+            return
+        device_id, seconds = expired[0]
+        logger.error(
+            f"[{device_id}] BLEハードタイムアウト(SIGALRM {seconds}秒)。"
+            f"プロセスを終了します（systemdが再起動します）。"
+        )
+        raise SystemExit(1)
+
+
+hard_deadlines = HardDeadlineRegistry()
+
+
 async def run_with_ble_timeout(coro, device_id, timeout):
     """BLE操作に2段階タイムアウトを設定して実行する。
 
@@ -412,6 +496,7 @@ async def run_with_ble_timeout(coro, device_id, timeout):
         Stage 1のキャンセルが効かない場合（Bleakのクリーンアップがハングする等）、
         SIGALRMがepoll_waitをINTRで中断し、プロセスを終了する。
         systemdが自動的に再起動する。
+        複数アダプタのBLE操作が並行するため、期限は hard_deadlines で共有する。
     """
     loop = asyncio.get_running_loop()
     task = asyncio.ensure_future(coro)
@@ -423,15 +508,7 @@ async def run_with_ble_timeout(coro, device_id, timeout):
         )
         loop.call_soon_threadsafe(task.cancel)
 
-    def _sigalrm_handler(signum, frame):
-        logger.error(
-            f"[{device_id}] BLEハードタイムアウト(SIGALRM {timeout + HARD_KILL_EXTRA}秒)。"
-            f"プロセスを終了します（systemdが再起動します）。"
-        )
-        raise SystemExit(1)
-
-    old_sigalrm = signal.signal(signal.SIGALRM, _sigalrm_handler)
-    signal.alarm(timeout + HARD_KILL_EXTRA)
+    token = hard_deadlines.add(device_id, timeout + HARD_KILL_EXTRA)
     timer = threading.Timer(timeout, _cancel_from_thread)
     timer.start()
     try:
@@ -440,23 +517,276 @@ async def run_with_ble_timeout(coro, device_id, timeout):
         raise asyncio.TimeoutError(f"[{device_id}] BLE操作が{timeout}秒でタイムアウト")
     finally:
         timer.cancel()
-        signal.alarm(0)
-        signal.signal(signal.SIGALRM, old_sigalrm)
+        hard_deadlines.remove(token)
+
+
+# 欠損期間のバックフィル対象を決めるプランナー（要求済みの時刻を記憶する）
+backfill_planner = BackfillPlanner()
+
+
+async def backfill_device(ble_device, dev_id, data_version):
+    """
+    接続中のデバイスから、DB上で欠損している期間のデータを取得してパイプに書き出す。
+    CMD_GET_TIME_DATAに対応したデバイス (data_versionがTIME_DATA_LAYOUTSに登録済み) のみ対象。
+    バックフィルの失敗はポーリングの失敗として扱わない。
+    """
+    if not config.BACKFILL_ENABLED or data_version not in TIME_DATA_LAYOUTS:
+        return
+    try:
+        targets = backfill_planner.plan(dev_id)
+        if not targets:
+            return
+        results = await run_with_ble_timeout(
+            ble_device.get_time_data_batch([target for target, _, _ in targets]),
+            dev_id,
+            timeout=config.BACKFILL_TIMEOUT
+        )
+        backfill_planner.mark_attempted(dev_id, targets)
+        records = collect_backfill_records(targets, results)
+        if records:
+            write_to_pipe({
+                "device_id": dev_id,
+                "timestamp": datetime.now().isoformat(),
+                "data_version": data_version,
+                "backfill": records
+            })
+            logger.info(f"{dev_id} の欠損期間のデータを {len(records)} 件取得しました")
+    except (asyncio.TimeoutError, BleakError) as e:
+        logger.warning(f"{dev_id} のバックフィルに失敗しました: {e}")
+    except Exception as e:
+        logger.error(f"{dev_id} のバックフィル中に予期しないエラーが発生しました: {e}", exc_info=True)
+
+
+# デバイスごとのサーキットブレーカー（状態はdevice_poll_stateに保存する）
+circuit_breaker = DeviceCircuitBreaker()
+
+
+def load_breaker_state():
+    """前回起動時のブレーカー状態をDBから復元する"""
+    conn = None
+    try:
+        conn = get_db_connection(readonly=True)
+        circuit_breaker.load(conn)
+    except Exception as e:
+        logger.error(f"ブレーカー状態の読み込みに失敗しました: {e}", exc_info=True)
+    finally:
+        if conn:
+            conn.close()
+
+
+def save_breaker_state(device_id):
+    """デバイスのブレーカー状態をDBに保存する"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        circuit_breaker.save(conn, device_id)
+        conn.commit()
+    except Exception as e:
+        logger.error(f"{device_id} のブレーカー状態の保存に失敗しました: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+def save_adapter_health_snapshot(active_by_adapter=None):
+    """アダプタごとの健全性指標をDBに保存し、保持期間を過ぎた指標を削除する"""
+    active_by_adapter = active_by_adapter or {}
+    conn = None
+    try:
+        conn = get_db_connection()
+        for adapter, health in adapter_pool.health.items():
+            health.save_snapshot(conn, active_by_adapter.get(adapter))
+        conn.execute(
+            "DELETE FROM adapter_health_metrics WHERE recorded_at < datetime('now', 'localtime', ?)",
+            (f"-{config.ADAPTER_HEALTH_RETENTION_DAYS} days",)
+        )
+        conn.commit()
+    except Exception as e:
+        logger.error(f"アダプタの健全性指標の保存に失敗しました: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+async def poll_device(device, adapter, scheduler, plant_connections, stats):
+    """1台のデバイスをアダプタ adapter でポーリングし、結果をブレーカーとスケジューラに記録する"""
+    dev_id = device.get('device_id')
+    device_type = device.get('device_type')
+    mac_address = device.get('mac_address')
+    data_version = device.get('data_version', 1)  # デフォルトは1
+    health = adapter_pool.health.get(adapter)
+    sensor_data = None
+    received_at = None
+    failure = None
+
+    logger.info(f"device info: {device}")
+    logger.info(f"Polling device: {device.get('device_name')} ({dev_id}) of type {device_type} at {mac_address} via {adapter}")
+    logger.info(f"デバイスをポーリング中: {device.get('device_name')} ({dev_id})")
+
+    try:
+        try:
+            if device_type == 'plant_sensor':
+                ble_device = get_plant_device(plant_connections, dev_id, mac_address, adapter)
+                try:
+                    sensor_data = await run_with_ble_timeout(
+                        ble_device.get_sensor_data(),
+                        dev_id,
+                        timeout=DEVICE_POLL_TIMEOUT
+                    )
+                    received_at = datetime.now()
+                    # 同じ接続のまま、受信できなかった期間のデータをデバイスの記録から補完する
+                    if sensor_data:
+                        await backfill_device(ble_device, dev_id, sensor_data.get('data_version', data_version))
+                finally:
+                    # 接続を明示的に切断してBluetoothリソースを解放
+                    await ble_device.disconnect()
+                    adapter_pool.record_rssi(mac_address, adapter, ble_device.last_rssi)
+
+            elif device_type and device_type.startswith('switchbot_'):
+                sensor_data = await run_with_ble_timeout(
+                    get_switchbot_adv_data(mac_address, adapter),
+                    dev_id,
+                    timeout=SWITCHBOT_POLL_TIMEOUT
+                )
+                received_at = datetime.now()
+
+            # 取得結果をpipeファイルに書き出す
+            # センサーデータに含まれるdata_versionを優先し、なければDB値を使用
+            # timestampは受信時刻（切断・バックフィルの前）。デバイスの計測時刻は data['datetime'] にある
+            actual_data_version = sensor_data.get('data_version', data_version) if sensor_data else data_version
+            pipe_data = {
+                "device_id": dev_id,
+                "timestamp": (received_at or datetime.now()).isoformat(),
+                "data_version": actual_data_version,
+                "data": sensor_data  # データがなくてもNoneとして記録
+            }
+            write_to_pipe(pipe_data)
+
+            # plant_sensorでデータ取得失敗（retry_on_failureがNoneを返した場合）
+            if device_type == 'plant_sensor' and sensor_data is None:
+                failure = "センサーデータ取得に失敗しました（リトライ上限到達）"
+                stats['error'] += 1
+                stats['ble_error'] += 1
+                logger.warning(f"{dev_id} のセンサーデータ取得に失敗しました（リトライ上限到達）")
+
+        except (asyncio.TimeoutError, BleakError) as e:
+            failure = str(e) or type(e).__name__
+            if health:
+                health.record_error(e)
+            stats['error'] += 1
+            stats['ble_error'] += 1
+            logger.error(f"{dev_id} のBLE通信がタイムアウトしました: {e}", exc_info=True)
+            write_to_pipe({
+                "device_id": dev_id,
+                "timestamp": datetime.now().isoformat(),
+                "error": str(e)
+            })
+
+        except Exception as e:
+            failure = str(e) or type(e).__name__
+            stats['error'] += 1
+            stats['ble_error'] += 1
+            logger.error(f"{dev_id} のデータ収集中に未処理のエラーが発生しました: {e}", exc_info=True)
+            # エラー情報もpipeに書き出す
+            write_to_pipe({
+                "device_id": dev_id,
+                "timestamp": datetime.now().isoformat(),
+                "error": str(e)
+            })
+
+        if health:
+            health.record_device_result(dev_id, failure is None)
+        if failure is None:
+            stats['success'] += 1
+            if circuit_breaker.record_success(dev_id):
+                save_breaker_state(dev_id)
+            interval = scheduler.record_success(dev_id, sensor_data)
+            if interval is not None:
+                logger.info(f"{dev_id} の次回ポーリングは {interval:.0f} 秒後です ({scheduler.states[dev_id]['reason']})")
+        else:
+            new_breaker_state = circuit_breaker.record_failure(dev_id, failure)
+            save_breaker_state(dev_id)
+            if new_breaker_state == OPEN:
+                scheduler.reschedule(dev_id, circuit_breaker.seconds_until_retry(dev_id), 'circuit_open')
+            else:
+                scheduler.record_failure(dev_id)
+    finally:
+        # 取り出したまま次回時刻が決まらなかった（キャンセル等で中断された）デバイスを戻す
+        state = scheduler.states.get(dev_id)
+        if state is not None and state['due'] is None:
+            scheduler.record_failure(dev_id)
+
+
+async def adapter_worker(adapter, queue, scheduler, plant_connections, stats):
+    """アダプタごとのポーリングパイプライン。割り当てられたデバイスを順にポーリングする"""
+    while True:
+        device = await queue.get()
+        dev_id = device['device_id']
+        try:
+            if adapter not in adapter_pool.available():
+                # 待っている間にアダプタが外された場合は、すぐに他のアダプタに割り当て直す
+                scheduler.reschedule(dev_id, 0, 'adapter_failover')
+                continue
+            async with get_device_lock(dev_id):
+                await poll_device(device, adapter, scheduler, plant_connections, stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[{adapter}] {dev_id} のポーリング中に予期しないエラーが発生しました: {e}", exc_info=True)
+        finally:
+            queue.task_done()
+        await asyncio.sleep(2) # デバイス間のポーリングに短い遅延
+
+
+def sync_adapter_workers(workers, scheduler, plant_connections, stats):
+    """アダプタの増減に合わせてワーカーを起動・停止する"""
+    for adapter in adapter_pool.adapters:
+        if adapter not in workers:
+            queue = asyncio.Queue()
+            task = asyncio.ensure_future(adapter_worker(adapter, queue, scheduler, plant_connections, stats))
+            workers[adapter] = (queue, task)
+    for adapter in list(workers):
+        if adapter not in adapter_pool.adapters:
+            queue, task = workers.pop(adapter)
+            task.cancel()
+            # 待っていたデバイスは他のアダプタに割り当て直す
+            while not queue.empty():
+                scheduler.reschedule(queue.get_nowait()['device_id'], 0, 'adapter_removed')
+
+
+def count_active_plant_sensors(scheduler):
+    """アダプタごとの、ポーリング対象の（ブレーカーが閉じている）プラントセンサーの台数"""
+    active_by_adapter = {}
+    for dev_id, state in scheduler.states.items():
+        if state['device'].get('device_type') == 'plant_sensor' and circuit_breaker.state(dev_id) == CLOSED:
+            adapter = adapter_pool.assignment.get(dev_id)
+            if adapter is not None:
+                active_by_adapter[adapter] = active_by_adapter.get(adapter, 0) + 1
+    return active_by_adapter
 
 
 async def main_loop():
-    """Bluetoothデバイスのポーリングとコマンド処理を行うメインループ"""
+    """
+    Bluetoothデバイスのポーリングとコマンド処理を行うメインループ。
+    ポーリング時刻になったデバイスを割り当てられたアダプタのキューに入れ、
+    アダプタごとのワーカー (adapter_worker) が並行してポーリングする。
+    """
     logger.info("Bluetoothデーモンループを開始します...")
     plant_sensor_connections = {}
     iteration = 0
     last_heartbeat_time = datetime.now()
     heartbeat_interval = 300  # 5分ごとにハートビートログを出力
 
-    # エラー統計
-    error_count = 0
-    success_count = 0
-    db_error_count = 0
-    ble_error_count = 0
+    # デバイスごとの次回ポーリング時刻を管理する
+    scheduler = PollScheduler()
+    load_breaker_state()
+    last_device_refresh = None
+    last_health_snapshot = time.monotonic()
+
+    # エラー統計（アダプタごとのワーカーと共有する）
+    stats = {'success': 0, 'error': 0, 'db_error': 0, 'ble_error': 0}
+    # adapter -> (asyncio.Queue, ワーカーのタスク)
+    workers = {}
 
     while True:
         try:
@@ -465,14 +795,17 @@ async def main_loop():
 
             # 詳細なハートビートログ（5分ごと）
             if (current_time - last_heartbeat_time).total_seconds() >= heartbeat_interval:
-                total_operations = success_count + error_count
-                success_rate = (success_count / total_operations * 100) if total_operations > 0 else 0
+                total_operations = stats['success'] + stats['error']
+                success_rate = (stats['success'] / total_operations * 100) if total_operations > 0 else 0
                 logger.info(
                     f"=== ハートビート === "
                     f"イテレーション: {iteration}, "
                     f"アクティブ接続: {len(plant_sensor_connections)}, "
-                    f"成功/エラー: {success_count}/{error_count} ({success_rate:.1f}%), "
-                    f"DB/BLEエラー: {db_error_count}/{ble_error_count}, "
+                    f"成功/エラー: {stats['success']}/{stats['error']} ({success_rate:.1f}%), "
+                    f"DB/BLEエラー: {stats['db_error']}/{stats['ble_error']}, "
+                    f"スケジュール: {scheduler.snapshot()}, "
+                    f"割り当て: {adapter_pool.assignment}, "
+                    f"アダプタ: {[health.metrics() for health in adapter_pool.health.values()]}, "
                     f"稼働時間: {current_time.strftime('%Y-%m-%d %H:%M:%S')}"
                 )
                 last_heartbeat_time = current_time
@@ -482,130 +815,64 @@ async def main_loop():
             # コマンド処理をループの最初に追加
             await process_commands(plant_sensor_connections)
 
-            try:
-                devices_to_poll = get_devices_from_db()
-            except Exception as e:
-                db_error_count += 1
-                error_count += 1
-                logger.error(f"デバイス一覧の取得に失敗: {e}", exc_info=True)
-                await asyncio.sleep(10)
-                continue
-
-            if not devices_to_poll:
-                logger.info("データベースに設定済みのデバイスがありません。待機します...")
-                await asyncio.sleep(config.DATA_FETCH_INTERVAL)
-                continue
-
-            logger.info(f"{len(devices_to_poll)} 個のデバイスのデータ収集サイクルを開始します。")
-
-            # サイクル内のタイムアウト追跡
-            cycle_plant_sensor_count = 0
-            cycle_timeout_count = 0
-
-            for device in devices_to_poll:
-                dev_id = device.get('device_id')
-                device_type = device.get('device_type')
-                mac_address = device.get('mac_address')
-                data_version = device.get('data_version', 1)  # デフォルトは1
-                sensor_data = None
-
-                logger.info(f"device info: {device}")
-                logger.info(f"Polling device: {device.get('device_name')} ({dev_id}) of type {device_type} at {mac_address}")
-                logger.info(f"デバイスをポーリング中: {device.get('device_name')} ({dev_id})")
-
+            # デバイス一覧・閾値・アダプタを定期的に読み直してスケジューラとワーカーに反映する
+            if last_device_refresh is None or time.monotonic() - last_device_refresh >= config.POLL_DEVICE_REFRESH_SECONDS:
                 try:
-                    if device_type == 'plant_sensor':
-                        cycle_plant_sensor_count += 1
-                        if dev_id not in plant_sensor_connections:
-                            plant_sensor_connections[dev_id] = PlantDeviceBLE(mac_address, dev_id)
-                        ble_device = plant_sensor_connections[dev_id]
-                        try:
-                            sensor_data = await run_with_ble_timeout(
-                                ble_device.get_sensor_data(),
-                                dev_id,
-                                timeout=DEVICE_POLL_TIMEOUT
-                            )
-                        finally:
-                            # 接続を明示的に切断してBluetoothリソースを解放
-                            await ble_device.disconnect()
-
-                    elif device_type and device_type.startswith('switchbot_'):
-                        sensor_data = await run_with_ble_timeout(
-                            get_switchbot_adv_data(mac_address),
-                            dev_id,
-                            timeout=SWITCHBOT_POLL_TIMEOUT
-                        )
-
-                    # 取得結果をpipeファイルに書き出す
-                    # センサーデータに含まれるdata_versionを優先し、なければDB値を使用
-                    actual_data_version = sensor_data.get('data_version', data_version) if sensor_data else data_version
-                    pipe_data = {
-                        "device_id": dev_id,
-                        "timestamp": datetime.now().isoformat(),
-                        "data_version": actual_data_version,
-                        "data": sensor_data  # データがなくてもNoneとして記録
-                    }
-                    write_to_pipe(pipe_data)
-
-                    # plant_sensorでデータ取得失敗（retry_on_failureがNoneを返した場合）
-                    if device_type == 'plant_sensor' and sensor_data is None:
-                        cycle_timeout_count += 1
-                        error_count += 1
-                        ble_error_count += 1
-                        bt_connection_tracker.record_result(False)
-                        logger.warning(f"{dev_id} のセンサーデータ取得に失敗しました（リトライ上限到達）")
-                    else:
-                        success_count += 1
-                        bt_connection_tracker.record_result(True)
-
-                except (asyncio.TimeoutError, BleakError) as e:
-                    error_count += 1
-                    ble_error_count += 1
-                    bt_connection_tracker.record_result(False)
-                    if device_type == 'plant_sensor':
-                        cycle_timeout_count += 1
-                    logger.error(f"{dev_id} のBLE通信がタイムアウトしました: {e}", exc_info=True)
-                    write_to_pipe({
-                        "device_id": dev_id,
-                        "timestamp": datetime.now().isoformat(),
-                        "error": str(e)
-                    })
-
+                    devices = get_devices_from_db()
+                    scheduler.sync(devices)
+                    scheduler.set_thresholds(get_poll_thresholds_from_db())
+                    last_device_refresh = time.monotonic()
                 except Exception as e:
-                    error_count += 1
-                    ble_error_count += 1
-                    bt_connection_tracker.record_result(False)
-                    logger.error(f"{dev_id} のデータ収集中に未処理のエラーが発生しました: {e}", exc_info=True)
-                    # エラー情報もpipeに書き出す
-                    write_to_pipe({
-                        "device_id": dev_id,
-                        "timestamp": datetime.now().isoformat(),
-                        "error": str(e)
-                    })
-
-                await asyncio.sleep(2) # デバイス間のポーリングに短い遅延
-
-            # 全plant_sensorデバイスがタイムアウトした場合、Bluetoothデーモンを即座にリセット
-            if cycle_plant_sensor_count > 0 and cycle_timeout_count >= cycle_plant_sensor_count:
-                logger.warning(
-                    f"全plant_sensorデバイス({cycle_plant_sensor_count}台)がタイムアウトしました。"
-                    f"Bluetoothデーモンをリセットします。"
-                )
-                bt_connection_tracker.restart_bluetooth()
-                plant_sensor_connections.clear()
-                logger.info("Bluetoothリセット後、15秒間待機します...")
-                await asyncio.sleep(15)
-                continue
-
-            # Bluetooth接続成功率をチェックし、必要なら再起動
-            if bt_connection_tracker.should_restart_bluetooth():
-                bt_connection_tracker.restart_bluetooth()
+                    stats['db_error'] += 1
+                    stats['error'] += 1
+                    logger.error(f"デバイス一覧の取得に失敗: {e}", exc_info=True)
+                    await asyncio.sleep(10)
+                    continue
+                adapter_pool.update_adapters(discover_adapters())
+                sync_adapter_workers(workers, scheduler, plant_sensor_connections, stats)
+
+            for device in scheduler.pop_due():
+                dev_id = device['device_id']
+                # ブレーカーが開いているデバイスは再試行時刻まで飛ばす
+                if not circuit_breaker.allow(dev_id):
+                    scheduler.reschedule(dev_id, circuit_breaker.seconds_until_retry(dev_id), 'circuit_open')
+                    continue
+                adapter = adapter_pool.adapter_for(device)
+                if adapter is None or adapter not in workers:
+                    scheduler.reschedule(dev_id, config.POLL_IDLE_CHECK_SECONDS, 'no_adapter')
+                    continue
+                workers[adapter][0].put_nowait(device)
+
+            # 一部のアダプタだけに異常（スキャンで何も受信できない・D-Busエラー・複数デバイスへの接続失敗）がある場合は
+            # そのアダプタを外してデバイスを他のアダプタに移す。すべてのアダプタが異常な場合だけ
+            # Bluetoothサービスを再起動する。個々のデバイスの失敗はブレーカーとバックオフで扱う
+            active_by_adapter = count_active_plant_sensors(scheduler)
+            unhealthy = adapter_pool.unhealthy_adapters(active_by_adapter)
+            if unhealthy and len(unhealthy) < len(adapter_pool.available()):
+                for adapter, reason in unhealthy:
+                    adapter_pool.mark_failed(adapter, reason)
+            elif bt_restart_manager.should_restart_bluetooth(active_by_adapter):
+                if bt_restart_manager.restart_bluetooth():
+                    plant_sensor_connections.clear()
+                    # 再起動後はバックオフ中のデバイスもすぐに再試行する（ポーリング中のデバイスは除く）
+                    for dev_id, state in scheduler.states.items():
+                        if state['device'].get('device_type') == 'plant_sensor' and state['due'] is not None \
+                                and circuit_breaker.state(dev_id) == CLOSED:
+                            scheduler.reschedule(dev_id, 15, 'bluetooth_reset')
                 # 再起動後は少し長めに待機してBluetoothスタックの安定化を待つ
                 logger.info("Bluetooth再起動後、15秒間待機します...")
                 await asyncio.sleep(15)
 
-            logger.info(f"データ収集サイクルが終了しました。{config.DATA_FETCH_INTERVAL} 秒間待機します。")
-            await asyncio.sleep(config.DATA_FETCH_INTERVAL)
+            # アダプタの健全性指標を定期的に保存する（グラフ表示用）
+            if time.monotonic() - last_health_snapshot >= config.ADAPTER_HEALTH_SNAPSHOT_SECONDS:
+                save_adapter_health_snapshot(active_by_adapter)
+                last_health_snapshot = time.monotonic()
+
+            wait_seconds = scheduler.seconds_until_next()
+            if wait_seconds is None and not scheduler.states:
+                logger.info("データベースに設定済みのデバイスがありません。待機します...")
+            # 待機中もコマンドパイプを確認できるよう、短い間隔で起きる
+            await asyncio.sleep(min(config.POLL_IDLE_CHECK_SECONDS, wait_seconds if wait_seconds is not None else config.POLL_IDLE_CHECK_SECONDS))
 
         except asyncio.CancelledError:
             logger.info("メインループがキャンセルされました。終了します。")
@@ -614,9 +881,9 @@ async def main_loop():
             logger.info("キーボード割り込みを受信しました。終了します。")
             raise
         except Exception as e:
-            error_count += 1
+            stats['error'] += 1
             logger.error(f"メインループで予期しないエラーが発生しました: {e}", exc_info=True)
-            logger.warning(f"エラー統計 - 成功: {success_count}, エラー: {error_count}, DB: {db_error_count}, BLE: {ble_error_count}")
+            logger.warning(f"エラー統計 - 成功: {stats['success']}, エラー: {stats['error']}, DB: {stats['db_error']}, BLE: {stats['ble_error']}")
             logger.info("10秒後にループを再開します...")
             await asyncio.sleep(10)
             continue
@@ -0,0 +1,147 @@
+# plant_dashboard/circuit_breaker.py
+"""
+デバイスごとのサーキットブレーカー
+
+電池切れや通信圏外のセンサーは、ポーリングのたびにタイムアウトまで待たされるうえ、
+失敗がBluetooth全体の接続成功率に数えられてアダプタの再起動や再起動(reboot)の原因になる。
+連続して失敗したデバイスはブレーカーを開いて一定時間ポーリングを止め、
+時間が経ったら1回だけ試す（half-open）。成功すれば閉じ、失敗すれば停止時間を延ばして再び開く。
+
+状態は device_poll_state テーブルに保存し、デーモン再起動後も引き継ぐ。Webアプリはこのテーブルを参照する。
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class DeviceCircuitBreaker:
+    """デバイスごとのブレーカー状態を管理する"""
+
+    def __init__(self, failure_threshold=None, open_base_seconds=None, open_max_seconds=None):
+        self.failure_threshold = failure_threshold or config.BREAKER_FAILURE_THRESHOLD
+        self.open_base_seconds = open_base_seconds or config.BREAKER_OPEN_BASE_SECONDS
+        self.open_max_seconds = open_max_seconds or config.BREAKER_OPEN_MAX_SECONDS
+        # device_id -> {'state', 'consecutive_failures', 'open_count', 'opened_at', 'retry_at', 'last_error', ...}
+        self.devices = {}
+
+    def load(self, conn):
+        """device_poll_state から状態を復元する"""
+        for row in conn.execute("SELECT * FROM device_poll_state").fetchall():
+            self.devices[row['device_id']] = {
+                'state': row['breaker_state'],
+                'consecutive_failures': row['consecutive_failures'],
+                'open_count': row['open_count'],
+                'opened_at': _parse(row['opened_at']),
+                'retry_at': _parse(row['retry_at']),
+                'last_success_at': _parse(row['last_success_at']),
+                'last_failure_at': _parse(row['last_failure_at']),
+                'last_error': row['last_error'],
+            }
+
+    def get(self, device_id):
+        return self.devices.setdefault(device_id, {
+            'state': CLOSED, 'consecutive_failures': 0, 'open_count': 0, 'opened_at': None, 'retry_at': None,
+            'last_success_at': None, 'last_failure_at': None, 'last_error': None,
+        })
+
+    def state(self, device_id):
+        return self.get(device_id)['state']
+
+    def allow(self, device_id, now=None):
+        """
+        ポーリングしてよいかを返す。開いているブレーカーは停止時間が過ぎたら half-open にして1回だけ許可する。
+        """
+        now = now or datetime.now()
+        breaker = self.get(device_id)
+        if breaker['state'] == OPEN:
+            if breaker['retry_at'] is not None and now < breaker['retry_at']:
+                return False
+            breaker['state'] = HALF_OPEN
+            logger.info(f"[{device_id}] ブレーカーを half-open にして再試行します")
+        return True
+
+    def seconds_until_retry(self, device_id, now=None):
+        """開いているブレーカーの再試行までの秒数。閉じていれば0"""
+        now = now or datetime.now()
+        breaker = self.get(device_id)
+        if breaker['state'] != OPEN or breaker['retry_at'] is None:
+            return 0
+        return max(0.0, (breaker['retry_at'] - now).total_seconds())
+
+    def record_success(self, device_id, now=None):
+        """成功を記録する。状態を保存する必要があればTrueを返す"""
+        now = now or datetime.now()
+        breaker = self.get(device_id)
+        changed = breaker['state'] != CLOSED or breaker['consecutive_failures'] > 0
+        if breaker['state'] != CLOSED:
+            logger.info(f"[{device_id}] ポーリングが成功したためブレーカーを閉じます")
+        breaker.update(state=CLOSED, consecutive_failures=0, open_count=0, opened_at=None, retry_at=None,
+                       last_success_at=now)
+        return changed
+
+    def record_failure(self, device_id, error=None, now=None):
+        """
+        失敗を記録する。half-open での失敗、または連続失敗が閾値に達した場合にブレーカーを開く。
+        開くたびに停止時間を2倍にする（上限 open_max_seconds）。
+
+        Returns:
+            str: 記録後の状態
+        """
+        now = now or datetime.now()
+        breaker = self.get(device_id)
+        breaker['consecutive_failures'] += 1
+        breaker['last_failure_at'] = now
+        breaker['last_error'] = str(error)[:500] if error else None
+
+        if breaker['state'] == HALF_OPEN or breaker['consecutive_failures'] >= self.failure_threshold:
+            open_seconds = min(self.open_max_seconds, self.open_base_seconds * (2 ** breaker['open_count']))
+            breaker['open_count'] += 1
+            breaker.update(state=OPEN, opened_at=now, retry_at=now + timedelta(seconds=open_seconds))
+            logger.warning(
+                f"[{device_id}] {breaker['consecutive_failures']}回連続で失敗したためブレーカーを開きます。"
+                f"{open_seconds:.0f}秒間ポーリングを停止します"
+            )
+        return breaker['state']
+
+    def save(self, conn, device_id):
+        """状態を device_poll_state に保存する（コミットは呼び出し側で行う）"""
+        breaker = self.get(device_id)
+        conn.execute("""
+            INSERT INTO device_poll_state (
+                device_id, breaker_state, consecutive_failures, open_count, opened_at, retry_at,
+                last_success_at, last_failure_at, last_error, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(device_id) DO UPDATE SET
+                breaker_state=excluded.breaker_state, consecutive_failures=excluded.consecutive_failures,
+                open_count=excluded.open_count, opened_at=excluded.opened_at, retry_at=excluded.retry_at,
+                last_success_at=excluded.last_success_at, last_failure_at=excluded.last_failure_at,
+                last_error=excluded.last_error, updated_at=excluded.updated_at
+        """, (
+            device_id, breaker['state'], breaker['consecutive_failures'], breaker['open_count'],
+            _format(breaker['opened_at']), _format(breaker['retry_at']),
+            _format(breaker['last_success_at']), _format(breaker['last_failure_at']),
+            breaker['last_error'], datetime.now().strftime(TIMESTAMP_FORMAT)
+        ))
+
+
+def _format(value):
+    return value.strftime(TIMESTAMP_FORMAT) if value else None
+
+
+def _parse(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
@@ -21,6 +21,43 @@ os.makedirs(os.path.join(BASE_DIR, 'logs'), exist_ok=True)
 # --- データベース設定 ---
 DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'plant_monitor.db')
 
+# SQLiteストレージプロファイル（接続作成時に一度だけ適用される）
+# mmap_size: メモリマップI/Oのサイズ(バイト)。0で無効
+# cache_size: ページキャッシュ。負の値はKiB単位
+# temp_store: 一時テーブル・ソート領域 (DEFAULT / FILE / MEMORY)
+# wal_autocheckpoint: WALが何ページを超えたら書き込み側で自動チェックポイントするか。0で無効
+DB_STORAGE_PROFILES = {
+    # 従来の設定（SQLiteの既定値）
+    'default': {
+        'synchronous': 'NORMAL',
+        'mmap_size': 0,
+        'cache_size': -2000,
+        'temp_store': 'DEFAULT',
+        'wal_autocheckpoint': 1000,
+    },
+    # SDカード運用向け。読み取りはmmapと大きめのキャッシュで吸収し、
+    # チェックポイントは分析デーモンのバックグラウンド処理に任せる（自動チェックポイントは保険として大きめに設定）
+    'sd_card': {
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 4000,
+    },
+    # メモリの少ない環境向け
+    'low_memory': {
+        'synchronous': 'NORMAL',
+        'mmap_size': 16 * 1024 * 1024,
+        'cache_size': -4000,
+        'temp_store': 'MEMORY',
+        'wal_autocheckpoint': 2000,
+    },
+}
+# 使用するプロファイル名。環境変数 'PLANT_DB_STORAGE_PROFILE' で上書き可能
+DB_STORAGE_PROFILE = os.environ.get('PLANT_DB_STORAGE_PROFILE', 'sd_card')
+# 分析デーモンがバックグラウンドでWALチェックポイントを実行する間隔(秒)
+DB_CHECKPOINT_INTERVAL = 60
+
 # --- Webアプリケーション設定 ---
 SECRET_KEY = os.environ.get('SECRET_KEY', 'a-very-secret-key-for-dev')
 DEBUG = False
@@ -30,6 +67,17 @@ BASIC_AUTH_USERNAME = 'admin'
 BASIC_AUTH_PASSWORD = 'plant'
 BASIC_AUTH_FORCE = True # アプリ全体でBasic認証を有効にする
 
+# 履歴APIのキャッシュ設定
+# サーバー側の履歴レスポンスキャッシュ (history_cache.py)
+# gunicornのワーカー間で共有するキャッシュファイル。Noneにするとワーカーごとのキャッシュだけを使う
+HISTORY_CACHE_PATH = os.path.join('/tmp', 'plant_dashboard_history_cache.db')
+HISTORY_CACHE_MAX_ENTRIES = 256  # ワーカーごとに保持する件数
+HISTORY_CACHE_SHARED_MAX_ENTRIES = 2000  # 共有ファイルに保持する件数
+HISTORY_CACHE_TTL_SECONDS = 600  # 現在時刻を含む期間のエントリの有効期間(秒)
+HISTORY_CACHE_PAST_TTL_SECONDS = 24 * 3600  # 過去の期間のエントリの有効期間(秒)
+# 一括履歴API (/api/history/batch) で1回に要求できる項目数
+HISTORY_BATCH_MAX_ITEMS = 50
+
 # 画像アップロード設定
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads', 'plant_images')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -55,7 +103,115 @@ BLE_OPERATION_RETRY_DELAY = 1.0  # リトライ間の待機時間(秒)
 DATA_FETCH_INTERVAL = 60
 # 植物の状態分析デーモンの実行間隔(秒)
 PLANT_ANALYZER_INTERVAL = 3600 # 1時間
+# 分析デーモンがデータパイプを確認する間隔(秒)
+ANALYZER_PIPE_CHECK_INTERVAL = 1
+# 新着データ到着後、追加データを待ってから分析を開始するまでの時間(秒)
+ANALYSIS_DEBOUNCE_SECONDS = 30
+# データが届き続ける場合でも、この時間(秒)を超えて分析を遅らせない
+ANALYSIS_MAX_DELAY_SECONDS = 180
+# 同じ植物を再分析するまでの最小間隔(秒)
+ANALYSIS_MIN_INTERVAL_SECONDS = 600
 # Webアプリからデーモンへのコマンド連携用パイプ
 COMMAND_PIPE_PATH = "/tmp/plant_dashboard_cmd_pipe.jsonl"
 
+# --- バックフィル設定 ---
+# 受信できなかった期間のデータを、デバイス内の記録 (CMD_GET_TIME_DATA) から取得して補完する
+BACKFILL_ENABLED = True
+# 欠損を探す期間(時間)
+BACKFILL_LOOKBACK_HOURS = 48
+# この秒数を超えて読み取りが空いている区間を欠損とみなす
+BACKFILL_GAP_THRESHOLD_SECONDS = 600
+# 欠損区間内で取得する時刻の間隔(秒)
+BACKFILL_STEP_SECONDS = 600
+# 1回のポーリングで取得する最大件数
+BACKFILL_MAX_TARGETS_PER_POLL = 36
+# 応答を待たずに送信するリクエスト数 (1で逐次実行)
+BACKFILL_PIPELINE_DEPTH = 4
+# バックフィル全体のタイムアウト(秒)
+BACKFILL_TIMEOUT = 90
+# 取得できなかった時刻を再度リクエストするまでの間隔(秒)
+BACKFILL_RETRY_SECONDS = 6 * 3600
+
+# --- ポーリングスケジューラ設定 ---
+# デバイスごとの間隔の下限・上限(秒)。初回や変化速度が不明な間はDATA_FETCH_INTERVALを使う
+# 上限は欠損とみなす間隔 (BACKFILL_GAP_THRESHOLD_SECONDS) から、ポーリング自体にかかる時間の余裕を引いた値にする。
+# 上限の方が長いと、値が安定したデバイスが毎回欠損と判定され、バックフィルが走りカバレッジも下がる
+POLL_INTERVAL_MARGIN_SECONDS = 60
+POLL_MIN_INTERVAL_SECONDS = DATA_FETCH_INTERVAL
+POLL_MAX_INTERVAL_SECONDS = BACKFILL_GAP_THRESHOLD_SECONDS - POLL_INTERVAL_MARGIN_SECONDS
+# 致死温度・乾燥の閾値に近いデバイスの間隔(秒)
+POLL_NEAR_THRESHOLD_INTERVAL_SECONDS = DATA_FETCH_INTERVAL
+POLL_LETHAL_TEMP_MARGIN = 2.0  # 致死温度までの余裕(℃)がこれ以下なら閾値付近とみなす
+POLL_SOIL_DRY_MARGIN = 100.0  # 乾燥閾値までの余裕(mV)がこれ以下なら閾値付近とみなす
+# 取得失敗時の指数バックオフの上限(秒)
+POLL_FAILURE_BACKOFF_MAX_SECONDS = 1800
+# 変化速度の指数移動平均の係数 (0〜1、大きいほど直近の変化を重視)
+POLL_VOLATILITY_SMOOTHING = 0.3
+# 有意な変化とみなす変化量。この変化が起きるまでの予想時間をポーリング間隔にする
+POLL_SIGNIFICANT_CHANGE = {
+    'temperature': 0.5,     # ℃
+    'humidity': 3.0,        # %
+    'soil_moisture': 30.0,  # mV
+}
+# デバイス一覧と閾値をDBから読み直す間隔(秒)
+POLL_DEVICE_REFRESH_SECONDS = 60
+# ポーリング対象がないときにコマンドパイプを確認する間隔(秒)
+POLL_IDLE_CHECK_SECONDS = 5
+
+# --- サーキットブレーカー設定 ---
+# 連続してこの回数失敗したデバイスはポーリングを一時停止する
+BREAKER_FAILURE_THRESHOLD = 3
+# 停止時間(秒)。再試行に失敗するたびに2倍にし、上限で打ち切る
+BREAKER_OPEN_BASE_SECONDS = 300
+BREAKER_OPEN_MAX_SECONDS = 6 * 3600
+
+# --- Bluetoothアダプタ健全性設定 ---
+# スキャンで何も受信できない・D-Bus/アダプタのエラーがこの回数続いたらBluetoothサービスを再起動する
+ADAPTER_FAILURE_THRESHOLD = 3
+# 成功を挟まずにこの台数の異なるデバイスへの接続が失敗したら再起動する（ポーリング対象の台数が少なければその台数、最低2台）
+ADAPTER_CONNECT_FAILURE_DEVICES = 3
+# スキャン時間・接続時間のパーセンタイルを計算するサンプル数
+ADAPTER_LATENCY_WINDOW = 200
+# 指標をadapter_health_metricsに保存する間隔(秒)と保持期間(日)
+ADAPTER_HEALTH_SNAPSHOT_SECONDS = 300
+ADAPTER_HEALTH_RETENTION_DAYS = 14
+# Bluetoothサービス再起動のクールダウン(秒)と、システム再起動に切り替えるまでの連続再起動回数
+BLUETOOTH_RESTART_COOLDOWN_SECONDS = 600
+BLUETOOTH_MAX_RESTARTS_BEFORE_REBOOT = 3
+
+# --- 複数アダプタ設定 ---
+# 使用するアダプタ名のリスト（例: "hci0,hci1"）。未設定なら /sys/class/bluetooth から検出する
+BLE_ADAPTERS = [name.strip() for name in os.environ.get('PLANT_BLE_ADAPTERS', '').split(',') if name.strip()]
+# アダプタが検出できないときに使うアダプタ名
+BLE_DEFAULT_ADAPTER = 'hci0'
+# デバイスのアダプタへの固定の割り当て。device_id またはMACアドレス -> アダプタ名
+BLE_DEVICE_ADAPTER_MAP = {}
+# 現在のアダプタよりこの値(dB)以上RSSIが強いアダプタがあれば割り当てを移す
+BLE_ADAPTER_RSSI_MARGIN = 6
+# 割り当てに使うRSSIの有効期間(秒)
+BLE_ADAPTER_RSSI_TTL_SECONDS = 1800
+# 異常で外したアダプタをポーリングに戻すまでの時間(秒)。アダプタがすべて異常ならBluetoothサービスを再起動する
+BLE_ADAPTER_FAILOVER_RETRY_SECONDS = 600
+
+# --- データ完全性設定 ---
+# 1時間あたりの期待読み取り数の基準となる間隔(秒)。この間隔ごとに1件以上あればその時間帯は欠損なしとみなす
+# 欠損の判定と揃え、ポーリング間隔の上限 (POLL_MAX_INTERVAL_SECONDS) で取得していれば100%になるようにする
+COMPLETENESS_EXPECTED_INTERVAL_SECONDS = BACKFILL_GAP_THRESHOLD_SECONDS
+# ポーリング順の決定に使うカバレッジの集計期間(時間)
+COMPLETENESS_PRIORITY_HOURS = 6
+
+# --- エクスポート設定 ---
+# data_export.py がDBから一度に読み出す行数（CSV/Parquetのチャンク・行グループの大きさ）
+EXPORT_CHUNK_ROWS = 5000
+
+# --- インポート設定 ---
+# data_import.py がステージングテーブルへ executemany で書き込み、コミットする行数
+IMPORT_BATCH_ROWS = 50000
+# 追加する行がこの数以上なら sensor_data のインデックスを削除してから追加し、最後に作り直す
+IMPORT_REBUILD_INDEX_MIN_ROWS = 1000000
+
+# --- デバイス時刻設定 ---
+# デバイスの計測時刻と受信時刻のずれ(秒)がこの範囲内なら、計測時刻で保存する。超える場合は時計がずれているとみなし受信時刻で保存する
+DEVICE_CLOCK_MAX_SKEW_SECONDS = 120
+
 FDC1004_CHANNEL_COUNT = 4  # FDC1004は4チャネルまで対応
\ No newline at end of file
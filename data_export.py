@@ -0,0 +1,265 @@
+# plant_dashboard/data_export.py
+"""
+センサーデータ・日別分析結果のエクスポート (CSV / Parquet)
+
+デバイスまたは植物と期間を指定して sensor_data / daily_plant_analysis を書き出す。
+カーソルから config.EXPORT_CHUNK_ROWS 行ずつ読み、変換したバイト列を順に返すため、
+何年分でもメモリ使用量は一定で、Webでは応答を逐次送信する (/api/export/<dataset>)。
+
+並び順はインデックス (device_id, timestamp) / (managed_plant_id, analysis_date) の順にして、
+SQLite側で全件をソートしないようにしている。
+
+Parquetの出力には pyarrow が必要（なければCSVのみ）。行グループ単位で書き出す。
+
+使い方:
+    python3 data_export.py sensor_data --device <device_id> --start 2025-01-01 --end 2025-12-31 -o sensor.csv
+    python3 data_export.py daily_plant_analysis --plant <managed_plant_id> --format parquet -o analysis.parquet
+"""
+
+import argparse
+import csv
+import io
+import logging
+import sys
+from datetime import date, timedelta
+
+import config
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# データセット -> (対象を絞る列, 期間を絞る列)
+DATASETS = {
+    'sensor_data': ('device_id', 'timestamp'),
+    'daily_plant_analysis': ('managed_plant_id', 'analysis_date'),
+}
+EXPORT_FORMATS = ('csv', 'parquet')
+MIMETYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_targets(conn, dataset, device_id=None, plant_id=None):
+    """
+    デバイス・植物の指定を、データセットの対象列の値のリストにする。
+    sensor_data に植物を指定した場合は植物に割り当てたセンサー、
+    daily_plant_analysis にデバイスを指定した場合はそのデバイスを割り当てた植物になる。
+    """
+    target_column, _ = DATASETS[dataset]
+    if device_id and plant_id:
+        raise ValueError("デバイスと植物はどちらか一方を指定してください")
+    if not device_id and not plant_id:
+        raise ValueError("デバイスまたは植物を指定してください")
+
+    if target_column == 'device_id':
+        if device_id:
+            return [device_id]
+        row = conn.execute(
+            "SELECT assigned_plant_sensor_id, assigned_switchbot_id FROM managed_plants WHERE managed_plant_id = ?",
+            (plant_id,)
+        ).fetchone()
+        return [value for value in (row or []) if value]
+
+    if plant_id:
+        return [plant_id]
+    rows = conn.execute(
+        "SELECT managed_plant_id FROM managed_plants WHERE assigned_plant_sensor_id = ? OR assigned_switchbot_id = ?",
+        (device_id, device_id)
+    ).fetchall()
+    return [row['managed_plant_id'] for row in rows]
+
+
+def table_columns(conn, table):
+    """[(列名, 宣言された型)] をテーブルの列順で返す"""
+    return [(row['name'], (row['type'] or '').upper()) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def iter_chunks(conn, dataset, target_ids, start=None, end=None, chunk_rows=None):
+    """
+    期間内の行を chunk_rows 行ずつのリストで返す。
+
+    Args:
+        start, end: 期間 (date)。両端の日を含む。Noneなら制限しない
+    """
+    target_column, time_column = DATASETS[dataset]
+    if not target_ids:
+        return
+    columns = ', '.join(name for name, _ in table_columns(conn, dataset))
+    conditions = [f"{target_column} IN ({','.join('?' * len(target_ids))})"]
+    params = list(target_ids)
+    if start:
+        conditions.append(f"{time_column} >= ?")
+        params.append(start.isoformat())
+    if end:
+        # 日時の列も文字列比較で終了日の翌日より前までを含める
+        conditions.append(f"{time_column} < ?")
+        params.append((end + timedelta(days=1)).isoformat())
+
+    cursor = conn.execute(f"""
+        SELECT {columns} FROM {dataset}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {target_column}, {time_column}
+    """, params)
+    while True:
+        rows = cursor.fetchmany(chunk_rows or config.EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        yield [tuple(row) for row in rows]
+
+
+def iter_csv(columns, chunks):
+    """ヘッダー行とチャンクごとのCSVをUTF-8のバイト列で返す"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink:
+    """ParquetWriterの書き込み先。書かれたバイト列を溜めておき、drain()で取り出す"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _arrow_type(pa, declared_type):
+    # SQLiteの型の決め方 (type affinity) に合わせる
+    if 'INT' in declared_type:
+        return pa.int64()
+    if any(name in declared_type for name in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    return pa.string()
+
+
+def iter_parquet(columns, chunks):
+    """チャンクごとに行グループを書き、できたバイト列を順に返す"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, _arrow_type(pa, declared_type)) for name, declared_type in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in chunks:
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export(dataset, export_format='csv', device_id=None, plant_id=None, start=None, end=None, chunk_rows=None):
+    """
+    エクスポートのバイト列を返すジェネレーターを作る。
+
+    引数の誤りはここで ValueError を送出する（Webではレスポンスを返し始める前に400にするため）。
+    接続はジェネレーターを最後まで読むか閉じたときに返却する。
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"不明なデータセットです: {dataset}")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"不明な形式です: {export_format}")
+    if export_format == 'parquet' and not parquet_available():
+        raise ValueError("Parquet形式の出力には pyarrow が必要です")
+    if start and end and start > end:
+        raise ValueError("開始日が終了日より後になっています")
+
+    conn = get_db_connection(readonly=True)
+    try:
+        target_ids = resolve_targets(conn, dataset, device_id, plant_id)
+        columns = table_columns(conn, dataset)
+    except Exception:
+        conn.close()
+        raise
+
+    def generate():
+        try:
+            chunks = iter_chunks(conn, dataset, target_ids, start, end, chunk_rows)
+            encode = iter_parquet if export_format == 'parquet' else iter_csv
+            yield from encode(columns, chunks)
+        finally:
+            conn.close()
+
+    return generate()
+
+
+def export_filename(dataset, export_format, device_id=None, plant_id=None, start=None, end=None):
+    parts = [dataset, device_id or plant_id]
+    if start or end:
+        parts.append(f"{start or ''}_{end or ''}")
+    return '_'.join(str(part) for part in parts if part).replace(':', '') + f".{export_format}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="sensor_data / daily_plant_analysis をCSVまたはParquetで書き出す")
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--device', help="デバイスID")
+    target.add_argument('--plant', help="管理植物ID (managed_plant_id)")
+    parser.add_argument('--start', type=date.fromisoformat, help="開始日 (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, help="終了日 (YYYY-MM-DD、この日を含む)")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('-o', '--output', help="出力ファイル。省略時は標準出力")
+    args = parser.parse_args(argv)
+
+    try:
+        chunks = export(args.dataset, args.format, args.device, args.plant, args.start, args.end)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            output.close()
+    if args.output:
+        print(f"{args.output} に {written} バイト書き出しました", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
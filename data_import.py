@@ -0,0 +1,349 @@
+# plant_dashboard/data_import.py
+"""
+過去のセンサーデータの一括取り込み (CSV / JSONL / SQLite)
+
+旧デーモン (plant_monitor_daemon copy.py, switchbot_daemon copy.py) のDBや、デバイスのCSVダンプを
+sensor_data に取り込む。数千万行でも数分で終わるよう、1行ずつINSERTせずに以下の手順で行う。
+
+1. 読み取った行を data_version のレイアウト (sensor_payloads.storage_layout) で保存するカラムに揃え、
+   インデックスのないステージングテーブルに executemany で書き込む（config.IMPORT_BATCH_ROWS 行ごとにコミット）
+2. 書き込み後にステージングのインデックスを作り、(device_id, timestamp) の重複と既存の行を除く
+3. sensor_data に INSERT ... SELECT でまとめて追加する。追加する行が多い場合は
+   sensor_data のインデックスを削除してから追加し、最後に作り直す
+4. 派生テーブル (sensor_latest, sensor_daily_last, sensor_completeness) を取り込んだデバイス・日・時間帯だけ更新し、
+   履歴キャッシュを無効にする。--reanalyze を指定すると取り込んだ日の日別分析もやり直す
+
+入力:
+- CSV: ヘッダー行のカラム名を sensor_data のカラム名として読む（device_id がなければ --device が必要）
+- JSONL: 1行1オブジェクト。データパイプと同じ {"device_id", "timestamp", "data": {...}, "data_version"} 形式も読める
+  （data['datetime'] の計測時刻はアナライザーと同じ規則で優先する）
+- SQLite: 別のDBファイルの sensor_data テーブル
+
+data_version は 行の値 > --data-version > devicesテーブルの値 > 1 の順に決める。
+
+使い方:
+    python3 data_import.py old_plant_monitor.db
+    python3 data_import.py dump.csv --device <device_id> --data-version 3
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import date
+from itertools import islice
+
+import config
+import history_cache
+from database import (
+    SENSOR_DATA_COLUMNS, checkpoint_wal, expected_readings_per_hour, get_db_connection, get_storage_profile
+)
+from device_manager import _format_sensor_timestamp, resolve_reading_timestamp
+from sensor_payloads import storage_layout
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = '_import_staging'
+# ステージングに書き込むカラム (sensor_dataのidを除く)
+STAGING_COLUMNS = [column for column in SENSOR_DATA_COLUMNS if column != 'id']
+SOURCE_FORMATS = ('csv', 'jsonl', 'sqlite')
+# 入力のカラム名の別名
+COLUMN_ALIASES = {
+    'datetime': 'timestamp',
+    'ext_temperature': 'ex_temperature',
+}
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.json', '.ndjson'):
+        return 'jsonl'
+    if extension in ('.db', '.sqlite', '.sqlite3'):
+        return 'sqlite'
+    raise ValueError(f"入力の形式を判別できません: {path}（--format で指定してください）")
+
+
+def _normalize(record):
+    return {COLUMN_ALIASES.get(key, key): value for key, value in record.items()}
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for record in csv.DictReader(f):
+            yield _normalize(record)
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            data = record.get('data')
+            if isinstance(data, dict):
+                # データパイプの形式。アナライザーと同じく、時計がずれていなければデバイスの計測時刻を使う
+                timestamp = record.get('timestamp')
+                if timestamp:
+                    timestamp, _ = resolve_reading_timestamp(record.get('device_id'), timestamp, data)
+                record = {**{k: v for k, v in data.items() if k != 'datetime'},
+                          **{k: v for k, v in record.items() if k != 'data'}, 'timestamp': timestamp}
+            yield _normalize(record)
+
+
+def read_sqlite(path, table='sensor_data'):
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    source.row_factory = sqlite3.Row
+    try:
+        for row in source.execute(f"SELECT * FROM {table}"):
+            record = dict(row)
+            record.pop('id', None)
+            yield _normalize(record)
+    finally:
+        source.close()
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'sqlite': read_sqlite}
+
+
+def _to_number(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _to_version(value):
+    number = _to_number(value)
+    return int(number) if number is not None else None
+
+
+class RowBuilder:
+    """入力のレコードをステージングの行 (STAGING_COLUMNS順のタプル) にする"""
+
+    def __init__(self, device_id=None, data_version=None, device_versions=None):
+        self.device_id = device_id
+        self.data_version = data_version
+        self.device_versions = device_versions or {}
+        self.skipped = 0
+        self._builders = {}
+
+    def _builder(self, version):
+        builder = self._builders.get(version)
+        if builder is None:
+            # レイアウトが保存しないカラムはNULLにする（save_sensor_dataと同じ）
+            stored = set(storage_layout(version).columns)
+            plan = [(column, column in stored) for column in STAGING_COLUMNS[2:]]
+
+            def builder(device_id, timestamp, record):
+                return (device_id, timestamp) + tuple(
+                    (version if column == 'data_version' else _to_number(record.get(column))) if keep else None
+                    for column, keep in plan
+                )
+            self._builders[version] = builder
+        return builder
+
+    def build(self, record):
+        device_id = record.get('device_id') or self.device_id
+        timestamp = record.get('timestamp')
+        if not device_id or not timestamp:
+            self.skipped += 1
+            return None
+        version = (_to_version(record.get('data_version')) or self.data_version
+                   or self.device_versions.get(device_id) or 1)
+        return self._builder(version)(device_id, _format_sensor_timestamp(str(timestamp)), record)
+
+
+def _load_staging(conn, records, builder):
+    """レコードをステージングに書き込み、読み取った件数を返す"""
+    placeholders = ', '.join('?' * len(STAGING_COLUMNS))
+    insert_sql = f"INSERT INTO {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) VALUES ({placeholders})"
+    read = 0
+    records = iter(records)
+    while True:
+        batch = list(islice(records, config.IMPORT_BATCH_ROWS))
+        if not batch:
+            return read
+        read += len(batch)
+        conn.executemany(insert_sql, filter(None, map(builder.build, batch)))
+        conn.commit()
+        logger.info(f"Staged {read} records...")
+
+
+def _refresh_derived_tables(conn):
+    """
+    取り込んだ行で sensor_latest / sensor_daily_last / sensor_completeness を更新する。
+    最新値・日次最終値はデバイス・日ごとに取り込んだ最後の行だけを比べればよい（既存の方が新しければ上書きしない）。
+    """
+    columns = ', '.join(f"d.{column}" for column in SENSOR_DATA_COLUMNS)
+    updates = ', '.join(f"{column} = excluded.{column}" for column in SENSOR_DATA_COLUMNS if column != 'device_id')
+    conn.execute(f"""
+        INSERT INTO sensor_latest ({', '.join(SENSOR_DATA_COLUMNS)})
+        SELECT {columns} FROM sensor_data d
+        JOIN (SELECT device_id, MAX(timestamp) AS timestamp FROM {STAGING_TABLE} GROUP BY device_id) s
+          ON d.device_id = s.device_id AND d.timestamp = s.timestamp
+        WHERE 1
+        ON CONFLICT(device_id) DO UPDATE SET {updates}
+        WHERE excluded.timestamp >= sensor_latest.timestamp
+    """)
+    conn.execute(f"""
+        INSERT INTO sensor_daily_last (device_id, day, sensor_data_id, timestamp)
+        SELECT d.device_id, substr(d.timestamp, 1, 10), d.id, d.timestamp FROM sensor_data d
+        JOIN (SELECT device_id, MAX(timestamp) AS timestamp FROM {STAGING_TABLE} GROUP BY device_id, substr(timestamp, 1, 10)) s
+          ON d.device_id = s.device_id AND d.timestamp = s.timestamp
+        WHERE 1
+        ON CONFLICT(device_id, day) DO UPDATE SET
+            sensor_data_id = excluded.sensor_data_id,
+            timestamp = excluded.timestamp
+        WHERE excluded.timestamp >= sensor_daily_last.timestamp
+    """)
+    conn.execute(f"""
+        INSERT INTO sensor_completeness (device_id, hour, actual_count, expected_count, updated_at)
+        SELECT device_id, substr(timestamp, 1, 13), COUNT(*), ?, datetime('now', 'localtime')
+        FROM {STAGING_TABLE}
+        GROUP BY device_id, substr(timestamp, 1, 13)
+        ON CONFLICT(device_id, hour) DO UPDATE SET
+            actual_count = sensor_completeness.actual_count + excluded.actual_count,
+            updated_at = excluded.updated_at
+    """, (expected_readings_per_hour(),))
+
+
+def _reanalyze(conn, days_by_device):
+    """取り込んだ日の日別分析を、前日の結果を引き継げるよう古い日から順にやり直す"""
+    from plant_logic import PlantStateAnalyzer
+
+    for plant_row in conn.execute("SELECT * FROM managed_plants").fetchall():
+        days = set()
+        for device_id in (plant_row['assigned_plant_sensor_id'], plant_row['assigned_switchbot_id']):
+            days |= days_by_device.get(device_id, set())
+        if not days:
+            continue
+        analyzer = PlantStateAnalyzer(dict(plant_row), conn)
+        for day in sorted(days):
+            analyzer.run_analysis_for_date(date.fromisoformat(day))
+        logger.info(f"Re-analyzed {len(days)} days for plant {plant_row['managed_plant_id']}")
+
+
+def import_records(records, device_id=None, data_version=None, reanalyze=False):
+    """
+    レコード (dict) のイテラブルを sensor_data に取り込む。
+
+    Returns:
+        dict: read / skipped / duplicates / inserted / devices / seconds
+    """
+    started = time.monotonic()
+    conn = get_db_connection()
+    synchronous = get_storage_profile()['synchronous']
+    try:
+        device_versions = {
+            row['device_id']: row['data_version']
+            for row in conn.execute("SELECT device_id, data_version FROM devices")
+        }
+        builder = RowBuilder(device_id, data_version, device_versions)
+
+        # ステージングはインデックスなしで書き込み、重複の判定は読み込み後に行う
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        conn.execute(f"CREATE TABLE {STAGING_TABLE} AS SELECT {', '.join(STAGING_COLUMNS)} FROM sensor_data WHERE 0")
+        read = _load_staging(conn, records, builder)
+
+        conn.execute(f"CREATE INDEX {STAGING_TABLE}_key ON {STAGING_TABLE} (device_id, timestamp)")
+        staged = conn.execute(f"SELECT COUNT(*) FROM {STAGING_TABLE}").fetchone()[0]
+        conn.execute(f"""
+            DELETE FROM {STAGING_TABLE} WHERE rowid NOT IN (
+                SELECT MIN(rowid) FROM {STAGING_TABLE} GROUP BY device_id, timestamp
+            )
+        """)
+        conn.execute(f"""
+            DELETE FROM {STAGING_TABLE} WHERE EXISTS (
+                SELECT 1 FROM sensor_data d
+                WHERE d.device_id = {STAGING_TABLE}.device_id AND d.timestamp = {STAGING_TABLE}.timestamp
+            )
+        """)
+        inserted = conn.execute(f"SELECT COUNT(*) FROM {STAGING_TABLE}").fetchone()[0]
+
+        # 大量に追加する場合はインデックスを後から作り直す方が速い
+        # 重複は上で除いてあり、書き込みロックを持ったままなので、一意インデックスがない間も重複は入らない
+        rebuild_index = inserted >= config.IMPORT_REBUILD_INDEX_MIN_ROWS
+        if rebuild_index:
+            conn.execute("DROP INDEX IF EXISTS idx_sensor_data_device_timestamp")
+        conn.execute(f"""
+            INSERT OR IGNORE INTO sensor_data ({', '.join(STAGING_COLUMNS)})
+            SELECT {', '.join(STAGING_COLUMNS)} FROM {STAGING_TABLE} ORDER BY device_id, timestamp
+        """)
+        if rebuild_index:
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_data_device_timestamp ON sensor_data (device_id, timestamp)")
+
+        _refresh_derived_tables(conn)
+        days_by_device = {}
+        for row in conn.execute(f"SELECT DISTINCT device_id, substr(timestamp, 1, 10) AS day FROM {STAGING_TABLE}"):
+            days_by_device.setdefault(row['device_id'], set()).add(row['day'])
+        conn.execute(f"DROP TABLE {STAGING_TABLE}")
+        conn.commit()
+
+        unknown = sorted(set(days_by_device) - set(device_versions))
+        if unknown:
+            logger.warning(f"Imported data for devices not registered in 'devices': {', '.join(unknown)}")
+        history_cache.invalidate_devices(days_by_device, include_past=True)
+        if reanalyze:
+            _reanalyze(conn, days_by_device)
+        checkpoint_wal(conn, 'TRUNCATE')
+    except Exception:
+        conn.rollback()
+        conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        conn.commit()
+        raise
+    finally:
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        conn.close()
+
+    result = {
+        'read': read,
+        'skipped': builder.skipped,
+        'duplicates': staged - inserted,
+        'inserted': inserted,
+        'devices': sorted(days_by_device),
+        'seconds': round(time.monotonic() - started, 1),
+    }
+    logger.info(f"Import finished: {result}")
+    return result
+
+
+def import_file(path, source_format=None, device_id=None, data_version=None, reanalyze=False):
+    """ファイルを取り込む。形式は拡張子から判別する"""
+    source_format = source_format or detect_format(path)
+    return import_records(READERS[source_format](path), device_id, data_version, reanalyze)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSV / JSONL / SQLite のセンサーデータを sensor_data に取り込む")
+    parser.add_argument('path', help="入力ファイル")
+    parser.add_argument('--format', choices=SOURCE_FORMATS, help="入力の形式（省略時は拡張子から判別）")
+    parser.add_argument('--device', help="device_id カラムがない入力に使うデバイスID")
+    parser.add_argument('--data-version', type=int, help="data_version カラムがない行に使うデータバージョン")
+    parser.add_argument('--reanalyze', action='store_true', help="取り込んだ日の日別分析をやり直す")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [Import] - %(levelname)s - %(message)s')
+    try:
+        result = import_file(args.path, args.format, args.device, args.data_version, args.reanalyze)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        logger.error(f"取り込みに失敗しました: {e}")
+        return 1
+    print(f"{result['inserted']} 件を追加しました（読み取り {result['read']} 件、重複 {result['duplicates']} 件、"
+          f"スキップ {result['skipped']} 件、{result['seconds']} 秒）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
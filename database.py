@@ -3,28 +3,258 @@
 import sqlite3
 import os
 import logging
-from config import DATABASE_PATH
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from config import DATABASE_PATH, DB_STORAGE_PROFILE, DB_STORAGE_PROFILES, COMPLETENESS_EXPECTED_INTERVAL_SECONDS
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
+# sensor_data / sensor_latest で共通のカラム（マイグレーション済みDBではカラム順が異なるため明示する）
+SENSOR_DATA_COLUMNS = [
+    'id', 'device_id', 'timestamp', 'temperature', 'humidity', 'light_lux', 'soil_moisture',
+    'soil_temperature1', 'soil_temperature2', 'soil_temperature3', 'soil_temperature4',
+    'ex_temperature', 'capacitance_ch1', 'capacitance_ch2', 'capacitance_ch3', 'capacitance_ch4',
+    'data_version'
+]
+
+# --- コネクションプール設定 ---
+# プロセスごとに保持するアイドル接続の上限（読み取り用・書き込み用それぞれ）
+POOL_MAX_IDLE_CONNECTIONS = 4
+# 接続ごとにキャッシュするプリペアドステートメント数（sqlite3の既定値は128）
+POOL_CACHED_STATEMENTS = 256
+
+# --- 重複除去設定 ---
+# sensor_dataの重複除去マイグレーションで一度に処理するidの範囲
+SENSOR_DATA_DEDUPE_BATCH_ROWS = 50000
+
+
+def get_storage_profile(name=None):
     """
-    データベース接続を取得する。
-    WALモードを有効にし、タイムアウトを設定して複数プロセスからの同時アクセスに対応。
+    ストレージプロファイルの設定を返す。
+    未定義の名前が指定された場合は警告を出し、'default'プロファイルを使用する。
     """
-    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH, timeout=30.0, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    name = name or DB_STORAGE_PROFILE
+    profile = DB_STORAGE_PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"Unknown DB storage profile '{name}'. Falling back to 'default'.")
+        profile = DB_STORAGE_PROFILES['default']
+    return profile
+
+
+def checkpoint_wal(conn, mode='PASSIVE'):
+    """
+    WALチェックポイントを実行し、(busy, WALのページ数, チェックポイント済みページ数) を返す。
+    PASSIVEは他の読み書きを待たせず、書き戻せる範囲だけを処理する。
+    """
+    if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+        raise ValueError(f"Invalid checkpoint mode: {mode}")
+    row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return tuple(row)
+
+
+class PooledConnection:
+    """
+    プールから貸し出されたsqlite3接続のラッパー。
+    close()で実際には切断せず、未確定のトランザクションをロールバックしてプールへ返却する。
+    それ以外の属性アクセスは元の接続へ委譲するため、既存の conn.execute()/commit() はそのまま使える。
+    """
+
+    def __init__(self, pool, raw_conn, path, readonly, request_scoped=False):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', raw_conn)
+        object.__setattr__(self, '_path', path)
+        object.__setattr__(self, 'readonly', readonly)
+        object.__setattr__(self, 'request_scoped', request_scoped)
+
+    def __getattr__(self, name):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """接続をプールへ返却する。リクエストスコープの接続はteardown時にまとめて返却する。"""
+        if self.request_scoped:
+            return
+        self.release()
 
-    # WALモードを有効化（複数プロセスからの同時読み書きを改善）
-    conn.execute("PRAGMA journal_mode=WAL")
-    # 同期モードを調整（パフォーマンスと安全性のバランス）
-    conn.execute("PRAGMA synchronous=NORMAL")
-    # Busy timeoutを設定（ロック時の待機時間）
-    conn.execute("PRAGMA busy_timeout=30000")
+    def release(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        self._pool.release(conn, self._path, self.readonly)
 
+
+class ConnectionPool:
+    """
+    プロセス単位のSQLite接続プール。
+    PRAGMAは接続作成時に一度だけ設定し、読み取り専用(query_only)と書き込み用の接続を別々に保持する。
+    fork後の子プロセスでは親の接続を引き継がず、空のプールから作り直す。
+    """
+
+    def __init__(self, max_idle=POOL_MAX_IDLE_CONNECTIONS, cached_statements=POOL_CACHED_STATEMENTS):
+        self.max_idle = max_idle
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = {False: [], True: []}
+        self._stats = {
+            'created': 0, 'reused': 0, 'checked_out': 0,
+            'released': 0, 'discarded': 0, 'rolled_back': 0,
+        }
+
+    def _connect(self, readonly):
+        os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+        conn = sqlite3.connect(
+            DATABASE_PATH, timeout=30.0, check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+
+        # WALモードを有効化（複数プロセスからの同時読み書きを改善）
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Busy timeoutを設定（ロック時の待機時間）
+        conn.execute("PRAGMA busy_timeout=30000")
+        # ストレージプロファイル（同期モード、mmap、キャッシュ、一時領域、自動チェックポイント）
+        profile = get_storage_profile()
+        conn.execute(f"PRAGMA synchronous={profile['synchronous']}")
+        conn.execute(f"PRAGMA mmap_size={int(profile['mmap_size'])}")
+        conn.execute(f"PRAGMA cache_size={int(profile['cache_size'])}")
+        conn.execute(f"PRAGMA temp_store={profile['temp_store']}")
+        conn.execute(f"PRAGMA wal_autocheckpoint={int(profile['wal_autocheckpoint'])}")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def acquire(self, readonly=False, request_scoped=False):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            idle = self._idle[readonly]
+            raw_conn = None
+            while idle:
+                candidate_path, candidate = idle.pop()
+                # DATABASE_PATHが差し替えられた場合（テストなど）は古い接続を使わない
+                if candidate_path == DATABASE_PATH:
+                    raw_conn = candidate
+                    break
+                candidate.close()
+                self._stats['discarded'] += 1
+            if raw_conn is not None:
+                self._stats['reused'] += 1
+            self._stats['checked_out'] += 1
+
+        if raw_conn is None:
+            raw_conn = self._connect(readonly)
+            with self._lock:
+                self._stats['created'] += 1
+        return PooledConnection(self, raw_conn, DATABASE_PATH, readonly, request_scoped)
+
+    def release(self, raw_conn, path, readonly):
+        try:
+            if raw_conn.in_transaction:
+                raw_conn.rollback()
+                with self._lock:
+                    self._stats['rolled_back'] += 1
+            raw_conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            raw_conn.close()
+            with self._lock:
+                self._stats['checked_out'] -= 1
+                self._stats['discarded'] += 1
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._stats['checked_out'] -= 1
+            self._stats['released'] += 1
+            idle = self._idle[readonly]
+            if len(idle) < self.max_idle:
+                idle.append((path, raw_conn))
+                return
+            self._stats['discarded'] += 1
+        raw_conn.close()
+
+    def metrics(self):
+        """プールの利用状況を返す（管理APIから参照）"""
+        with self._lock:
+            metrics = dict(self._stats)
+            metrics['idle_read'] = len(self._idle[True])
+            metrics['idle_write'] = len(self._idle[False])
+            metrics['max_idle'] = self.max_idle
+            metrics['pid'] = self._pid
+        total = metrics['created'] + metrics['reused']
+        metrics['reuse_ratio'] = round(metrics['reused'] / total, 3) if total else 0.0
+        return metrics
+
+
+_pool = ConnectionPool()
+
+
+def get_db_connection(readonly=False):
+    """
+    データベース接続をプールから取得する。
+    WALモード等のPRAGMAは接続作成時に一度だけ設定される。
+    close()を呼ぶと接続はプールへ返却される（従来通りの使い方で再利用される）。
+
+    Args:
+        readonly: Trueの場合、書き込みを禁止した読み取り専用接続を返す
+    """
+    return _pool.acquire(readonly)
+
+
+def get_pool_metrics():
+    return _pool.metrics()
+
+
+def get_request_db(readonly=False):
+    """
+    Flaskのリクエスト中で共有する接続を返す。
+    同じリクエスト内では同じ接続を使い回し、init_app()で登録したteardownでプールへ返却する。
+    リクエストスコープの接続に対するclose()は何もしない。
+    """
+    from flask import g
+
+    key = '_db_read' if readonly else '_db_write'
+    conn = g.get(key)
+    if conn is None:
+        conn = _pool.acquire(readonly, request_scoped=True)
+        setattr(g, key, conn)
     return conn
 
+
+def init_app(app):
+    """リクエスト終了時にリクエストスコープの接続を返却するteardownを登録する"""
+
+    @app.teardown_appcontext
+    def release_request_db(exception=None):
+        from flask import g
+
+        for key in ('_db_read', '_db_write'):
+            conn = g.pop(key, None)
+            if conn is not None:
+                conn.release()
+
 def migrate_db_schema(cursor):
     """Ensures all tables have the latest schema by adding missing columns."""
     logger.info("Checking database schema...")
@@ -168,10 +398,292 @@ def migrate_db_schema(cursor):
         """)
 
 
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def ensure_sensor_latest(cursor):
+    """
+    デバイスごとの最新センサー値を保持するsensor_latestテーブルを作成する。
+    テーブルを新規作成した場合は、既存のsensor_dataから最新行をバックフィルする。
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sensor_latest'")
+    already_exists = cursor.fetchone() is not None
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sensor_latest (
+        device_id TEXT PRIMARY KEY,
+        id INTEGER,
+        timestamp DATETIME,
+        temperature REAL, humidity REAL, light_lux REAL, soil_moisture REAL,
+        soil_temperature1 REAL, soil_temperature2 REAL, soil_temperature3 REAL, soil_temperature4 REAL,
+        ex_temperature REAL,
+        capacitance_ch1 REAL, capacitance_ch2 REAL, capacitance_ch3 REAL, capacitance_ch4 REAL,
+        data_version INTEGER,
+        FOREIGN KEY (device_id) REFERENCES devices(device_id)
+    );
+    """)
+    # 日付指定の参照（最新値が対象日より新しい場合）で使用する
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sensor_data_device_timestamp ON sensor_data (device_id, timestamp)")
+
+    if not already_exists:
+        columns = ", ".join(SENSOR_DATA_COLUMNS)
+        cursor.execute(f"""
+            INSERT INTO sensor_latest ({columns})
+            SELECT {columns} FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY timestamp DESC, id DESC) AS rn
+                FROM sensor_data
+                WHERE device_id IS NOT NULL
+            ) WHERE rn = 1
+        """)
+        logger.info(f"Created 'sensor_latest' table and backfilled {cursor.rowcount} devices.")
+
+def ensure_sensor_daily_last(cursor):
+    """
+    デバイスごと・日ごとの最終読み取り行を保持するsensor_daily_lastテーブルを作成する。
+    過去日付のダッシュボード表示で、全デバイスの「その日時点の最新値」を1クエリで引くために使う。
+    テーブルを新規作成した場合は、既存のsensor_dataからバックフィルする。
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sensor_daily_last'")
+    already_exists = cursor.fetchone() is not None
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sensor_daily_last (
+        device_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        sensor_data_id INTEGER NOT NULL,
+        timestamp DATETIME NOT NULL,
+        PRIMARY KEY (device_id, day)
+    ) WITHOUT ROWID;
+    """)
+
+    if not already_exists:
+        cursor.execute("""
+            INSERT INTO sensor_daily_last (device_id, day, sensor_data_id, timestamp)
+            SELECT device_id, day, id, timestamp FROM (
+                SELECT device_id, substr(timestamp, 1, 10) AS day, id, timestamp,
+                       ROW_NUMBER() OVER (PARTITION BY device_id, substr(timestamp, 1, 10) ORDER BY timestamp DESC, id DESC) AS rn
+                FROM sensor_data
+                WHERE device_id IS NOT NULL AND timestamp IS NOT NULL
+            ) WHERE rn = 1
+        """)
+        logger.info(f"Created 'sensor_daily_last' table and backfilled {cursor.rowcount} device-days.")
+
+def upsert_sensor_daily_last(conn, sensor_data_id):
+    """
+    sensor_dataに挿入した行でsensor_daily_lastを更新する。
+    同じ日のより新しい読み取りが既にある場合は上書きしない。
+    """
+    conn.execute("""
+        INSERT INTO sensor_daily_last (device_id, day, sensor_data_id, timestamp)
+        SELECT device_id, substr(timestamp, 1, 10), id, timestamp FROM sensor_data
+        WHERE id = ? AND device_id IS NOT NULL AND timestamp IS NOT NULL
+        ON CONFLICT(device_id, day) DO UPDATE SET
+            sensor_data_id = excluded.sensor_data_id,
+            timestamp = excluded.timestamp
+        WHERE excluded.timestamp >= sensor_daily_last.timestamp
+    """, (sensor_data_id,))
+
+def upsert_sensor_latest(conn, sensor_data_id):
+    """
+    sensor_dataに挿入した行でsensor_latestを更新する。
+    呼び出し側のトランザクション内で実行し、コミットは呼び出し側で行う。
+    古いタイムスタンプのデータ（遅延到着・再送）で最新値を上書きしない。
+    """
+    columns = ", ".join(SENSOR_DATA_COLUMNS)
+    updates = ", ".join(f"{col} = excluded.{col}" for col in SENSOR_DATA_COLUMNS if col != 'device_id')
+    conn.execute(f"""
+        INSERT INTO sensor_latest ({columns})
+        SELECT {columns} FROM sensor_data WHERE id = ?
+        ON CONFLICT(device_id) DO UPDATE SET {updates}
+        WHERE excluded.timestamp >= sensor_latest.timestamp
+    """, (sensor_data_id,))
+
+def expected_readings_per_hour():
+    """1時間あたりの期待読み取り数"""
+    return max(1, 3600 // COMPLETENESS_EXPECTED_INTERVAL_SECONDS)
+
+def ensure_sensor_completeness(cursor):
+    """
+    デバイスごと・1時間ごとの読み取り数を保持するsensor_completenessテーブルを作成する。
+    hourは 'YYYY-MM-DD HH' 形式。expected_countは記録時点の設定値で、設定を変えても過去の集計は変わらない。
+    テーブルを新規作成した場合は、既存のsensor_dataから集計する。
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sensor_completeness'")
+    already_exists = cursor.fetchone() is not None
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sensor_completeness (
+        device_id TEXT NOT NULL,
+        hour TEXT NOT NULL,
+        actual_count INTEGER NOT NULL DEFAULT 0,
+        expected_count INTEGER NOT NULL,
+        PRIMARY KEY (device_id, hour)
+    ) WITHOUT ROWID;
+    """)
+
+    if not already_exists:
+        cursor.execute("""
+            INSERT INTO sensor_completeness (device_id, hour, actual_count, expected_count)
+            SELECT device_id, substr(timestamp, 1, 13), COUNT(*), ?
+            FROM sensor_data
+            WHERE device_id IS NOT NULL AND timestamp IS NOT NULL
+            GROUP BY device_id, substr(timestamp, 1, 13)
+        """, (expected_readings_per_hour(),))
+        logger.info(f"Created 'sensor_completeness' table and backfilled {cursor.rowcount} device-hours.")
+
+def increment_sensor_completeness(conn, device_id, timestamp, count=1):
+    """
+    sensor_dataに挿入した読み取りをsensor_completenessに加算する。
+    呼び出し側のトランザクション内で実行し、コミットは呼び出し側で行う。
+    """
+    conn.execute("""
+        INSERT INTO sensor_completeness (device_id, hour, actual_count, expected_count, updated_at)
+        VALUES (?, substr(?, 1, 13), ?, ?, datetime('now', 'localtime'))
+        ON CONFLICT(device_id, hour) DO UPDATE SET
+            actual_count = sensor_completeness.actual_count + excluded.actual_count,
+            updated_at = excluded.updated_at
+    """, (device_id, timestamp, count, expected_readings_per_hour()))
+
+def ensure_device_poll_state(cursor):
+    """
+    デバイスごとのポーリング状態（サーキットブレーカー）を保持するdevice_poll_stateテーブルを作成する。
+    bluetooth_daemonが書き込み、Webアプリが参照する。
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS device_poll_state (
+        device_id TEXT PRIMARY KEY,
+        breaker_state TEXT NOT NULL DEFAULT 'closed',
+        consecutive_failures INTEGER NOT NULL DEFAULT 0,
+        open_count INTEGER NOT NULL DEFAULT 0,
+        opened_at DATETIME,
+        retry_at DATETIME,
+        last_success_at DATETIME,
+        last_failure_at DATETIME,
+        last_error TEXT,
+        updated_at DATETIME
+    );
+    """)
+
+def ensure_adapter_health_metrics(cursor):
+    """Bluetoothアダプタの健全性指標（スキャン・接続の件数とパーセンタイル）の時系列テーブルを作成する。"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS adapter_health_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recorded_at DATETIME NOT NULL,
+        adapter TEXT NOT NULL,
+        status TEXT NOT NULL,
+        scan_count INTEGER NOT NULL DEFAULT 0,
+        empty_scan_count INTEGER NOT NULL DEFAULT 0,
+        adapter_error_count INTEGER NOT NULL DEFAULT 0,
+        scan_p50 REAL, scan_p90 REAL, scan_p99 REAL,
+        connect_count INTEGER NOT NULL DEFAULT 0,
+        connect_failure_count INTEGER NOT NULL DEFAULT 0,
+        connect_p50 REAL, connect_p90 REAL, connect_p99 REAL,
+        device_success_count INTEGER NOT NULL DEFAULT 0,
+        device_failure_count INTEGER NOT NULL DEFAULT 0,
+        restart_count INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_adapter_health_metrics_adapter_time ON adapter_health_metrics (adapter, recorded_at)")
 
+def ensure_updated_at_columns(cursor):
+    """
+    sensor_completeness と daily_plant_analysis に更新日時 (updated_at) を追加する。
+    履歴APIのETag/Last-Modifiedを、sensor_dataを走査せずに求めるために使う。
+    既存の行はNULLのまま（次に更新されるまでは件数だけで判定する）。
+    """
+    for table in ('sensor_completeness', 'daily_plant_analysis'):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if 'updated_at' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME")
+            logger.info(f"Added column 'updated_at' to '{table}' table.")
+
+def _delete_sensor_duplicates(cursor, condition, params=()):
+    """
+    condition に一致する sensor_data の行を削除し、削除した件数を返す（cursorには接続も渡せる）。
+    削除した行の分は sensor_completeness から差し引く。
+    """
+    counts = cursor.execute(f"""
+        SELECT COUNT(*), device_id, substr(timestamp, 1, 13) FROM sensor_data
+        WHERE {condition}
+        GROUP BY device_id, substr(timestamp, 1, 13)
+    """, params).fetchall()
+    cursor.executemany(
+        "UPDATE sensor_completeness SET actual_count = MAX(0, actual_count - ?) WHERE device_id = ? AND hour = ?",
+        [tuple(row) for row in counts]
+    )
+    return cursor.execute(f"DELETE FROM sensor_data WHERE {condition}", params).rowcount
+
+def dedupe_sensor_data(conn):
+    """
+    sensor_data の (device_id, timestamp) の重複行を削除する（マイグレーション9の前処理）。
+    パイプ処理の再試行やクラッシュ後の再処理で同じ読み取りが複数回保存されていた場合、日別分析の平均値が歪むため。
+    最初に保存された行 (idが最小) を残す。
+
+    大きなテーブルで書き込みロックを持ち続けたりWALが膨らんだりしないよう、マイグレーションのトランザクションの外で
+    id の範囲 SENSOR_DATA_DEDUPE_BATCH_ROWS 行ごとにコミットする。途中で中断しても、次回の起動で再実行すれば続きが処理される。
+    """
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_data").fetchone()[0]
+    deleted = 0
+    for low in range(1, max_id + 1, SENSOR_DATA_DEDUPE_BATCH_ROWS):
+        deleted += _delete_sensor_duplicates(conn, """
+            id BETWEEN ? AND ? AND EXISTS (
+                SELECT 1 FROM sensor_data k
+                WHERE k.device_id = sensor_data.device_id AND k.timestamp = sensor_data.timestamp AND k.id < sensor_data.id
+            )
+        """, (low, low + SENSOR_DATA_DEDUPE_BATCH_ROWS - 1))
+        conn.commit()
+    if deleted:
+        logger.info(f"Removed {deleted} duplicate rows from 'sensor_data'.")
+
+def ensure_unique_sensor_data_key(cursor):
+    """
+    sensor_data の (device_id, timestamp) を一意インデックスにする。
+    重複の大半は前処理 (dedupe_sensor_data) で削除済み。ここでは前処理の後に他のプロセスが書き込んだ重複だけを
+    インデックスで探して削除し、削除した行を指す sensor_latest / sensor_daily_last を残した行に付け替える。
+    """
+    deleted = _delete_sensor_duplicates(cursor, """
+        id IN (
+            SELECT s.id FROM sensor_data s
+            JOIN (
+                SELECT device_id, timestamp, MIN(id) AS keep_id FROM sensor_data
+                GROUP BY device_id, timestamp HAVING COUNT(*) > 1
+            ) g ON s.device_id = g.device_id AND s.timestamp = g.timestamp AND s.id > g.keep_id
+        )
+    """)
+    if deleted:
+        logger.info(f"Removed {deleted} duplicate rows written during the migration from 'sensor_data'.")
+
+    columns = ", ".join(f"d.{col}" for col in SENSOR_DATA_COLUMNS)
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO sensor_latest ({", ".join(SENSOR_DATA_COLUMNS)})
+        SELECT {columns} FROM sensor_latest l
+        JOIN sensor_data d ON d.device_id = l.device_id AND d.timestamp = l.timestamp
+        WHERE NOT EXISTS (SELECT 1 FROM sensor_data WHERE id = l.id)
+    """)
+    cursor.execute("""
+        UPDATE sensor_daily_last SET sensor_data_id = (
+            SELECT d.id FROM sensor_data d
+            WHERE d.device_id = sensor_daily_last.device_id AND d.timestamp = sensor_daily_last.timestamp
+        )
+        WHERE NOT EXISTS (SELECT 1 FROM sensor_data WHERE id = sensor_daily_last.sensor_data_id)
+    """)
+    cursor.execute("DROP INDEX IF EXISTS idx_sensor_data_device_timestamp")
+    cursor.execute("CREATE UNIQUE INDEX idx_sensor_data_device_timestamp ON sensor_data (device_id, timestamp)")
+
+def ensure_device_clock_skew_column(cursor):
+    """
+    devices にデバイスの時計のずれ (clock_skew_seconds) を追加する。
+    読み取りの計測時刻と受信時刻の差で、アナライザーがパイプの処理時に更新する。
+    """
+    cursor.execute("PRAGMA table_info(devices)")
+    if 'clock_skew_seconds' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE devices ADD COLUMN clock_skew_seconds INTEGER")
+        logger.info("Added column 'clock_skew_seconds' to 'devices' table.")
+
+# --- スキーマバージョン管理 ---
+# スキーマの版数は PRAGMA user_version に記録する。
+# スキーマを変更する場合は、末尾にマイグレーション関数を追加してMIGRATIONSに登録する（既存の関数は変更しない）。
+
+def _migration_001_base_schema(cursor):
+    """基本テーブル一式。user_version導入前のDBに対しては不足カラムの追加も行う。"""
     # --- Table Creations ---
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS devices (device_id TEXT PRIMARY KEY, device_name TEXT NOT NULL, mac_address TEXT UNIQUE NOT NULL, last_seen DATETIME, battery_level INTEGER, data_version INTEGER, connection_status TEXT DEFAULT 'disconnected', device_type TEXT NOT NULL DEFAULT 'plant_sensor');
@@ -295,18 +807,125 @@ def init_db():
     );
     """)
 
+    # 旧バージョンのDBに不足しているカラムを追加する
     migrate_db_schema(cursor)
 
-    conn.commit()
-    conn.close()
+
+def _migration_002_plant_alerts(cursor):
+    """致死温度アラート（ストリーミング判定）のイベント・状態テーブル"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS plant_alert_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        managed_plant_id TEXT NOT NULL,
+        device_id TEXT,
+        alert_type TEXT NOT NULL,
+        event TEXT NOT NULL,
+        temperature REAL,
+        threshold REAL,
+        occurred_at DATETIME NOT NULL,
+        FOREIGN KEY (managed_plant_id) REFERENCES managed_plants(managed_plant_id)
+    );
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_plant_alert_events_plant ON plant_alert_events (managed_plant_id, occurred_at);
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS plant_alert_state (
+        managed_plant_id TEXT PRIMARY KEY,
+        alert_status TEXT NOT NULL DEFAULT 'safe',
+        since DATETIME,
+        last_temperature REAL,
+        FOREIGN KEY (managed_plant_id) REFERENCES managed_plants(managed_plant_id)
+    );
+    """)
+
+
+MIGRATIONS = [
+    (1, "base schema", _migration_001_base_schema),
+    (2, "plant alert tables", _migration_002_plant_alerts),
+    (3, "sensor_latest table", ensure_sensor_latest),
+    (4, "sensor_daily_last table", ensure_sensor_daily_last),
+    (5, "sensor_completeness table", ensure_sensor_completeness),
+    (6, "device_poll_state table", ensure_device_poll_state),
+    (7, "adapter_health_metrics table", ensure_adapter_health_metrics),
+    (8, "updated_at columns for history validators", ensure_updated_at_columns),
+    (9, "unique (device_id, timestamp) on sensor_data", ensure_unique_sensor_data_key),
+    (10, "clock skew column on devices", ensure_device_clock_skew_column),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# マイグレーションの前にトランザクションの外で実行する処理（版数 -> 関数(conn)）。
+# 大きなテーブルをバッチごとにコミットしながら処理するためのもので、何度実行しても同じ結果になること。
+# 版数はマイグレーション本体のトランザクションでのみ更新するため、前処理の途中で中断した場合は次回に再実行される
+MIGRATION_PREPARE = {
+    9: dedupe_sensor_data,
+}
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@contextmanager
+def _migration_lock():
+    """
+    マイグレーション用のファイルロック。
+    gunicornの各ワーカーとデーモンが同時に起動しても、マイグレーションは1プロセスだけが実行する。
+    fcntlが使えない環境（Windowsでの開発時など）ではロックなしで実行する。
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+    with open(DATABASE_PATH + ".migrate.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def init_db():
+    """
+    スキーマを最新バージョンに更新する。
+    すでに最新の場合は PRAGMA user_version を1回確認するだけで終了する。
+    """
+    conn = get_db_connection()
+    try:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return
+
+        with _migration_lock():
+            # ロック待ちの間に他のプロセスがマイグレーションを完了している場合がある
+            current_version = get_schema_version(conn)
+            if current_version >= SCHEMA_VERSION:
+                return
+
+            logger.info(f"Migrating database schema from version {current_version} to {SCHEMA_VERSION}...")
+            for version, description, migration in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                prepare = MIGRATION_PREPARE.get(version)
+                cursor = conn.cursor()
+                try:
+                    if prepare is not None:
+                        prepare(conn)
+                    # DDLも含めて1つのトランザクションで適用し、途中で失敗した場合は何も残さない
+                    cursor.execute("BEGIN")
+                    migration(cursor)
+                    cursor.execute(f"PRAGMA user_version = {version}")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    logger.error(f"Schema migration {version} ({description}) failed.", exc_info=True)
+                    raise
+                logger.info(f"Applied schema migration {version}: {description}")
+    finally:
+        conn.close()
     logger.info("Database initialization and migration check completed.")
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     logger.info("Starting database migration...")
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    migrate_db_schema(cursor)
-    conn.commit()
-    conn.close()
+    init_db()
     logger.info("Database migration finished.")
@@ -2,9 +2,14 @@
 
 import sqlite3
 import logging
+import config
 from datetime import datetime
 from datetime import datetime, timezone, timedelta
-from database import get_db_connection
+from database import (
+    get_db_connection, upsert_sensor_latest, upsert_sensor_daily_last,
+    increment_sensor_completeness, expected_readings_per_hour
+)
+from sensor_payloads import storage_layout
 
 logger = logging.getLogger(__name__)
 
@@ -46,8 +51,11 @@ def get_all_devices():
 def get_device_by_id(device_id):
     return device_states.get(device_id)
 
-def update_device_status(device_id, status, battery=None):
-    """（デーモン用）デバイスの接続状態をDBに書き込む"""
+def update_device_status(device_id, status, battery=None, clock_skew=None):
+    """
+    （デーモン用）デバイスの接続状態をDBに書き込む。
+    clock_skewを指定した場合は、デバイスの時計のずれ（秒）も記録する。
+    """
     if device_id in device_states:
         device_states[device_id]['connection_status'] = status
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -59,126 +67,270 @@ def update_device_status(device_id, status, battery=None):
             cursor.execute('UPDATE devices SET connection_status = ?, last_seen = ?, battery_level = ? WHERE device_id = ?', (status, now, battery, device_id))
         else:
             cursor.execute('UPDATE devices SET connection_status = ?, last_seen = ? WHERE device_id = ?', (status, now, device_id))
+        if clock_skew is not None:
+            cursor.execute('UPDATE devices SET clock_skew_seconds = ? WHERE device_id = ?', (clock_skew, device_id))
         conn.commit()
         conn.close()
 
+def _format_sensor_timestamp(timestamp):
+    """センサーデータのタイムスタンプをDB保存形式 (YYYY-MM-DD HH:MM:SS) に揃える"""
+    if timestamp:
+        # ISO形式の文字列をdatetimeオブジェクトにパースし、指定の形式に再フォーマット
+        try:
+            dt_object = datetime.fromisoformat(timestamp)
+            return dt_object.strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            # 既に正しい形式の場合や、他の形式で来た場合のエラーハンドリング
+            return timestamp
+    # タイムスタンプが提供されていなければ、現在時刻を生成
+    return datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
+
+# 時計のずれが許容範囲を超えているデバイス（警告を状態が変わったときだけ出すため）
+skewed_devices = set()
+
+def resolve_reading_timestamp(device_id, received_timestamp, data):
+    """
+    読み取りを保存する時刻を決め、(DB保存形式の時刻, 時計のずれ秒数) を返す。
+
+    デバイスが返した計測時刻 (data['datetime']) と受信時刻のずれが DEVICE_CLOCK_MAX_SKEW_SECONDS 以内なら
+    計測時刻を使う。ポーリングの待ち時間や再処理で保存時刻が変わらず、同じ読み取りは同じキーになる。
+    計測時刻がない・不正な場合や、ずれが大きい（時計が未設定・電池交換後など）場合は受信時刻を使う。
+    ずれは計測時刻 - 受信時刻（デバイスの時計が進んでいれば正）。計測時刻がなければNone。
+    """
+    received = _format_sensor_timestamp(received_timestamp)
+    device_time = (data or {}).get('datetime')
+    try:
+        measured = datetime.strptime(device_time, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return received, None
+
+    skew = round((measured - datetime.strptime(received, "%Y-%m-%d %H:%M:%S")).total_seconds())
+    if abs(skew) > config.DEVICE_CLOCK_MAX_SKEW_SECONDS:
+        if device_id not in skewed_devices:
+            skewed_devices.add(device_id)
+            logger.warning(f"Clock of device {device_id} is off by {skew} seconds ({device_time}). Using receive time.")
+        return received, skew
+    if device_id in skewed_devices:
+        skewed_devices.discard(device_id)
+        logger.info(f"Clock of device {device_id} is back within {config.DEVICE_CLOCK_MAX_SKEW_SECONDS} seconds ({skew} seconds).")
+    return measured.strftime("%Y-%m-%d %H:%M:%S"), skew
+
 def save_sensor_data(device_id, timestamp, data, data_version=1):
     """
     センサーデータをDBに保存します。
-    data_versionに応じてv1/v2/v3デバイスのデータに対応。
+    data_versionに応じてv1/v2/v3デバイスのデータに対応（カラムは sensor_payloads のレイアウト定義に従う）。
 
     Args:
         device_id: デバイスID
         timestamp: タイムスタンプ (ISO形式文字列)
         data: センサーデータ辞書
         data_version: データバージョン (1=Rev1/Rev2, 2=Rev3, 3=Rev4)
+
+    Returns:
+        bool: 新たに行を保存した場合True（同じ時刻の読み取りが保存済み・データなし・保存失敗はFalse）
     """
     if not data:
-        return
+        return False
 
     logging.info(f"Saving sensor data for device {device_id} with data_version {data_version}")
 
     conn = get_db_connection()
-    formatted_timestamp = ""
+    formatted_timestamp = _format_sensor_timestamp(timestamp)
 
-    if timestamp:
-        # ISO形式の文字列をdatetimeオブジェクトにパースし、指定の形式に再フォーマット
-        try:
-            dt_object = datetime.fromisoformat(timestamp)
-            formatted_timestamp = dt_object.strftime("%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            # 既に正しい形式の場合や、他の形式で来た場合のエラーハンドリング
-            formatted_timestamp = timestamp
-    else:
-        # タイムスタンプが提供されていなければ、現在時刻を生成
-        formatted_timestamp = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
+    # 保存するカラムはdata_versionごとのペイロードレイアウトから決まる（未登録のバージョンはv1の基本カラム）
+    layout = storage_layout(data_version)
 
     try:
+        cursor = conn.execute(
+            layout.insert_sql,
+            layout.insert_row(device_id, formatted_timestamp, data, data_version)
+        )
+        if cursor.rowcount == 0:
+            # 同じ時刻の読み取りが保存済み（パイプの再処理など）
+            logger.info(f"Skipped duplicate sensor data for {device_id} at {formatted_timestamp}")
+            return False
+        logger.info(f"Saved v{data_version} sensor data for {device_id} at {formatted_timestamp}")
 
-        # v3デバイスのカラム (Rev4: v2 + ex_temperature)
-        if data_version == 3:
-            columns = "(device_id, timestamp, temperature, humidity, light_lux, soil_moisture, data_version, soil_temperature1, soil_temperature2, soil_temperature3, soil_temperature4, ex_temperature, capacitance_ch1, capacitance_ch2, capacitance_ch3, capacitance_ch4)"
-            values = "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?"
-            row_data = (
-                device_id,
-                formatted_timestamp,
-                data.get('temperature'),
-                data.get('humidity'),
-                data.get('light_lux'),
-                data.get('soil_moisture'),
-                data_version,
-                data.get('soil_temperature1'),
-                data.get('soil_temperature2'),
-                data.get('soil_temperature3'),
-                data.get('soil_temperature4'),
-                data.get('ex_temperature'),
-                data.get('capacitance_ch1'),
-                data.get('capacitance_ch2'),
-                data.get('capacitance_ch3'),
-                data.get('capacitance_ch4')
-            )
-
-            conn.execute(
-                f"INSERT INTO sensor_data {columns} VALUES ({values})",
-                row_data
-            )
-            logger.info(f"Saved v3 sensor data for {device_id} at {formatted_timestamp}")
-
-        # v2デバイスのカラム (Rev3: soil_temperature1-4 + capacitance)
-        elif data_version == 2:
-            extended_columns = "(device_id, timestamp, temperature, humidity, light_lux, soil_moisture, data_version, soil_temperature1, soil_temperature2, soil_temperature3, soil_temperature4, capacitance_ch1, capacitance_ch2, capacitance_ch3, capacitance_ch4)"
-            extended_values = "?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?"
-            extended_data = (
-                device_id,
-                formatted_timestamp,
-                data.get('temperature'),
-                data.get('humidity'),
-                data.get('light_lux'),
-                data.get('soil_moisture'),
-                data_version,
-                data.get('soil_temperature1'),
-                data.get('soil_temperature2'),
-                data.get('soil_temperature3'),
-                data.get('soil_temperature4'),
-                data.get('capacitance_ch1'),
-                data.get('capacitance_ch2'),
-                data.get('capacitance_ch3'),
-                data.get('capacitance_ch4')
-            )
-
-            conn.execute(
-                f"INSERT INTO sensor_data {extended_columns} VALUES ({extended_values})",
-                extended_data
-            )
-            logger.info(f"Saved v2 sensor data for {device_id} at {formatted_timestamp}")
-        else:
-            # v1デバイスのカラム
-            base_columns = "(device_id, timestamp, temperature, humidity, light_lux, soil_moisture, data_version)"
-            base_values = "?, ?, ?, ?, ?, ?, ?"
-            base_data = (
-                device_id,
-                formatted_timestamp,
-                data.get('temperature'),
-                data.get('humidity'),
-                data.get('light_lux'),
-                data.get('soil_moisture'),
-                data_version
-            )
-
-            # v1デバイス
-            conn.execute(
-                f"INSERT INTO sensor_data {base_columns} VALUES ({base_values})",
-                base_data
-            )
-            logger.info(f"Saved v1 sensor data for {device_id} at {formatted_timestamp}")
-
+        # 最新値・日次最終値・完全性インデックスを同一トランザクションで更新
+        upsert_sensor_latest(conn, cursor.lastrowid)
+        upsert_sensor_daily_last(conn, cursor.lastrowid)
+        increment_sensor_completeness(conn, device_id, formatted_timestamp)
         conn.commit()
+        return True
     except sqlite3.Error as e:
         logger.error(f"Failed to save sensor data for {device_id}: {e}")
+        return False
     finally:
         if conn:
             conn.close()
 
+def save_sensor_data_batch(device_id, records, data_version=1):
+    """
+    デバイス内の記録から取得した過去データ（バックフィル）をまとめて保存します。
+    既に同じ時刻の行があるレコードはスキップするため、同じバッチを何度保存しても結果は変わりません。
+
+    Args:
+        device_id: デバイスID
+        records: [{"timestamp": ..., "data": {...}}, ...]
+        data_version: データバージョン
+
+    Returns:
+        list: 新たに保存した行のタイムスタンプ（古い順）
+    """
+    rows = {}
+    for record in records or []:
+        data = record.get('data')
+        if record.get('timestamp') and data:
+            rows[_format_sensor_timestamp(record['timestamp'])] = data
+    if not rows:
+        return []
+
+    layout = storage_layout(data_version)
+    timestamps = sorted(rows)
+    conn = get_db_connection()
+    try:
+        inserted = []
+        last_id_per_day = {}
+        count_per_hour = {}
+        for timestamp in timestamps:
+            cursor = conn.execute(layout.insert_sql, layout.insert_row(device_id, timestamp, rows[timestamp], data_version))
+            if cursor.rowcount == 0:
+                continue
+            inserted.append(timestamp)
+            last_id_per_day[timestamp[:10]] = cursor.lastrowid
+            count_per_hour[timestamp[:13]] = count_per_hour.get(timestamp[:13], 0) + 1
+
+        if inserted:
+            # 最新値・日次最終値テーブルは日ごとの最後の行だけで更新すれば足りる
+            for sensor_data_id in last_id_per_day.values():
+                upsert_sensor_daily_last(conn, sensor_data_id)
+            upsert_sensor_latest(conn, last_id_per_day[inserted[-1][:10]])
+            for hour, count in count_per_hour.items():
+                increment_sensor_completeness(conn, device_id, hour, count)
+        conn.commit()
+        logger.info(f"Backfilled {len(inserted)}/{len(rows)} sensor records for {device_id}")
+        return inserted
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.error(f"Failed to save backfilled sensor data for {device_id}: {e}")
+        return []
+    finally:
+        conn.close()
+
+def get_sensor_completeness(conn, since, until, device_id=None):
+    """
+    sensor_completenessから期間内の時間帯ごとの読み取り数を取得します。
+
+    Args:
+        conn: DB接続
+        since, until: 期間 (datetime)。時間単位で両端を含む
+        device_id: 指定した場合はそのデバイスのみ
+
+    Returns:
+        list: device_id, hour ('YYYY-MM-DD HH'), actual_count, expected_count の行
+    """
+    params = [since.strftime("%Y-%m-%d %H"), until.strftime("%Y-%m-%d %H")]
+    device_filter = ""
+    if device_id is not None:
+        device_filter = "AND device_id = ?"
+        params.append(device_id)
+    return conn.execute(f"""
+        SELECT device_id, hour, actual_count, expected_count FROM sensor_completeness
+        WHERE hour BETWEEN ? AND ? {device_filter}
+        ORDER BY device_id, hour
+    """, params).fetchall()
+
+def get_history_version(conn, device_id, since, until):
+    """
+    期間内のセンサーデータの版を返します（履歴APIのETag/Last-Modified用）。
+    sensor_completenessの集計だけで求めるため、sensor_dataは走査しません。
+
+    Args:
+        since, until: 期間 (datetime)。時間単位で両端を含む
+
+    Returns:
+        tuple: (読み取り数の合計, 最終更新日時の文字列 or None)
+    """
+    row = conn.execute("""
+        SELECT COALESCE(SUM(actual_count), 0) AS reading_count, MAX(updated_at) AS updated_at
+        FROM sensor_completeness
+        WHERE device_id = ? AND hour BETWEEN ? AND ?
+    """, (device_id, since.strftime("%Y-%m-%d %H"), until.strftime("%Y-%m-%d %H"))).fetchone()
+    return row['reading_count'], row['updated_at']
+
+def get_history_versions(conn, device_ids, since, until):
+    """
+    複数デバイスの get_history_version を1回のクエリで求めます（一括履歴API用）。
+
+    Returns:
+        dict: device_id -> (読み取り数の合計, 最終更新日時の文字列 or None)
+    """
+    placeholders = ','.join('?' * len(device_ids))
+    rows = conn.execute(f"""
+        SELECT device_id, SUM(actual_count) AS reading_count, MAX(updated_at) AS updated_at
+        FROM sensor_completeness
+        WHERE device_id IN ({placeholders}) AND hour BETWEEN ? AND ?
+        GROUP BY device_id
+    """, (*device_ids, since.strftime("%Y-%m-%d %H"), until.strftime("%Y-%m-%d %H"))).fetchall()
+    versions = {device_id: (0, None) for device_id in device_ids}
+    for row in rows:
+        versions[row['device_id']] = (row['reading_count'], row['updated_at'])
+    return versions
+
+def get_analysis_version(conn, managed_plant_id, start_date, end_date):
+    """
+    期間内の日別分析結果の版を返します（分析履歴APIのETag/Last-Modified用）。
+
+    Returns:
+        tuple: (分析結果の件数, 最終更新日時の文字列 or None)
+    """
+    row = conn.execute("""
+        SELECT COUNT(*) AS analysis_count, MAX(updated_at) AS updated_at
+        FROM daily_plant_analysis
+        WHERE managed_plant_id = ? AND analysis_date BETWEEN ? AND ?
+    """, (managed_plant_id, start_date, end_date)).fetchone()
+    return row['analysis_count'], row['updated_at']
+
+def get_device_coverage(conn, hours, now=None):
+    """
+    直近hours時間（現在の時間帯は含まない）のデバイスごとのカバレッジを計算します。
+    各時間帯は期待読み取り数を上限として数え、最初の読み取りより前の時間帯は対象外にします。
+
+    Returns:
+        dict: device_id -> {'coverage': 0.0〜1.0, 'missing_hours': 欠損のある時間帯の数, 'hours': 対象の時間帯の数}
+    """
+    now = now or datetime.now()
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    since = current_hour - timedelta(hours=hours)
+    since_key = since.strftime("%Y-%m-%d %H")
+    until_key = current_hour.strftime("%Y-%m-%d %H")
+    expected = expected_readings_per_hour()
+
+    rows = conn.execute("""
+        SELECT d.device_id,
+               (SELECT MIN(hour) FROM sensor_completeness WHERE device_id = d.device_id) AS first_hour,
+               COALESCE(SUM(MIN(c.actual_count, c.expected_count)), 0) AS covered,
+               COALESCE(SUM(c.actual_count >= c.expected_count), 0) AS complete_hours
+        FROM devices d
+        LEFT JOIN sensor_completeness c
+          ON c.device_id = d.device_id AND c.hour >= ? AND c.hour < ?
+        GROUP BY d.device_id
+    """, (since_key, until_key)).fetchall()
+
+    coverage = {}
+    for row in rows:
+        if row['first_hour'] is None:
+            target_hours = 0
+        else:
+            first_hour = datetime.strptime(row['first_hour'], "%Y-%m-%d %H")
+            target_hours = int(max(0, min(hours, (current_hour - max(first_hour, since)).total_seconds() // 3600)))
+        coverage[row['device_id']] = {
+            'coverage': min(1.0, row['covered'] / (target_hours * expected)) if target_hours else 1.0,
+            'missing_hours': max(0, target_hours - row['complete_hours']),
+            'hours': target_hours,
+        }
+    return coverage
+
 def log_system_event(message, level='INFO', device_id=None):
     try:
         conn = get_db_connection()
@@ -188,27 +340,35 @@ def log_system_event(message, level='INFO', device_id=None):
     except sqlite3.Error as e:
         logger.error(f"Failed to write to system_logs: {e}")
 
+def get_latest_sensor_row(conn, device_id, until=None):
+    """
+    デバイスの最新センサー行を取得する。
+    通常はsensor_latestの1行参照で済み、最新値がuntilより新しい場合のみ履歴を検索する。
+    """
+    row = conn.execute('SELECT * FROM sensor_latest WHERE device_id = ?', (device_id,)).fetchone()
+    if row is None or until is None or row['timestamp'] <= until:
+        return row
+    return conn.execute(
+        """
+        SELECT * FROM sensor_data
+        WHERE device_id = ? AND timestamp <= ?
+        ORDER BY timestamp DESC
+        LIMIT 1
+        """, (device_id, until)
+    ).fetchone()
+
 def get_devices_with_latest_sensor_data():
     """
     すべてのデバイス情報と、それぞれに対応する最新のセンサーデータをDBから直接取得する
     """
     conn = get_db_connection()
     devices = conn.execute('SELECT * FROM devices ORDER BY device_name').fetchall()
+    latest_by_device = {row['device_id']: dict(row) for row in conn.execute('SELECT * FROM sensor_latest')}
     
     devices_with_data = []
     for device in devices:
         device_dict = dict(device)
-        
-        latest_data = conn.execute(
-            """
-            SELECT * FROM sensor_data
-            WHERE device_id = ?
-            ORDER BY timestamp DESC
-            LIMIT 1
-            """, (device['device_id'],)
-        ).fetchone()
-        
-        device_dict['last_data'] = dict(latest_data) if latest_data else {}
+        device_dict['last_data'] = latest_by_device.get(device['device_id'], {})
         devices_with_data.append(device_dict)
             
     conn.close()
@@ -218,21 +378,24 @@ def get_devices_latest_on_date(date_str):
     """指定された日付における、各デバイスの最後の状態を取得する"""
     conn = get_db_connection()
     devices = conn.execute('SELECT * FROM devices').fetchall()
-    
-    end_of_day = f"{date_str} 23:59:59"
-    
+
+    # sensor_daily_lastから「指定日以前で最後に記録のある日」の最終行を全デバイス分まとめて取得
+    # (CROSS JOINで結合順を固定し、デバイスごとに主キー検索させる)
+    rows = conn.execute(
+        """
+        SELECT s.* FROM devices d
+        CROSS JOIN sensor_daily_last dl ON dl.device_id = d.device_id AND dl.day = (
+            SELECT MAX(day) FROM sensor_daily_last
+            WHERE device_id = d.device_id AND day <= ?
+        )
+        JOIN sensor_data s ON s.id = dl.sensor_data_id
+        """, (date_str,)
+    ).fetchall()
+    last_readings = {row['device_id']: dict(row) for row in rows}
+
     device_data = []
     for device in devices:
-        device_id = device['device_id']
-        
-        last_reading = conn.execute(
-            """
-            SELECT * FROM sensor_data 
-            WHERE device_id = ? AND timestamp <= ? 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-            """, (device_id, end_of_day)
-        ).fetchone()
+        last_reading = last_readings.get(device['device_id'])
 
         data = {
             'device_id': device['device_id'],
@@ -241,7 +404,7 @@ def get_devices_latest_on_date(date_str):
             'device_type': device['device_type'],
             'connection_status': 'historical' if last_reading else 'no_data',
             'battery_level': device['battery_level'],
-            'last_data': dict(last_reading) if last_reading else {}
+            'last_data': last_reading or {}
         }
         device_data.append(data)
         
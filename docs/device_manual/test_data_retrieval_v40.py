@@ -20,12 +20,17 @@ PlantMonitor Rev4デバイスに接続して全センサーデータ・構成情
 """
 
 import asyncio
+import os
 import struct
 import sys
 import time
 from datetime import datetime
 from bleak import BleakClient, BleakScanner
 
+# ペイロードのレイアウトはダッシュボード本体のレジストリ (sensor_payloads.py) を共用する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from sensor_payloads import SENSOR_DATA_LAYOUTS, TIME_DATA_LAYOUTS
+
 # BLE UUIDs (ble_manager.cと一致)
 SERVICE_UUID = "59462f12-9543-9999-12c8-58b459a2712d"
 COMMAND_UUID = "6a3b2c1d-4e5f-6a7b-8c9d-e0f123456791"
@@ -118,7 +123,29 @@ def parse_response_packet(data: bytes) -> dict:
 #   offset101: padding                        (3 bytes)
 #   Total: 104 bytes
 # ---------------------------------------------------------------------------
-SOIL_DATA_V3_SIZE = 104
+SOIL_DATA_V3_SIZE = SENSOR_DATA_LAYOUTS[3].size
+
+
+def _reading_to_display(reading, payload: bytes) -> dict:
+    """レジストリのデコード結果を表示用の辞書に変換 (data_versionはペイロードの生の値を表示する)"""
+    result = {
+        'data_version': payload[0],
+        'datetime': reading.datetime,
+        'lux': reading.light_lux,
+        'temperature': reading.temperature,
+        'humidity': reading.humidity,
+        'soil_moisture': reading.soil_moisture,
+        'soil_temperature': [reading.soil_temperature1, reading.soil_temperature2,
+                             reading.soil_temperature3, reading.soil_temperature4],
+        'soil_temperature_count': reading.soil_temperature_count,
+        'capacitance': [reading.capacitance_ch1, reading.capacitance_ch2,
+                        reading.capacitance_ch3, reading.capacitance_ch4],
+        'ext_temperature': reading.ex_temperature,
+        'ext_temperature_valid': reading.ext_temperature_valid,
+    }
+    if 'sensor_error' in reading._fields:
+        result['sensor_error'] = int(reading.sensor_error)
+    return result
 
 
 def parse_sensor_data_v3(payload: bytes) -> dict:
@@ -127,42 +154,7 @@ def parse_sensor_data_v3(payload: bytes) -> dict:
         return {'error': f'ペイロードが短すぎます: {len(payload)} bytes (期待: {SOIL_DATA_V3_SIZE})'}
 
     try:
-        # data_version + padding
-        data_version = payload[0]
-        # struct tm (offset 4)
-        tm_fields = struct.unpack_from('<9i', payload, 4)
-        tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year = tm_fields[:6]
-        # float fields (offset 40)
-        lux, temperature, humidity, soil_moisture = struct.unpack_from('<4f', payload, 40)
-        # sensor_error (offset 56)
-        sensor_error = payload[56]
-        # soil_temperature[4] (offset 60)
-        soil_temps = struct.unpack_from('<4f', payload, 60)
-        # soil_temperature_count (offset 76)
-        soil_temp_count = payload[76]
-        # soil_moisture_capacitance[4] (offset 80)
-        capacitance = struct.unpack_from('<4f', payload, 80)
-        # ext_temperature (offset 96)
-        ext_temperature = struct.unpack_from('<f', payload, 96)[0]
-        # ext_temperature_valid (offset 100)
-        ext_temperature_valid = payload[100]
-
-        datetime_str = _format_tm(tm_year, tm_mon, tm_mday, tm_hour, tm_min, tm_sec)
-
-        return {
-            'data_version': data_version,
-            'datetime': datetime_str,
-            'lux': lux,
-            'temperature': temperature,
-            'humidity': humidity,
-            'soil_moisture': soil_moisture,
-            'sensor_error': sensor_error,
-            'soil_temperature': list(soil_temps),
-            'soil_temperature_count': soil_temp_count,
-            'capacitance': list(capacitance),
-            'ext_temperature': ext_temperature,
-            'ext_temperature_valid': bool(ext_temperature_valid),
-        }
+        return _reading_to_display(SENSOR_DATA_LAYOUTS[3].decode(payload), payload)
     except Exception as e:
         return {'error': str(e), 'raw': payload.hex()}
 
@@ -184,7 +176,7 @@ def parse_sensor_data_v3(payload: bytes) -> dict:
 #   offset 90: uint8_t  ext_temperature_valid (1 byte)
 #   Total: 91 bytes
 # ---------------------------------------------------------------------------
-TIME_DATA_RESPONSE_V3_SIZE = 91
+TIME_DATA_RESPONSE_V3_SIZE = TIME_DATA_LAYOUTS[3].size
 
 
 def parse_time_data_response_v3(payload: bytes) -> dict:
@@ -193,38 +185,7 @@ def parse_time_data_response_v3(payload: bytes) -> dict:
         return {'error': f'ペイロードが短すぎます: {len(payload)} bytes (期待: {TIME_DATA_RESPONSE_V3_SIZE})'}
 
     try:
-        data_version = payload[0]
-        # struct tm (offset 1, packed)
-        tm_fields = struct.unpack_from('<9i', payload, 1)
-        tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year = tm_fields[:6]
-        # float fields (offset 37, packed)
-        temperature, humidity, lux, soil_moisture = struct.unpack_from('<4f', payload, 37)
-        # soil_temperature[4] (offset 53)
-        soil_temps = struct.unpack_from('<4f', payload, 53)
-        # soil_temperature_count (offset 69)
-        soil_temp_count = payload[69]
-        # soil_moisture_capacitance[4] (offset 70)
-        capacitance = struct.unpack_from('<4f', payload, 70)
-        # ext_temperature (offset 86)
-        ext_temperature = struct.unpack_from('<f', payload, 86)[0]
-        # ext_temperature_valid (offset 90)
-        ext_temperature_valid = payload[90]
-
-        datetime_str = _format_tm(tm_year, tm_mon, tm_mday, tm_hour, tm_min, tm_sec)
-
-        return {
-            'data_version': data_version,
-            'datetime': datetime_str,
-            'lux': lux,
-            'temperature': temperature,
-            'humidity': humidity,
-            'soil_moisture': soil_moisture,
-            'soil_temperature': list(soil_temps),
-            'soil_temperature_count': soil_temp_count,
-            'capacitance': list(capacitance),
-            'ext_temperature': ext_temperature,
-            'ext_temperature_valid': bool(ext_temperature_valid),
-        }
+        return _reading_to_display(TIME_DATA_LAYOUTS[3].decode(payload), payload)
     except Exception as e:
         return {'error': str(e), 'raw': payload.hex()}
 
@@ -376,15 +337,6 @@ def parse_system_status(payload: bytes) -> dict:
         return {'error': str(e), 'raw': payload.hex()}
 
 
-def _format_tm(tm_year, tm_mon, tm_mday, tm_hour, tm_min, tm_sec):
-    """struct tmフィールドを日時文字列に変換"""
-    try:
-        dt = datetime(1900 + tm_year, tm_mon + 1, tm_mday, tm_hour, tm_min, tm_sec)
-        return dt.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception:
-        return f'{1900 + tm_year}-{tm_mon + 1:02d}-{tm_mday:02d} {tm_hour:02d}:{tm_min:02d}:{tm_sec:02d}'
-
-
 def notification_handler(sender, data):
     """レスポンス通知ハンドラ"""
     global response_data
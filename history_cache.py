@@ -0,0 +1,298 @@
+# plant_dashboard/history_cache.py
+"""
+履歴API (/api/history) のレスポンスキャッシュ
+
+同じ (device_id, period, date) の組み合わせを複数のタブ・ユーザーが要求しても、集計SQLを1回で済ませる。
+
+- プロセス内: 件数上限つきのLRU + TTL
+- プロセス間: ローカルのSQLiteファイル (config.HISTORY_CACHE_PATH) に同じエントリを保存し、
+  gunicornの他のワーカーが集計した結果も使う
+
+無効化:
+- 分析デーモンがセンサーデータを取り込むたびに、そのデバイスの世代 (generation) を進める (invalidate_devices)。
+  現在時刻を含む期間（終了日が今日以降）のエントリは、作成時の世代と一致しなければ使わない。
+- バックフィル・デバイス削除など過去のデータが変わった場合は include_past=True で過去の期間も無効にする。
+- エントリには履歴APIのETagも記録し、閾値の変更などでETagが変わった場合も使わない。
+
+共有ストアが使えない場合（ファイルを作れない等）はプロセス内のキャッシュだけで動く。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCacheStore:
+    """ワーカー・デーモン間で共有するキャッシュのSQLiteファイル"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    device_id TEXT NOT NULL,
+                    live INTEGER NOT NULL,
+                    generation INTEGER NOT NULL,
+                    etag TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    body BLOB NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_generations (
+                    device_id TEXT PRIMARY KEY,
+                    live_generation INTEGER NOT NULL DEFAULT 0,
+                    past_generation INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def generation(self, device_id, live):
+        rows = self._execute(
+            "SELECT live_generation, past_generation FROM cache_generations WHERE device_id = ?", (device_id,)
+        )
+        if not rows:
+            return 0
+        return rows[0][0] if live else rows[0][1]
+
+    def get(self, key):
+        rows = self._execute("SELECT generation, etag, expires_at, body FROM cache_entries WHERE key = ?", (key,))
+        return rows[0] if rows else None
+
+    def put(self, key, device_id, live, generation, etag, expires_at, body):
+        self._execute(
+            "INSERT OR REPLACE INTO cache_entries (key, device_id, live, generation, etag, expires_at, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, device_id, int(live), generation, etag, expires_at, body)
+        )
+
+    def bump(self, device_ids, include_past=False):
+        """デバイスの世代を進め、古い世代のエントリを削除する"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for device_id in device_ids:
+                    conn.execute("""
+                        INSERT INTO cache_generations (device_id, live_generation, past_generation) VALUES (?, 1, ?)
+                        ON CONFLICT(device_id) DO UPDATE SET
+                            live_generation = live_generation + 1,
+                            past_generation = past_generation + ?
+                    """, (device_id, int(include_past), int(include_past)))
+                    live_filter = "" if include_past else "AND live = 1"
+                    conn.execute(f"DELETE FROM cache_entries WHERE device_id = ? {live_filter}", (device_id,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def prune(self, max_entries, now):
+        """期限切れのエントリと、上限を超えた古いエントリを削除する"""
+        self._execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        self._execute("""
+            DELETE FROM cache_entries WHERE key IN (
+                SELECT key FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,))
+
+    def count(self):
+        return self._execute("SELECT COUNT(*) FROM cache_entries")[0][0]
+
+
+class HistoryCache:
+    """履歴APIのレスポンス本文を (device_id, period, end_date) ごとにキャッシュする"""
+
+    def __init__(self, max_entries=None, ttl_seconds=None, past_ttl_seconds=None, store_path=None,
+                 shared_max_entries=None, clock=time.time):
+        self.max_entries = max_entries or config.HISTORY_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or config.HISTORY_CACHE_TTL_SECONDS
+        self.past_ttl_seconds = past_ttl_seconds or config.HISTORY_CACHE_PAST_TTL_SECONDS
+        self.shared_max_entries = shared_max_entries or config.HISTORY_CACHE_SHARED_MAX_ENTRIES
+        store_path = store_path if store_path is not None else config.HISTORY_CACHE_PATH
+        self.store = SharedCacheStore(store_path) if store_path else None
+        self.clock = clock
+        # key -> (generation, etag, expires_at, body)
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self.counters = {
+            'memory_hits': 0, 'shared_hits': 0, 'misses': 0,
+            'invalidated': 0, 'expired': 0, 'evictions': 0, 'puts': 0, 'store_errors': 0,
+        }
+
+    @staticmethod
+    def make_key(device_id, period, end_date):
+        return f"{device_id}|{period}|{end_date}"
+
+    def _generation(self, device_id, live):
+        if self.store is None:
+            return 0
+        try:
+            return self.store.generation(device_id, live)
+        except sqlite3.Error as e:
+            self._store_error(e)
+            return None
+
+    def _store_error(self, error):
+        self.counters['store_errors'] += 1
+        logger.warning(f"履歴キャッシュの共有ストアにアクセスできません: {error}")
+
+    def get(self, device_id, period, end_date, etag, live):
+        """
+        有効なエントリの本文を返す。なければNone。
+
+        Args:
+            etag: 現在のデータの版から作った履歴APIのETag
+            live: 期間が現在時刻を含むか（終了日が今日以降か）
+        """
+        key = self.make_key(device_id, period, end_date)
+        now = self.clock()
+        generation = self._generation(device_id, live)
+        if generation is None:
+            # 世代が分からない場合は古いデータを返さないよう、キャッシュを使わない
+            self.counters['misses'] += 1
+            return None
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self._is_valid(entry, generation, etag, now):
+                    self.entries.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return entry[3]
+                del self.entries[key]
+
+        if self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except sqlite3.Error as e:
+                self._store_error(e)
+                entry = None
+            if entry is not None and self._is_valid(entry, generation, etag, now):
+                self._remember(key, tuple(entry))
+                self.counters['shared_hits'] += 1
+                return entry[3]
+
+        self.counters['misses'] += 1
+        return None
+
+    def _is_valid(self, entry, generation, etag, now):
+        entry_generation, entry_etag, expires_at, _body = entry
+        if expires_at <= now:
+            self.counters['expired'] += 1
+            return False
+        if entry_generation != generation or entry_etag != etag:
+            self.counters['invalidated'] += 1
+            return False
+        return True
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def put(self, device_id, period, end_date, etag, live, body):
+        """集計したレスポンス本文 (bytes) を保存する"""
+        generation = self._generation(device_id, live)
+        if generation is None:
+            return
+        key = self.make_key(device_id, period, end_date)
+        now = self.clock()
+        expires_at = now + (self.ttl_seconds if live else self.past_ttl_seconds)
+        self._remember(key, (generation, etag, expires_at, body))
+        self.counters['puts'] += 1
+        if self.store is None:
+            return
+        try:
+            self.store.put(key, device_id, live, generation, etag, expires_at, body)
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= 100:
+                self.store.prune(self.shared_max_entries, now)
+                self._puts_since_prune = 0
+        except sqlite3.Error as e:
+            self._store_error(e)
+
+    def invalidate_devices(self, device_ids, include_past=False):
+        """このプロセスと共有ストアの、デバイスのエントリを無効にする"""
+        device_ids = set(device_ids)
+        if not device_ids:
+            return
+        with self._lock:
+            for key in [key for key in self.entries if key.split('|', 1)[0] in device_ids]:
+                del self.entries[key]
+        if self.store is not None:
+            try:
+                self.store.bump(device_ids, include_past)
+            except sqlite3.Error as e:
+                self._store_error(e)
+
+    def metrics(self):
+        """ヒット率などの指標（このプロセスの値と共有ストアのエントリ数）"""
+        lookups = self.counters['memory_hits'] + self.counters['shared_hits'] + self.counters['misses']
+        shared_entries = None
+        if self.store is not None:
+            try:
+                shared_entries = self.store.count()
+            except sqlite3.Error as e:
+                self._store_error(e)
+        return {
+            'pid': os.getpid(),
+            'lookups': lookups,
+            'hit_rate': round((self.counters['memory_hits'] + self.counters['shared_hits']) / lookups, 4) if lookups else None,
+            'memory_entries': len(self.entries),
+            'shared_entries': shared_entries,
+            **self.counters,
+        }
+
+
+_history_cache = None
+_invalidation_store = None
+
+
+def get_history_cache():
+    """Webアプリのワーカーごとのキャッシュ"""
+    global _history_cache
+    if _history_cache is None:
+        _history_cache = HistoryCache()
+    return _history_cache
+
+
+def invalidate_devices(device_ids, include_past=False):
+    """
+    デバイスの履歴キャッシュを無効にする（分析デーモンなど、キャッシュを持たないプロセスから呼ぶ）。
+    失敗しても取り込み処理は止めない。
+    """
+    global _invalidation_store
+    device_ids = set(device_ids)
+    if not device_ids or not config.HISTORY_CACHE_PATH:
+        return
+    if _invalidation_store is None:
+        _invalidation_store = SharedCacheStore(config.HISTORY_CACHE_PATH)
+    try:
+        _invalidation_store.bump(device_ids, include_past)
+    except sqlite3.Error as e:
+        logger.warning(f"履歴キャッシュの無効化に失敗しました: {e}")
@@ -0,0 +1,158 @@
+# plant_dashboard/lib/downsample.py
+"""
+グラフ表示用の間引き (Largest-Triangle-Three-Buckets)
+
+長い期間の履歴をグラフの幅に合わせた点数に減らす。単純な間引きや平均と違い、
+スパイクや谷など形に効く点を残す。
+
+複数の系列（温度・湿度・土壌水分など）を同じ行の組み合わせで返す必要があるため、
+各系列を0〜1に正規化した三角形の面積の合計で点を選ぶ。
+欠損値 (None) はその系列の面積に加えない。
+
+numpyがあればバケット内の計算をベクトル化し、なければ同じアルゴリズムを純Pythonで実行する。
+"""
+
+import math
+from datetime import datetime
+
+# numpyは読み込みに時間がかかるため、最初に間引きが必要になったときに読み込む (_load_numpy)
+np = None
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:  # Raspberry Piなどnumpyがない環境
+            np = False
+    return np
+
+
+def _bucket_bounds(n, max_points):
+    """
+    先頭・末尾を除いた点を max_points - 2 個のバケットに分けた境界。
+    bounds[i]〜bounds[i+1] がバケットi、最後の要素は末尾の点。
+    """
+    every = (n - 2) / (max_points - 2)
+    bounds = [int(math.floor(i * every)) + 1 for i in range(max_points - 1)]
+    bounds[-1] = n - 1
+    return bounds + [n]
+
+
+def _normalize(values):
+    present = [v for v in values if v is not None]
+    if not present:
+        return [None] * len(values)
+    low, high = min(present), max(present)
+    scale = (high - low) or 1.0
+    return [None if v is None else (v - low) / scale for v in values]
+
+
+def _lttb_python(x, series, max_points):
+    n = len(x)
+    bounds = _bucket_bounds(n, max_points)
+    series = [_normalize(values) for values in series]
+    selected = [0]
+    a = 0
+    for i in range(max_points - 2):
+        start, end = bounds[i], bounds[i + 1]
+        next_start, next_end = bounds[i + 1], bounds[i + 2]
+        cx = sum(x[next_start:next_end]) / (next_end - next_start)
+        averages = []
+        for values in series:
+            present = [v for v in values[next_start:next_end] if v is not None]
+            averages.append(sum(present) / len(present) if present else None)
+
+        best, best_area = start, -1.0
+        for p in range(start, end):
+            area = 0.0
+            for values, cy in zip(series, averages):
+                ay, py = values[a], values[p]
+                if ay is None or py is None or cy is None:
+                    continue
+                area += abs((x[a] - cx) * (py - ay) - (x[a] - x[p]) * (cy - ay))
+            if area > best_area:
+                best, best_area = p, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def _lttb_numpy(x, series, max_points):
+    n = len(x)
+    bounds = np.array(_bucket_bounds(n, max_points))
+    x = np.asarray(x, dtype=float)
+    ys = np.array([[np.nan if v is None else v for v in values] for values in series], dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        low = np.min(np.where(np.isnan(ys), np.inf, ys), axis=1, keepdims=True)
+        high = np.max(np.where(np.isnan(ys), -np.inf, ys), axis=1, keepdims=True)
+        scale = np.where(high > low, high - low, 1.0)
+        ys = (ys - low) / scale
+
+        # 各バケットの平均（次のバケットの代表点）をまとめて計算する
+        starts = bounds[:-1]
+        counts = np.diff(bounds)
+        avg_x = np.add.reduceat(x, starts) / counts
+        present = ~np.isnan(ys)
+        avg_y = np.add.reduceat(np.where(present, ys, 0.0), starts, axis=1) / np.add.reduceat(present.astype(float), starts, axis=1)
+
+    selected = np.empty(max_points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = bounds[i], bounds[i + 1]
+        cx, cy = avg_x[i + 1], avg_y[:, i + 1:i + 2]
+        ay = ys[:, a:a + 1]
+        areas = np.abs((x[a] - cx) * (ys[:, start:end] - ay) - (x[a] - x[start:end]) * (cy - ay))
+        a = start + int(np.argmax(np.nansum(areas, axis=0)))
+        selected[i + 1] = a
+    return selected.tolist()
+
+
+def lttb_indices(x, series, max_points):
+    """
+    残す点のインデックスを返す。
+
+    Args:
+        x: 昇順の数値（時刻）のリスト
+        series: x と同じ長さの値のリストのリスト（None は欠損）
+        max_points: 残す点数 (3以上)
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return list(range(n))
+    if not series:
+        series = [[0.0] * n]
+    if _load_numpy():
+        return _lttb_numpy(x, series, max_points)
+    return _lttb_python(x, series, max_points)
+
+
+def _to_seconds(timestamp, fallback):
+    try:
+        return datetime.fromisoformat(str(timestamp)).timestamp()
+    except ValueError:
+        return float(fallback)
+
+
+def downsample_rows(rows, max_points, value_keys, time_key='timestamp'):
+    """
+    履歴の行 (dict) を max_points 行以下に間引く。
+
+    Args:
+        rows: 時刻順の行のリスト
+        value_keys: 形を保つ対象の列
+    """
+    if max_points is None or len(rows) <= max_points:
+        return rows
+    x = [_to_seconds(row.get(time_key), i) for i, row in enumerate(rows)]
+    series = []
+    for key in value_keys:
+        values = [row.get(key) for row in rows]
+        if any(v is not None for v in values):
+            series.append(values)
+    return [rows[i] for i in lttb_indices(x, series, max_points)]
@@ -0,0 +1,84 @@
+# plant_dashboard/lib/history_format.py
+"""
+履歴APIのレスポンスのエンコード
+
+- 列指向 (format=columnar): 行ごとに列名を繰り返さず、列ごとの配列と
+  差分エンコードした時刻（UNIX秒）で返す。static/js/utils.js の decodeColumnarHistory で行に戻す。
+- JSONの書き出しはorjsonがあればそれを使い、なければ標準のjsonで区切りを詰めて出力する。
+- gzipに対応したクライアントには圧縮して返す。
+"""
+
+import gzip
+import json
+import zlib
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # orjsonがない環境では標準のjsonを使う
+    orjson = None
+
+HISTORY_FORMATS = ('rows', 'columnar')
+# これより小さいレスポンスは圧縮しない（ヘッダーの方が大きくなる）
+GZIP_MIN_BYTES = 1024
+# 列指向で返す値の小数点以下の桁数（集計値のAVGが長い小数になるため）
+COLUMNAR_PRECISION = 3
+
+
+def json_dumps(data):
+    """JSONをbytesで返す"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _epoch(timestamp):
+    # DBの日時はサーバーのローカル時刻
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+
+def to_columnar(rows, time_key='timestamp'):
+    """
+    行 (dict) のリストを列指向に変換する。
+
+    Returns:
+        {'t0': 先頭の時刻, 'dt': 直前の行からの秒数のリスト, 'columns': {列名: 値のリスト},
+         'empty': すべてnullの列名のリスト}
+    """
+    keys = [key for key in (rows[0].keys() if rows else []) if key != time_key]
+    epochs = [_epoch(row[time_key]) for row in rows]
+    columns = {}
+    empty = []
+    for key in keys:
+        values = [row[key] for row in rows]
+        if all(v is None for v in values):
+            # センサーが持たない項目は列名だけ送る（グラフ側は列の有無で表示を切り替える）
+            empty.append(key)
+            continue
+        columns[key] = [round(v, COLUMNAR_PRECISION) if isinstance(v, float) else v for v in values]
+    return {
+        't0': epochs[0] if epochs else None,
+        'dt': [b - a for a, b in zip(epochs, epochs[1:])],
+        'columns': columns,
+        'empty': empty,
+    }
+
+
+def compress(body):
+    """gzip圧縮した本文を返す。小さい本文はNone"""
+    if len(body) < GZIP_MIN_BYTES:
+        return None
+    return gzip.compress(body, compresslevel=6)
+
+
+def gzip_stream(chunks):
+    """
+    逐次送るレスポンスをgzip圧縮する。
+    チャンクごとにフラッシュし、クライアントが届いた分から展開できるようにする。
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -3,18 +3,18 @@ import logging
 import time
 import json
 import os
+import threading
 from datetime import datetime, date, timedelta
 
 import config
 import device_manager as dm
-from database import init_db, get_db_connection
-from plant_logic import PlantStateAnalyzer
+import history_cache
+from database import init_db, get_db_connection, checkpoint_wal
+from plant_logic import PlantStateAnalyzer, LethalTemperatureMonitor
 
 DATA_PIPE_PATH = "/tmp/plant_dashboard_pipe.jsonl"
-# データ取り込みの間隔（秒）
-DATA_FETCH_INTERVAL_SECONDS = 60  # 1分
-# 1時間ごとに分析を実行
-ANALYSIS_INTERVAL_SECONDS = 3600
+# データ取り込みの間隔（秒）。新着データをすぐ検知できるよう短めにする
+DATA_FETCH_INTERVAL_SECONDS = config.ANALYZER_PIPE_CHECK_INTERVAL
 
 log_format = '%(asctime)s - [AnalyzerDaemon] - %(levelname)s - %(message)s'
 formatter = logging.Formatter(log_format)
@@ -41,17 +41,86 @@ logger = logging.getLogger(__name__)
 # ★★★ デバッグログを表示するためのおまじない ★★★
 #logger.setLevel(logging.DEBUG)
 # ★★★ ここまで ★★★
-def process_data_pipe():
-    """一時ファイルを処理してDBに保存する"""
+
+
+class AnalysisScheduler:
+    """
+    新着データのあった植物だけを再分析対象として管理する。
+    最後のデータ到着から debounce_seconds 経過するか、最初の到着から max_delay_seconds
+    経過した時点で分析対象となる。ただし同じ植物は min_interval_seconds 以内に再分析しない。
+    """
+
+    def __init__(self, debounce_seconds, min_interval_seconds, max_delay_seconds):
+        self.debounce_seconds = debounce_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.max_delay_seconds = max_delay_seconds
+        # managed_plant_id -> (最初の到着時刻, 最後の到着時刻)
+        self.pending = {}
+        # managed_plant_id -> 最後に分析した時刻
+        self.last_run = {}
+
+    def mark_dirty(self, plant_ids, now):
+        """新着データのあった植物を記録する"""
+        for plant_id in plant_ids:
+            first_seen, _ = self.pending.get(plant_id, (now, now))
+            self.pending[plant_id] = (first_seen, now)
+
+    def pop_due(self, now):
+        """分析を実行すべき植物IDのリストを返し、保留状態から取り除く"""
+        due = []
+        for plant_id, (first_seen, last_seen) in list(self.pending.items()):
+            settled = (now - last_seen) >= self.debounce_seconds
+            overdue = (now - first_seen) >= self.max_delay_seconds
+            if not (settled or overdue):
+                continue
+            if (now - self.last_run.get(plant_id, 0)) < self.min_interval_seconds:
+                continue
+            due.append(plant_id)
+            del self.pending[plant_id]
+            self.last_run[plant_id] = now
+        return due
+
+
+def get_plants_for_devices(device_ids):
+    """指定されたデバイスが割り当てられている管理植物のIDを返す"""
+    if not device_ids:
+        return []
+    placeholders = ', '.join('?' for _ in device_ids)
+    params = list(device_ids) * 2
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            f"""
+            SELECT managed_plant_id FROM managed_plants
+            WHERE assigned_plant_sensor_id IN ({placeholders})
+               OR assigned_switchbot_id IN ({placeholders})
+            """, params
+        ).fetchall()
+        return [row['managed_plant_id'] for row in rows]
+    finally:
+        conn.close()
+
+
+def process_data_pipe(alert_monitor=None, backfilled=None):
+    """
+    一時ファイルを処理してDBに保存する。
+    alert_monitorが指定された場合、新たに保存した温度を即座に致死温度判定へ流す。
+    バックフィル（デバイス内の記録から取得した過去データ）は致死温度判定には流さず、
+    backfilled が指定された場合は {日付: デバイスIDの集合} として保存した日付を記録する。
+
+    Returns:
+        set: センサーデータが新たに保存されたデバイスIDの集合
+    """
+    updated_devices = set()
     if not os.path.exists(DATA_PIPE_PATH):
-        return
+        return updated_devices
     
     # 複数のアナライザープロセスが同時に動くことを想定し、一意なファイル名で処理
     processing_path = DATA_PIPE_PATH + f".processing_{os.getpid()}"
     try:
         os.rename(DATA_PIPE_PATH, processing_path)
     except FileNotFoundError:
-        return # 他のプロセスが先にリネームした場合
+        return updated_devices # 他のプロセスが先にリネームした場合
 
     lines_processed = 0
     with open(processing_path, "r") as f:
@@ -67,10 +136,22 @@ def process_data_pipe():
 
                 if record.get("error"):
                     dm.update_device_status(device_id, 'error')
+                elif "backfill" in record:
+                    inserted = dm.save_sensor_data_batch(device_id, record["backfill"], data_version)
+                    if backfilled is not None:
+                        for day in {timestamp[:10] for timestamp in inserted}:
+                            backfilled.setdefault(date.fromisoformat(day), set()).add(device_id)
                 elif sensor_data:
+                    # 受信時刻 (timestamp) よりデバイスの計測時刻を優先する（時計がずれていなければ）
+                    reading_time, clock_skew = dm.resolve_reading_timestamp(device_id, timestamp, sensor_data)
                     # data_versionを渡してデータを保存
-                    dm.save_sensor_data(device_id, timestamp, sensor_data, data_version)
-                    dm.update_device_status(device_id, 'connected', sensor_data.get('battery_level'))
+                    saved = dm.save_sensor_data(device_id, reading_time, sensor_data, data_version)
+                    dm.update_device_status(device_id, 'connected', sensor_data.get('battery_level'), clock_skew)
+                    # 再送・再ポーリングされた同じ計測（保存済み）は新しい読み取りとして数えない
+                    if saved:
+                        updated_devices.add(device_id)
+                        if alert_monitor is not None:
+                            alert_monitor.process_reading(device_id, reading_time, sensor_data.get('temperature'))
                 else:
                     dm.update_device_status(device_id, 'disconnected')
                 lines_processed += 1
@@ -80,12 +161,19 @@ def process_data_pipe():
     os.remove(processing_path)
     if lines_processed > 0:
         logger.info(f"Processed {lines_processed} records from the data pipe.")
+    return updated_devices
 
-def run_full_analysis(target_date):
-    """指定された日付の分析をすべての管理植物に対して実行する"""
+def run_full_analysis(target_date, plant_ids=None):
+    """指定された日付の分析を管理植物に対して実行する（plant_ids指定時はその植物のみ）"""
     conn = get_db_connection()
     try:
-        managed_plants = conn.execute("SELECT * FROM managed_plants").fetchall()
+        if plant_ids is None:
+            managed_plants = conn.execute("SELECT * FROM managed_plants").fetchall()
+        else:
+            placeholders = ', '.join('?' for _ in plant_ids)
+            managed_plants = conn.execute(
+                f"SELECT * FROM managed_plants WHERE managed_plant_id IN ({placeholders})", list(plant_ids)
+            ).fetchall()
         logger.info(f"Found {len(managed_plants)} managed plants to analyze for {target_date}.")
         for plant_row in managed_plants:
             analyzer = PlantStateAnalyzer(dict(plant_row), conn)
@@ -96,61 +184,111 @@ def run_full_analysis(target_date):
         if conn:
             conn.close()
 
+def run_checkpoint_loop(stop_event, interval_seconds):
+    """
+    WALチェックポイントを定期的に実行するバックグラウンドスレッド本体。
+    書き込み側の自動チェックポイントに頼らず、ここでPASSIVEモードで書き戻すことで
+    取り込み処理やWebからの書き込みがチェックポイントで待たされないようにする。
+    """
+    conn = get_db_connection()
+    try:
+        while not stop_event.wait(interval_seconds):
+            try:
+                start = time.monotonic()
+                busy, wal_pages, checkpointed = checkpoint_wal(conn, 'PASSIVE')
+                elapsed_ms = (time.monotonic() - start) * 1000
+                logger.debug(f"WAL checkpoint: busy={busy}, wal_pages={wal_pages}, checkpointed={checkpointed}, {elapsed_ms:.1f}ms")
+            except Exception as e:
+                logger.error(f"WAL checkpoint failed: {e}")
+    finally:
+        conn.close()
+
+def start_checkpoint_thread(interval_seconds):
+    """チェックポイントスレッドを起動し、停止用のEventを返す"""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_checkpoint_loop, args=(stop_event, interval_seconds),
+        name="wal-checkpoint", daemon=True
+    )
+    thread.start()
+    logger.info(f"Started WAL checkpoint thread (interval: {interval_seconds}s).")
+    return stop_event
+
 def main_loop():
     logger.info("Starting Plant Analyzer Daemon loop...")
-    last_processed_date = None
     
     init_db()
 
-    # --- 設定値 ---
-    # データ取り込みの間隔（秒）
-    #DATA_FETCH_INTERVAL_SECONDS = 60  # 1分
-    # 分析実行の間隔（秒）
-    #ANALYSIS_INTERVAL_SECONDS = 3600 # 1時間
+    # WALチェックポイントは分析デーモンがバックグラウンドで担当する
+    start_checkpoint_thread(config.DB_CHECKPOINT_INTERVAL)
 
-    # 最後に分析処理を実行した時刻を記録する変数
-    # プログラム起動後、すぐに初回の分析が実行されるように初期値は0にしておきます
-    last_analysis_execution_time = 0
+    # 新着データのあった植物だけを、デバウンスと最小間隔付きで再分析する
+    scheduler = AnalysisScheduler(
+        debounce_seconds=config.ANALYSIS_DEBOUNCE_SECONDS,
+        min_interval_seconds=config.ANALYSIS_MIN_INTERVAL_SECONDS,
+        max_delay_seconds=config.ANALYSIS_MAX_DELAY_SECONDS
+    )
+
+    # 致死温度アラートは取り込みと同時に判定する（専用の常時接続を使用）
+    alert_conn = get_db_connection()
+    alert_monitor = LethalTemperatureMonitor(alert_conn)
+
+    # 起動直後に当日の分析を一度すべての植物に対して実行する
+    last_processed_date = date.today()
+    logger.info(f"Running initial analysis for {last_processed_date}...")
+    run_full_analysis(last_processed_date)
 
     while True:
         # ループの開始時刻を記録
         loop_start_time = time.time()
 
-        # --- ① Bluetoothデーモンからのデータを取り込む (毎分実行) ---
-        logger.info("Processing data from pipe...")
-        process_data_pipe()
+        # --- ① Bluetoothデーモンからのデータを取り込む ---
+        logger.debug("Processing data from pipe...")
+        backfilled = {}
+        updated_devices = process_data_pipe(alert_monitor, backfilled)
+        # 新しい読み取りのあったデバイスの履歴キャッシュを無効にする（過去の日付が補完された場合は過去の期間も）
+        past_backfilled = {device_id for day, device_ids in backfilled.items() if day < date.today() for device_id in device_ids}
+        history_cache.invalidate_devices(updated_devices - past_backfilled)
+        history_cache.invalidate_devices(past_backfilled, include_past=True)
+
+        current_date = date.today()
 
-        # --- ② 前回の分析から1時間以上経過したかチェック ---
+        # --- ② 日付が変わった場合は前日分の分析を最終確定させる ---
+        if last_processed_date != current_date:
+            yesterday = current_date - timedelta(days=1)
+            logger.info(f"New day detected. Finalizing analysis for {yesterday}...")
+            run_full_analysis(yesterday)
+            last_processed_date = current_date
+
+        # --- ③ 新着データのあった植物の再分析を予約する ---
+        # 生存限界は取り込み時に alert_monitor が判定済み（plant_alert_state）なので、ここでは集計し直さない
         current_time = time.time()
-        if (current_time - last_analysis_execution_time) >= ANALYSIS_INTERVAL_SECONDS:
-            logger.info("Starting hourly analysis process...")
-            
-            # 最後に分析を実行した時刻を現在時刻に更新
-            last_analysis_execution_time = current_time
-            
-            current_date = date.today()
-            
-            # --- ③ 日付が変わり、最初の実行かチェック ---
-            if last_processed_date != current_date:
-                yesterday = current_date - timedelta(days=1)
-                # 初回起動時以外は、前日分の分析を最終確定させる
-                if last_processed_date is not None:
-                    logger.info(f"New day detected. Finalizing analysis for {yesterday}...")
-                    run_full_analysis(yesterday)
-                last_processed_date = current_date
-
-            # --- ④ 1時間ごとに当日の暫定分析を実行 ---
-            logger.info(f"Running hourly analysis for {current_date}...")
-            run_full_analysis(current_date)
-            
-            logger.info("Hourly analysis finished.")
+        if updated_devices:
+            plant_ids = get_plants_for_devices(updated_devices)
+            if plant_ids:
+                scheduler.mark_dirty(plant_ids, current_time)
+
+        # --- ③' バックフィルで過去のデータが補完された植物は、その日の分析をやり直す ---
+        for backfilled_date, device_ids in sorted(backfilled.items()):
+            plant_ids = get_plants_for_devices(device_ids)
+            if not plant_ids:
+                continue
+            if backfilled_date < current_date:
+                logger.info(f"Re-running analysis for {len(plant_ids)} plants with backfilled data on {backfilled_date}...")
+                run_full_analysis(backfilled_date, plant_ids)
+            else:
+                scheduler.mark_dirty(plant_ids, current_time)
+
+        # --- ④ デバウンス・最小間隔を満たした植物だけを分析する ---
+        due_plant_ids = scheduler.pop_due(current_time)
+        if due_plant_ids:
+            logger.info(f"Running analysis for {len(due_plant_ids)} plants with new data on {current_date}...")
+            run_full_analysis(current_date, due_plant_ids)
 
         # --- 次のデータ取り込みまで待機 ---
-        # 処理にかかった時間を差し引いて、ループ全体が約1分間隔になるよう調整
         elapsed_time = time.time() - loop_start_time
         sleep_time = DATA_FETCH_INTERVAL_SECONDS - elapsed_time
         if sleep_time > 0:
-            logger.info(f"Waiting for {sleep_time:.2f} seconds until next data fetch.")
             time.sleep(sleep_time)
 
 if __name__ == "__main__":
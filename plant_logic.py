@@ -1,6 +1,7 @@
 # plant_dashboard/plant_logic.py
 
 import json
+import time
 from datetime import datetime, date, timedelta
 import logging
 
@@ -14,6 +15,12 @@ GROWTH_STATE_STREAK_DAYS = {
     'cold_dormancy': 2
 }
 LETHAL_LIMIT_TRIGGER_COUNT = 3
+# Streaming alert: a raised alert clears only after this many consecutive readings
+# back inside the limit by at least LETHAL_ALERT_HYSTERESIS degrees.
+LETHAL_ALERT_HYSTERESIS = 1.0
+LETHAL_ALERT_CLEAR_COUNT = 3
+# How often the device -> plant threshold mapping is reloaded from the database (seconds).
+LETHAL_ALERT_REFRESH_SECONDS = 60
 
 class PlantStateAnalyzer:
     """Analyzes plant state and manages daily records."""
@@ -140,8 +147,10 @@ class PlantStateAnalyzer:
                 daily_capacitance_ch3_max, daily_capacitance_ch3_min, daily_capacitance_ch3_ave,
                 daily_capacitance_ch4_max, daily_capacitance_ch4_min, daily_capacitance_ch4_ave,
                 daily_ex_temperature_max, daily_ex_temperature_min, daily_ex_temperature_ave,
-                daily_watering_events, growth_period, survival_limit_status, watering_advice, watering_status, analysis_log
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                daily_watering_events, growth_period, survival_limit_status, watering_advice, watering_status, analysis_log,
+                updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                datetime('now', 'localtime'))
             ON CONFLICT(managed_plant_id, analysis_date) DO UPDATE SET
                 daily_temp_max=excluded.daily_temp_max, daily_temp_min=excluded.daily_temp_min, daily_temp_ave=excluded.daily_temp_ave,
                 daily_humidity_max=excluded.daily_humidity_max, daily_humidity_min=excluded.daily_humidity_min, daily_humidity_ave=excluded.daily_humidity_ave,
@@ -158,7 +167,8 @@ class PlantStateAnalyzer:
                 daily_ex_temperature_max=excluded.daily_ex_temperature_max, daily_ex_temperature_min=excluded.daily_ex_temperature_min, daily_ex_temperature_ave=excluded.daily_ex_temperature_ave,
                 daily_watering_events=excluded.daily_watering_events, growth_period=excluded.growth_period,
                 survival_limit_status=excluded.survival_limit_status, watering_advice=excluded.watering_advice,
-                watering_status=excluded.watering_status, analysis_log=excluded.analysis_log
+                watering_status=excluded.watering_status, analysis_log=excluded.analysis_log,
+                updated_at=excluded.updated_at
         """, (
             self.plant_id, target_date.strftime('%Y-%m-%d'),
             sensor_summary.get('daily_temp_max'), sensor_summary.get('daily_temp_min'), sensor_summary.get('daily_temp_ave'),
@@ -222,7 +232,7 @@ class PlantStateAnalyzer:
         low_triggers = self.conn.execute("SELECT COUNT(*) FROM sensor_data WHERE device_id = ? AND timestamp BETWEEN ? AND ? AND temperature < ?", (self.temp_sensor_id, start_of_day, end_of_day, t['lethal_temp_low'])).fetchone()[0]
         if low_triggers >= LETHAL_LIMIT_TRIGGER_COUNT: return 'lethal_low'
         return 'safe'
-        
+
     def _determine_watering_advice(self, growth_period, sensor_summary, last_analysis):
         """Determines watering advice based on sensor data or growth period."""
         daily_avg_moisture = sensor_summary.get('daily_soil_moisture_ave')
@@ -293,4 +303,147 @@ class PlantStateAnalyzer:
             "dry_streak_days": new_dry_streak,
             "is_dry": new_soil_state == 'dry'
         }
-        return advice, new_log
\ No newline at end of file
+        return advice, new_log
+
+class LethalTemperatureMonitor:
+    """Streaming lethal-temperature evaluator.
+
+    Consumes temperature readings as they are ingested and keeps a per-plant state
+    machine ('safe' -> 'lethal_high'/'lethal_low' -> 'safe'). An alert is raised after
+    LETHAL_LIMIT_TRIGGER_COUNT consecutive readings beyond the limit and cleared after
+    LETHAL_ALERT_CLEAR_COUNT consecutive readings back inside it with hysteresis.
+    Transitions are recorded in plant_alert_events and the current status is kept in
+    plant_alert_state so the dashboard can read it without aggregating the day.
+    """
+
+    def __init__(self, db_conn):
+        self.conn = db_conn
+        self.plants_by_device = {}
+        self.loaded_at = 0
+        # managed_plant_id -> {'status', 'trigger_count', 'clear_count'}
+        self.states = {}
+        for row in self.conn.execute("SELECT managed_plant_id, alert_status FROM plant_alert_state").fetchall():
+            self.states[row['managed_plant_id']] = {'status': row['alert_status'], 'trigger_count': 0, 'clear_count': 0}
+        self._refresh_thresholds()
+
+    def _refresh_thresholds(self):
+        """Reloads which plants use which device as their temperature source.
+
+        Plants that are no longer monitored (sensor unassigned, limits removed or plant
+        deleted) lose their state so a raised alert does not stay on the dashboard forever.
+        """
+        rows = self.conn.execute("""
+            SELECT mp.managed_plant_id, mp.plant_name,
+                   COALESCE(NULLIF(mp.assigned_plant_sensor_id, ''), mp.assigned_switchbot_id) AS temp_sensor_id,
+                   p.lethal_temp_high, p.lethal_temp_low
+            FROM managed_plants mp
+            JOIN plants p ON mp.library_plant_id = p.plant_id
+            WHERE p.lethal_temp_high IS NOT NULL AND p.lethal_temp_low IS NOT NULL
+        """).fetchall()
+        plants_by_device = {}
+        for row in rows:
+            if row['temp_sensor_id']:
+                plants_by_device.setdefault(row['temp_sensor_id'], []).append(dict(row))
+        previous_plants = {plant['managed_plant_id']: plant for plants in self.plants_by_device.values() for plant in plants}
+        self.plants_by_device = plants_by_device
+        self.loaded_at = time.monotonic()
+
+        monitored_ids = {plant['managed_plant_id'] for plants in plants_by_device.values() for plant in plants}
+        dropped_ids = [plant_id for plant_id in self.states if plant_id not in monitored_ids]
+        if dropped_ids:
+            self._clear_unmonitored(dropped_ids, previous_plants)
+
+    def _clear_unmonitored(self, plant_ids, previous_plants):
+        """Resets plants that dropped out of monitoring. Raised alerts are recorded as cleared;
+        rows of deleted plants are removed."""
+        existing_ids = {row['managed_plant_id'] for row in self.conn.execute("SELECT managed_plant_id FROM managed_plants").fetchall()}
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for plant_id in plant_ids:
+            state = self.states.pop(plant_id)
+            if plant_id not in existing_ids:
+                self.conn.execute("DELETE FROM plant_alert_state WHERE managed_plant_id = ?", (plant_id,))
+                continue
+            if state['status'] == 'safe':
+                continue
+            plant = previous_plants.get(plant_id) or {'managed_plant_id': plant_id, 'plant_name': plant_id,
+                                                      'lethal_temp_high': None, 'lethal_temp_low': None}
+            self._record_transition(plant, None, now, None, state['status'], 'safe')
+        self.conn.commit()
+
+    def process_reading(self, device_id, timestamp, temperature):
+        """Feeds one reading into the state machines of the plants using this device.
+
+        Returns a list of (managed_plant_id, new_status) transitions.
+        """
+        if temperature is None:
+            return []
+        if time.monotonic() - self.loaded_at > LETHAL_ALERT_REFRESH_SECONDS:
+            self._refresh_thresholds()
+
+        transitions = []
+        for plant in self.plants_by_device.get(device_id, []):
+            previous_status = self.states.get(plant['managed_plant_id'], {}).get('status', 'safe')
+            new_status = self._advance(plant, temperature)
+            if new_status is not None:
+                self._record_transition(plant, device_id, timestamp, temperature, previous_status, new_status)
+                transitions.append((plant['managed_plant_id'], new_status))
+        if transitions:
+            self.conn.commit()
+        return transitions
+
+    def _advance(self, plant, temperature):
+        """Advances one plant's state machine. Returns the new status on a transition."""
+        high, low = plant['lethal_temp_high'], plant['lethal_temp_low']
+        state = self.states.setdefault(plant['managed_plant_id'], {'status': 'safe', 'trigger_count': 0, 'clear_count': 0})
+
+        if state['status'] == 'safe':
+            if temperature > high:
+                candidate = 'lethal_high'
+            elif temperature < low:
+                candidate = 'lethal_low'
+            else:
+                candidate = None
+            # Only consecutive readings beyond the same limit count toward the trigger
+            if candidate is None or candidate != state.get('candidate'):
+                state['trigger_count'] = 0
+            state['candidate'] = candidate
+            if candidate is None:
+                return None
+            state['trigger_count'] += 1
+            if state['trigger_count'] >= LETHAL_LIMIT_TRIGGER_COUNT:
+                state.update(status=candidate, candidate=None, trigger_count=0, clear_count=0)
+                return candidate
+            return None
+
+        if state['status'] == 'lethal_high':
+            recovered = temperature <= high - LETHAL_ALERT_HYSTERESIS
+        else:
+            recovered = temperature >= low + LETHAL_ALERT_HYSTERESIS
+        state['clear_count'] = state['clear_count'] + 1 if recovered else 0
+        if state['clear_count'] >= LETHAL_ALERT_CLEAR_COUNT:
+            state.update(status='safe', candidate=None, trigger_count=0, clear_count=0)
+            return 'safe'
+        return None
+
+    def _record_transition(self, plant, device_id, timestamp, temperature, previous_status, new_status):
+        event = 'cleared' if new_status == 'safe' else 'raised'
+        alert_type = previous_status if event == 'cleared' else new_status
+        threshold = plant['lethal_temp_high'] if alert_type == 'lethal_high' else plant['lethal_temp_low']
+
+        self.conn.execute("""
+            INSERT INTO plant_alert_events (managed_plant_id, device_id, alert_type, event, temperature, threshold, occurred_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (plant['managed_plant_id'], device_id, alert_type, event, temperature, threshold, timestamp))
+        self.conn.execute("""
+            INSERT INTO plant_alert_state (managed_plant_id, alert_status, since, last_temperature)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(managed_plant_id) DO UPDATE SET
+                alert_status=excluded.alert_status, since=excluded.since, last_temperature=excluded.last_temperature
+        """, (plant['managed_plant_id'], new_status, timestamp, temperature))
+
+        if event == 'raised':
+            logger.warning(f"Lethal temperature alert raised for '{plant['plant_name']}': {new_status} ({temperature:.1f}°C, limit {threshold}°C)")
+        elif temperature is None:
+            logger.info(f"Lethal temperature alert cleared for '{plant['plant_name']}' (no longer monitored)")
+        else:
+            logger.info(f"Lethal temperature alert cleared for '{plant['plant_name']}' ({temperature:.1f}°C)")
@@ -0,0 +1,230 @@
+# plant_dashboard/poll_scheduler.py
+"""
+デバイスごとのポーリング間隔を調整するスケジューラ
+
+固定間隔で全デバイスを順にポーリングする代わりに、デバイスごとに次回ポーリング時刻を持ち、
+時刻の早いものから取り出す（優先度付きキュー）。間隔は次のように決める。
+
+- 値の変化が遅いデバイスは間隔を延ばす（有意な変化が起きるまでの予想時間に合わせる）
+- 取得に失敗し続けるデバイスは指数バックオフする
+- 致死温度や乾燥の閾値に近いデバイスは短い間隔でポーリングする
+"""
+
+import heapq
+import itertools
+import logging
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def load_poll_thresholds(conn):
+    """
+    デバイスごとに、そのデバイスを使っている植物の閾値を読み込む。
+
+    Returns:
+        dict: device_id -> [{'lethal_temp_high', 'lethal_temp_low', 'soil_dry_threshold'}, ...]
+    """
+    rows = conn.execute("""
+        SELECT COALESCE(NULLIF(mp.assigned_plant_sensor_id, ''), mp.assigned_switchbot_id) AS temp_sensor_id,
+               mp.assigned_plant_sensor_id AS soil_sensor_id,
+               p.lethal_temp_high, p.lethal_temp_low,
+               mp.soil_moisture_dry_threshold_voltage
+        FROM managed_plants mp
+        LEFT JOIN plants p ON mp.library_plant_id = p.plant_id
+    """).fetchall()
+    thresholds = {}
+    for row in rows:
+        if row['temp_sensor_id'] and (row['lethal_temp_high'] is not None or row['lethal_temp_low'] is not None):
+            thresholds.setdefault(row['temp_sensor_id'], []).append({
+                'lethal_temp_high': row['lethal_temp_high'], 'lethal_temp_low': row['lethal_temp_low'],
+            })
+        if row['soil_sensor_id'] and row['soil_moisture_dry_threshold_voltage'] is not None:
+            thresholds.setdefault(row['soil_sensor_id'], []).append({
+                'soil_dry_threshold': row['soil_moisture_dry_threshold_voltage'],
+            })
+    return thresholds
+
+
+def is_near_threshold(data, thresholds, temp_margin=None, dry_margin=None):
+    """読み取り値が致死温度または乾燥の閾値に近い（または超えている）場合にTrueを返す"""
+    if not data or not thresholds:
+        return False
+    temp_margin = config.POLL_LETHAL_TEMP_MARGIN if temp_margin is None else temp_margin
+    dry_margin = config.POLL_SOIL_DRY_MARGIN if dry_margin is None else dry_margin
+    temperature = data.get('temperature')
+    soil_moisture = data.get('soil_moisture')
+    for t in thresholds:
+        if temperature is not None:
+            if t.get('lethal_temp_high') is not None and temperature >= t['lethal_temp_high'] - temp_margin:
+                return True
+            if t.get('lethal_temp_low') is not None and temperature <= t['lethal_temp_low'] + temp_margin:
+                return True
+        # 土壌水分は電圧が高いほど乾燥している
+        if soil_moisture is not None and t.get('soil_dry_threshold') is not None:
+            if soil_moisture >= t['soil_dry_threshold'] - dry_margin:
+                return True
+    return False
+
+
+class PollScheduler:
+    """
+    デバイスごとの次回ポーリング時刻を管理する優先度付きキュー。
+
+    時刻は time.monotonic() 基準。キューの要素は (due, seq, device_id) で、
+    間隔を変更したときは古い要素を残したまま新しい要素を追加し、取り出し時に読み飛ばす。
+    """
+
+    def __init__(self, base_interval=None, min_interval=None, max_interval=None, near_threshold_interval=None,
+                 backoff_max=None, smoothing=None, significant_change=None):
+        self.base_interval = base_interval or config.DATA_FETCH_INTERVAL
+        self.min_interval = min_interval or config.POLL_MIN_INTERVAL_SECONDS
+        self.max_interval = max_interval or config.POLL_MAX_INTERVAL_SECONDS
+        self.near_threshold_interval = near_threshold_interval or config.POLL_NEAR_THRESHOLD_INTERVAL_SECONDS
+        self.backoff_max = backoff_max or config.POLL_FAILURE_BACKOFF_MAX_SECONDS
+        self.smoothing = smoothing or config.POLL_VOLATILITY_SMOOTHING
+        self.significant_change = significant_change or config.POLL_SIGNIFICANT_CHANGE
+        self.queue = []
+        self.counter = itertools.count()
+        # device_id -> ポーリング状態
+        self.states = {}
+        self.thresholds = {}
+
+    def sync(self, devices, now=None):
+        """
+        DBのデバイス一覧と同期する。新しいデバイスは渡された順ですぐにポーリング対象にし、
+        一覧から消えたデバイスは取り除く。
+        """
+        now = time.monotonic() if now is None else now
+        device_ids = set()
+        for device in devices:
+            device_id = device['device_id']
+            device_ids.add(device_id)
+            state = self.states.get(device_id)
+            if state is None:
+                self.states[device_id] = {
+                    'device': device, 'interval': self.base_interval, 'due': now, 'failures': 0,
+                    'rates': {}, 'last_values': {}, 'last_polled': None, 'near_threshold': False, 'reason': 'new',
+                }
+                heapq.heappush(self.queue, (now, next(self.counter), device_id))
+            else:
+                # 取り出されたデバイス (due is None) はポーリング中のため、結果の記録で次回時刻が決まる
+                state['device'] = device
+        for device_id in set(self.states) - device_ids:
+            del self.states[device_id]
+
+    def set_thresholds(self, thresholds):
+        """load_poll_thresholds の戻り値を設定する"""
+        self.thresholds = thresholds or {}
+
+    def pop_due(self, now=None):
+        """次回時刻を過ぎたデバイスを時刻の早い順に取り出す"""
+        now = time.monotonic() if now is None else now
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            due_at, _, device_id = heapq.heappop(self.queue)
+            state = self.states.get(device_id)
+            if state is None or state['due'] != due_at:
+                continue
+            state['due'] = None
+            due.append(state['device'])
+        return due
+
+    def seconds_until_next(self, now=None):
+        """次のポーリングまでの秒数。対象がなければNone"""
+        now = time.monotonic() if now is None else now
+        while self.queue:
+            due_at, _, device_id = self.queue[0]
+            state = self.states.get(device_id)
+            if state is None or state['due'] != due_at:
+                heapq.heappop(self.queue)
+                continue
+            return max(0.0, due_at - now)
+        return None
+
+    def record_success(self, device_id, data, now=None):
+        """取得成功を記録し、値の変化速度と閾値からの距離で次回時刻を決める。決めた間隔を返す"""
+        now = time.monotonic() if now is None else now
+        state = self.states.get(device_id)
+        if state is None:
+            return None
+        state['failures'] = 0
+        if data:
+            self._update_rates(state, data, now)
+        state['last_polled'] = now
+
+        interval, reason = self._volatility_interval(state)
+        state['near_threshold'] = is_near_threshold(data, self.thresholds.get(device_id))
+        if state['near_threshold'] and interval > self.near_threshold_interval:
+            interval, reason = self.near_threshold_interval, 'near_threshold'
+        return self._schedule(state, device_id, interval, reason, now)
+
+    def record_failure(self, device_id, now=None):
+        """取得失敗を記録し、連続失敗回数に応じて指数バックオフする。決めた間隔を返す"""
+        now = time.monotonic() if now is None else now
+        state = self.states.get(device_id)
+        if state is None:
+            return None
+        state['failures'] += 1
+        interval = min(self.backoff_max, self.base_interval * (2 ** state['failures']))
+        return self._schedule(state, device_id, interval, 'backoff', now)
+
+    def reschedule(self, device_id, delay, reason, now=None):
+        """指定した秒数後にポーリングし直す（間隔の学習状態は変えない）"""
+        now = time.monotonic() if now is None else now
+        state = self.states.get(device_id)
+        if state is None:
+            return None
+        return self._schedule(state, device_id, delay, reason, now)
+
+    def snapshot(self, now=None):
+        """デバイスごとのスケジュール状態（ログ・確認用）"""
+        now = time.monotonic() if now is None else now
+        return {
+            device_id: {
+                'interval': state['interval'],
+                'next_in': None if state['due'] is None else round(state['due'] - now, 1),
+                'failures': state['failures'],
+                'near_threshold': state['near_threshold'],
+                'reason': state['reason'],
+            }
+            for device_id, state in self.states.items()
+        }
+
+    def _update_rates(self, state, data, now):
+        """各指標の変化速度 (単位/秒) を指数移動平均で更新する"""
+        elapsed = now - state['last_polled'] if state['last_polled'] is not None else None
+        for metric in self.significant_change:
+            value = data.get(metric)
+            if value is None:
+                continue
+            previous = state['last_values'].get(metric)
+            state['last_values'][metric] = value
+            if previous is None or not elapsed or elapsed <= 0:
+                continue
+            rate = abs(value - previous) / elapsed
+            old = state['rates'].get(metric)
+            state['rates'][metric] = rate if old is None else old + self.smoothing * (rate - old)
+
+    def _volatility_interval(self, state):
+        """最も早く有意な変化が起きそうな指標に合わせた間隔"""
+        if not state['rates']:
+            return self.base_interval, 'base'
+        interval = self.max_interval
+        reason = 'stable'
+        for metric, rate in state['rates'].items():
+            if rate > 0:
+                expected = self.significant_change[metric] / rate
+                if expected < interval:
+                    interval, reason = expected, f'volatile:{metric}'
+        return max(self.min_interval, min(self.max_interval, interval)), reason
+
+    def _schedule(self, state, device_id, interval, reason, now):
+        state['interval'] = interval
+        state['reason'] = reason
+        state['due'] = now + interval
+        heapq.heappush(self.queue, (state['due'], next(self.counter), device_id))
+        logger.debug(f"[{device_id}] 次回ポーリング: {interval:.0f}秒後 ({reason})")
+        return interval
@@ -0,0 +1,283 @@
+# plant_dashboard/sensor_payloads.py
+"""
+センサーペイロードのレイアウト定義（data_versionごとのレジストリ）
+
+各ハードウェアリビジョンのバイナリレイアウトをここで一度だけ宣言し、そこから
+- 1回の unpack_from で全体を読み取る struct.Struct
+- 値を組み立てるデコーダー関数（namedtupleと同様にソースを生成してコンパイル）
+- sensor_data テーブルへ保存するカラムとINSERT文
+を生成する。新しいハードウェアリビジョンはレイアウトを1つ追加するだけで対応できる。
+"""
+
+import logging
+import struct
+from collections import namedtuple
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from database import SENSOR_DATA_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# sensor_data テーブルにペイロードから保存できるカラム
+STORABLE_COLUMNS = frozenset(SENSOR_DATA_COLUMNS) - {'id', 'device_id', 'timestamp'}
+
+TM_FIELD_COUNT = 9  # struct tm (tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year, tm_wday, tm_yday, tm_isdst)
+
+
+class Field(NamedTuple):
+    """レイアウトを構成する1要素"""
+    kind: str                          # 'version' / 'tm' / 'value' / 'array' / 'pad'
+    name: Optional[str] = None
+    fmt: str = ''                      # 1要素分のstruct書式
+    length: int = 1                    # arrayの要素数 / padのバイト数
+    count_field: Optional[str] = None  # array: この値以上の添字の要素はNoneにする
+    valid_field: Optional[str] = None  # value: このフラグが偽ならNoneにする
+
+
+def version():
+    """data_versionバイト (uint8_t)。出力にはレイアウトのdata_versionを使う"""
+    return Field('version', 'data_version', 'B')
+
+
+def tm(name='datetime'):
+    """struct tm (9 x int32)。'YYYY-MM-DD HH:MM:SS' 形式の文字列に変換する"""
+    return Field('tm', name, 'i' * TM_FIELD_COUNT)
+
+
+def value(name, fmt, valid_field=None):
+    return Field('value', name, fmt, valid_field=valid_field)
+
+
+def array(prefix, length, fmt, count_field=None):
+    """固定長配列。要素は prefix1, prefix2, ... として出力する"""
+    return Field('array', prefix, fmt, length, count_field=count_field)
+
+
+def pad(length):
+    """コンパイラのパディング"""
+    return Field('pad', fmt=f'{length}x', length=length)
+
+
+def tm_to_str(tm_values, device_id=None):
+    """struct tm の値を日時文字列に変換する。不正な日時の場合は 1970-01-01 00:00:00 を返す"""
+    tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year = tm_values[:6]
+    try:
+        return datetime(tm_year + 1900, tm_mon + 1, tm_mday, tm_hour, tm_min, tm_sec).isoformat(sep=' ')
+    except (ValueError, OverflowError) as e:
+        logger.warning(f"[{device_id}] 無効な日時データ: {e}. デフォルト値を使用します")
+        return "1970-01-01 00:00:00"
+
+
+class PayloadLayout:
+    """
+    1つのペイロード構造体の宣言と、そこから生成したデコーダー・保存用SQL。
+
+    Args:
+        data_version: データバージョン
+        name: レコード型の名前 (例: 'SensorReadingV3')
+        fields: Fieldのリスト（構造体の先頭から順に）
+        extra: ペイロードに含まれないが出力に含める項目と既定値
+    """
+
+    def __init__(self, data_version, name, fields, extra=None):
+        self.data_version = data_version
+        self.name = name
+        self.fields = tuple(fields)
+        self.extra = dict(extra or {})
+
+        self.struct = struct.Struct('<' + ''.join(self._struct_fmt(f) for f in self.fields))
+        self.size = self.struct.size
+
+        self.record_type, self.decode = self._build_decoder()
+        self.keys = self.record_type._fields
+
+        # sensor_dataへの保存: レイアウトに含まれるカラムだけをINSERTする
+        # (device_id, timestamp) は一意のため、再送・再処理された読み取りは無視される
+        self.columns = tuple(key for key in self.keys if key in STORABLE_COLUMNS)
+        placeholders = ', '.join('?' for _ in range(len(self.columns) + 2))
+        self.insert_sql = f"INSERT OR IGNORE INTO sensor_data (device_id, timestamp, {', '.join(self.columns)}) VALUES ({placeholders})"
+
+    @staticmethod
+    def _struct_fmt(field):
+        if field.kind == 'pad':
+            return field.fmt
+        if field.kind == 'array':
+            return field.fmt * field.length
+        return field.fmt
+
+    def _build_decoder(self):
+        """
+        レイアウトからデコーダー関数のソースを生成する。
+        unpack結果のタプルから添字で直接値を取り出すだけの関数になるため、読み取りごとの分岐や辞書操作がない。
+        """
+        # まず各項目がunpack結果の何番目かを求める
+        index = {}
+        position = 0
+        for field in self.fields:
+            if field.kind == 'pad':
+                continue
+            if field.kind == 'array':
+                for i in range(field.length):
+                    index[f"{field.name}{i + 1}"] = position + i
+                position += field.length
+            elif field.kind == 'tm':
+                index[field.name] = position
+                position += TM_FIELD_COUNT
+            else:
+                index[field.name] = position
+                position += 1
+
+        keys = ['data_version']
+        exprs = [repr(self.data_version)]
+        for field in self.fields:
+            if field.kind in ('pad', 'version'):
+                continue
+            if field.kind == 'tm':
+                start = index[field.name]
+                keys.append(field.name)
+                exprs.append(f"_tm(v[{start}:{start + TM_FIELD_COUNT}], device_id)")
+            elif field.kind == 'value':
+                expr = f"v[{index[field.name]}]"
+                if field.valid_field:
+                    expr = f"({expr} if v[{index[field.valid_field]}] else None)"
+                keys.append(field.name)
+                exprs.append(expr)
+            elif field.kind == 'array':
+                for i in range(field.length):
+                    key = f"{field.name}{i + 1}"
+                    expr = f"v[{index[key]}]"
+                    if field.count_field:
+                        expr = f"({expr} if v[{index[field.count_field]}] > {i} else None)"
+                    keys.append(key)
+                    exprs.append(expr)
+        for key, default in self.extra.items():
+            keys.append(key)
+            exprs.append(repr(default))
+
+        record_type = namedtuple(self.name, keys)
+        source = (
+            "def decode(payload, device_id=None, offset=0):\n"
+            "    v = _unpack_from(payload, offset)\n"
+            f"    return _new(_Record, ({', '.join(exprs)},))\n"
+        )
+        namespace = {
+            '_unpack_from': self.struct.unpack_from,
+            '_tm': tm_to_str,
+            '_Record': record_type,
+            '_new': tuple.__new__,
+        }
+        exec(compile(source, f"<payload layout {self.name}>", 'exec'), namespace)
+        decode = namespace['decode']
+        decode.__doc__ = f"{self.name} ({self.size}バイト) をデコードする。バッファが短い場合は struct.error を送出する。"
+        return record_type, decode
+
+    def insert_row(self, device_id, timestamp, data, data_version=None):
+        """insert_sqlに渡すパラメータを作成する。dataはデコード結果の辞書（パイプ経由のJSON）"""
+        stored_version = self.data_version if data_version is None else data_version
+        return (device_id, timestamp) + tuple(
+            stored_version if column == 'data_version' else data.get(column)
+            for column in self.columns
+        )
+
+    def __repr__(self):
+        return f"<PayloadLayout {self.name} v{self.data_version} {self.size}B>"
+
+
+# --- CMD_GET_SENSOR_DATA (0x01) のレスポンス ---
+# v1 (Rev1/Rev2): data_versionフィールドなし、56バイト
+# v2 (Rev3): soil_data_t (非packed) 96バイト
+# v3 (Rev4): soil_data_t (非packed) 104バイト = v2 + ext_temperature + ext_temperature_valid
+_SOIL_DATA_COMMON = [
+    version(), pad(3),                                   # offset  0
+    tm(),                                                # offset  4
+    value('light_lux', 'f'), value('temperature', 'f'),  # offset 40
+    value('humidity', 'f'), value('soil_moisture', 'f'),
+    value('sensor_error', '?'), pad(3),                  # offset 56
+    array('soil_temperature', 4, 'f', count_field='soil_temperature_count'),  # offset 60
+    value('soil_temperature_count', 'B'), pad(3),        # offset 76
+    array('capacitance_ch', 4, 'f'),                     # offset 80
+]
+
+SENSOR_DATA_LAYOUTS = {}
+TIME_DATA_LAYOUTS = {}
+
+
+def register_layout(layout, registry=None):
+    """レイアウトをレジストリに登録する（既定はCMD_GET_SENSOR_DATA用）"""
+    registry = SENSOR_DATA_LAYOUTS if registry is None else registry
+    registry[layout.data_version] = layout
+    return layout
+
+
+register_layout(PayloadLayout(1, 'SensorReadingV1', [
+    tm(),
+    value('light_lux', 'f'), value('temperature', 'f'),
+    value('humidity', 'f'), value('soil_moisture', 'f'),
+    value('sensor_error', '?'), pad(3),
+], extra={'battery_level': None}))
+
+register_layout(PayloadLayout(2, 'SensorReadingV2', _SOIL_DATA_COMMON, extra={'battery_level': None}))
+
+register_layout(PayloadLayout(3, 'SensorReadingV3', _SOIL_DATA_COMMON + [
+    value('ex_temperature', 'f', valid_field='ext_temperature_valid'),  # offset 96
+    value('ext_temperature_valid', '?'), pad(3),                        # offset 100
+], extra={'battery_level': None}))
+
+# --- CMD_GET_TIME_DATA (0x0A) のレスポンス ---
+# v3 (Rev4): time_data_response_t (packed) 91バイト
+register_layout(PayloadLayout(3, 'TimeDataReadingV3', [
+    version(),                                           # offset  0
+    tm(),                                                # offset  1
+    value('temperature', 'f'), value('humidity', 'f'),   # offset 37
+    value('light_lux', 'f'), value('soil_moisture', 'f'),
+    array('soil_temperature', 4, 'f', count_field='soil_temperature_count'),  # offset 53
+    value('soil_temperature_count', 'B'),                # offset 69
+    array('capacitance_ch', 4, 'f'),                     # offset 70
+    value('ex_temperature', 'f', valid_field='ext_temperature_valid'),  # offset 86
+    value('ext_temperature_valid', '?'),                 # offset 90
+]), registry=TIME_DATA_LAYOUTS)
+
+# data_versionバイトを持たないv1ペイロードの長さ
+V1_PAYLOAD_SIZE = SENSOR_DATA_LAYOUTS[1].size
+
+
+def get_layout(data_version, registry=None):
+    """data_versionに対応するレイアウトを返す。未登録の場合はNone"""
+    registry = SENSOR_DATA_LAYOUTS if registry is None else registry
+    return registry.get(data_version)
+
+
+def detect_sensor_layout(payload):
+    """
+    CMD_GET_SENSOR_DATAのペイロードからレイアウトを判別する。
+    v1は固定長(56バイト)でdata_versionバイトを持たない。それ以外は先頭バイトのdata_versionで判別し、
+    未登録のバージョンはv2として扱う（従来の動作）。判別できない長さの場合はNoneを返す。
+    v1は長さだけで判別するため、先頭バイトが1でもv1のレイアウトは選ばない。
+    """
+    if len(payload) == V1_PAYLOAD_SIZE:
+        return SENSOR_DATA_LAYOUTS[1]
+    if len(payload) > 70:
+        data_version = payload[0]
+        if data_version >= 2 and data_version in SENSOR_DATA_LAYOUTS:
+            return SENSOR_DATA_LAYOUTS[data_version]
+        return SENSOR_DATA_LAYOUTS[2]
+    return None
+
+
+def storage_layout(data_version):
+    """
+    save_sensor_dataで使うレイアウトを返す。
+    未登録のdata_version（SwitchBotなど）はv1の基本カラムのみ保存する。
+    """
+    return SENSOR_DATA_LAYOUTS.get(data_version) or SENSOR_DATA_LAYOUTS[1]
+
+
+def format_reading(reading):
+    """ログ出力用にデコード結果を要約する"""
+    parts = [f"datetime={reading.datetime}"] if 'datetime' in reading._fields else []
+    for key, val in zip(reading._fields, reading):
+        if key in ('data_version', 'datetime') or val is None:
+            continue
+        parts.append(f"{key}={val:.1f}" if isinstance(val, float) else f"{key}={val}")
+    return ', '.join(parts)
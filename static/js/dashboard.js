@@ -40,11 +40,23 @@ function initializePageCharts() {
     const chartInstances = {};
     const dateForChart = pageContainer.dataset.selectedDate || new Date().toISOString().split('T')[0];
 
-    const chartCanvases = pageContainer.querySelectorAll('canvas[id^="history-chart-"]');
-    chartCanvases.forEach(canvas => {
-        const deviceId = canvas.id.replace('history-chart-', '');
-        updateHistoryChart(deviceId, '24h', chartInstances, dateForChart);
-    });
+    // 初期表示の24時間グラフは全デバイス分を1回のリクエストで取得する
+    const chartCanvases = [...pageContainer.querySelectorAll('canvas[id^="history-chart-"]')];
+    const deviceIds = chartCanvases.map(canvas => canvas.id.replace('history-chart-', ''));
+    if (deviceIds.length > 0) {
+        const maxPoints = Math.max(...chartCanvases.map(canvas => historyMaxPoints(canvas)));
+        deviceIds.forEach(deviceId => document.getElementById(`chart-loader-${deviceId}`)?.classList.remove('d-none'));
+        fetchHistoryBatch(deviceIds, '24h', dateForChart, maxPoints)
+            .catch(error => {
+                console.error('Failed to load batch history, falling back to per-device requests:', error);
+                return {};
+            })
+            .then(results => {
+                deviceIds.forEach(deviceId => {
+                    updateHistoryChart(deviceId, '24h', chartInstances, dateForChart, results[`${deviceId}:24h`]);
+                });
+            });
+    }
 
     pageContainer.querySelectorAll('.period-btn').forEach(button => {
         button.addEventListener('click', (e) => {
@@ -57,7 +69,7 @@ function initializePageCharts() {
 }
 
 
-async function updateHistoryChart(deviceId, period, chartInstances, selectedDate) {
+async function updateHistoryChart(deviceId, period, chartInstances, selectedDate, preloadedData) {
     const canvas = document.getElementById(`history-chart-${deviceId}`);
     const loader = document.getElementById(`chart-loader-${deviceId}`);
     if (!canvas || !loader) return;
@@ -71,11 +83,13 @@ async function updateHistoryChart(deviceId, period, chartInstances, selectedDate
     canvas.style.visibility = 'hidden';
 
     try {
-        const response = await fetch(`/api/history/${deviceId}?period=${period}&date=${selectedDate}`);
-        if (!response.ok) throw new Error(`API request failed`);
-        
-        const responseData = await response.json();
-        const historyData = responseData.history; 
+        let responseData = preloadedData;
+        if (!responseData) {
+            const response = await fetch(`/api/history/${deviceId}?period=${period}&date=${selectedDate}&max_points=${historyMaxPoints(canvas)}&format=columnar`);
+            if (!response.ok) throw new Error(`API request failed`);
+            responseData = await response.json();
+        }
+        const historyData = decodeColumnarHistory(responseData);
 
         if (historyData.length === 0) {
             ctx.clearRect(0, 0, canvas.width, canvas.height);
@@ -115,13 +115,13 @@ async function updateHistoryChart(deviceId, period, chartInstances, selectedDate
     canvas.style.display = 'none';
 
     try {
-        const response = await fetch(`/api/history/${deviceId}?period=${period}&date=${selectedDate}`);
+        const response = await fetch(`/api/history/${deviceId}?period=${period}&date=${selectedDate}&max_points=${historyMaxPoints(canvas)}&format=columnar`);
         if (!response.ok) {
             throw new Error(`API request failed with status ${response.status}`);
         }
         
         const responseData = await response.json();
-        const historyData = responseData.history;
+        const historyData = decodeColumnarHistory(responseData);
 
         if (!historyData || historyData.length === 0) {
             ctx.clearRect(0, 0, canvas.width, canvas.height);
@@ -634,11 +634,11 @@ async function updateSensorHistoryChart(deviceId, period, chartInstances, select
     if(optionsContainer) optionsContainer.style.display = 'none';
 
     try {
-        const response = await fetch(`/api/history/${deviceId}?period=${period}&date=${selectedDate}`);
+        const response = await fetch(`/api/history/${deviceId}?period=${period}&date=${selectedDate}&max_points=${historyMaxPoints(canvas)}&format=columnar`);
         if (!response.ok) throw new Error(`API request failed`);
         
         const responseData = await response.json();
-        const historyData = responseData.history;
+        const historyData = decodeColumnarHistory(responseData);
         const thresholds = responseData.thresholds;
         
         if(optionsContainer){
@@ -35,3 +35,48 @@ function showAlert(type, message, containerId = 'main-alert-box') {
         }
     }, 5000);
 }
+
+/**
+ * 履歴APIに渡す max_points をグラフの幅から決める（1pxあたり1点程度）
+ * @param {HTMLCanvasElement} canvas - 描画先のキャンバス（非表示中は親要素の幅を使う）
+ * @returns {number} 点数
+ */
+function historyMaxPoints(canvas) {
+    const width = canvas.clientWidth || (canvas.parentElement && canvas.parentElement.clientWidth) || 600;
+    return Math.max(100, Math.min(1000, Math.round(width)));
+}
+
+/**
+ * 履歴APIの列指向レスポンス (format=columnar) を行の配列に戻す
+ * @param {object} data - {t0, dt, columns, empty}
+ * @returns {Array<object>} timestamp (Date) と各列の値を持つ行の配列
+ */
+function decodeColumnarHistory(data) {
+    if (data.t0 === null || data.t0 === undefined) return [];
+    const keys = Object.keys(data.columns);
+    const rows = [];
+    let epoch = data.t0;
+    for (let i = 0; i <= data.dt.length; i++) {
+        if (i > 0) epoch += data.dt[i - 1];
+        const row = { timestamp: new Date(epoch * 1000) };
+        for (const key of keys) row[key] = data.columns[key][i];
+        for (const key of data.empty) row[key] = null;
+        rows.push(row);
+    }
+    return rows;
+}
+
+/**
+ * 複数デバイスの履歴を1回のリクエストで取得する (/api/history/batch)
+ * @param {Array<string>} deviceIds - デバイスIDの配列
+ * @param {string} period - 期間 ('24h', '7d', '30d', '1y')
+ * @param {string} selectedDate - 終了日 (YYYY-MM-DD)
+ * @param {number} maxPoints - 1デバイスあたりの最大点数
+ * @returns {Promise<object>} "device_id:period" -> 列指向の履歴レスポンス
+ */
+async function fetchHistoryBatch(deviceIds, period, selectedDate, maxPoints) {
+    const devices = deviceIds.map(encodeURIComponent).join(',');
+    const response = await fetch(`/api/history/batch?devices=${devices}&period=${period}&date=${selectedDate}&max_points=${maxPoints}&format=columnar`);
+    if (!response.ok) throw new Error(`Batch history request failed with status ${response.status}`);
+    return (await response.json()).results;
+}
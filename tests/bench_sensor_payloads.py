@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+センサーペイロードのデコード ベンチマーク
+
+sensor_payloads のレジストリに登録された各レイアウトについて
+- decode (1回のunpack_from + 生成コードでレコード化)
+- decode + _asdict (パイプへ書き出す辞書の作成まで)
+- insert_row (sensor_dataへのINSERTパラメータ作成)
+の1件あたりの所要時間を計測し、フィールドごとに unpack_from する素朴な実装と比較する。
+
+使い方:
+    python3 tests/bench_sensor_payloads.py [--number 100000]
+"""
+import sys
+import os
+import argparse
+import struct
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sensor_payloads as sp
+
+
+def sample_payload(layout, tm_offset):
+    payload = bytearray(layout.size)
+    if tm_offset:
+        payload[0] = layout.data_version
+    struct.pack_into('<6i', payload, tm_offset, 0, 30, 12, 1, 5, 124)
+    return bytes(payload)
+
+
+def naive_soil_data_v3(payload):
+    """フィールドごとにunpack_fromする実装（比較用）"""
+    tm_fields = struct.unpack_from('<9i', payload, 4)
+    lux, temperature, humidity, soil_moisture = struct.unpack_from('<4f', payload, 40)
+    soil_temps = struct.unpack_from('<4f', payload, 60)
+    count = payload[76]
+    caps = struct.unpack_from('<4f', payload, 80)
+    ext_temperature = struct.unpack_from('<f', payload, 96)[0]
+    valid = payload[100] != 0
+    result = {
+        'data_version': 3, 'datetime': sp.tm_to_str(tm_fields),
+        'light_lux': lux, 'temperature': temperature, 'humidity': humidity, 'soil_moisture': soil_moisture,
+        'sensor_error': payload[56] != 0,
+    }
+    for i in range(4):
+        result[f'soil_temperature{i + 1}'] = soil_temps[i] if i < count else None
+    result['soil_temperature_count'] = count
+    for i in range(4):
+        result[f'capacitance_ch{i + 1}'] = caps[i]
+    result['ex_temperature'] = ext_temperature if valid else None
+    result['ext_temperature_valid'] = valid
+    result['battery_level'] = None
+    return result
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sensor payload decode benchmark")
+    parser.add_argument('--number', type=int, default=100000, help="計測回数")
+    args = parser.parse_args()
+
+    cases = [
+        ('sensor v1', sp.SENSOR_DATA_LAYOUTS[1], 0),
+        ('sensor v2', sp.SENSOR_DATA_LAYOUTS[2], 4),
+        ('sensor v3', sp.SENSOR_DATA_LAYOUTS[3], 4),
+        ('time_data v3', sp.TIME_DATA_LAYOUTS[3], 1),
+    ]
+
+    print("=" * 70)
+    print(f"センサーペイロード デコード ベンチマーク (number={args.number})")
+    print("=" * 70)
+    print(f"{'layout':<14}{'size':>6}{'decode':>12}{'+asdict':>12}{'insert_row':>12}  (us/call)")
+    print("-" * 70)
+    for name, layout, tm_offset in cases:
+        payload = sample_payload(layout, tm_offset)
+        data = layout.decode(payload)._asdict()
+        decode_us = per_call_us(lambda: layout.decode(payload), args.number)
+        asdict_us = per_call_us(lambda: layout.decode(payload)._asdict(), args.number)
+        row_us = per_call_us(lambda: layout.insert_row('bench', '2024-06-01 12:30:00', data), args.number)
+        print(f"{name:<14}{layout.size:>6}{decode_us:>12.2f}{asdict_us:>12.2f}{row_us:>12.2f}")
+    print("-" * 70)
+
+    payload = sample_payload(sp.SENSOR_DATA_LAYOUTS[3], 4)
+    naive_us = per_call_us(lambda: naive_soil_data_v3(payload), args.number)
+    print(f"{'naive v3':<14}{104:>6}{'':>12}{naive_us:>12.2f}  (フィールドごとのunpack_from)")
+
+
+if __name__ == '__main__':
+    main()
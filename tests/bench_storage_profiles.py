@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+SQLiteストレージプロファイルのベンチマーク
+
+config.DB_STORAGE_PROFILES の各プロファイルについて、一時DBを作成して
+- センサーデータの取り込みスループット（save_sensor_data経由、1件ずつコミット）
+- ダッシュボード系クエリのレイテンシ（最新値一覧、過去日付の一覧、7日/30日履歴API）
+を計測し、比較表を表示する。
+
+使い方:
+    python3 tests/bench_storage_profiles.py [--devices 10] [--days 30] [--interval 10] [--profiles default,sd_card]
+
+注意: 実際のSDカード上で比較する場合は --dir でDBの作成先をSDカード上のディレクトリに指定すること。
+"""
+import sys
+import os
+import argparse
+import base64
+import logging
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import database
+import device_manager as dm
+
+QUERY_REPEAT = 20
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SQLite storage profile benchmark")
+    parser.add_argument('--devices', type=int, default=10, help="デバイス数")
+    parser.add_argument('--days', type=int, default=30, help="生成するデータの日数")
+    parser.add_argument('--interval', type=int, default=10, help="読み取り間隔(分)")
+    parser.add_argument('--profiles', default=','.join(config.DB_STORAGE_PROFILES.keys()),
+                        help="比較するプロファイル名（カンマ区切り）")
+    parser.add_argument('--dir', default=None, help="一時DBを作成するディレクトリ")
+    return parser.parse_args()
+
+
+def measure(func, repeat=QUERY_REPEAT):
+    """funcをrepeat回実行し、中央値と最大値(ms)を返す"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def run_profile(profile_name, args, work_dir, client, auth_headers):
+    db_path = os.path.join(work_dir, f"bench_{profile_name}.db")
+    database.DATABASE_PATH = db_path
+    database.DB_STORAGE_PROFILE = profile_name
+    database.init_db()
+
+    conn = database.get_db_connection()
+    device_ids = [f"bench_{i:02d}" for i in range(args.devices)]
+    for i, device_id in enumerate(device_ids):
+        conn.execute(
+            "INSERT INTO devices (device_id, device_name, mac_address, data_version, device_type) VALUES (?, ?, ?, 3, 'plant_sensor')",
+            (device_id, f"PlantMonitor_40_{i:04d}", f"00:00:00:00:{i // 256:02x}:{i % 256:02x}")
+        )
+    conn.commit()
+    conn.close()
+
+    # --- 取り込みスループット ---
+    start_time = datetime.now() - timedelta(days=args.days)
+    steps = args.days * 24 * 60 // args.interval
+    readings = 0
+    ingest_start = time.perf_counter()
+    for step in range(steps):
+        timestamp = (start_time + timedelta(minutes=step * args.interval)).isoformat(timespec='seconds')
+        for n, device_id in enumerate(device_ids):
+            dm.save_sensor_data(device_id, timestamp, {
+                'temperature': 20.0 + (step + n) % 10,
+                'humidity': 50.0 + step % 20,
+                'light_lux': float(step % 1000),
+                'soil_moisture': 1.2,
+                'soil_temperature1': 18.0,
+                'soil_temperature2': 18.5,
+                'capacitance_ch1': 10.0,
+            }, 3)
+            readings += 1
+    ingest_seconds = time.perf_counter() - ingest_start
+
+    wal_path = db_path + "-wal"
+    wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+    # --- クエリレイテンシ ---
+    past_date = (start_time + timedelta(days=args.days // 2)).date().isoformat()
+    today = datetime.now().date().isoformat()
+    results = {
+        'latest': measure(dm.get_devices_with_latest_sensor_data),
+        'on_date': measure(lambda: dm.get_devices_latest_on_date(past_date)),
+        'hist_7d': measure(lambda: client.get(f"/api/history/{device_ids[0]}?period=7d&date={today}", headers=auth_headers)),
+        'hist_30d': measure(lambda: client.get(f"/api/history/{device_ids[0]}?period=30d&date={today}", headers=auth_headers)),
+    }
+
+    return {
+        'profile': profile_name,
+        'readings': readings,
+        'ingest_rate': readings / ingest_seconds if ingest_seconds else 0,
+        'wal_mb': wal_size / (1024 * 1024),
+        'queries': results,
+    }
+
+
+def main():
+    args = parse_args()
+    logging.disable(logging.INFO)
+
+    work_dir = tempfile.mkdtemp(prefix="plant_bench_", dir=args.dir)
+    original_path = database.DATABASE_PATH
+    original_profile = database.DB_STORAGE_PROFILE
+
+    # 履歴APIはFlaskのテストクライアント経由で計測する
+    database.DATABASE_PATH = os.path.join(work_dir, "bootstrap.db")
+    from app import create_app
+    app = create_app()
+    client = app.test_client()
+    auth = base64.b64encode(f"{config.BASIC_AUTH_USERNAME}:{config.BASIC_AUTH_PASSWORD}".encode()).decode()
+    auth_headers = {'Authorization': f"Basic {auth}"}
+
+    print("=" * 70)
+    print("SQLiteストレージプロファイル ベンチマーク")
+    print(f"devices={args.devices}, days={args.days}, interval={args.interval}min, dir={work_dir}")
+    print("=" * 70)
+
+    rows = []
+    try:
+        for profile_name in args.profiles.split(','):
+            profile_name = profile_name.strip()
+            if profile_name not in config.DB_STORAGE_PROFILES:
+                print(f"✗ 未定義のプロファイル: {profile_name}")
+                continue
+            print(f"\n▶ {profile_name}: {config.DB_STORAGE_PROFILES[profile_name]}")
+            rows.append(run_profile(profile_name, args, work_dir, client, auth_headers))
+    finally:
+        database.DATABASE_PATH = original_path
+        database.DB_STORAGE_PROFILE = original_profile
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n" + "-" * 70)
+    print(f"{'profile':<12}{'ingest/s':>10}{'WAL MB':>8}  "
+          f"{'latest':>10}{'on_date':>10}{'hist_7d':>10}{'hist_30d':>10}  (median ms)")
+    print("-" * 70)
+    for row in rows:
+        q = row['queries']
+        print(f"{row['profile']:<12}{row['ingest_rate']:>10.0f}{row['wal_mb']:>8.1f}  "
+              f"{q['latest'][0]:>10.2f}{q['on_date'][0]:>10.2f}{q['hist_7d'][0]:>10.2f}{q['hist_30d'][0]:>10.2f}")
+    print("-" * 70)
+
+
+if __name__ == '__main__':
+    main()
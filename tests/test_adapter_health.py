@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bluetooth adapter health model
+
+- エラーのアダプタ/デバイス分類とパーセンタイル計算
+- 1台のデバイスの失敗（見つからない・接続できない）では再起動しないこと
+- スキャンで何も受信できない状態の連続・複数デバイスへの接続失敗で再起動と判定すること
+- PlantDeviceBLE.connect がスキャン・接続の結果を記録すること
+  (BleakScannerとBLEクライアントはテスト用に差し替える)
+- adapter_health_metrics への保存
+"""
+import sys
+import os
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import database
+from adapter_health import AdapterHealthMonitor, LatencyWindow, classify_ble_error, HEALTHY, DEGRADED, UNHEALTHY
+
+logging.disable(logging.WARNING)
+
+header("Bluetoothアダプタ健全性モデルのテスト")
+
+check(classify_ble_error("[org.freedesktop.DBus.Error.NoReply] Did not receive a reply") == 'adapter'
+      and classify_ble_error("org.bluez.Error.NotReady") == 'adapter'
+      and classify_ble_error("Device with address AA:BB was not found") == 'device', "error classification")
+
+window = LatencyWindow(200)
+for i in range(1, 101):
+    window.add(i / 10)
+check(window.percentiles() == {'p50': 5.0, 'p90': 9.0, 'p99': 9.9}, f"percentiles: {window.percentiles()}")
+
+# 1台のデバイスだけが失敗し続ける
+health = AdapterHealthMonitor(window_size=50, adapter_failure_threshold=3, connect_failure_devices=3)
+for _ in range(10):
+    health.record_scan(10.0, seen_count=12)            # 周囲のアドバタイズは受信できているが対象が見つからない
+    health.record_connect("dead", 15.0, False, error=asyncio.TimeoutError())
+    health.record_device_result("dead", False)
+check(health.status(active_devices=3)[0] == DEGRADED and not health.should_restart(3), "single failing device does not escalate")
+
+health.record_connect("ok", 1.2, True)
+check(health.status(3)[0] == HEALTHY, "successful connect clears connect failures")
+
+# 複数デバイスへの接続が続けて失敗
+for dev_id in ("a", "b"):
+    health.record_connect(dev_id, 15.0, False)
+check(not health.should_restart(3) and health.should_restart(2), "connect failures across devices escalate (threshold capped by active devices)")
+check(not AdapterHealthMonitor(connect_failure_devices=3).should_restart(1), "threshold is at least two devices")
+health.record_connect("c", 15.0, False)
+check(health.should_restart(3), f"three devices failing -> unhealthy: {health.status(3)}")
+health.mark_restarted()
+check(health.status(3)[0] == HEALTHY and health.restart_count == 1, "restart resets symptoms")
+
+# スキャンで何も受信できない
+health.record_scan(10.0, seen_count=0)
+health.record_error(Exception("org.bluez.Error.NotReady"))
+check(health.status()[0] == DEGRADED, "adapter symptoms below threshold -> degraded")
+health.record_scan(10.0, seen_count=0)
+check(health.status()[0] == UNHEALTHY, "repeated empty scans -> unhealthy")
+health.record_scan(4.0, seen_count=3)
+check(health.status()[0] == HEALTHY, "scan with advertisements clears adapter symptoms")
+
+metrics = health.metrics()
+check(metrics['scan_count'] == 13 and metrics['empty_scan_count'] == 2 and metrics['adapter_error_count'] == 3
+      and metrics['connect_latency']['p50'] == 1.2, f"metrics: { {k: metrics[k] for k in ('scan_count', 'empty_scan_count', 'adapter_error_count')} }")
+
+
+# --- PlantDeviceBLE.connect からの記録 ---
+import ble_manager
+from ble_manager import PlantDeviceBLE
+
+
+class FakeBLEDevice:
+    def __init__(self, address):
+        self.address = address
+
+
+class FakeScanner:
+    advertisers = []
+
+    @classmethod
+    async def find_device_by_filter(cls, filterfunc, timeout=10.0):
+        for address in cls.advertisers:
+            device = FakeBLEDevice(address)
+            if filterfunc(device, None):
+                return device
+        return None
+
+
+class FakeClient:
+    is_connected = False
+
+    async def connect(self, timeout=None):
+        self.is_connected = True
+
+
+async def run_connect(advertisers):
+    FakeScanner.advertisers = advertisers
+    device = PlantDeviceBLE("aa:bb:cc:dd:ee:01", "dev1", health=ble_health)
+    device.client = FakeClient()
+    return await device.connect()
+
+
+ble_health = AdapterHealthMonitor(window_size=50, adapter_failure_threshold=2)
+original_scanner = ble_manager.BleakScanner
+ble_manager.BleakScanner = FakeScanner
+try:
+    missing = asyncio.run(run_connect(["11:22:33:44:55:66"]))
+    empty = asyncio.run(run_connect([]))
+    found = asyncio.run(run_connect(["11:22:33:44:55:66", "AA:BB:CC:DD:EE:01"]))
+finally:
+    ble_manager.BleakScanner = original_scanner
+check(missing is False and empty is False and found is True, "connect results")
+metrics = ble_health.metrics()
+check(metrics['scan_count'] == 3 and metrics['empty_scan_count'] == 1 and metrics['connect_count'] == 1
+      and metrics['adapter_failure_streak'] == 0, f"scan/connect recorded from PlantDeviceBLE: {metrics['scan_count']} scans")
+
+# --- 保存 ---
+with temp_database():
+    conn = database.get_db_connection()
+    health.save_snapshot(conn)
+    conn.commit()
+    row = conn.execute("SELECT * FROM adapter_health_metrics").fetchone()
+    conn.close()
+    check(row['adapter'] == 'hci0' and row['scan_count'] == 13 and row['connect_p50'] == 1.2 and row['restart_count'] == 1,
+          "snapshot saved to adapter_health_metrics")
+    check(health.metrics()['scan_count'] == 0, "counters reset after snapshot")
+
+finish()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for the analyzer daemon's AnalysisScheduler
+
+- 最後のデータ到着から debounce_seconds 経過するまで分析しないこと（到着のたびに延びる）
+- データが届き続けても最初の到着から max_delay_seconds で分析すること
+- 同じ植物は min_interval_seconds 以内に再分析しないこと（保留は残る）
+- 植物ごとに独立して判定すること
+"""
+import sys
+import os
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header
+
+from plant_analyzer_daemon import AnalysisScheduler
+
+logging.disable(logging.WARNING)
+
+header("分析スケジューラ（デバウンス・最大遅延・最小間隔）のテスト")
+
+DEBOUNCE, MIN_INTERVAL, MAX_DELAY = 30, 300, 120
+
+# 1. デバウンス
+scheduler = AnalysisScheduler(DEBOUNCE, MIN_INTERVAL, MAX_DELAY)
+scheduler.mark_dirty(['m1'], 1000)
+check(scheduler.pop_due(1000 + DEBOUNCE - 1) == [], "not due before the debounce period")
+scheduler.mark_dirty(['m1'], 1020)
+check(scheduler.pop_due(1000 + DEBOUNCE) == [], "a new arrival extends the debounce period")
+check(scheduler.pop_due(1020 + DEBOUNCE) == ['m1'] and 'm1' not in scheduler.pending,
+      "due once the last arrival has settled, and removed from pending")
+check(scheduler.pop_due(1020 + DEBOUNCE + 1) == [], "not returned twice")
+
+# 2. 最大遅延
+scheduler = AnalysisScheduler(DEBOUNCE, MIN_INTERVAL, MAX_DELAY)
+now = 1000
+due_at = None
+while now <= 1000 + 2 * MAX_DELAY and due_at is None:
+    scheduler.mark_dirty(['m1'], now)
+    if scheduler.pop_due(now):
+        due_at = now
+    now += DEBOUNCE // 2
+check(due_at == 1000 + MAX_DELAY, f"continuous arrivals are analyzed after max_delay_seconds: due at {due_at}")
+
+# 3. 最小間隔
+scheduler.mark_dirty(['m1'], due_at + 1)
+check(scheduler.pop_due(due_at + 1 + DEBOUNCE) == [] and 'm1' in scheduler.pending,
+      "settled plant waits for min_interval_seconds and stays pending")
+check(scheduler.pop_due(due_at + MIN_INTERVAL) == ['m1'], "due once min_interval_seconds has passed since the last run")
+
+# 4. 植物ごとの判定
+scheduler = AnalysisScheduler(DEBOUNCE, MIN_INTERVAL, MAX_DELAY)
+scheduler.mark_dirty(['m1', 'm2'], 1000)
+scheduler.mark_dirty(['m2'], 1010)
+check(scheduler.pop_due(1000 + DEBOUNCE) == ['m1'], "plants are debounced independently")
+check(sorted(scheduler.pending) == ['m2'] and scheduler.pop_due(1010 + DEBOUNCE) == ['m2'],
+      "other plant becomes due after its own debounce period")
+
+finish()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test script for sensor data backfill
+
+- 欠損区間の検出 (backfill.find_sensor_gaps) と取得時刻の計画
+- 欠損区間外・重複した応答の除外 (collect_backfill_records)
+- save_sensor_data_batch が冪等で、sensor_latest / sensor_daily_last を更新すること
+- PlantDeviceBLE.get_time_data_batch がリクエストをパイプライン送信し、シーケンス番号で応答を対応付けること
+  (BLEクライアントは応答を順不同で返すテスト用クライアントに差し替える)
+"""
+import sys
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import database
+import backfill
+import sensor_payloads as sp
+
+logging.disable(logging.WARNING)
+
+
+def time_data_payload(actual_time, temperature):
+    """time_data_response_t (packed, v3) のペイロードを作成する"""
+    values = [3, actual_time.second, actual_time.minute, actual_time.hour, actual_time.day,
+              actual_time.month - 1, actual_time.year - 1900, 0, 0, 0,
+              temperature, 50.0, 100.0, 2.0, 18.0, 0.0, 0.0, 0.0, 1, 10.0, 11.0, 12.0, 13.0, 0.0, 0]
+    return sp.TIME_DATA_LAYOUTS[3].struct.pack(*values)
+
+
+header("バックフィルのテスト")
+
+with temp_database():
+    import device_manager as dm
+
+    # 10分間隔のデータ。12:00-15:00 の3時間が欠損
+    base = datetime(2024, 6, 1, 10, 0, 0)
+    for minutes in list(range(0, 121, 10)) + list(range(300, 361, 10)):
+        ts = (base + timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
+        dm.save_sensor_data("dev1", ts, {'temperature': 20.0, 'humidity': 50.0}, 3)
+
+    conn = database.get_db_connection()
+    now = base + timedelta(hours=7)  # 16:00 の読み取りから1時間経過
+    gaps = backfill.find_sensor_gaps(conn, "dev1", base - timedelta(hours=1), now, 900)
+    conn.close()
+    expected_gaps = [(datetime(2024, 6, 1, 12, 0), datetime(2024, 6, 1, 15, 0)),
+                     (datetime(2024, 6, 1, 16, 0), now)]
+    check(gaps == expected_gaps, f"gaps detected: {gaps}")
+
+    targets = backfill.plan_backfill_targets(gaps, 1800, 100)
+    target_times = [t for t, _, _ in targets]
+    check(target_times[0] == datetime(2024, 6, 1, 16, 30), "newest gap planned first")
+    check(datetime(2024, 6, 1, 12, 30) in target_times and datetime(2024, 6, 1, 14, 30) in target_times
+          and datetime(2024, 6, 1, 15, 0) not in target_times, f"targets inside gap: {len(targets)}")
+    skip = {t.strftime("%Y-%m-%d %H:%M:%S") for t in target_times[:2]}
+    check(len(backfill.plan_backfill_targets(gaps, 1800, 100, skip=skip)) == len(targets) - 2, "attempted targets skipped")
+    check(len(backfill.plan_backfill_targets(gaps, 1800, 3)) == 3, "max_targets respected")
+
+    # デバイスは要求時刻に最も近い記録を返す。区間外・重複は除外される
+    gap = (datetime(2024, 6, 1, 12, 0), datetime(2024, 6, 1, 15, 0))
+    targets = [(datetime(2024, 6, 1, 12, 30), *gap), (datetime(2024, 6, 1, 12, 31), *gap),
+               (datetime(2024, 6, 1, 13, 0), *gap), (datetime(2024, 6, 1, 14, 30), *gap)]
+    results = [
+        (targets[0][0], {'datetime': '2024-06-01 12:29:58', 'temperature': 21.0}),
+        (targets[1][0], {'datetime': '2024-06-01 12:29:58', 'temperature': 21.0}),  # 同じ記録
+        (targets[2][0], None),                                                      # 記録なし
+        (targets[3][0], {'datetime': '2024-06-01 15:00:00', 'temperature': 22.0}),  # 区間の端 (保存済み)
+    ]
+    records = backfill.collect_backfill_records(targets, results)
+    check([r['timestamp'] for r in records] == ['2024-06-01 12:29:58'], f"records filtered: {records}")
+
+    # バッチ保存は冪等
+    batch = [{'timestamp': f"2024-06-01T{h:02d}:{m:02d}:00", 'data': {'temperature': 25.0 + h, 'humidity': 40.0}}
+             for h in (12, 13, 14) for m in (15, 45)]
+    batch.append({'timestamp': '2024-06-01T17:30:00', 'data': {'temperature': 30.0, 'humidity': 40.0}})
+    first = dm.save_sensor_data_batch("dev1", batch, 3)
+    second = dm.save_sensor_data_batch("dev1", batch, 3)
+    conn = database.get_db_connection()
+    count = conn.execute("SELECT COUNT(*) FROM sensor_data WHERE device_id = 'dev1'").fetchone()[0]
+    latest = conn.execute("SELECT timestamp, temperature FROM sensor_latest WHERE device_id = 'dev1'").fetchone()
+    daily = conn.execute(
+        "SELECT s.timestamp FROM sensor_daily_last d JOIN sensor_data s ON s.id = d.sensor_data_id "
+        "WHERE d.device_id = 'dev1' AND d.day = '2024-06-01'"
+    ).fetchone()
+    conn.close()
+    check(len(first) == 7 and second == [], f"batch insert idempotent: first={len(first)}, second={len(second)}")
+    check(count == 13 + 7 + 7, f"row count after backfill: {count}")
+    check(tuple(latest) == ('2024-06-01 17:30:00', 30.0), f"sensor_latest updated: {tuple(latest)}")
+    check(daily['timestamp'] == '2024-06-01 17:30:00', "sensor_daily_last updated")
+
+
+# --- パイプライン送信 ---
+from ble_manager import PlantDeviceBLE, COMMAND_HEADER, RESPONSE_HEADER, CMD_GET_TIME_DATA, TIME_DATA_REQUEST
+
+
+class ReorderingClient:
+    """受け取ったリクエストへの応答を、送信済みのものをまとめて逆順で返すテスト用BLEクライアント"""
+
+    def __init__(self, missing_minutes):
+        self.is_connected = True
+        self.handler = None
+        self.pending = []
+        self.max_in_flight = 0
+        self.missing_minutes = missing_minutes
+
+    async def start_notify(self, uuid, handler):
+        self.handler = handler
+
+    async def stop_notify(self, uuid):
+        self.handler = None
+
+    async def write_gatt_char(self, uuid, packet):
+        command_id, seq, length = COMMAND_HEADER.unpack_from(packet)
+        tm = TIME_DATA_REQUEST.unpack_from(packet, COMMAND_HEADER.size)
+        self.pending.append((command_id, seq, tm))
+        self.max_in_flight = max(self.max_in_flight, len(self.pending))
+        asyncio.get_running_loop().call_later(0.01, self.flush)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for command_id, seq, tm in reversed(pending):
+            if tm[1] in self.missing_minutes:
+                self.handler(0, RESPONSE_HEADER.pack(command_id, 1, seq, 0))
+                continue
+            actual = datetime(tm[5] + 1900, tm[4] + 1, tm[3], tm[2], tm[1], 5)
+            payload = time_data_payload(actual, float(tm[1]))
+            # 対応するリクエストのない応答も混ぜる
+            self.handler(0, RESPONSE_HEADER.pack(command_id, 0, (seq + 100) % 256, len(payload)) + payload)
+            self.handler(0, RESPONSE_HEADER.pack(command_id, 0, seq, len(payload)) + payload)
+
+
+async def run_pipeline():
+    device = PlantDeviceBLE("00:00:00:00:00:01", "dev1")
+    device.client = ReorderingClient(missing_minutes={20})
+    targets = [datetime(2024, 6, 1, 12, minute) for minute in range(0, 60, 10)]
+    results = await device.get_time_data_batch(targets, pipeline_depth=3)
+    return device.client, targets, results
+
+
+client, targets, results = asyncio.run(run_pipeline())
+check([t for t, _ in results] == targets, "results keep request order")
+check(all((reading is None) == (t.minute == 20) for t, reading in results), "error status -> None")
+check(all(reading['temperature'] == float(t.minute) and reading['datetime'] == t.replace(second=5).strftime("%Y-%m-%d %H:%M:%S")
+          for t, reading in results if reading), "responses matched by sequence number")
+check(client.max_in_flight == 3, f"pipelined requests in flight: {client.max_in_flight}")
+
+finish()
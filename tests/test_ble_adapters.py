@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for multi-adapter BLE device assignment
+
+- /sys/class/bluetooth からのアダプタの検出（接続ごとのエントリを除く）
+- 固定の割り当て・RSSIによる割り当て（ヒステリシス）・台数の少ないアダプタへの割り当て
+- 異常なアダプタを外したときのデバイスの移動と、一定時間後の復帰
+"""
+import sys
+import os
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header
+
+from ble_adapters import AdapterPool, discover_adapters
+
+logging.disable(logging.WARNING)
+
+header("複数アダプタへのデバイス割り当てのテスト")
+
+# --- アダプタの検出 ---
+with tempfile.TemporaryDirectory() as sysfs:
+    for name in ('hci10', 'hci1', 'hci0', 'hci0:64'):
+        os.mkdir(os.path.join(sysfs, name))
+    found = discover_adapters(sysfs)
+check(found == ['hci0', 'hci1', 'hci10'], f"adapters discovered in numeric order: {found}")
+check(discover_adapters('/nonexistent/bluetooth') == [], "missing sysfs -> no adapters")
+
+# --- 割り当て ---
+def device(device_id):
+    return {'device_id': device_id, 'mac_address': f"aa:bb:cc:dd:ee:0{device_id[-1]}"}
+
+
+pool = AdapterPool(['hci0', 'hci1'], mapping={'dev9': 'hci1'}, rssi_margin=6, rssi_ttl_seconds=600, failover_retry_seconds=300)
+now = 1000.0
+assigned = [pool.adapter_for(device(f"dev{i}"), now) for i in range(1, 5)]
+check(assigned == ['hci0', 'hci1', 'hci0', 'hci1'], f"devices spread over adapters without RSSI: {assigned}")
+check(pool.adapter_for(device("dev9"), now) == 'hci1', "configured mapping wins")
+
+pool.record_rssi("AA:BB:CC:DD:EE:01", 'hci0', -80, now)
+pool.record_rssi("AA:BB:CC:DD:EE:01", 'hci1', -77, now)
+check(pool.adapter_for(device("dev1"), now) == 'hci0', "small RSSI difference keeps current adapter")
+pool.record_rssi("AA:BB:CC:DD:EE:01", 'hci1', -70, now)
+check(pool.adapter_for(device("dev1"), now) == 'hci1', "much stronger adapter takes over")
+check(pool.adapter_for(device("dev1"), now + 700) == 'hci1' and pool.bleak_kwargs('hci1') == {'adapter': 'hci1'},
+      "stale RSSI keeps current assignment")
+
+# --- フェイルオーバー ---
+pool.mark_failed('hci1', "empty scans", now)
+moved = {device_id: pool.adapter_for(device(device_id), now + 10) for device_id in ('dev1', 'dev2', 'dev9')}
+check(set(moved.values()) == {'hci0'}, f"devices move off failed adapter: {moved}")
+check(pool.available(now + 299) == ['hci0'] and pool.available(now + 300) == ['hci0', 'hci1'], "failed adapter returns after retry period")
+check(pool.adapter_for(device("dev9"), now + 300) == 'hci1', "mapped device returns to its adapter")
+
+single = AdapterPool([])
+check(single.adapters == ['hci0'] and single.bleak_kwargs('hci0') == {}, "single adapter uses system default")
+
+finish()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script for the per-device circuit breaker
+
+- 連続失敗が閾値に達するとブレーカーが開き、停止時間中はポーリングを許可しないこと
+- 停止時間が過ぎると half-open で1回だけ試し、失敗すると停止時間を延ばして再び開くこと
+- 成功でブレーカーが閉じ、停止時間がリセットされること
+- device_poll_state への保存と復元
+"""
+import sys
+import os
+import logging
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import database
+from circuit_breaker import DeviceCircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+logging.disable(logging.WARNING)
+
+header("サーキットブレーカーのテスト")
+
+breaker = DeviceCircuitBreaker(failure_threshold=3, open_base_seconds=300, open_max_seconds=1000)
+now = datetime(2024, 6, 1, 12, 0, 0)
+
+states = [breaker.record_failure("dev1", "timeout", now) for _ in range(3)]
+check(states == [CLOSED, CLOSED, OPEN], f"opens after threshold failures: {states}")
+check(not breaker.allow("dev1", now + timedelta(seconds=299)), "polling blocked while open")
+check(breaker.seconds_until_retry("dev1", now + timedelta(seconds=100)) == 200, "seconds until retry")
+
+check(breaker.allow("dev1", now + timedelta(seconds=300)) and breaker.state("dev1") == HALF_OPEN, "half-open after open window")
+now += timedelta(seconds=300)
+check(breaker.record_failure("dev1", "timeout", now) == OPEN, "half-open failure reopens immediately")
+check(breaker.get("dev1")['retry_at'] == now + timedelta(seconds=600), "open window doubles")
+for _ in range(3):
+    breaker.allow("dev1", now + timedelta(days=1))
+    breaker.record_failure("dev1", "timeout", now)
+check(breaker.get("dev1")['retry_at'] == now + timedelta(seconds=1000), "open window capped")
+
+breaker.allow("dev1", now + timedelta(days=1))
+check(breaker.record_success("dev1", now) and breaker.state("dev1") == CLOSED, "success closes breaker")
+check(breaker.get("dev1")['open_count'] == 0 and breaker.get("dev1")['consecutive_failures'] == 0, "success resets counters")
+check(not breaker.record_success("dev1", now), "no state change on repeated success")
+
+# --- 保存と復元 ---
+with temp_database():
+    for _ in range(3):
+        breaker.record_failure("dev2", "device not found", now)
+    conn = database.get_db_connection()
+    breaker.save(conn, "dev1")
+    breaker.save(conn, "dev2")
+    conn.commit()
+
+    restored = DeviceCircuitBreaker(failure_threshold=3, open_base_seconds=300, open_max_seconds=1000)
+    restored.load(conn)
+    conn.close()
+    check(restored.get("dev2") == breaker.get("dev2"), "state restored from device_poll_state")
+    check(not restored.allow("dev2", now + timedelta(seconds=10)) and restored.state("dev1") == CLOSED, "restored breaker keeps blocking")
+
+finish()
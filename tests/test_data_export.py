@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for sensor history export
+
+- 期間（両端の日を含む）とデバイス・植物の指定で sensor_data / daily_plant_analysis を書き出すこと
+- チャンクに分けて読んでも1回で読んだ場合と同じCSVになること
+- /api/export のダウンロードとエラー、Parquet（pyarrowがある場合）
+"""
+import sys
+import os
+import base64
+import csv
+import io
+import logging
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import config
+import database
+
+logging.disable(logging.WARNING)
+
+header("センサーデータのエクスポートのテスト")
+
+with temp_database():
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 3)")
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev2', 'Other', 'AA:BB:CC:DD:EE:02', 3)")
+    conn.execute("INSERT INTO managed_plants (managed_plant_id, plant_name, assigned_plant_sensor_id) VALUES ('m1', 'Plant', 'dev1')")
+    conn.executemany(
+        "INSERT INTO sensor_data (device_id, timestamp, temperature, data_version) VALUES (?, ?, ?, 3)",
+        [(device_id, f"2025-01-{day:02d} {hour:02d}:30:00", day + hour / 100)
+         for device_id in ('dev1', 'dev2') for day in range(1, 11) for hour in range(24)]
+    )
+    conn.executemany(
+        "INSERT INTO daily_plant_analysis (managed_plant_id, analysis_date, daily_temp_max) VALUES ('m1', ?, ?)",
+        [(f"2025-01-{day:02d}", 20 + day) for day in range(1, 11)]
+    )
+    conn.commit()
+    conn.close()
+
+    import data_export
+
+    def read_csv(chunks):
+        return list(csv.DictReader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+
+    rows = read_csv(data_export.export('sensor_data', device_id='dev1', start=date(2025, 1, 3), end=date(2025, 1, 4)))
+    check(len(rows) == 48 and rows[0]['timestamp'] == '2025-01-03 00:30:00' and rows[-1]['timestamp'] == '2025-01-04 23:30:00'
+          and {row['device_id'] for row in rows} == {'dev1'}, f"date range includes both days: {len(rows)} rows")
+
+    chunks = list(data_export.export('sensor_data', device_id='dev1', chunk_rows=50))
+    check(len(chunks) == 5 and read_csv(chunks) == read_csv(data_export.export('sensor_data', device_id='dev1')),
+          f"chunked export ({len(chunks)} chunks) equals unchunked")
+
+    check(len(read_csv(data_export.export('sensor_data', plant_id='m1'))) == 240
+          and len(read_csv(data_export.export('daily_plant_analysis', device_id='dev1'))) == 10,
+          "plant resolves to its sensor and device to its plants")
+
+    try:
+        data_export.export('sensor_data')
+        check(False, "missing target raises ValueError")
+    except ValueError:
+        check(True, "missing target raises ValueError")
+
+    from app import create_app
+    client = create_app().test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(f"{config.BASIC_AUTH_USERNAME}:{config.BASIC_AUTH_PASSWORD}".encode()).decode()}
+
+    response = client.get('/api/export/daily_plant_analysis?plant_id=m1&start=2025-01-05', headers=headers)
+    streamed = response.is_streamed
+    exported = read_csv([response.data])
+    check(response.status_code == 200 and response.mimetype == 'text/csv' and streamed
+          and 'attachment' in response.headers['Content-Disposition'] and len(exported) == 6,
+          f"api streams csv download: {response.headers['Content-Disposition']}")
+    check(client.get('/api/export/devices?device_id=dev1', headers=headers).status_code == 400, "unknown dataset -> 400")
+
+    parquet = client.get('/api/export/sensor_data?device_id=dev1&format=parquet', headers=headers)
+    if data_export.parquet_available():
+        import pyarrow.parquet as pq
+        table = pq.read_table(io.BytesIO(parquet.data))
+        check(parquet.status_code == 200 and table.num_rows == 240, f"parquet export: {table.num_rows} rows")
+    else:
+        check(parquet.status_code == 400, "parquet without pyarrow -> 400")
+
+finish()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for the bulk sensor data importer
+
+- CSV / JSONL（データパイプ形式）/ 旧デーモンのSQLite DBを取り込めること
+- (device_id, timestamp) の重複をファイル内・既存の行の両方で除くこと
+- data_version のレイアウトにないカラムを保存しないこと
+- sensor_latest / sensor_daily_last / sensor_completeness を更新すること
+"""
+import sys
+import os
+import json
+import logging
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import config
+import database
+
+logging.disable(logging.WARNING)
+
+header("センサーデータの一括取り込みのテスト")
+
+config.IMPORT_BATCH_ROWS = 100
+with temp_database(history_cache=True) as tmp:
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 1)")
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev2', 'Soil', 'AA:BB:CC:DD:EE:02', 3)")
+    conn.commit()
+    conn.close()
+
+    import device_manager as dm
+    dm.save_sensor_data('dev1', '2025-01-01T00:00:00', {'temperature': 99.0}, 1)
+    dm.save_sensor_data('dev1', '2025-02-01T00:00:00', {'temperature': 30.0}, 1)
+
+    import data_import
+
+    csv_path = os.path.join(tmp, 'dump.csv')
+    with open(csv_path, 'w') as f:
+        f.write("datetime,temperature,humidity,soil_temperature1\n")
+        for minute in range(0, 60, 10):
+            f.write(f"2025-01-01T00:{minute:02d}:00,{20 + minute / 10},50,15\n")
+        f.write("2025-01-01T00:10:00,0,0,0\n")  # ファイル内の重複
+        f.write(",1,1,1\n")  # タイムスタンプなし
+    result = data_import.import_file(csv_path, device_id='dev1')
+    check(result['read'] == 8 and result['skipped'] == 1 and result['duplicates'] == 2 and result['inserted'] == 5,
+          f"csv import dedupes within file and against existing rows: {result}")
+
+    conn = database.get_db_connection()
+    rows = conn.execute("SELECT * FROM sensor_data WHERE device_id = 'dev1' ORDER BY timestamp").fetchall()
+    check(len(rows) == 7 and rows[0]['temperature'] == 99.0 and rows[1]['temperature'] == 21.0
+          and rows[1]['soil_temperature1'] is None and rows[1]['humidity'] == 50.0 and rows[1]['data_version'] == 1,
+          "existing row kept; v1 layout drops soil_temperature1")
+    latest = conn.execute("SELECT timestamp FROM sensor_latest WHERE device_id = 'dev1'").fetchone()
+    check(latest['timestamp'] == '2025-02-01 00:00:00', "older import does not overwrite sensor_latest")
+    completeness = conn.execute("SELECT actual_count FROM sensor_completeness WHERE device_id = 'dev1' AND hour = '2025-01-01 00'").fetchone()
+    check(completeness['actual_count'] == 6, f"sensor_completeness counts imported rows: {completeness['actual_count']}")
+    conn.close()
+
+    jsonl_path = os.path.join(tmp, 'pipe.jsonl')
+    with open(jsonl_path, 'w') as f:
+        for hour in range(3):
+            f.write(json.dumps({'device_id': 'dev2', 'timestamp': f"2025-03-0{hour + 1}T12:00:00",
+                                'data': {'temperature': 10 + hour, 'soil_temperature1': 5 + hour}, 'data_version': 3}) + "\n")
+    result = data_import.import_file(jsonl_path)
+    conn = database.get_db_connection()
+    daily = conn.execute("SELECT COUNT(*) FROM sensor_daily_last WHERE device_id = 'dev2'").fetchone()[0]
+    latest = conn.execute("SELECT temperature, soil_temperature1 FROM sensor_latest WHERE device_id = 'dev2'").fetchone()
+    check(result['inserted'] == 3 and daily == 3 and latest['temperature'] == 12 and latest['soil_temperature1'] == 7,
+          "jsonl pipe records import with their data_version and update daily/latest tables")
+    conn.close()
+
+    old_db = os.path.join(tmp, 'old_plant_monitor.db')
+    old = sqlite3.connect(old_db)
+    old.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, device_id TEXT, temperature REAL, humidity REAL, light_lux REAL, soil_moisture REAL, timestamp DATETIME)")
+    old.executemany("INSERT INTO sensor_data (device_id, temperature, humidity, light_lux, soil_moisture, timestamp) VALUES (?, ?, 40, 1000, 30, ?)",
+                    [('old1', 18 + i % 5, f"2024-06-{1 + i // 24:02d} {i % 24:02d}:00:00") for i in range(240)])
+    old.commit()
+    old.close()
+    result = data_import.import_file(old_db)
+    again = data_import.import_file(old_db)
+    check(result['inserted'] == 240 and result['devices'] == ['old1'] and again['inserted'] == 0 and again['duplicates'] == 240,
+          "old daemon database imports once; re-import adds nothing")
+
+    conn = database.get_db_connection()
+    staging = conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '_import_staging%'").fetchall()
+    index = conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_sensor_data_device_timestamp'").fetchone()
+    check(not staging and index is not None, "staging table dropped and sensor_data index kept")
+    conn.close()
+
+    config.IMPORT_REBUILD_INDEX_MIN_ROWS = 1
+    result = data_import.import_records([{'device_id': 'dev2', 'timestamp': '2025-04-01 00:00:00', 'temperature': 1}])
+    conn = database.get_db_connection()
+    index = conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_sensor_data_device_timestamp'").fetchone()
+    check(result['inserted'] == 1 and index is not None, "index rebuilt after a large import")
+    conn.close()
+
+finish()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script for device-side measurement timestamps
+
+- 計測時刻 (data['datetime']) が受信時刻に近ければ計測時刻で保存し、ずれが大きい・不正なら受信時刻を使うこと
+- デバイスごとの時計のずれを devices.clock_skew_seconds に記録すること
+- パイプの再処理で受信時刻が変わっても、同じ読み取りは1行だけ保存されること
+"""
+import sys
+import os
+import json
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import database
+
+logging.disable(logging.WARNING)
+
+header("デバイスの計測時刻のテスト")
+
+import device_manager as dm
+
+check(dm.resolve_reading_timestamp('dev1', '2026-01-10T12:00:30.123456', {'datetime': '2026-01-10 11:59:50'})
+      == ('2026-01-10 11:59:50', -40), "device time within tolerance is used")
+check(dm.resolve_reading_timestamp('dev1', '2026-01-10T12:00:30', {'datetime': '1970-01-01 00:00:00'})[0] == '2026-01-10 12:00:30'
+      and 'dev1' in dm.skewed_devices, "unset device clock falls back to receive time")
+check(dm.resolve_reading_timestamp('dev2', '2026-01-10T12:00:30', {'temperature': 20.0}) == ('2026-01-10 12:00:30', None)
+      and dm.resolve_reading_timestamp('dev2', '2026-01-10T12:00:30', {'datetime': 'garbage'})[1] is None,
+      "missing or invalid device time uses receive time")
+dm.resolve_reading_timestamp('dev1', '2026-01-10T12:10:30', {'datetime': '2026-01-10 12:10:31'})
+check('dev1' not in dm.skewed_devices, "skew warning state clears when the clock recovers")
+
+with temp_database() as tmp:
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, device_type, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 'plant_sensor', 3)")
+    conn.commit()
+    conn.close()
+    dm.load_devices_from_db()
+
+    import plant_analyzer_daemon as analyzer
+    analyzer.DATA_PIPE_PATH = os.path.join(tmp, 'pipe.jsonl')
+
+    def write_pipe(*records):
+        with open(analyzer.DATA_PIPE_PATH, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    reading = {'datetime': '2026-01-10 08:00:00', 'temperature': 21.5}
+    write_pipe(
+        {'device_id': 'dev1', 'timestamp': '2026-01-10T08:00:45', 'data_version': 3, 'data': reading},
+        # 同じ読み取りの再送（受信時刻だけが異なる）
+        {'device_id': 'dev1', 'timestamp': '2026-01-10T08:01:20', 'data_version': 3, 'data': reading},
+    )
+    analyzer.process_data_pipe()
+    conn = database.get_db_connection()
+    rows = conn.execute("SELECT timestamp FROM sensor_data WHERE device_id = 'dev1'").fetchall()
+    skew = conn.execute("SELECT clock_skew_seconds FROM devices WHERE device_id = 'dev1'").fetchone()[0]
+    check([row['timestamp'] for row in rows] == ['2026-01-10 08:00:00'] and skew == -80,
+          f"re-sent reading stored once at device time; skew recorded: {skew}")
+    conn.close()
+
+finish()
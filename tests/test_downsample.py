@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script for LTTB downsampling of history charts
+
+- 指定した点数に減り、先頭・末尾とスパイクが残ること
+- 欠損値 (None) や値のない列があっても動くこと
+- numpyがある環境では純Python版と同じ点を選ぶこと
+- /api/history の max_points パラメータ
+"""
+import sys
+import os
+import base64
+import logging
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import config
+import database
+from lib import downsample
+from lib.downsample import downsample_rows, lttb_indices
+
+logging.disable(logging.WARNING)
+
+header("履歴グラフの間引き (LTTB) のテスト")
+
+random.seed(0)
+rows = [
+    {
+        'timestamp': f"2026-01-10 {i // 60:02d}:{i % 60:02d}:00",
+        'temperature': 300.0 if i == 777 else 20 + random.random(),
+        'humidity': None if i % 17 == 0 else 50 + random.random(),
+        'light_lux': None,
+    }
+    for i in range(1440)
+]
+
+sampled = downsample_rows(rows, 200, ['temperature', 'humidity', 'light_lux'])
+check(len(sampled) == 200 and sampled[0] is rows[0] and sampled[-1] is rows[-1], f"1440 rows -> {len(sampled)} keeping ends")
+check(rows[777] in sampled, "spike survives downsampling")
+check([r['timestamp'] for r in sampled] == sorted(r['timestamp'] for r in sampled), "rows stay in time order")
+check(downsample_rows(rows[:50], 200, ['temperature']) == rows[:50] and downsample_rows(rows, None, ['temperature']) is rows,
+      "short input or no max_points is unchanged")
+
+if downsample._load_numpy():
+    x = list(range(5000))
+    series = [[random.random() for _ in x], [None if i % 7 == 0 else random.random() for i in x]]
+    check(downsample._lttb_numpy(x, series, 300) == downsample._lttb_python(x, series, 300), "numpy and pure Python agree")
+else:
+    check(len(lttb_indices(list(range(10)), [], 4)) == 4, "pure Python fallback without numpy")
+
+# --- /api/history ---
+with temp_database():
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 3)")
+    conn.executemany(
+        "INSERT INTO sensor_data (device_id, timestamp, temperature) VALUES ('dev1', ?, ?)",
+        [(row['timestamp'], row['temperature']) for row in rows]
+    )
+    conn.commit()
+    conn.close()
+
+    from app import create_app
+    client = create_app().test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(f"{config.BASIC_AUTH_USERNAME}:{config.BASIC_AUTH_PASSWORD}".encode()).decode()}
+
+    full = client.get('/api/history/dev1?period=24h&date=2026-01-10', headers=headers).get_json()['history']
+    reduced = client.get('/api/history/dev1?period=24h&date=2026-01-10&max_points=120', headers=headers).get_json()['history']
+    check(len(full) == 1440 and len(reduced) == 120 and max(r['temperature'] for r in reduced) == 300.0,
+          f"api max_points: {len(full)} -> {len(reduced)} rows")
+    bad = client.get('/api/history/dev1?period=24h&date=2026-01-10&max_points=abc', headers=headers)
+    check(bad.status_code == 400, "invalid max_points -> 400")
+
+finish()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script for the multi-device batch history API
+
+- /api/history/batch が項目ごとに /api/history と同じ本文を返すこと（期間の指定・データのないデバイスを含む）
+- 閾値・集計のクエリをデバイスの台数によらずまとめて実行すること
+- ETagによる304、gzipで逐次送るレスポンス、/api/history とキャッシュを共有すること
+"""
+import sys
+import os
+import base64
+import gzip
+import json
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import config
+import database
+
+logging.disable(logging.WARNING)
+
+header("一括履歴APIのテスト")
+
+with temp_database(history_cache=True):
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO plants (plant_id, genus, species, lethal_temp_high, lethal_temp_low) VALUES ('p1', 'Genus', 'species', 35, 2)")
+    for i in range(1, 5):
+        conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES (?, ?, ?, 3)",
+                     (f"dev{i}", f"Sensor {i}", f"AA:BB:CC:DD:EE:0{i}"))
+    conn.execute("INSERT INTO managed_plants (managed_plant_id, plant_name, library_plant_id, assigned_plant_sensor_id) VALUES ('m1', 'Plant', 'p1', 'dev1')")
+    conn.commit()
+    conn.close()
+
+    import device_manager as dm
+    for i in range(1, 4):
+        for hour in range(0, 24, 2):
+            dm.save_sensor_data(f"dev{i}", f"2026-01-10T{hour:02d}:00:00", {'temperature': 20.0 + i + hour / 10, 'humidity': 50.0}, 3)
+
+    from app import create_app
+    client = create_app().test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(f"{config.BASIC_AUTH_USERNAME}:{config.BASIC_AUTH_PASSWORD}".encode()).decode()}
+
+    params = 'date=2026-01-10&format=columnar'
+    batch_url = f"/api/history/batch?devices=dev1,dev2,dev3:7d,dev4&period=24h&{params}"
+
+    statements = []
+    original_get_request_db = database.get_request_db
+
+    def tracing_get_request_db(*args, **kwargs):
+        db = original_get_request_db(*args, **kwargs)
+        db.set_trace_callback(statements.append)
+        return db
+
+    import blueprints.dashboard.routes as routes
+    routes.get_request_db = tracing_get_request_db
+    batch = client.get(batch_url, headers=headers)
+    results = json.loads(batch.data)['results']  # 本文は逐次生成されるため、読み終えてからクエリを数える
+    routes.get_request_db = original_get_request_db
+    batch_statements = list(statements)
+    check(batch.status_code == 200 and sorted(results) == ['dev1:24h', 'dev2:24h', 'dev3:7d', 'dev4:24h'],
+          f"batch returns every item: {list(results)}")
+
+    singles = {
+        key: client.get(f"/api/history/{key.split(':')[0]}?period={key.split(':')[1]}&{params}", headers=headers)
+        for key in results
+    }
+    check(all(results[key] == json.loads(response.data) for key, response in singles.items()),
+          "each item matches /api/history")
+    check(results['dev1:24h']['thresholds'].get('lethal_temp_high') == 35 and results['dev2:24h']['thresholds'] == {}
+          and results['dev4:24h']['t0'] is None, "thresholds per device and empty history for device without data")
+
+    queries = [s for s in batch_statements if 'FROM sensor_data' in s or 'FROM managed_plants' in s]
+    check(len(queries) == 3, f"one threshold query and one query per period ({len(queries)} queries for 4 devices)")
+
+    cached = client.get(batch_url, headers={**headers, 'If-None-Match': batch.headers['ETag']})
+    check(cached.status_code == 304, "matching If-None-Match -> 304")
+
+    compressed = client.get(batch_url, headers={**headers, 'Accept-Encoding': 'gzip'})
+    check(compressed.headers.get('Content-Encoding') == 'gzip' and json.loads(gzip.decompress(compressed.data))['results'] == results,
+          "streamed gzip body decodes to the same results")
+
+    metrics = client.get('/api/cache/history', headers=headers).get_json()
+    check(metrics['memory_hits'] >= 4, f"batch and single endpoints share the cache: {metrics['memory_hits']} memory hits")
+
+    check(client.get('/api/history/batch?period=24h', headers=headers).status_code == 400, "missing devices -> 400")
+
+finish()
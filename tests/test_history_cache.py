@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script for the server-side history response cache
+
+- ワーカー内のLRU（件数上限）とTTL
+- 共有ストア経由で別のワーカー（別のHistoryCache）が集計結果を使えること
+- 取り込み時の無効化は現在時刻を含む期間だけ、include_past=Trueで過去の期間も無効になること
+- ETagが変わったエントリを使わないこと、ヒット率の集計
+"""
+import sys
+import os
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header
+
+import config
+import history_cache
+from history_cache import HistoryCache
+
+logging.disable(logging.WARNING)
+
+header("履歴レスポンスキャッシュのテスト")
+
+now = [1000.0]
+
+
+def clock():
+    return now[0]
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    store_path = os.path.join(tmp, 'history_cache.db')
+    config.HISTORY_CACHE_PATH = store_path
+
+    # --- LRUとTTL ---
+    memory_only = HistoryCache(max_entries=2, ttl_seconds=60, past_ttl_seconds=3600, store_path='', clock=clock)
+    for period in ('24h', '7d', '30d'):
+        memory_only.put('dev1', period, '2026-01-10', 'etag', True, period.encode())
+    check(memory_only.get('dev1', '24h', '2026-01-10', 'etag', True) is None
+          and memory_only.get('dev1', '30d', '2026-01-10', 'etag', True) == b'30d', "least recently used entry evicted")
+    now[0] += 61
+    check(memory_only.get('dev1', '30d', '2026-01-10', 'etag', True) is None, "live entry expires after TTL")
+
+    # --- ワーカー間の共有 ---
+    worker_a = HistoryCache(max_entries=10, ttl_seconds=60, past_ttl_seconds=3600, store_path=store_path, clock=clock)
+    worker_b = HistoryCache(max_entries=10, ttl_seconds=60, past_ttl_seconds=3600, store_path=store_path, clock=clock)
+    worker_a.put('dev1', '7d', '2026-01-10', 'e1', True, b'live')
+    worker_a.put('dev1', '24h', '2026-01-01', 'e2', False, b'past')
+    check(worker_b.get('dev1', '7d', '2026-01-10', 'e1', True) == b'live', "other worker hits shared store")
+    check(worker_b.get('dev1', '7d', '2026-01-10', 'changed', True) is None, "changed ETag is not served")
+
+    # --- 取り込み時の無効化 ---
+    history_cache.invalidate_devices(['dev1'])
+    check(worker_a.get('dev1', '7d', '2026-01-10', 'e1', True) is None
+          and worker_b.get('dev1', '24h', '2026-01-01', 'e2', False) == b'past',
+          "ingest invalidates live ranges only")
+    history_cache.invalidate_devices(['dev1'], include_past=True)
+    check(worker_a.get('dev1', '24h', '2026-01-01', 'e2', False) is None, "include_past invalidates past ranges")
+
+    worker_a.put('dev2', '7d', '2026-01-10', 'e3', True, b'other')
+    history_cache.invalidate_devices(['dev1'])
+    check(worker_a.get('dev2', '7d', '2026-01-10', 'e3', True) == b'other', "other devices stay cached")
+
+    metrics = worker_b.metrics()
+    check(metrics['shared_hits'] == 2 and metrics['misses'] == 1 and metrics['hit_rate'] == round(2 / 3, 4),
+          f"hit rate metrics: {metrics}")
+
+finish()
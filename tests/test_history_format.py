@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test script for the columnar history response format
+
+- 列指向への変換（時刻の差分エンコード・値のない列）と行への復元
+- /api/history?format=columnar の内容とサイズ、gzip圧縮
+- 従来の行形式も同じ値を返すこと
+"""
+import sys
+import os
+import base64
+import gzip
+import json
+import logging
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import config
+import database
+from lib.history_format import to_columnar
+
+logging.disable(logging.WARNING)
+
+
+def decode(data):
+    """static/js/utils.js の decodeColumnarHistory と同じ手順で行に戻す"""
+    if data['t0'] is None:
+        return []
+    epochs = [data['t0']]
+    for delta in data['dt']:
+        epochs.append(epochs[-1] + delta)
+    return [
+        {'timestamp': datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S'),
+         **{key: values[i] for key, values in data['columns'].items()},
+         **{key: None for key in data['empty']}}
+        for i, epoch in enumerate(epochs)
+    ]
+
+
+header("履歴APIの列指向フォーマットのテスト")
+
+rows = [
+    {'timestamp': f"2026-01-10 {hour:02d}:00:00", 'temperature': 20.123456 + hour, 'humidity': None, 'light_lux': 100 * hour}
+    for hour in range(24)
+]
+columnar = to_columnar(rows)
+check(columnar['dt'] == [3600] * 23 and columnar['empty'] == ['humidity'] and columnar['columns']['temperature'][1] == 21.123,
+      "columnar encodes deltas, rounds floats and lists empty columns")
+check(decode(columnar) == [{**row, 'temperature': round(row['temperature'], 3)} for row in rows], "columnar decodes back to rows")
+check(to_columnar([]) == {'t0': None, 'dt': [], 'columns': {}, 'empty': []}, "empty history")
+
+with temp_database():
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 3)")
+    conn.executemany(
+        "INSERT INTO sensor_data (device_id, timestamp, temperature, humidity) VALUES ('dev1', ?, ?, ?)",
+        [(f"2026-01-{day:02d} {hour:02d}:{minute:02d}:00", 20 + minute / 7, 50 + hour / 3)
+         for day in range(1, 11) for hour in range(24) for minute in range(0, 60, 5)]
+    )
+    conn.commit()
+    conn.close()
+
+    from app import create_app
+    client = create_app().test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(f"{config.BASIC_AUTH_USERNAME}:{config.BASIC_AUTH_PASSWORD}".encode()).decode()}
+
+    url = '/api/history/dev1?period=7d&date=2026-01-10'
+    rows_response = client.get(url, headers=headers)
+    columnar_response = client.get(url + '&format=columnar', headers=headers)
+    history = rows_response.get_json()['history']
+    decoded = decode(columnar_response.get_json())
+    check(len(decoded) == len(history) and all(
+        d['timestamp'] == h['timestamp'] and d['humidity_max'] == round(h['humidity_max'], 3) for d, h in zip(decoded, history)
+    ), f"columnar api matches rows ({len(history)} rows)")
+    check(len(columnar_response.data) < len(rows_response.data) / 3,
+          f"columnar is smaller: {len(rows_response.data)} -> {len(columnar_response.data)} bytes")
+
+    compressed = client.get(url + '&format=columnar', headers={**headers, 'Accept-Encoding': 'gzip, deflate'})
+    check(compressed.headers.get('Content-Encoding') == 'gzip' and 'Accept-Encoding' in compressed.headers.get('Vary', '')
+          and json.loads(gzip.decompress(compressed.data)) == columnar_response.get_json(),
+          f"gzip when accepted: {len(compressed.data)} bytes")
+    check(client.get(url + '&format=xml', headers=headers).status_code == 400, "unknown format -> 400")
+
+finish()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test script for conditional responses of the history APIs
+
+- /api/history と /api/plant-analysis-history が ETag・Cache-Control を返すこと
+- If-None-Match が一致すれば 304 を返し、新しい読み取りの保存でETagが変わること
+- 過去の期間も長くキャッシュさせず、毎回ETagで再検証させること
+"""
+import sys
+import os
+import base64
+import logging
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import config
+import database
+
+logging.disable(logging.WARNING)
+
+header("履歴APIの条件付きレスポンスのテスト")
+
+with temp_database():
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 3)")
+    conn.execute("INSERT INTO plants (plant_id, genus, species, lethal_temp_high, lethal_temp_low) VALUES ('p1', 'Genus', 'species', 35, 2)")
+    conn.execute("INSERT INTO managed_plants (managed_plant_id, plant_name, library_plant_id, assigned_plant_sensor_id) VALUES ('m1', 'Plant', 'p1', 'dev1')")
+    conn.commit()
+    conn.close()
+
+    import device_manager as dm
+    from app import create_app
+
+    dm.save_sensor_data('dev1', None, {'temperature': 20.0}, 3)
+    client = create_app().test_client()
+    headers = {'Authorization': 'Basic ' + base64.b64encode(f"{config.BASIC_AUTH_USERNAME}:{config.BASIC_AUTH_PASSWORD}".encode()).decode()}
+
+    first = client.get('/api/history/dev1?period=7d', headers=headers)
+    etag = first.headers.get('ETag')
+    check(first.status_code == 200 and etag and first.headers.get('Cache-Control') == 'private, no-cache'
+          and first.headers.get('Last-Modified'), f"history validators: {etag}")
+
+    again = client.get('/api/history/dev1?period=7d', headers={**headers, 'If-None-Match': etag})
+    check(again.status_code == 304 and not again.data, "matching If-None-Match -> 304")
+
+    # 同じ時刻の読み取りは重複として無視されるため、1分前の読み取りを追加する
+    dm.save_sensor_data('dev1', (datetime.now() - timedelta(minutes=1)).isoformat(timespec='seconds'), {'temperature': 21.0}, 3)
+    changed = client.get('/api/history/dev1?period=7d', headers={**headers, 'If-None-Match': etag})
+    check(changed.status_code == 200 and changed.headers.get('ETag') != etag, "new reading changes ETag")
+
+    past = client.get('/api/history/dev1?period=24h&date=2020-01-01', headers=headers)
+    check(past.headers.get('Cache-Control') == 'private, no-cache', "past range is revalidated too")
+
+    analysis = client.get('/api/plant-analysis-history/m1?period=30d', headers=headers)
+    cached = client.get('/api/plant-analysis-history/m1?period=30d', headers={**headers, 'If-None-Match': analysis.headers.get('ETag')})
+    check(analysis.status_code == 200 and cached.status_code == 304, "analysis history revalidates to 304")
+
+finish()
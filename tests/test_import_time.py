@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Import-time budget test
+
+`python -X importtime` でWebアプリ(app)と分析デーモンのimportを計測し、
+- BLE(bleak/ble_manager)やHTTPクライアント(httpx)がimport時に読み込まれていないこと
+- import時にルートロガーへハンドラーが追加されていないこと（ログ設定がimportの副作用になっていないこと）
+- import全体の所要時間が予算内であること
+を確認する。
+
+予算は環境変数 IMPORT_TIME_BUDGET_MS で変更できる（Raspberry Pi上では大きめに設定する）。
+"""
+import sys
+import os
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from testlib import check, finish, header
+
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 1500))
+
+# モジュール名 -> import時に読み込まれてはいけないモジュール
+TARGETS = {
+    'app': ['bleak', 'ble_manager', 'httpx'],
+    'plant_analyzer_daemon': ['bleak', 'ble_manager', 'httpx', 'flask'],
+}
+
+
+def measure_import(module_name):
+    """サブプロセスでモジュールをimportし、(読み込まれたモジュールの累積時間(us)の辞書, ルートロガーのハンドラー数) を返す"""
+    code = (
+        "import logging, sys\n"
+        "before = len(logging.getLogger().handlers)\n"
+        f"import {module_name}\n"
+        "print(len(logging.getLogger().handlers) - before)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=PROJECT_DIR, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue  # ヘッダー行
+        cumulative[parts[2].strip()] = cumulative_us
+
+    added_handlers = int(result.stdout.strip().splitlines()[-1])
+    return cumulative, added_handlers
+
+
+header(f"Import-time budget test (budget: {IMPORT_TIME_BUDGET_MS:.0f}ms)")
+
+for module_name, forbidden in TARGETS.items():
+    print(f"\n▶ import {module_name}")
+    cumulative, added_handlers = measure_import(module_name)
+
+    total_ms = cumulative.get(module_name, 0) / 1000
+    check(total_ms <= IMPORT_TIME_BUDGET_MS, f"{total_ms:.1f}ms (budget {IMPORT_TIME_BUDGET_MS:.0f}ms)")
+
+    loaded = [name for name in forbidden if name in cumulative]
+    check(not loaded, f"not loaded at import: {', '.join(forbidden)}" if not loaded else f"loaded at import: {', '.join(loaded)}")
+
+    # ログ設定は各プロセスの起動処理で行い、importの副作用にしない
+    if module_name == 'app':
+        check(added_handlers == 0, f"{added_handlers} logging handlers added at import")
+
+    # 対象モジュール配下で時間のかかっているimport（起動時にsiteが読み込むものは除外）
+    slowest = sorted(
+        ((name, us) for name, us in cumulative.items() if us < cumulative.get(module_name, 0)),
+        key=lambda item: item[1], reverse=True
+    )[:5]
+    for name, us in slowest:
+        print(f"    {us / 1000:8.1f}ms  {name}")
+
+print()
+finish()
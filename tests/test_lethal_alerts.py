@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming lethal-temperature alert monitor
+
+- 同じ限界を連続して超えた読み取りが LETHAL_LIMIT_TRIGGER_COUNT 件続いたらアラートになること
+- 上限・下限を交互に超えた読み取りは連続としてカウントしないこと
+- 解除にはヒステリシス分だけ内側の読み取りが LETHAL_ALERT_CLEAR_COUNT 件連続で必要なこと
+- 再起動時に plant_alert_state から状態を引き継ぐこと
+- 監視対象から外れた植物のアラートを解除し、削除された植物の状態を消すこと
+- データパイプで再送された同じ計測（保存済み）は判定に流さないこと
+"""
+import sys
+import os
+import json
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import database
+from plant_logic import (
+    LethalTemperatureMonitor, LETHAL_LIMIT_TRIGGER_COUNT, LETHAL_ALERT_CLEAR_COUNT, LETHAL_ALERT_HYSTERESIS
+)
+
+logging.disable(logging.WARNING)
+
+header("致死温度アラート（ストリーミング判定）のテスト")
+
+HIGH, LOW = 35.0, 2.0
+
+
+def feed(monitor, device_id, temperatures, start_minute=0):
+    """読み取りを順に流し、各読み取りで起きた遷移のリストを返す"""
+    return [monitor.process_reading(device_id, f"2025-07-01 12:{start_minute + i:02d}:00", temperature)
+            for i, temperature in enumerate(temperatures)]
+
+
+def alert_status(conn, plant_id):
+    row = conn.execute("SELECT alert_status FROM plant_alert_state WHERE managed_plant_id = ?", (plant_id,)).fetchone()
+    return row['alert_status'] if row else None
+
+
+def events(conn, plant_id):
+    return [tuple(row) for row in conn.execute(
+        "SELECT alert_type, event FROM plant_alert_events WHERE managed_plant_id = ? ORDER BY id", (plant_id,)
+    ).fetchall()]
+
+
+with temp_database() as tmp:
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO plants (plant_id, genus, species, lethal_temp_high, lethal_temp_low) VALUES ('p1', 'G', 's', ?, ?)", (HIGH, LOW))
+    for i in (1, 2, 3):
+        conn.execute("INSERT INTO managed_plants (managed_plant_id, plant_name, library_plant_id, assigned_plant_sensor_id) VALUES (?, ?, 'p1', ?)",
+                     (f"m{i}", f"Plant {i}", f"dev{i}"))
+    conn.commit()
+
+    monitor = LethalTemperatureMonitor(conn)
+
+    # 1. トリガー回数
+    transitions = feed(monitor, 'dev1', [HIGH + 1] * LETHAL_LIMIT_TRIGGER_COUNT)
+    check(transitions[:-1] == [[]] * (LETHAL_LIMIT_TRIGGER_COUNT - 1) and transitions[-1] == [('m1', 'lethal_high')],
+          f"alert raised on reading #{LETHAL_LIMIT_TRIGGER_COUNT} beyond the limit: {transitions}")
+    check(alert_status(conn, 'm1') == 'lethal_high' and events(conn, 'm1') == [('lethal_high', 'raised')],
+          "raised alert stored in plant_alert_state and plant_alert_events")
+
+    # 2. 同じ限界の連続のみカウントする
+    alternating = [HIGH + 1, HIGH + 1, LOW - 1, LOW - 1, HIGH + 1, LOW - 1, LOW - 1]
+    transitions = feed(monitor, 'dev2', alternating + [LOW - 1])
+    check(transitions[:len(alternating)] == [[]] * len(alternating) and transitions[-1] == [('m2', 'lethal_low')],
+          f"switching between limits restarts the count: {transitions}")
+
+    # 3. ヒステリシスと解除回数
+    inside = HIGH - LETHAL_ALERT_HYSTERESIS
+    transitions = feed(monitor, 'dev1', [HIGH - 0.5] * LETHAL_ALERT_CLEAR_COUNT, start_minute=10)
+    check(transitions == [[]] * LETHAL_ALERT_CLEAR_COUNT and alert_status(conn, 'm1') == 'lethal_high',
+          "readings inside the limit but within the hysteresis band do not clear")
+    transitions = feed(monitor, 'dev1', [inside] * (LETHAL_ALERT_CLEAR_COUNT - 1) + [HIGH - 0.5] + [inside] * (LETHAL_ALERT_CLEAR_COUNT - 1),
+                       start_minute=20)
+    check(all(t == [] for t in transitions) and alert_status(conn, 'm1') == 'lethal_high',
+          "a reading back in the hysteresis band restarts the clear count")
+    transitions = feed(monitor, 'dev1', [inside], start_minute=30)
+    check(transitions == [[('m1', 'safe')]] and alert_status(conn, 'm1') == 'safe'
+          and events(conn, 'm1') == [('lethal_high', 'raised'), ('lethal_high', 'cleared')],
+          f"alert cleared after {LETHAL_ALERT_CLEAR_COUNT} consecutive readings {LETHAL_ALERT_HYSTERESIS}°C inside the limit")
+
+    # 4. 再起動時は保存済みの状態から再開する
+    feed(monitor, 'dev1', [HIGH + 1] * LETHAL_LIMIT_TRIGGER_COUNT, start_minute=40)
+    restarted = LethalTemperatureMonitor(database.get_db_connection())
+    check(restarted.states['m1']['status'] == 'lethal_high' and restarted.states['m2']['status'] == 'lethal_low',
+          "restarted monitor loads the persisted alert statuses")
+    transitions = feed(restarted, 'dev1', [HIGH + 1] * LETHAL_LIMIT_TRIGGER_COUNT + [inside] * LETHAL_ALERT_CLEAR_COUNT, start_minute=50)
+    check(transitions[-1] == [('m1', 'safe')] and all(t == [] for t in transitions[:-1]),
+          "restarted monitor does not raise again and clears from the persisted alert")
+    restarted.conn.close()
+
+    # 5. 監視対象から外れた植物
+    feed(monitor, 'dev3', [LOW - 1] * LETHAL_LIMIT_TRIGGER_COUNT)
+    conn.execute("UPDATE managed_plants SET assigned_plant_sensor_id = NULL WHERE managed_plant_id = 'm2'")
+    conn.execute("DELETE FROM managed_plants WHERE managed_plant_id = 'm3'")
+    conn.commit()
+    monitor.loaded_at = 0
+    feed(monitor, 'dev1', [20.0], start_minute=59)
+    cleared = conn.execute("SELECT * FROM plant_alert_events WHERE managed_plant_id = 'm2' ORDER BY id DESC LIMIT 1").fetchone()
+    check(alert_status(conn, 'm2') == 'safe' and cleared['event'] == 'cleared' and cleared['alert_type'] == 'lethal_low'
+          and cleared['threshold'] == LOW and cleared['temperature'] is None and 'm2' not in monitor.states,
+          "alert of a plant whose sensor was unassigned is cleared on refresh")
+    check(alert_status(conn, 'm3') is None and 'm3' not in monitor.states,
+          "state of a deleted plant is removed on refresh")
+
+    conn.execute("UPDATE managed_plants SET assigned_plant_sensor_id = 'dev2' WHERE managed_plant_id = 'm2'")
+    conn.execute("UPDATE plant_alert_state SET alert_status = 'lethal_high' WHERE managed_plant_id = 'm2'")
+    conn.execute("UPDATE plants SET lethal_temp_high = NULL WHERE plant_id = 'p1'")
+    conn.commit()
+    LethalTemperatureMonitor(conn)
+    check(alert_status(conn, 'm2') == 'safe' and events(conn, 'm2')[-1] == ('lethal_high', 'cleared'),
+          "persisted alert of a plant without limits is cleared at startup")
+
+    # 6. 再送された同じ計測は1回の読み取りとして扱う
+    conn.execute("UPDATE plants SET lethal_temp_high = ? WHERE plant_id = 'p1'", (HIGH,))
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 3)")
+    conn.commit()
+    import plant_analyzer_daemon as analyzer
+    analyzer.DATA_PIPE_PATH = os.path.join(tmp, 'pipe.jsonl')
+    monitor = LethalTemperatureMonitor(conn)
+    reading = {'datetime': '2025-07-01 13:00:00', 'temperature': HIGH + 1}
+    with open(analyzer.DATA_PIPE_PATH, 'w') as f:
+        for second in range(LETHAL_LIMIT_TRIGGER_COUNT):
+            f.write(json.dumps({'device_id': 'dev1', 'timestamp': f"2025-07-01T13:00:{second:02d}", 'data_version': 3, 'data': reading}) + "\n")
+    calls = []
+    process_reading = monitor.process_reading
+
+    def recording_process_reading(*args):
+        calls.append(process_reading(*args))
+        return calls[-1]
+
+    monitor.process_reading = recording_process_reading
+    event_count = len(events(conn, 'm1'))
+    updated = analyzer.process_data_pipe(monitor)
+    check(calls == [[]] and updated == {'dev1'} and alert_status(conn, 'm1') == 'safe' and len(events(conn, 'm1')) == event_count,
+          f"same pipe record sent {LETHAL_LIMIT_TRIGGER_COUNT} times is evaluated once and raises nothing: {calls}")
+    with open(analyzer.DATA_PIPE_PATH, 'w') as f:
+        f.write(json.dumps({'device_id': 'dev1', 'timestamp': "2025-07-01T13:01:00", 'data_version': 3, 'data': reading}) + "\n")
+    updated = analyzer.process_data_pipe(monitor)
+    check(calls == [[]] and updated == set(), "re-polled measurement does not mark the device as updated")
+    conn.close()
+
+finish()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for the adaptive polling scheduler
+
+- 新しいデバイスは渡された順ですぐに取り出されること
+- 値の変化が遅いデバイスは間隔が延び、速いデバイスは短くなること
+- 取得失敗が続くと指数バックオフし、成功でリセットされること
+- 致死温度・乾燥の閾値付近では短い間隔になること
+- 閾値の読み込み (load_poll_thresholds)
+"""
+import sys
+import os
+import logging
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import config
+import database
+from poll_scheduler import PollScheduler, load_poll_thresholds, is_near_threshold
+
+logging.disable(logging.WARNING)
+
+
+def poll(scheduler, now, values):
+    """時刻nowで取り出されたデバイスに values[device_id] を返し、取り出された順を返す"""
+    order = []
+    for device in scheduler.pop_due(now):
+        dev_id = device['device_id']
+        order.append(dev_id)
+        if values.get(dev_id) is None:
+            scheduler.record_failure(dev_id, now)
+        else:
+            scheduler.record_success(dev_id, values[dev_id], now)
+    return order
+
+
+header("ポーリングスケジューラのテスト")
+
+scheduler = PollScheduler(base_interval=60, min_interval=60, max_interval=900, near_threshold_interval=60,
+                          backoff_max=1800, smoothing=0.5,
+                          significant_change={'temperature': 0.5, 'soil_moisture': 30.0})
+devices = [{'device_id': d, 'device_type': 'plant_sensor'} for d in ('stable', 'volatile', 'broken')]
+scheduler.sync(devices, now=0)
+
+# 1秒刻みで1時間分シミュレーションする
+counts = {d['device_id']: 0 for d in devices}
+first_order = None
+now = 0
+while now <= 3600:
+    values = {
+        'stable': {'temperature': 20.0 + now / 36000, 'soil_moisture': 1200.0},  # 1時間で0.1℃
+        'volatile': {'temperature': 20.0 + (now % 600) / 60},                     # 10分で10℃
+    }
+    order = poll(scheduler, now, values)
+    if now == 0:
+        first_order = order
+    for dev_id in order:
+        counts[dev_id] += 1
+    now += 1
+check(first_order == ['stable', 'volatile', 'broken'], f"new devices polled immediately in given order: {first_order}")
+
+snapshot = scheduler.snapshot(now)
+check(snapshot['stable']['interval'] == 900, f"slow-changing device backs off to max interval: {snapshot['stable']}")
+check(snapshot['volatile']['interval'] == 60 and counts['volatile'] > 4 * counts['stable'],
+      f"volatile device polled more often: {counts}")
+check(snapshot['broken']['interval'] == 1800 and counts['broken'] <= 6, f"failing device backs off exponentially: {counts['broken']} polls")
+
+interval = scheduler.record_success('broken', {'temperature': 20.0}, now)
+check(interval == 60 and scheduler.states['broken']['failures'] == 0, "success resets backoff")
+
+# 閾値付近
+scheduler.set_thresholds({'stable': [{'lethal_temp_high': 35.0, 'lethal_temp_low': 2.0}, {'soil_dry_threshold': 1500.0}]})
+interval = scheduler.record_success('stable', {'temperature': 20.1, 'soil_moisture': 1480.0}, now + 900)
+check(interval == 60 and snapshot['stable']['interval'] == 900, f"near dry threshold -> short interval: {interval}")
+check(is_near_threshold({'temperature': 33.5}, [{'lethal_temp_high': 35.0, 'lethal_temp_low': 2.0}], temp_margin=2.0)
+      and not is_near_threshold({'temperature': 25.0}, [{'lethal_temp_high': 35.0, 'lethal_temp_low': 2.0}], temp_margin=2.0),
+      "lethal temperature margin")
+
+# 削除されたデバイスは取り除かれる
+scheduler.sync(devices[:2], now=now)
+check('broken' not in scheduler.states and all(d['device_id'] != 'broken' for d in scheduler.pop_due(now + 10000)),
+      "removed devices dropped from queue")
+
+# --- 閾値の読み込み ---
+with temp_database():
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO plants (plant_id, genus, species, lethal_temp_high, lethal_temp_low) VALUES ('p1', 'G', 's', 35, 2)")
+    conn.execute("""INSERT INTO managed_plants (managed_plant_id, plant_name, library_plant_id, assigned_plant_sensor_id,
+                    assigned_switchbot_id, soil_moisture_dry_threshold_voltage) VALUES ('m1', 'A', 'p1', 'sensor1', NULL, 1500)""")
+    conn.execute("""INSERT INTO managed_plants (managed_plant_id, plant_name, library_plant_id, assigned_plant_sensor_id,
+                    assigned_switchbot_id) VALUES ('m2', 'B', 'p1', NULL, 'bot1')""")
+    conn.commit()
+    thresholds = load_poll_thresholds(conn)
+    conn.close()
+    check(thresholds == {
+        'sensor1': [{'lethal_temp_high': 35.0, 'lethal_temp_low': 2.0}, {'soil_dry_threshold': 1500.0}],
+        'bot1': [{'lethal_temp_high': 35.0, 'lethal_temp_low': 2.0}],
+    }, f"thresholds loaded per device: {thresholds}")
+
+# --- 上限の間隔でポーリングしても欠損・カバレッジ低下にならないこと ---
+with temp_database():
+    import device_manager as dm
+    from backfill import find_sensor_gaps
+
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('stable', 'Sensor', 'AA:BB:CC:DD:EE:01', 3)")
+    conn.commit()
+    conn.close()
+
+    # 設定値のスケジューラで、1回のポーリングに POLL_INTERVAL_MARGIN_SECONDS の半分かかる安定したデバイスを7時間分動かす
+    scheduler = PollScheduler()
+    scheduler.sync([{'device_id': 'stable', 'device_type': 'plant_sensor'}], now=0)
+    start = datetime(2026, 1, 10, 0, 0, 5)
+    poll_seconds = config.POLL_INTERVAL_MARGIN_SECONDS / 2
+    now = 0
+    while now < 7 * 3600:
+        if scheduler.pop_due(now):
+            finished = now + poll_seconds
+            dm.save_sensor_data('stable', (start + timedelta(seconds=finished)).isoformat(), {'temperature': 20.0}, 3)
+            scheduler.record_success('stable', {'temperature': 20.0, 'soil_moisture': 1200.0}, finished)
+        now += 1
+
+    conn = database.get_db_connection()
+    gaps = find_sensor_gaps(conn, 'stable', start + timedelta(hours=1), start + timedelta(hours=7), config.BACKFILL_GAP_THRESHOLD_SECONDS)
+    coverage = dm.get_device_coverage(conn, 5, now=start + timedelta(hours=7))['stable']
+    conn.close()
+    check(scheduler.states['stable']['interval'] == config.POLL_MAX_INTERVAL_SECONDS and not gaps and coverage['coverage'] == 1.0
+          and coverage['missing_hours'] == 0,
+          f"device at max interval ({config.POLL_MAX_INTERVAL_SECONDS}s) has no gaps and full coverage: {len(gaps)} gaps, {coverage}")
+
+finish()
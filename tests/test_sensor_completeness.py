@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test script for the per-device data completeness index
+
+- マイグレーションで既存の sensor_data から sensor_completeness が作成されること
+- save_sensor_data / save_sensor_data_batch で時間帯ごとの読み取り数が更新されること
+- get_device_coverage が期待読み取り数を上限に数え、カバレッジの低いデバイスを判別できること
+"""
+import sys
+import os
+import logging
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import database
+
+logging.disable(logging.WARNING)
+
+
+def completeness(conn, device_id):
+    rows = conn.execute(
+        "SELECT hour, actual_count FROM sensor_completeness WHERE device_id = ? ORDER BY hour", (device_id,)
+    ).fetchall()
+    return {row['hour']: row['actual_count'] for row in rows}
+
+
+header("データ完全性インデックスのテスト")
+
+with temp_database():
+    import device_manager as dm
+
+    expected = database.expected_readings_per_hour()
+    check(expected == 3600 // database.COMPLETENESS_EXPECTED_INTERVAL_SECONDS, f"expected readings per hour: {expected}")
+
+    # --- マイグレーションによる既存データからの作成 ---
+    conn = database.get_db_connection()
+    conn.execute("DROP TABLE sensor_completeness")
+    conn.executemany(
+        "INSERT INTO sensor_data (device_id, timestamp, temperature) VALUES (?, ?, 20.0)",
+        [("legacy", f"2024-06-01 09:{m:02d}:00") for m in range(0, 60, 20)] + [("legacy", "2024-06-01 10:05:00")]
+    )
+    conn.execute("PRAGMA user_version = 4")
+    conn.commit()
+    conn.close()
+    database.init_db()
+    conn = database.get_db_connection()
+    check(completeness(conn, "legacy") == {'2024-06-01 09': 3, '2024-06-01 10': 1}, "migration backfills from sensor_data")
+    conn.close()
+
+    # --- 取り込み時の更新 ---
+    now = datetime(2024, 6, 2, 12, 30, 0)
+    for device_id, name in (("full", "Full"), ("sparse", "Sparse"), ("new", "New")):
+        conn = database.get_db_connection()
+        conn.execute("INSERT INTO devices (device_id, device_name, mac_address, device_type) VALUES (?, ?, ?, 'plant_sensor')",
+                     (device_id, name, f"00:00:00:00:00:{len(name):02d}"))
+        conn.commit()
+        conn.close()
+
+    # full: 直近6時間すべて10分間隔、sparse: 1時間に2件のみ
+    for hour in range(6, 0, -1):
+        start = now.replace(minute=0) - timedelta(hours=hour)
+        for minute in range(0, 60, 10):
+            dm.save_sensor_data("full", (start + timedelta(minutes=minute)).isoformat(), {'temperature': 20.0}, 3)
+        for minute in (0, 30):
+            dm.save_sensor_data("sparse", (start + timedelta(minutes=minute)).isoformat(), {'temperature': 20.0}, 3)
+    # new: 2時間前から登録（それ以前の時間帯は欠損とみなさない）
+    batch = [{'timestamp': (now.replace(minute=0) - timedelta(hours=2, minutes=-m)).isoformat(), 'data': {'temperature': 20.0}}
+             for m in range(0, 120, 5)]
+    inserted = dm.save_sensor_data_batch("new", batch, 3)
+    dm.save_sensor_data_batch("new", batch, 3)
+
+    conn = database.get_db_connection()
+    new_counts = completeness(conn, "new")
+    check(len(inserted) == 24 and new_counts == {'2024-06-02 10': 12, '2024-06-02 11': 12},
+          f"batch insert counted per hour, duplicates ignored: {new_counts}")
+    check(set(completeness(conn, "sparse").values()) == {2}, "single inserts counted")
+
+    coverage = dm.get_device_coverage(conn, 6, now=now)
+    conn.close()
+    check(coverage['full']['coverage'] == 1.0 and coverage['full']['missing_hours'] == 0, f"full coverage: {coverage['full']}")
+    check(abs(coverage['sparse']['coverage'] - 2 / expected) < 1e-9 and coverage['sparse']['missing_hours'] == 6,
+          f"sparse coverage: {coverage['sparse']}")
+    check(coverage['new']['coverage'] == 1.0 and coverage['new']['hours'] == 2, f"window clipped to first reading: {coverage['new']}")
+    order = sorted(coverage, key=lambda d: coverage[d]['coverage'])
+    check(order[0] == "sparse", f"lowest coverage first: {order}")
+
+finish()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for sensor_data natural-key uniqueness
+
+- マイグレーション9が (device_id, timestamp) の重複行を最初の行だけ残して削除すること
+- 前処理はバッチごとにコミットし、途中で中断しても版数は上がらず、再実行で残りが処理されること
+- 削除した行の分を sensor_completeness から差し引き、sensor_latest / sensor_daily_last を残した行に付け替えること
+- 移行後は save_sensor_data / save_sensor_data_batch が同じ読み取りを二重に保存せず、save_sensor_data は保存したかどうかを返すこと
+"""
+import sys
+import os
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, header, temp_database
+
+import database
+
+logging.disable(logging.WARNING)
+
+header("sensor_dataの重複除去のテスト")
+
+database.SENSOR_DATA_DEDUPE_BATCH_ROWS = 7
+with temp_database(init=False):
+    # マイグレーション8までのDBに、パイプの再処理で重複した行を作る
+    migrations = database.MIGRATIONS
+    database.MIGRATIONS = [migration for migration in migrations if migration[0] <= 8]
+    database.SCHEMA_VERSION = 8
+    database.init_db()
+    database.MIGRATIONS = migrations
+    database.SCHEMA_VERSION = migrations[-1][0]
+
+    import device_manager as dm
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO devices (device_id, device_name, mac_address, data_version) VALUES ('dev1', 'Sensor', 'AA:BB:CC:DD:EE:01', 1)")
+    conn.commit()
+    conn.close()
+    for repeat in range(3):
+        for minute in range(0, 60, 10):
+            dm.save_sensor_data('dev1', f"2026-01-10T08:{minute:02d}:00", {'temperature': 20.0 + minute + repeat / 10}, 1)
+    conn = database.get_db_connection()
+    before = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+    conn.close()
+
+    # 2バッチ目で中断する。1バッチ目の削除はコミット済みで、版数と一意インデックスはまだ変わらない
+    original_delete = database._delete_sensor_duplicates
+    calls = []
+
+    def failing_delete(cursor, condition, params=()):
+        calls.append(params)
+        if len(calls) == 2:
+            raise RuntimeError("interrupted")
+        return original_delete(cursor, condition, params)
+
+    database._delete_sensor_duplicates = failing_delete
+    try:
+        database.init_db()
+    except RuntimeError:
+        pass
+    database._delete_sensor_duplicates = original_delete
+    conn = database.get_db_connection()
+    interrupted = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+    version = database.get_schema_version(conn)
+    unique = [row['unique'] for row in conn.execute("PRAGMA index_list(sensor_data)") if row['name'] == 'idx_sensor_data_device_timestamp']
+    conn.close()
+    check(interrupted == 17 and version == 8 and unique == [0],
+          f"interrupted dedupe keeps committed batch only: {interrupted} rows, user_version {version}")
+
+    # 前処理を飛ばしても、マイグレーション本体が残りの重複を削除してから一意インデックスを作る
+    prepare = database.MIGRATION_PREPARE
+    database.MIGRATION_PREPARE = {}
+    database.init_db()
+    database.MIGRATION_PREPARE = prepare
+    conn = database.get_db_connection()
+    rows = conn.execute("SELECT timestamp, temperature FROM sensor_data ORDER BY timestamp").fetchall()
+    check(before == 18 and len(rows) == 6 and all(row['temperature'] == 20.0 + int(row['timestamp'][14:16]) for row in rows),
+          f"migration keeps the first reading of each key: {before} -> {len(rows)} rows")
+    completeness = conn.execute("SELECT actual_count FROM sensor_completeness WHERE device_id = 'dev1'").fetchone()
+    check(completeness['actual_count'] == 6, f"completeness corrected: {completeness['actual_count']}")
+    latest = conn.execute("SELECT l.temperature, l.id IN (SELECT id FROM sensor_data) AS valid FROM sensor_latest l").fetchone()
+    daily = conn.execute("SELECT sensor_data_id IN (SELECT id FROM sensor_data) AS valid FROM sensor_daily_last").fetchone()
+    check(latest['valid'] and latest['temperature'] == 70.0 and daily['valid'],
+          "sensor_latest / sensor_daily_last point at kept rows")
+    unique = [row['unique'] for row in conn.execute("PRAGMA index_list(sensor_data)") if row['name'] == 'idx_sensor_data_device_timestamp']
+    check(unique == [1], "idx_sensor_data_device_timestamp is unique")
+    conn.close()
+
+    saved = [dm.save_sensor_data('dev1', '2026-01-10T08:50:00', {'temperature': 99.0}, 1),
+             dm.save_sensor_data('dev1', '2026-01-10T08:55:00', {'temperature': 20.5}, 1)]
+    inserted = dm.save_sensor_data_batch('dev1', [
+        {'timestamp': '2026-01-10T08:40:00', 'data': {'temperature': 99.0}},
+        {'timestamp': '2026-01-10T09:00:00', 'data': {'temperature': 21.0}},
+    ], 1)
+    conn = database.get_db_connection()
+    count = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+    latest = conn.execute("SELECT temperature FROM sensor_latest WHERE device_id = 'dev1'").fetchone()
+    completeness = conn.execute("SELECT SUM(actual_count) FROM sensor_completeness WHERE device_id = 'dev1'").fetchone()[0]
+    check(saved == [False, True] and inserted == ['2026-01-10 09:00:00'] and count == 8 and latest['temperature'] == 21.0
+          and completeness == 8, f"re-sent readings are ignored by single and batch writers: saved {saved}")
+    conn.close()
+
+finish()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Fuzz test for sensor payload layouts (sensor_payloads.py)
+
+レジストリのレイアウトから生成したデコーダーを、ファームウェアの構造体定義 (オフセット) から
+直接書いた参照デコーダーとランダムなペイロードで比較する。あわせて
+- 任意長のランダムなバイト列で struct.error 以外の例外が出ないこと
+- 生成したINSERT文で保存した値がそのまま読み戻せること
+を確認する。
+
+使い方:
+    python3 tests/test_sensor_payloads.py [iterations]
+"""
+import sys
+import os
+import math
+import random
+import struct
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from testlib import check, finish, temp_database
+
+import database
+import sensor_payloads as sp
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+SEED = 20240601
+
+
+# --- 参照デコーダー (ファームウェアの構造体のオフセットをそのまま読む) ---
+
+
+def ref_tm(payload, offset):
+    tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year = struct.unpack_from('<6i', payload, offset)
+    return sp.tm_to_str((tm_sec, tm_min, tm_hour, tm_mday, tm_mon, tm_year))
+
+
+def ref_soil_data(payload, version):
+    """soil_data_t (非packed) v2: 96バイト / v3: 104バイト"""
+    lux, temperature, humidity, soil_moisture = struct.unpack_from('<4f', payload, 40)
+    soil_temps = struct.unpack_from('<4f', payload, 60)
+    count = payload[76]
+    caps = struct.unpack_from('<4f', payload, 80)
+    result = {
+        'data_version': version,
+        'datetime': ref_tm(payload, 4),
+        'light_lux': lux, 'temperature': temperature, 'humidity': humidity, 'soil_moisture': soil_moisture,
+        'sensor_error': payload[56] != 0,
+    }
+    for i in range(4):
+        result[f'soil_temperature{i + 1}'] = soil_temps[i] if i < count else None
+    result['soil_temperature_count'] = count
+    for i in range(4):
+        result[f'capacitance_ch{i + 1}'] = caps[i]
+    if version == 3:
+        valid = payload[100] != 0
+        result['ex_temperature'] = struct.unpack_from('<f', payload, 96)[0] if valid else None
+        result['ext_temperature_valid'] = valid
+    result['battery_level'] = None
+    return result
+
+
+def ref_v1(payload):
+    lux, temperature, humidity, soil_moisture = struct.unpack_from('<4f', payload, 36)
+    return {
+        'data_version': 1, 'datetime': ref_tm(payload, 0),
+        'light_lux': lux, 'temperature': temperature, 'humidity': humidity, 'soil_moisture': soil_moisture,
+        'sensor_error': payload[52] != 0, 'battery_level': None,
+    }
+
+
+def ref_time_data_v3(payload):
+    """time_data_response_t (packed) 91バイト"""
+    temperature, humidity, lux, soil_moisture = struct.unpack_from('<4f', payload, 37)
+    soil_temps = struct.unpack_from('<4f', payload, 53)
+    count = payload[69]
+    caps = struct.unpack_from('<4f', payload, 70)
+    valid = payload[90] != 0
+    result = {
+        'data_version': 3, 'datetime': ref_tm(payload, 1),
+        'temperature': temperature, 'humidity': humidity, 'light_lux': lux, 'soil_moisture': soil_moisture,
+    }
+    for i in range(4):
+        result[f'soil_temperature{i + 1}'] = soil_temps[i] if i < count else None
+    result['soil_temperature_count'] = count
+    for i in range(4):
+        result[f'capacitance_ch{i + 1}'] = caps[i]
+    result['ex_temperature'] = struct.unpack_from('<f', payload, 86)[0] if valid else None
+    result['ext_temperature_valid'] = valid
+    return result
+
+
+CASES = [
+    ('sensor v1', sp.SENSOR_DATA_LAYOUTS[1], 56, 0, ref_v1),
+    ('sensor v2', sp.SENSOR_DATA_LAYOUTS[2], 96, 4, lambda p: ref_soil_data(p, 2)),
+    ('sensor v3', sp.SENSOR_DATA_LAYOUTS[3], 104, 4, lambda p: ref_soil_data(p, 3)),
+    ('time_data v3', sp.TIME_DATA_LAYOUTS[3], 91, 1, ref_time_data_v3),
+]
+
+
+def random_payload(rnd, size, tm_offset):
+    """ランダムなバイト列。大半は有効な日時・カウントにして値の比較が意味を持つようにする"""
+    payload = bytearray(rnd.getrandbits(8) for _ in range(size))
+    if rnd.random() < 0.8:
+        struct.pack_into('<6i', payload, tm_offset,
+                         rnd.randint(0, 59), rnd.randint(0, 59), rnd.randint(0, 23),
+                         rnd.randint(1, 28), rnd.randint(0, 11), rnd.randint(70, 140))
+    return bytes(payload)
+
+
+def same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b and type(a) is type(b)
+
+
+print("=" * 60)
+print(f"センサーペイロード レイアウトのテスト (iterations={ITERATIONS})")
+print("=" * 60)
+
+logging.disable(logging.WARNING)  # 無効な日時の警告を抑制
+rnd = random.Random(SEED)
+# 1. 構造体サイズがファームウェアと一致すること
+for name, layout, size, _, _ in CASES:
+    check(layout.size == size, f"{name}: size={layout.size} (expected: {size})")
+
+# 2. 参照デコーダーとの比較
+for name, layout, size, tm_offset, reference in CASES:
+    mismatch = None
+    for _ in range(ITERATIONS):
+        payload = random_payload(rnd, size, tm_offset)
+        if size > 56:
+            payload = bytes([layout.data_version]) + payload[1:]
+        expected = reference(payload)
+        actual = layout.decode(payload)._asdict()
+        if list(actual) != list(expected) or not all(same_value(actual[k], expected[k]) for k in expected):
+            mismatch = (payload.hex(), expected, actual)
+            break
+    check(mismatch is None, f"{name}: decode matches reference" + (f" -> {mismatch}" if mismatch else ""))
+
+# 3. 任意長のバイト列: 判別とデコードは struct.error 以外を送出しない
+unexpected = None
+for _ in range(ITERATIONS):
+    payload = bytes(rnd.getrandbits(8) for _ in range(rnd.randint(0, 130)))
+    try:
+        layout = sp.detect_sensor_layout(payload)
+        if layout is not None:
+            layout.decode(payload)
+    except struct.error:
+        pass
+    except Exception as e:
+        unexpected = (payload.hex(), repr(e))
+        break
+check(unexpected is None, "random lengths raise only struct.error" + (f" -> {unexpected}" if unexpected else ""))
+
+check(sp.detect_sensor_layout(bytes(56)) is sp.SENSOR_DATA_LAYOUTS[1], "56 bytes -> v1")
+check(sp.detect_sensor_layout(bytes([3]) + bytes(103)) is sp.SENSOR_DATA_LAYOUTS[3], "version byte 3 -> v3")
+check(sp.detect_sensor_layout(bytes([9]) + bytes(95)) is sp.SENSOR_DATA_LAYOUTS[2], "unknown version -> v2")
+check(sp.detect_sensor_layout(bytes([1]) + bytes(95)) is sp.SENSOR_DATA_LAYOUTS[2], "long payload with version byte 1 -> v2, not v1")
+check(sp.detect_sensor_layout(bytes(60)) is None, "unsupported length -> None")
+
+# 4. 生成したINSERT文で保存・読み戻し
+with temp_database():
+    import device_manager as dm
+
+    for name, layout, size, tm_offset, _ in CASES[:3]:
+        # SQLiteはNaNをNULLとして保存するため、読み戻しの比較には有限値のペイロードを使う
+        while True:
+            payload = random_payload(rnd, size, tm_offset)
+            if size > 56:
+                payload = bytes([layout.data_version]) + payload[1:]
+            data = layout.decode(payload)._asdict()
+            if not any(isinstance(v, float) and not math.isfinite(v) for v in data.values()):
+                break
+        device_id = f"fuzz_v{layout.data_version}"
+        dm.save_sensor_data(device_id, "2024-06-01 12:00:00", data, layout.data_version)
+
+        conn = database.get_db_connection()
+        row = conn.execute("SELECT * FROM sensor_data WHERE device_id = ?", (device_id,)).fetchone()
+        conn.close()
+        stored_ok = row is not None and all(
+            same_value(row[column], data[column]) if data[column] is not None else row[column] is None
+            for column in layout.columns
+        )
+        unset = [c for c in database.SENSOR_DATA_COLUMNS if c not in layout.columns + ('id', 'device_id', 'timestamp')]
+        check(stored_ok and all(row[c] is None for c in unset), f"{name}: stored columns round-trip ({len(layout.columns)} columns)")
+
+    # 未登録のdata_version (SwitchBot等) はv1の基本カラムで保存し、data_versionはそのまま記録する
+    dm.save_sensor_data("fuzz_unknown", "2024-06-01 12:00:00", {'temperature': 21.5, 'humidity': 40.0}, 9)
+    conn = database.get_db_connection()
+    row = conn.execute("SELECT * FROM sensor_data WHERE device_id = 'fuzz_unknown'").fetchone()
+    conn.close()
+    check(row['temperature'] == 21.5 and row['data_version'] == 9, "unknown data_version stored with v1 columns")
+
+# 5. 新しいレイアウトの追加はエントリ1つで済むこと (保存カラムはsensor_dataに存在するものだけ)
+registry = {}
+layout = sp.register_layout(sp.PayloadLayout(99, 'SensorReadingV99', [
+    sp.version(), sp.pad(3), sp.tm(),
+    sp.value('temperature', 'f'), sp.value('co2_ppm', 'H'), sp.pad(2),
+]), registry=registry)
+payload = bytes([99, 0, 0, 0]) + struct.pack('<9i', 0, 30, 12, 1, 5, 124, 0, 0, 0) + struct.pack('<fH2x', 23.5, 800)
+reading = layout.decode(payload)
+check(sp.get_layout(99, registry) is layout and reading.co2_ppm == 800 and reading.temperature == 23.5
+      and reading.datetime == '2024-06-01 12:30:00', "new layout entry decodes")
+check(layout.columns == ('data_version', 'temperature'), f"new layout columns: {layout.columns}")
+
+finish()
@@ -0,0 +1,74 @@
+"""
+テストスクリプト共通の結果集計と一時データベース
+
+各テストは header() で見出しを出し、check() で結果を記録し、最後に finish() で集計を表示して終了する。
+DBを使うテストは temp_database() の中で実行する（config / database の参照先を一時ディレクトリに切り替える）。
+
+    from testlib import check, finish, header, temp_database
+"""
+import sys
+import os
+import tempfile
+from contextlib import contextmanager
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+import config
+import database
+
+passed = 0
+failed = 0
+
+
+def check(ok, message):
+    global passed, failed
+    if ok:
+        passed += 1
+        print(f"✓ PASS | {message}")
+    else:
+        failed += 1
+        print(f"✗ FAIL | {message}")
+
+
+def header(title):
+    print("=" * 60)
+    print(title)
+    print("=" * 60)
+
+
+def finish():
+    """集計を表示し、失敗がなければ0、あれば1で終了する"""
+    print("=" * 60)
+    print(f"結果: {passed} passed, {failed} failed")
+    print("=" * 60)
+
+    if failed == 0:
+        print("✓ すべてのテストが成功しました!")
+        sys.exit(0)
+    else:
+        print("✗ テストに失敗したケースがあります")
+        sys.exit(1)
+
+
+@contextmanager
+def temp_database(init=True, history_cache=False):
+    """
+    一時ディレクトリのDBを使う。終了時にディレクトリごと削除する。
+
+    Args:
+        init: Trueならスキーマを最新にする（Falseならマイグレーションは呼び出し側で行う）
+        history_cache: Trueなら履歴キャッシュの共有ストアも一時ディレクトリに置く。Falseなら共有ストアを使わない
+
+    Yields:
+        str: 一時ディレクトリのパス
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'plant_monitor.db')
+        config.DATABASE_PATH = db_path
+        database.DATABASE_PATH = db_path
+        config.HISTORY_CACHE_PATH = os.path.join(tmp, 'history_cache.db') if history_cache else None
+        if init:
+            database.init_db()
+        yield tmp